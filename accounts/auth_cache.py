@@ -0,0 +1,75 @@
+"""
+Cache for per-user authorization checks (staff, instructor, regular student,
+group membership).  Values are cached by user id under a per-user generation
+number; bumping the generation (on any permission or group change for the
+user) makes all of the user's cached values stale at once.
+"""
+from django.core.cache import cache
+
+from pipsevents import cache_versions
+
+
+AUTH_CACHE_TIMEOUT = 1800
+
+
+def _generation_key(user_id):
+    return 'user_%s_auth_generation' % str(user_id)
+
+
+def get_generation(user_id):
+    return cache_versions.get_version(_generation_key(user_id))
+
+
+def bump_generation(*user_ids):
+    cache_versions.bump_version(
+        *[_generation_key(user_id) for user_id in user_ids]
+    )
+
+
+def invalidate_user(user):
+    """
+    Make the user's cached checks stale, including any memoized on this user
+    instance
+    """
+    bump_generation(user.id)
+    user.__dict__.pop('_auth_cache', None)
+
+
+def cached_user_check(user, name, check):
+    """
+    Return check(), cached for the user under the name given.  Values are
+    also memoized on the user instance, i.e. for the rest of the request.
+    """
+    if not user.is_authenticated():
+        return check()
+
+    memo = user.__dict__.setdefault('_auth_cache', {})
+    if name not in memo:
+        key = 'user_%s_%s_%s' % (str(user.id), get_generation(user.id), name)
+        value = cache.get(key)
+        if value is None:
+            value = bool(check())
+            cache.set(key, value, AUTH_CACHE_TIMEOUT)
+        memo[name] = value
+    return memo[name]
+
+
+def is_staff(user):
+    return cached_user_check(user, 'is_staff', lambda: user.is_staff)
+
+
+def in_group(user, group_name):
+    return cached_user_check(
+        user, 'in_group_%s' % group_name,
+        lambda: user.groups.filter(name=group_name).exists()
+    )
+
+
+def is_instructor_or_staff(user):
+    return is_staff(user) or in_group(user, 'instructors')
+
+
+def has_perm(user, perm):
+    return cached_user_check(
+        user, 'perm_%s' % perm, lambda: user.has_perm(perm)
+    )
@@ -0,0 +1,113 @@
+"""
+Encrypted disclaimer backup files, written and read as a stream.
+
+A backup file is FILE_HEADER followed by chunks, each a 4-byte big-endian
+length and a simplecrypt-encrypted (and authenticated) block.  Each block
+starts with the chunk's sequence number and a flag marking the final chunk,
+followed by csv rows, so chunks that are dropped, reordered or cut off at a
+chunk boundary are detected when the file is read.  Chunks hold whole rows
+and are flushed once they reach CHUNK_SIZE, so memory use is bounded by the
+chunk size rather than the number of disclaimers.  simplecrypt derives new
+keys for each chunk (deliberately slow), so chunks are large.
+"""
+import csv
+import os
+import struct
+
+from io import StringIO
+
+from simplecrypt import decrypt, encrypt
+
+
+PASSWORD = os.environ.get('SIMPLECRYPT_PASSWORD')
+
+FILE_HEADER = b'DISCLAIMER_BACKUP\x00\x02'
+CHUNK_SIZE = 8 * 1024 * 1024
+
+_LENGTH = struct.Struct('>I')
+# sequence number and final chunk flag, encrypted with the chunk's rows
+_CHUNK_HEADER = struct.Struct('>I?')
+
+
+class BackupFileError(Exception):
+    pass
+
+
+def _write_chunk(outfile, buffer, password, sequence, final):
+    data = encrypt(
+        password,
+        _CHUNK_HEADER.pack(sequence, final) +
+        buffer.getvalue().encode('utf-8')
+    )
+    outfile.write(_LENGTH.pack(len(data)))
+    outfile.write(data)
+    buffer.seek(0)
+    buffer.truncate()
+
+
+def write_encrypted_backup(outfile, header, rows, password=None):
+    """
+    Write the header row and rows (an iterable of lists of strings) to the
+    binary file outfile, encrypted in chunks.  Returns the number of rows
+    written, excluding the header.
+    """
+    password = password or PASSWORD
+    outfile.write(FILE_HEADER)
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    count = 0
+    sequence = 0
+    rows = iter(rows)
+    # look one row ahead so the last chunk can be flagged as final
+    row = next(rows, None)
+    while True:
+        if row is not None:
+            writer.writerow(row)
+            count += 1
+            row = next(rows, None)
+        final = row is None
+        if final or buffer.tell() >= CHUNK_SIZE:
+            _write_chunk(outfile, buffer, password, sequence, final)
+            sequence += 1
+        if final:
+            return count
+
+
+def read_encrypted_backup(infile, password=None):
+    """
+    Yield the csv rows (including the header row) from a backup file written
+    by write_encrypted_backup, decrypting one chunk at a time.  Raises
+    BackupFileError if the file isn't a backup file, is truncated or has
+    chunks missing or out of order, and simplecrypt.DecryptionException if a
+    chunk fails authentication.
+    """
+    password = password or PASSWORD
+    if infile.read(len(FILE_HEADER)) != FILE_HEADER:
+        raise BackupFileError('Not an encrypted disclaimer backup file')
+    expected_sequence = 0
+    final = False
+    while True:
+        length = infile.read(_LENGTH.size)
+        if not length:
+            if not final:
+                raise BackupFileError('Backup file is truncated')
+            return
+        if final:
+            raise BackupFileError('Backup file has data after the final chunk')
+        if len(length) < _LENGTH.size:
+            raise BackupFileError('Backup file is truncated')
+        size = _LENGTH.unpack(length)[0]
+        data = infile.read(size)
+        if len(data) < size:
+            raise BackupFileError('Backup file is truncated')
+        data = decrypt(password, data)
+        sequence, final = _CHUNK_HEADER.unpack_from(data)
+        if sequence != expected_sequence:
+            raise BackupFileError(
+                'Backup file chunks are missing or out of order'
+            )
+        expected_sequence += 1
+        chunk = data[_CHUNK_HEADER.size:].decode('utf-8')
+        for row in csv.reader(StringIO(chunk, newline='')):
+            yield row
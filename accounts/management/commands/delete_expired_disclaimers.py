@@ -5,74 +5,91 @@ Delete both Print and Online disclaimers (there should only be one or the
 other, but check for both just in case)
 Email studio notification and note whether online or paper or both
 ActivityLog it
+
+Expired disclaimers are found with one query per table (excluding users with
+a recent paid booking) and deleted in bulk.
 '''
 import logging
 from datetime import timedelta
 
 from django.utils import timezone
-from django.contrib.auth.models import User
 from django.conf import settings
 from django.core.mail import send_mail
 from django.template.loader import get_template
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.db.models import Q
 
 from accounts.models import OnlineDisclaimer, PrintDisclaimer
+from booking.models import Booking
 from booking.email_helpers import send_support_email
-from activitylog.models import ActivityLog
+from activitylog.helpers import buffered_activity_log, log_activity
 
 
 logger = logging.getLogger(__name__)
 
+# number of user names to include in each activity log
+LOG_BATCH_SIZE = 100
+# number of disclaimers to delete per query, to stay within SQLite's limit of
+# 999 query parameters
+DELETE_BATCH_SIZE = 500
+
+
+def delete_disclaimers(queryset):
+    """
+    Delete the disclaimers in queryset, and return a list of dicts of their
+    user_id, first_name and last_name.  The delete sends the post_delete
+    signals, which clear the users' cached has_disclaimer values.
+    """
+    ids = []
+    users = []
+    for disclaimer_id, user_id, first_name, last_name in \
+            queryset.select_for_update()\
+            .order_by('user__first_name', 'user__last_name')\
+            .values_list(
+                'id', 'user_id', 'user__first_name', 'user__last_name'
+            ):
+        ids.append(disclaimer_id)
+        users.append({
+            'user_id': user_id, 'first_name': first_name,
+            'last_name': last_name
+        })
+    for i in range(0, len(ids), DELETE_BATCH_SIZE):
+        queryset.model.objects.filter(
+            id__in=ids[i:i + DELETE_BATCH_SIZE]
+        ).delete()
+    return users
+
 
 class Command(BaseCommand):
     help = 'Delete disclaimers for users who do not have a paid booking ' \
            'within the past year'
 
+    @buffered_activity_log()
     def handle(self, *args, **options):
 
-        # get relevant users
-
         expire_date = timezone.now() - timedelta(days=365)
 
-        expired_users = []
-
-        for user in User.objects.all():
-            if not user.bookings.exists():
-                expired_users.append(user)
-            else:
-                recent_bookings = [
-                    True for booking in user.bookings.all()
-                    if (booking.event.date > expire_date) and booking.paid
-                    ]
-                if not recent_bookings:
-                    expired_users.append(user)
+        # users with a paid booking for an event in the past year keep their
+        # disclaimers; used as a NOT IN subquery, so expired disclaimers are
+        # found with a single query per table
+        recent_paid_booking_users = Booking.objects.filter(
+            paid=True, event__date__gt=expire_date
+        ).values('user_id')
 
         old_print_disclaimers = PrintDisclaimer.objects.filter(
             date__lt=expire_date
-        )
+        ).exclude(user__in=recent_paid_booking_users)
         old_online_disclaimers = OnlineDisclaimer.objects.filter(
             Q(date__lt=expire_date) &
             (Q(date_updated__isnull=True) | Q(date_updated__lt=expire_date))
-        )
-        print_disclaimer_users_to_delete = old_print_disclaimers.filter(
-            user__in=expired_users
-        )
-        print_disclaimer_users = [
-            '{} {}'.format(disc.user.first_name, disc.user.last_name)
-            for disc in print_disclaimer_users_to_delete
-            ]
-
-        online_disclaimer_users_to_delete = old_online_disclaimers.filter(
-            user__in=expired_users
-        )
-        online_disclaimer_users = [
-            '{} {}'.format(disc.user.first_name, disc.user.last_name)
-            for disc in online_disclaimer_users_to_delete
-            ]
-
-        print_disclaimer_users_to_delete.delete()
-        online_disclaimer_users_to_delete.delete()
+        ).exclude(user__in=recent_paid_booking_users)
+
+        with transaction.atomic():
+            print_disclaimer_users = delete_disclaimers(old_print_disclaimers)
+            online_disclaimer_users = delete_disclaimers(
+                old_online_disclaimers
+            )
 
         if print_disclaimer_users or online_disclaimer_users:
             # email studio
@@ -101,18 +118,26 @@ class Command(BaseCommand):
                     e, __name__, "Automatic disclaimer deletion - studio email"
                 )
 
-            ActivityLog.objects.create(
-                log='Print disclaimers deleted for expired users: {}'.format(
-                    ', '.format(print_disclaimer_users)
-                )
-            )
-            ActivityLog.objects.create(
-                log='Online disclaimers deleted for expired users: {}'.format(
-                    ', '.format(online_disclaimer_users)
+            for disclaimer_type, users in [
+                ('Print', print_disclaimer_users),
+                ('Online', online_disclaimer_users)
+            ]:
+                for i in range(0, len(users), LOG_BATCH_SIZE):
+                    log_activity(
+                        '{} disclaimers deleted for expired users: {}'.format(
+                            disclaimer_type,
+                            ', '.join([
+                                '{} {}'.format(
+                                    user['first_name'], user['last_name']
+                                ) for user in users[i:i + LOG_BATCH_SIZE]
+                            ])
+                        )
+                    )
+            self.stdout.write(
+                '{} print and {} online disclaimers deleted'.format(
+                    len(print_disclaimer_users), len(online_disclaimer_users)
                 )
             )
         else:
             self.stdout.write('No disclaimers to delete')
-            ActivityLog.objects.create(
-                log='Delete disclaimers job run; no expired users'
-            )
+            log_activity('Delete disclaimers job run; no expired users')
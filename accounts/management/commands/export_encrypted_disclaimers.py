@@ -1,20 +1,88 @@
-import csv
 import logging
 import os
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.core.mail.message import EmailMessage
-from django.utils.encoding import smart_str
 
-from simplecrypt import encrypt
-
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
+from accounts.disclaimer_backup import PASSWORD, write_encrypted_backup
 from accounts.models import OnlineDisclaimer
 
 logger = logging.getLogger(__name__)
 
-PASSWORD = os.environ.get('SIMPLECRYPT_PASSWORD')
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S:%f %z'
+
+# larger backups are left on disk and the email gives their location instead
+MAX_ATTACHMENT_SIZE = 10 * 1024 * 1024
+
+HEADER = [
+    "ID",
+    "User",
+    "Date",
+    "Date Updated",
+    "Name (as stated on disclaimer)",
+    "DOB",
+    "Address",
+    "Postcode",
+    "Home Phone",
+    "Mobile Phone",
+    "Emergency Contact 1: Name",
+    "Emergency Contact 1: Relationship",
+    "Emergency Contact 1: Phone",
+    "Emergency Contact 2: Name",
+    "Emergency Contact 2: Relationship",
+    "Emergency Contact 2: Phone",
+    "Medical Conditions",
+    "Medical Conditions Details",
+    "Joint Problems",
+    "Joint Problems Details",
+    "Allergies",
+    "Allergies Details",
+    "Medical Treatment Terms",
+    "Medical Treatment Accepted",
+    "Disclaimer Terms",
+    "Disclaimer Terms Accepted",
+    "Over 18 Statement",
+    "Over 18 Confirmed",
+]
+
+# fields in the same order as HEADER
+FIELDS = [
+    'id', 'user__username', 'date', 'date_updated', 'name', 'dob', 'address',
+    'postcode', 'home_phone', 'mobile_phone', 'emergency_contact1_name',
+    'emergency_contact1_relationship', 'emergency_contact1_phone',
+    'emergency_contact2_name', 'emergency_contact2_relationship',
+    'emergency_contact2_phone', 'medical_conditions',
+    'medical_conditions_details', 'joint_problems', 'joint_problems_details',
+    'allergies', 'allergies_details', 'medical_treatment_terms',
+    'medical_treatment_permission', 'disclaimer_terms', 'terms_accepted',
+    'over_18_statement', 'age_over_18_confirmed',
+]
+
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    if hasattr(value, 'hour'):
+        return value.strftime(DATETIME_FORMAT)
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+
+def disclaimer_rows():
+    """
+    Yield each online disclaimer as a list of strings, streamed from the
+    database with the username joined in
+    """
+    disclaimers = OnlineDisclaimer.objects.order_by('id')\
+        .values_list(*FIELDS).iterator()
+    for values in disclaimers:
+        yield [format_value(value) for value in values]
+
 
 class Command(BaseCommand):
     help = 'Encrypt and export disclaimers data'
@@ -30,116 +98,46 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         outputfile = options.get('file')
 
-        output_text = []
-
-        output_text.append(
-            '@@@@@'.join(
-                [
-                    smart_str(u"ID"),
-                    smart_str(u"User"),
-                    smart_str(u"Date"),
-                    smart_str(u"Date Updated"),
-                    smart_str(u"Name (as stated on disclaimer)"),
-                    smart_str(u"DOB"),
-                    smart_str(u"Address"),
-                    smart_str(u"Postcode"),
-                    smart_str(u"Home Phone"),
-                    smart_str(u"Mobile Phone"),
-                    smart_str(u"Emergency Contact 1: Name"),
-                    smart_str(u"Emergency Contact 1: Relationship"),
-                    smart_str(u"Emergency Contact 1: Phone"),
-                    smart_str(u"Emergency Contact 2: Name"),
-                    smart_str(u"Emergency Contact 2: Relationship"),
-                    smart_str(u"Emergency Contact 2: Phone"),
-                    smart_str(u"Medical Conditions"),
-                    smart_str(u"Medical Conditions Details"),
-                    smart_str(u"Joint Problems"),
-                    smart_str(u"Joint Problems Details"),
-                    smart_str(u"Allergies"),
-                    smart_str(u"Allergies Details"),
-                    smart_str(u"Medical Treatment Terms"),
-                    smart_str(u"Medical Treatment Accepted"),
-                    smart_str(u"Disclaimer Terms"),
-                    smart_str(u"Disclaimer Terms Accepted"),
-                    smart_str(u"Over 18 Statement"),
-                    smart_str(u"Over 18 Confirmed")
-                ]
+        with open(outputfile, 'wb') as out:
+            count = write_encrypted_backup(
+                out, HEADER, disclaimer_rows(), PASSWORD
             )
-        )
 
-        for obj in OnlineDisclaimer.objects.all():
-            output_text.append(
-                '@@@@@'.join(
-                    [
-                        smart_str(obj.pk),
-                        smart_str(obj.user),
-                        smart_str(obj.date.strftime('%Y-%m-%d %H:%M:%S:%f %z')),
-                        smart_str(obj.date_updated.strftime(
-                            '%Y-%m-%d %H:%M:%S:%f %z') if obj.date_updated else ''
-                        ),
-                        smart_str(obj.name),
-                        smart_str(obj.dob.strftime('%Y-%m-%d')),
-                        smart_str(obj.address),
-                        smart_str(obj.postcode),
-                        smart_str(obj.home_phone),
-                        smart_str(obj.mobile_phone),
-                        smart_str(obj.emergency_contact1_name),
-                        smart_str(obj.emergency_contact1_relationship),
-                        smart_str(obj.emergency_contact1_phone),
-                        smart_str(obj.emergency_contact2_name),
-                        smart_str(obj.emergency_contact2_relationship),
-                        smart_str(obj.emergency_contact2_phone),
-                        smart_str('Yes' if obj.medical_conditions else 'No'),
-                        smart_str(obj.medical_conditions_details),
-                        smart_str('Yes' if obj.joint_problems else 'No'),
-                        smart_str(obj.joint_problems_details),
-                        smart_str('Yes' if obj.allergies else 'No'),
-                        smart_str(obj.allergies_details),
-                        smart_str(obj.medical_treatment_terms),
-                        smart_str('Yes' if obj.medical_treatment_permission else 'No'),
-                        smart_str(obj.disclaimer_terms),
-                        smart_str('Yes' if obj.terms_accepted else 'No'),
-                        smart_str(obj.over_18_statement),
-                        smart_str('Yes' if obj.age_over_18_confirmed else 'No'),
+        subject = '{} disclaimer backup'.format(
+            settings.ACCOUNT_EMAIL_SUBJECT_PREFIX
+        )
+        try:
+            if os.path.getsize(outputfile) <= MAX_ATTACHMENT_SIZE:
+                with open(outputfile, 'rb') as file:
+                    attachments = [
+                        (os.path.split(outputfile)[1], file.read(),
+                         'bytes/bytes')
                     ]
-                )
+                body = 'Encrypted disclaimer back up file attached. ' \
+                    '{} records.'.format(count)
+            else:
+                attachments = []
+                body = 'Encrypted disclaimer back up file is too large to ' \
+                    'attach; it has been saved to {}. {} records.'.format(
+                        outputfile, count
+                    )
+            msg = EmailMessage(
+                subject, body, settings.DEFAULT_FROM_EMAIL,
+                to=[settings.SUPPORT_EMAIL], attachments=attachments
             )
-
-        output_str = '&&&&&'.join(output_text)
-
-        with open(outputfile, 'wb') as out:
-            out.write(encrypt(PASSWORD, output_str))
-
-        with open(outputfile, 'rb') as file:
-            filename = os.path.split(outputfile)[1]
-            try:
-                msg = EmailMessage(
-                    '{} disclaimer backup'.format(
-                        settings.ACCOUNT_EMAIL_SUBJECT_PREFIX
-                    ),
-                    'Encrypted disclaimer back up file attached. '
-                    '{} records.'.format(OnlineDisclaimer.objects.count()),
-                    settings.DEFAULT_FROM_EMAIL,
-                    to=[settings.SUPPORT_EMAIL],
-                    attachments=[(filename, file.read(), 'bytes/bytes')]
-                )
-                msg.send(fail_silently=False)
-            except:
-                pass
+            msg.send(fail_silently=False)
+        except:
+            pass
 
         self.stdout.write(
             '{} disclaimer records encrypted and written to {}'.format(
-                OnlineDisclaimer.objects.count(), outputfile
+                count, outputfile
             )
         )
 
         logger.info(
-            '{} disclaimer records encrypted and backed up'.format(
-                OnlineDisclaimer.objects.count()
-            )
+            '{} disclaimer records encrypted and backed up'.format(count)
         )
-        ActivityLog.objects.create(
-            log='{} disclaimer records encrypted and backed up'.format(
-                OnlineDisclaimer.objects.count()
-            )
+        log_activity(
+            '{} disclaimer records encrypted and backed up'.format(count)
         )
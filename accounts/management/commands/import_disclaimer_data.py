@@ -5,8 +5,10 @@ import os
 
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.utils.encoding import smart_str
 
+from accounts.disclaimer_backup import PASSWORD, read_encrypted_backup
 from accounts.models import OnlineDisclaimer, PrintDisclaimer
 from booking.email_helpers import send_support_email
 from activitylog.models import ActivityLog
@@ -16,21 +18,36 @@ logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
-    help = 'Import disclaimer data from decrypted csv backup file'
+    help = 'Import disclaimer data from decrypted csv backup file, or from ' \
+           'an encrypted backup made by export_encrypted_disclaimers'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--file',
             help='File path of input file'
         )
+        parser.add_argument(
+            '--encrypted',
+            action='store_true',
+            dest='encrypted',
+            default=False,
+            help='Input file is an encrypted backup; it is decrypted a '
+                 'chunk at a time as it is imported'
+        )
 
     def handle(self, *args, **options):
 
         inputfilepath = options.get('file')
+        encrypted = options['encrypted']
 
-        with open(inputfilepath, 'r') as file:
-            reader = csv.reader(file)
-            # rows = list(reader)
+        # a backup that turns out to be truncated or corrupt part way
+        # through imports nothing
+        with open(inputfilepath, 'rb' if encrypted else 'r') as file, \
+                transaction.atomic():
+            if encrypted:
+                reader = read_encrypted_backup(file, PASSWORD)
+            else:
+                reader = csv.reader(file)
 
             for i, row in enumerate(reader):
                 if i == 0:
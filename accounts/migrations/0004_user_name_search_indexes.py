@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# indexes for case insensitive prefix searches (istartswith) on user names,
+# used by the studioadmin user autocomplete; django queries these on
+# PostgreSQL as UPPER(column) LIKE UPPER('word%')
+SEARCH_FIELDS = ['first_name', 'last_name', 'username']
+
+POSTGRES_INDEX_SQL = [
+    'CREATE INDEX auth_user_{0}_upper_like ON auth_user '
+    '(UPPER("{0}") varchar_pattern_ops)'.format(field)
+    for field in SEARCH_FIELDS
+]
+
+POSTGRES_REVERSE_SQL = [
+    'DROP INDEX IF EXISTS auth_user_{}_upper_like'.format(field)
+    for field in SEARCH_FIELDS
+]
+
+
+def _run_sql(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_indexes(apps, schema_editor):
+    # other databases don't support expression indexes for LIKE, so searches
+    # scan the (small, local) user table
+    if schema_editor.connection.vendor == 'postgresql':
+        _run_sql(schema_editor, POSTGRES_INDEX_SQL)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _run_sql(schema_editor, POSTGRES_REVERSE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_auto_20160217_0817'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_search_indexes, reverse_code=drop_search_indexes
+        ),
+    ]
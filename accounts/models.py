@@ -4,10 +4,16 @@ import logging
 import pytz
 
 from django.db import models
-from django.contrib.auth.models import User
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
 from django.utils import timezone
 
-from activitylog.models import ActivityLog
+from accounts.auth_cache import bump_generation, invalidate_user
+from activitylog.helpers import log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -143,8 +149,8 @@ class OnlineDisclaimer(models.Model):
             self.over_18_statement = OVER_18_TERMS
             self.medical_treatment_terms = MEDICAL_TREATMENT_TERMS
 
-            ActivityLog.objects.create(
-                log="Online disclaimer created: {}".format(self.__str__())
+            log_activity(
+                "Online disclaimer created: {}".format(self.__str__())
             )
         super(OnlineDisclaimer, self).save()
 
@@ -158,3 +164,98 @@ class PrintDisclaimer(models.Model):
                 pytz.timezone('Europe/London')
             ).strftime('%d %b %Y, %H:%M'))
 
+
+def has_disclaimer_cache_key(user_id):
+    return 'user_%s_has_disclaimer' % str(user_id)
+
+
+def has_disclaimer(self):
+    """
+    Whether the user has an online or print disclaimer.  Memoized on the user
+    instance (request.user is a single instance for the whole request) and
+    cached for other requests; the cache is cleared when a disclaimer is
+    saved or deleted.
+    """
+    if not hasattr(self, '_has_disclaimer'):
+        if hasattr(self, 'user_has_online_disclaimer') and \
+                hasattr(self, 'user_has_print_disclaimer'):
+            # annotated by booking.context_helpers.annotate_user_flags
+            self._has_disclaimer = bool(self.user_has_online_disclaimer) or \
+                bool(self.user_has_print_disclaimer)
+        else:
+            key = has_disclaimer_cache_key(self.id)
+            disclaimer = cache.get(key)
+            if disclaimer is None:
+                disclaimer = OnlineDisclaimer.objects.filter(
+                    user=self
+                ).exists() or PrintDisclaimer.objects.filter(
+                    user=self
+                ).exists()
+                cache.set(key, disclaimer, 1800)
+            self._has_disclaimer = disclaimer
+    return self._has_disclaimer
+
+
+User.add_to_class("has_disclaimer", has_disclaimer)
+
+
+@receiver(post_save, sender=OnlineDisclaimer)
+@receiver(post_delete, sender=OnlineDisclaimer)
+@receiver(post_save, sender=PrintDisclaimer)
+@receiver(post_delete, sender=PrintDisclaimer)
+def clear_has_disclaimer_cache(sender, instance, **kwargs):
+    cache.delete(has_disclaimer_cache_key(instance.user_id))
+    # also reset the memoized value if the disclaimer's user is loaded
+    user = getattr(instance, '_user_cache', None)
+    if user is not None and hasattr(user, '_has_disclaimer'):
+        del user._has_disclaimer
+
+
+# Permission and group changes make the user's cached authorization checks
+# (accounts.auth_cache) stale
+
+def _group_user_ids(group_ids):
+    return User.objects.filter(groups__id__in=group_ids)\
+        .values_list('id', flat=True)
+
+
+@receiver(post_save, sender=User)
+def bump_auth_generation_on_user_save(sender, instance, **kwargs):
+    invalidate_user(instance)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def bump_auth_generation_on_user_m2m_change(
+        sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_user(instance)
+    elif action == 'pre_clear':
+        # instance is the group/permission; pk_set is not sent for clear()
+        bump_generation(*instance.user_set.values_list('id', flat=True))
+    elif pk_set:
+        bump_generation(*pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def bump_auth_generation_on_group_permissions_change(
+        sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        bump_generation(*_group_user_ids([instance.id]))
+    elif action == 'pre_clear':
+        bump_generation(
+            *_group_user_ids(instance.group_set.values_list('id', flat=True))
+        )
+    elif pk_set:
+        bump_generation(*_group_user_ids(pk_set))
+
+
+@receiver(pre_delete, sender=Group)
+def bump_auth_generation_on_group_delete(sender, instance, **kwargs):
+    bump_generation(*_group_user_ids([instance.id]))
@@ -1,28 +1,40 @@
 import csv
 import os
+import shutil
+import struct
+import tempfile
 
 from datetime import date, datetime, timedelta
+from io import BytesIO
 from mock import Mock, patch
 from model_mommy import mommy
 
 from django.conf import settings
 from django.core import management, mail
+from django.core.cache import cache
 from django.test import TestCase, override_settings
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import User, Group, Permission
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from allauth.account.models import EmailAddress
 
+from accounts import auth_cache
+from accounts.disclaimer_backup import BackupFileError, FILE_HEADER, \
+    read_encrypted_backup, write_encrypted_backup
 from accounts.forms import SignupForm, DisclaimerForm
 from accounts.management.commands.import_disclaimer_data import logger as \
     import_disclaimer_data_logger
 from accounts.management.commands.export_encrypted_disclaimers import EmailMessage
 from accounts.models import PrintDisclaimer, OnlineDisclaimer, \
-    DISCLAIMER_TERMS, MEDICAL_TREATMENT_TERMS, OVER_18_TERMS
+    DISCLAIMER_TERMS, MEDICAL_TREATMENT_TERMS, OVER_18_TERMS, \
+    has_disclaimer_cache_key
 from accounts.views import ProfileUpdateView, profile, DisclaimerCreateView
 
+from activitylog.models import ActivityLog
 from booking.models import Booking
 from booking.tests.helpers import set_up_fb, _create_session, TestSetupMixin
 
@@ -348,6 +360,131 @@ class DisclaimerModelTests(TestCase):
             disclaimer.save()
 
 
+class UserHasDisclaimerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = mommy.make_recipe('booking.user')
+
+    def test_has_disclaimer(self):
+        self.assertFalse(self.user.has_disclaimer())
+
+        online_user = mommy.make_recipe('booking.user')
+        mommy.make(OnlineDisclaimer, user=online_user)
+        self.assertTrue(online_user.has_disclaimer())
+
+        print_user = mommy.make_recipe('booking.user')
+        mommy.make(PrintDisclaimer, user=print_user)
+        self.assertTrue(print_user.has_disclaimer())
+
+    def test_has_disclaimer_memoized_and_cached(self):
+        mommy.make(PrintDisclaimer, user=self.user)
+        with self.assertNumQueries(2):
+            self.assertTrue(self.user.has_disclaimer())
+        with self.assertNumQueries(0):
+            self.assertTrue(self.user.has_disclaimer())
+        self.assertTrue(cache.get(has_disclaimer_cache_key(self.user.id)))
+
+        # a new instance of the user (e.g. in a later request) reads the cache
+        user = User.objects.get(id=self.user.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_disclaimer())
+
+    def test_cache_cleared_when_disclaimer_created(self):
+        self.assertFalse(self.user.has_disclaimer())
+        mommy.make(OnlineDisclaimer, user=self.user)
+        self.assertIsNone(cache.get(has_disclaimer_cache_key(self.user.id)))
+        self.assertTrue(self.user.has_disclaimer())
+        self.assertTrue(
+            User.objects.get(id=self.user.id).has_disclaimer()
+        )
+
+    def test_cache_cleared_when_disclaimer_deleted(self):
+        disclaimer = mommy.make(PrintDisclaimer, user=self.user)
+        self.assertTrue(self.user.has_disclaimer())
+        disclaimer.delete()
+        self.assertIsNone(cache.get(has_disclaimer_cache_key(self.user.id)))
+        self.assertFalse(
+            User.objects.get(id=self.user.id).has_disclaimer()
+        )
+
+
+class AuthCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = mommy.make_recipe('booking.user')
+        self.group = mommy.make(Group, name='instructors')
+        self.perm = Permission.objects.get(codename='is_regular_student')
+
+    def _fresh_user(self):
+        return User.objects.get(id=self.user.id)
+
+    def test_checks_cached(self):
+        user = self._fresh_user()
+        with self.assertNumQueries(1):
+            self.assertFalse(auth_cache.in_group(user, 'instructors'))
+        # memoized on the instance
+        with self.assertNumQueries(0):
+            self.assertFalse(auth_cache.in_group(user, 'instructors'))
+        # and cached for other instances
+        user = self._fresh_user()
+        with self.assertNumQueries(0):
+            self.assertFalse(auth_cache.in_group(user, 'instructors'))
+
+    def test_adding_user_to_group_invalidates_cache(self):
+        self.assertFalse(auth_cache.in_group(self.user, 'instructors'))
+        self.user.groups.add(self.group)
+        self.assertTrue(auth_cache.in_group(self.user, 'instructors'))
+        self.assertTrue(
+            auth_cache.is_instructor_or_staff(self._fresh_user())
+        )
+
+        self.group.user_set.remove(self.user)
+        self.assertFalse(
+            auth_cache.in_group(self._fresh_user(), 'instructors')
+        )
+
+    def test_user_permission_change_invalidates_cache(self):
+        self.assertFalse(
+            auth_cache.has_perm(self.user, 'booking.is_regular_student')
+        )
+        self.user.user_permissions.add(self.perm)
+        self.assertTrue(
+            auth_cache.has_perm(
+                self._fresh_user(), 'booking.is_regular_student'
+            )
+        )
+
+    def test_group_permission_change_invalidates_cache_for_group_users(self):
+        self.user.groups.add(self.group)
+        self.assertFalse(
+            auth_cache.has_perm(
+                self._fresh_user(), 'booking.is_regular_student'
+            )
+        )
+        self.group.permissions.add(self.perm)
+        self.assertTrue(
+            auth_cache.has_perm(
+                self._fresh_user(), 'booking.is_regular_student'
+            )
+        )
+
+    def test_saving_user_invalidates_cache(self):
+        self.assertFalse(auth_cache.is_staff(self.user))
+        self.user.is_staff = True
+        self.user.save()
+        self.assertTrue(auth_cache.is_staff(self.user))
+        self.assertTrue(auth_cache.is_staff(self._fresh_user()))
+
+    def test_generation_set_if_missing(self):
+        self.assertFalse(auth_cache.is_staff(self.user))
+        cache.delete('user_%s_auth_generation' % self.user.id)
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        auth_cache.bump_generation(self.user.id)
+        self.assertTrue(auth_cache.is_staff(self._fresh_user()))
+
+
 class DisclaimerCreateViewTests(TestSetupMixin, TestCase):
 
     def setUp(self):
@@ -526,6 +663,23 @@ class DeleteExpiredDisclaimersTests(TestCase):
         self.assertEqual(OnlineDisclaimer.objects.count(), 0)
         self.assertEqual(PrintDisclaimer.objects.count(), 0)
 
+    def test_cached_has_disclaimer_cleared_for_deleted_disclaimers(self):
+        cache.clear()
+        for user in [
+            self.user_online_only, self.user_print_only, self.user_both
+        ]:
+            self.assertTrue(
+                User.objects.get(id=user.id).has_disclaimer()
+            )
+        management.call_command('delete_expired_disclaimers')
+        for user in [
+            self.user_online_only, self.user_print_only, self.user_both
+        ]:
+            self.assertIsNone(cache.get(has_disclaimer_cache_key(user.id)))
+            self.assertFalse(
+                User.objects.get(id=user.id).has_disclaimer()
+            )
+
     def test_disclaimers_deleted_if_no_paid_booking_in_past_year(self):
         self.assertEqual(OnlineDisclaimer.objects.count(), 2)
         self.assertEqual(PrintDisclaimer.objects.count(), 2)
@@ -700,6 +854,78 @@ class DeleteExpiredDisclaimersTests(TestCase):
         self.assertEqual(PrintDisclaimer.objects.count(), 2)
         self.assertEqual(len(mail.outbox), 0)
 
+    def test_summary_email_and_activity_logs(self):
+        management.call_command('delete_expired_disclaimers')
+
+        self.assertEqual(len(mail.outbox), 1)
+        body = mail.outbox[0].body
+        for user in [
+            self.user_online_only, self.user_print_only, self.user_both
+        ]:
+            self.assertIn(
+                '- {} {}'.format(user.first_name, user.last_name), body
+            )
+
+        print_log = ActivityLog.objects.get(
+            log__startswith='Print disclaimers deleted'
+        )
+        for user in [self.user_print_only, self.user_both]:
+            self.assertIn(
+                '{} {}'.format(user.first_name, user.last_name), print_log.log
+            )
+        online_log = ActivityLog.objects.get(
+            log__startswith='Online disclaimers deleted'
+        )
+        for user in [self.user_online_only, self.user_both]:
+            self.assertIn(
+                '{} {}'.format(user.first_name, user.last_name),
+                online_log.log
+            )
+
+    def test_number_of_queries(self):
+        with CaptureQueriesContext(connection) as initial_queries:
+            management.call_command('delete_expired_disclaimers')
+
+        for user in mommy.make_recipe('booking.user', _quantity=10):
+            mommy.make(
+                OnlineDisclaimer, user=user,
+                date=timezone.now() - timedelta(370)
+            )
+            mommy.make(
+                PrintDisclaimer, user=user,
+                date=timezone.now() - timedelta(370)
+            )
+            mommy.make_recipe(
+                'booking.booking', user=user, paid=True,
+                event__date=timezone.now() - timedelta(400)
+            )
+        with CaptureQueriesContext(connection) as queries:
+            management.call_command('delete_expired_disclaimers')
+        self.assertEqual(len(queries), len(initial_queries))
+        self.assertFalse(OnlineDisclaimer.objects.exists())
+        self.assertFalse(PrintDisclaimer.objects.exists())
+
+
+    @patch(
+        'accounts.management.commands.delete_expired_disclaimers.'
+        'DELETE_BATCH_SIZE', 2
+    )
+    def test_disclaimers_deleted_in_batches(self):
+        mommy.make(
+            OnlineDisclaimer, date=timezone.now() - timedelta(370),
+            _quantity=3
+        )
+        with CaptureQueriesContext(connection) as queries:
+            management.call_command('delete_expired_disclaimers')
+        online_deletes = [
+            query for query in queries if query['sql'].startswith(
+                'DELETE FROM "accounts_onlinedisclaimer"'
+            )
+        ]
+        # 5 online disclaimers, in batches of 2
+        self.assertEqual(len(online_deletes), 3)
+        self.assertFalse(OnlineDisclaimer.objects.exists())
+        self.assertFalse(PrintDisclaimer.objects.exists())
 
 @override_settings(LOG_FOLDER=os.path.dirname(__file__))
 class ExportDisclaimersTests(TestCase):
@@ -752,9 +978,27 @@ class ExportEncryptedDisclaimersTests(TestCase):
         self.assertEqual(len(mail.outbox), 1)
         email = mail.outbox[0]
         self.assertEqual(email.to, [settings.SUPPORT_EMAIL])
+        self.assertEqual(email.attachments[0][0], 'disclaimers.bu')
+        with open(bu_file, 'rb') as backup:
+            self.assertEqual(email.attachments[0][1], backup.read())
 
         os.unlink(bu_file)
 
+    @patch(
+        'accounts.management.commands.export_encrypted_disclaimers.'
+        'MAX_ATTACHMENT_SIZE', 10
+    )
+    def test_large_backup_not_attached(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        bu_file = os.path.join(tmpdir, 'disclaimers.bu')
+        management.call_command('export_encrypted_disclaimers', file=bu_file)
+
+        self.assertEqual(len(mail.outbox), 1)
+        email = mail.outbox[0]
+        self.assertEqual(email.attachments, [])
+        self.assertIn(bu_file, email.body)
+
     @patch.object(EmailMessage, 'send')
     def test_email_errors(self, mock_send):
         mock_send.side_effect = Exception('Error sending mail')
@@ -932,6 +1176,166 @@ class ImportDisclaimersTests(TestCase):
         self.assertIsNotNone(test_1_disclaimer.over_18_statement)
         self.assertTrue(test_1_disclaimer.age_over_18_confirmed)
 
+    @patch('accounts.disclaimer_backup.CHUNK_SIZE', 1)
+    def test_import_encrypted_backup(self):
+        # export in chunks of one row each and import the backup again
+        for username in ['test_1', 'test_2']:
+            mommy.make(
+                OnlineDisclaimer, user__username=username,
+                name='Name of {}'.format(username), home_phone=None,
+                address='1 Test Road,\nTest Town', medical_conditions=True,
+                medical_conditions_details='"Quoted", with comma',
+                date_updated=timezone.now()
+            )
+        exported = {
+            disclaimer.user.username: disclaimer
+            for disclaimer in OnlineDisclaimer.objects.select_related('user')
+        }
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        bu_file = os.path.join(tmpdir, 'disclaimers.bu')
+
+        with override_settings(LOG_FOLDER=tmpdir):
+            with CaptureQueriesContext(connection) as queries:
+                management.call_command('export_encrypted_disclaimers')
+        # disclaimers and their users are read in one query
+        self.assertEqual(
+            len([
+                query for query in queries
+                if query['sql'].startswith('SELECT')
+            ]), 1
+        )
+
+        # header row and first disclaimer, then second disclaimer
+        with open(bu_file, 'rb') as backup:
+            self.assertEqual(backup.read(len(FILE_HEADER)), FILE_HEADER)
+            chunks = 0
+            length = backup.read(4)
+            while length:
+                backup.seek(struct.unpack('>I', length)[0], os.SEEK_CUR)
+                chunks += 1
+                length = backup.read(4)
+        self.assertEqual(chunks, 2)
+
+        OnlineDisclaimer.objects.all().delete()
+        management.call_command(
+            'import_disclaimer_data', file=bu_file, encrypted=True
+        )
+
+        self.assertEqual(OnlineDisclaimer.objects.count(), 2)
+        for disclaimer in OnlineDisclaimer.objects.select_related('user'):
+            original = exported[disclaimer.user.username]
+            for field in [
+                'date', 'date_updated', 'name', 'dob', 'address', 'postcode',
+                'mobile_phone', 'medical_conditions',
+                'medical_conditions_details', 'joint_problems',
+                'medical_treatment_permission', 'terms_accepted',
+                'age_over_18_confirmed'
+            ]:
+                self.assertEqual(
+                    getattr(disclaimer, field), getattr(original, field)
+                )
+            self.assertEqual(disclaimer.home_phone, '')
+
+    @patch('accounts.disclaimer_backup.encrypt', lambda password, data: data)
+    @patch('accounts.disclaimer_backup.decrypt', lambda password, data: data)
+    @patch('accounts.disclaimer_backup.CHUNK_SIZE', 1)
+    def test_import_truncated_backup(self):
+        mommy.make(OnlineDisclaimer, _quantity=2)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        bu_file = os.path.join(tmpdir, 'disclaimers.bu')
+        with override_settings(LOG_FOLDER=tmpdir):
+            management.call_command('export_encrypted_disclaimers')
+
+        # drop the final chunk
+        with open(bu_file, 'rb') as backup:
+            data = backup.read()
+        first_chunk_end = len(FILE_HEADER) + 4 + struct.unpack(
+            '>I', data[len(FILE_HEADER):len(FILE_HEADER) + 4]
+        )[0]
+        with open(bu_file, 'wb') as backup:
+            backup.write(data[:first_chunk_end])
+
+        OnlineDisclaimer.objects.all().delete()
+        with self.assertRaisesRegex(BackupFileError, 'truncated'):
+            management.call_command(
+                'import_disclaimer_data', file=bu_file, encrypted=True
+            )
+        # rows from the chunk that was read are not imported either
+        self.assertFalse(OnlineDisclaimer.objects.exists())
+
+    def test_import_encrypted_backup_invalid_file(self):
+        with self.assertRaises(BackupFileError):
+            management.call_command(
+                'import_disclaimer_data', file=self.bu_file, encrypted=True
+            )
+
+
+class DisclaimerBackupTests(TestCase):
+
+    def setUp(self):
+        # simplecrypt is deliberately slow; these tests check how the chunks
+        # are framed, not the encryption
+        for name in ['encrypt', 'decrypt']:
+            patcher = patch(
+                'accounts.disclaimer_backup.{}'.format(name),
+                lambda password, data: data
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # header and first row, then one chunk for each other row
+        backup = BytesIO()
+        with patch('accounts.disclaimer_backup.CHUNK_SIZE', 1):
+            write_encrypted_backup(
+                backup, ['header'], [['row 1'], ['row 2'], ['row 3']], 'test'
+            )
+        backup.seek(len(FILE_HEADER))
+        self.chunks = []
+        length = backup.read(4)
+        while length:
+            self.chunks.append(
+                length + backup.read(struct.unpack('>I', length)[0])
+            )
+            length = backup.read(4)
+
+    def _read(self, chunks):
+        return list(
+            read_encrypted_backup(
+                BytesIO(FILE_HEADER + b''.join(chunks)), 'test'
+            )
+        )
+
+    def test_read_backup(self):
+        self.assertEqual(len(self.chunks), 3)
+        self.assertEqual(
+            self._read(self.chunks),
+            [['header'], ['row 1'], ['row 2'], ['row 3']]
+        )
+
+    def test_truncated_at_chunk_boundary(self):
+        with self.assertRaisesRegex(BackupFileError, 'truncated'):
+            self._read(self.chunks[:2])
+
+    def test_chunks_missing_or_reordered(self):
+        with self.assertRaisesRegex(BackupFileError, 'out of order'):
+            self._read([self.chunks[0], self.chunks[2]])
+        with self.assertRaisesRegex(BackupFileError, 'out of order'):
+            self._read([self.chunks[1], self.chunks[0], self.chunks[2]])
+
+    def test_data_after_final_chunk(self):
+        with self.assertRaisesRegex(BackupFileError, 'final chunk'):
+            self._read(self.chunks + [self.chunks[0]])
+
+    def test_no_rows(self):
+        backup = BytesIO()
+        write_encrypted_backup(backup, ['header'], [], 'test')
+        backup.seek(0)
+        self.assertEqual(
+            list(read_encrypted_backup(backup, 'test')), [['header']]
+        )
+
 
 class EmailDuplicateUsersTests(TestCase):
 
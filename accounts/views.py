@@ -15,7 +15,7 @@ from allauth.account.views import LoginView
 
 from accounts.forms import DisclaimerForm
 
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 def profile(request):
@@ -138,8 +138,8 @@ def subscribe_view(request):
             messages.success(
                 request, 'You have been subscribed to the mailing list'
             )
-            ActivityLog.objects.create(
-                log='User {} {} ({}) has subscribed to the mailing list'.format(
+            log_activity(
+                'User {} {} ({}) has subscribed to the mailing list'.format(
                     request.user.first_name, request.user.last_name,
                     request.user.username
                 )
@@ -147,8 +147,8 @@ def subscribe_view(request):
         elif 'unsubscribe' in request.POST:
             group.user_set.remove(request.user)
             messages.success(request, 'You have been unsubscribed from the mailing list')
-            ActivityLog.objects.create(
-                log='User {} {} ({}) has unsubscribed from the mailing list'.format(
+            log_activity(
+                'User {} {} ({}) has unsubscribed from the mailing list'.format(
                     request.user.first_name, request.user.last_name,
                     request.user.username
                 )
@@ -2,7 +2,8 @@ from django.contrib import admin
 from activitylog.models import ActivityLog
 
 class ActivityLogAdmin(admin.ModelAdmin):
-    list_display = ('timestamp_formatted', 'log')
+    list_display = ('timestamp_formatted', 'log', 'action')
+    list_filter = ('action', 'object_type')
     search_fields = ('log',)
 
     def timestamp_formatted(self, obj):
@@ -0,0 +1,105 @@
+import threading
+
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+from activitylog.models import ActivityLog, EMPTY_CRON_LOGS
+
+
+_local = threading.local()
+
+
+class _Buffer(list):
+
+    def __init__(self):
+        super(_Buffer, self).__init__()
+        # a buffer opened outside a transaction must not hold logs for work
+        # that is later rolled back
+        self.in_atomic_block = connection.in_atomic_block
+
+
+def _buffers():
+    if not hasattr(_local, 'buffers'):
+        _local.buffers = []
+    return _local.buffers
+
+
+def _add(entry):
+    buffers = _buffers()
+    if buffers:
+        buffers[-1].append(entry)
+    else:
+        entry.save()
+
+
+def log_activity(log, actor=None, obj=None, action=''):
+    """
+    Record an activity log.  Inside buffered_activity_log() (i.e. during a
+    request or a management command that uses it) the log is held in memory
+    and written with the rest of the buffered logs in a single bulk insert;
+    otherwise it is saved immediately.  If the buffer was opened outside a
+    transaction, logs made inside one are only buffered once it commits.
+    """
+    entry = ActivityLog(
+        log=log, action=action,
+        actor_id=getattr(actor, 'pk', None),
+        object_type=obj._meta.label_lower if obj is not None else '',
+        object_id=obj.pk if obj is not None else None,
+        # bulk created logs don't go through ActivityLog.save
+        empty_cron=log in EMPTY_CRON_LOGS
+    )
+    buffers = _buffers()
+    if (buffers and connection.in_atomic_block and
+            not buffers[-1].in_atomic_block):
+        transaction.on_commit(lambda: _add(entry))
+    else:
+        _add(entry)
+    return entry
+
+
+def start_buffer():
+    _buffers().append(_Buffer())
+
+
+def reset_buffers():
+    """
+    Drop any buffers left open on this thread, e.g. by a request that never
+    reached the end of the middleware.
+    """
+    _local.buffers = []
+
+
+def flush_buffer(discard=False):
+    """
+    Close the innermost buffer and write its logs.  Logs from a nested buffer
+    are passed on to the enclosing one so they are written together.
+    """
+    buffers = _buffers()
+    if not buffers:
+        return
+    entries = buffers.pop()
+    if discard or not entries:
+        return
+    if buffers:
+        buffers[-1].extend(entries)
+    else:
+        ActivityLog.objects.bulk_create(entries)
+
+
+@contextmanager
+def buffered_activity_log():
+    """
+    Collect logs made with log_activity and write them in one insert on exit.
+    Can also be used as a decorator, e.g. on a management command's handle.
+    """
+    start_buffer()
+    try:
+        yield
+    except BaseException:
+        # if the database transaction is broken the logs can't be saved (and
+        # the changes they describe are being rolled back anyway)
+        flush_buffer(discard=connection.needs_rollback)
+        raise
+    else:
+        flush_buffer()
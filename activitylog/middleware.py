@@ -0,0 +1,29 @@
+from django.db import connection
+
+from activitylog.helpers import flush_buffer, reset_buffers, start_buffer
+
+
+class ActivityLogMiddleware(object):
+    """
+    Buffer activity logs made during a request and write them all at the end
+    """
+
+    def process_request(self, request):
+        # the thread may still hold the buffer of an earlier request whose
+        # response was never processed
+        reset_buffers()
+        start_buffer()
+        request._activity_log_buffered = True
+
+    def process_exception(self, request, exception):
+        if getattr(request, '_activity_log_buffered', False):
+            request._activity_log_buffered = False
+            flush_buffer(discard=connection.needs_rollback)
+
+    def process_response(self, request, response):
+        # process_request may not have been called if an earlier middleware
+        # returned a response
+        if getattr(request, '_activity_log_buffered', False):
+            request._activity_log_buffered = False
+            flush_buffer()
+        return response
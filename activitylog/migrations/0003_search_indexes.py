@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.1 on 2026-10-18 20:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+EMPTY_CRON_LOGS = [
+    'email_warnings job run; no unpaid booking warnings to send',
+    'cancel_unpaid_bookings job run; no bookings to cancel',
+    'deleted_unconfirmed_bookings job run; no bookings to cancel',
+    'email_ticket_booking_warnings job run; no unpaid booking warnings to send',
+    'cancel_unpaid_ticket_bookings job run; no bookings to cancel'
+]
+
+
+POSTGRES_SEARCH_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE activitylog_activitylog ADD COLUMN search_vector tsvector",
+    "UPDATE activitylog_activitylog "
+    "SET search_vector = to_tsvector('simple', log)",
+    "CREATE TRIGGER activitylog_search_vector_update "
+    "BEFORE INSERT OR UPDATE OF log ON activitylog_activitylog "
+    "FOR EACH ROW EXECUTE PROCEDURE "
+    "tsvector_update_trigger(search_vector, 'pg_catalog.simple', log)",
+    "CREATE INDEX activitylog_search_vector_idx "
+    "ON activitylog_activitylog USING gin(search_vector)",
+    # for substring matches (log ILIKE) in activitylog.search
+    "CREATE INDEX activitylog_log_trgm_idx "
+    "ON activitylog_activitylog USING gin(log gin_trgm_ops)",
+]
+
+POSTGRES_REVERSE_SQL = [
+    "DROP INDEX IF EXISTS activitylog_log_trgm_idx",
+    "DROP TRIGGER IF EXISTS activitylog_search_vector_update "
+    "ON activitylog_activitylog",
+    "ALTER TABLE activitylog_activitylog DROP COLUMN IF EXISTS search_vector",
+]
+
+# external content FTS5 table kept in sync with the activitylog table by
+# triggers
+SQLITE_SEARCH_SQL = [
+    "CREATE VIRTUAL TABLE activitylog_activitylog_fts USING fts5("
+    "log, content='activitylog_activitylog', content_rowid='id')",
+    "CREATE TRIGGER activitylog_fts_insert AFTER INSERT "
+    "ON activitylog_activitylog BEGIN "
+    "INSERT INTO activitylog_activitylog_fts(rowid, log) "
+    "VALUES (new.id, new.log); END",
+    "CREATE TRIGGER activitylog_fts_delete AFTER DELETE "
+    "ON activitylog_activitylog BEGIN "
+    "INSERT INTO activitylog_activitylog_fts"
+    "(activitylog_activitylog_fts, rowid, log) "
+    "VALUES ('delete', old.id, old.log); END",
+    "CREATE TRIGGER activitylog_fts_update AFTER UPDATE OF log "
+    "ON activitylog_activitylog BEGIN "
+    "INSERT INTO activitylog_activitylog_fts"
+    "(activitylog_activitylog_fts, rowid, log) "
+    "VALUES ('delete', old.id, old.log); "
+    "INSERT INTO activitylog_activitylog_fts(rowid, log) "
+    "VALUES (new.id, new.log); END",
+    "INSERT INTO activitylog_activitylog_fts(activitylog_activitylog_fts) "
+    "VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS activitylog_fts_insert",
+    "DROP TRIGGER IF EXISTS activitylog_fts_delete",
+    "DROP TRIGGER IF EXISTS activitylog_fts_update",
+    "DROP TABLE IF EXISTS activitylog_activitylog_fts",
+]
+
+
+def set_empty_cron(apps, schema_editor):
+    ActivityLog = apps.get_model('activitylog', 'ActivityLog')
+    ActivityLog.objects.filter(log__in=EMPTY_CRON_LOGS).update(
+        empty_cron=True
+    )
+
+
+def _run_sql(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run_sql(schema_editor, POSTGRES_SEARCH_SQL)
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("PRAGMA compile_options")
+            options = [row[0] for row in cursor.fetchall()]
+        # searches fall back to icontains if sqlite was built without FTS5
+        if 'ENABLE_FTS5' in options:
+            _run_sql(schema_editor, SQLITE_SEARCH_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run_sql(schema_editor, POSTGRES_REVERSE_SQL)
+    elif vendor == 'sqlite':
+        _run_sql(schema_editor, SQLITE_REVERSE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activitylog', '0002_structured_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activitylog',
+            name='empty_cron',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='activitylog',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(
+            set_empty_cron, reverse_code=migrations.RunPython.noop
+        ),
+        migrations.RunPython(
+            create_search_index, reverse_code=drop_search_index
+        ),
+    ]
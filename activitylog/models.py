@@ -1,7 +1,42 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
+
+# logs written by scheduled jobs that had nothing to do; these are hidden in
+# the studioadmin activity log by default
+EMPTY_CRON_LOGS = [
+    'email_warnings job run; no unpaid booking warnings to send',
+    'cancel_unpaid_bookings job run; no bookings to cancel',
+    'deleted_unconfirmed_bookings job run; no bookings to cancel',
+    'email_ticket_booking_warnings job run; no unpaid booking warnings to send',
+    'cancel_unpaid_ticket_bookings job run; no bookings to cancel'
+]
+
+
 class ActivityLog(models.Model):
 
-    timestamp = models.DateTimeField(default=timezone.now)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
     log = models.TextField()
+    # optional structured fields, so logs can be filtered without searching
+    # the log text
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True,
+        on_delete=models.SET_NULL, related_name='+'
+    )
+    action = models.CharField(max_length=50, blank=True)
+    # app_label.model_name of the object the log refers to
+    object_type = models.CharField(max_length=100, blank=True)
+    object_id = models.PositiveIntegerField(null=True, blank=True)
+    empty_cron = models.BooleanField(default=False)
+
+    # The log text is also indexed for full text search outside of the
+    # django model (see migration 0003 and activitylog.search)
+
+    class Meta:
+        index_together = ('object_type', 'object_id')
+
+    def save(self, *args, **kwargs):
+        if self.log in EMPTY_CRON_LOGS:
+            self.empty_cron = True
+        super(ActivityLog, self).save(*args, **kwargs)
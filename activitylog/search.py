@@ -0,0 +1,113 @@
+"""
+Full text search of activity log text.
+
+On PostgreSQL logs are matched with the pg_trgm GIN index on the log column
+(case insensitive substring matching, as icontains did, so "john" matches
+"john.smith" and "foo" matches "foo@bar.com"), and with the indexed
+search_vector column for words too short to make trigrams.  On SQLite
+(local/dev) logs are matched against the activitylog_activitylog_fts FTS5
+table, where search words match whole words or the start of words in the log
+(e.g. "cancel" matches "cancelled").  The indexes are created in migration
+0003 and kept up to date by database triggers.  Other databases, or an SQLite
+database without the FTS table, fall back to icontains.
+"""
+import operator
+import re
+
+from functools import reduce
+
+from django.db import connections
+from django.db.models import Q
+
+
+def get_search_words(search_text):
+    return re.findall(r'\w+', search_text, re.UNICODE)
+
+
+def get_search_terms(search_text):
+    """
+    Split search_text on whitespace into words (word characters only) and
+    terms containing punctuation (e.g. emails), ignoring any punctuation at
+    the start or end of each term
+    """
+    words = []
+    punctuated_terms = []
+    for term in search_text.split():
+        term = re.sub(r'^\W+|\W+$', '', term, flags=re.UNICODE)
+        if not term:
+            continue
+        if re.match(r'^\w+$', term, re.UNICODE):
+            words.append(term)
+        else:
+            punctuated_terms.append(term)
+    return words, punctuated_terms
+
+
+# the shortest term the trigram index can be used for
+MIN_TRIGRAM_LENGTH = 3
+
+
+def _like_pattern(term):
+    return '%{}%'.format(
+        term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    )
+
+
+def _postgres_search(queryset, search_text):
+    words, punctuated_terms = get_search_terms(search_text)
+    short_words = [word for word in words if len(word) < MIN_TRIGRAM_LENGTH]
+    terms = [
+        word for word in words if len(word) >= MIN_TRIGRAM_LENGTH
+    ] + punctuated_terms
+    where = ["activitylog_activitylog.log ILIKE %s" for term in terms]
+    params = [_like_pattern(term) for term in terms]
+    if short_words:
+        where.append(
+            "activitylog_activitylog.search_vector @@ "
+            "to_tsquery('simple', %s)"
+        )
+        params.append(' & '.join('{}:*'.format(word) for word in short_words))
+    return queryset.extra(where=where, params=params)
+
+
+def _sqlite_fts_available(connection):
+    # cached on the connection, per database (the test database is created
+    # on the same connection)
+    cache = connection.__dict__.setdefault('_activitylog_fts_available', {})
+    name = connection.settings_dict['NAME']
+    if name not in cache:
+        with connection.cursor() as cursor:
+            # the FTS table is only in sync while the triggers exist (they
+            # are dropped if a later migration rebuilds the activitylog
+            # table)
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' "
+                "AND name = 'activitylog_fts_insert'"
+            )
+            cache[name] = bool(cursor.fetchone()[0])
+    return cache[name]
+
+
+def search_logs(queryset, search_text):
+    """
+    Filter an ActivityLog queryset to logs containing all words in search_text
+    """
+    words = get_search_words(search_text)
+    if not words:
+        return queryset
+
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        return _postgres_search(queryset, search_text)
+    elif connection.vendor == 'sqlite' and _sqlite_fts_available(connection):
+        return queryset.extra(
+            where=[
+                "activitylog_activitylog.id IN ("
+                "SELECT rowid FROM activitylog_activitylog_fts "
+                "WHERE activitylog_activitylog_fts MATCH %s)"
+            ],
+            params=[' '.join('"{}"*'.format(word) for word in words)]
+        )
+    return queryset.filter(
+        reduce(operator.and_, (Q(log__icontains=word) for word in words))
+    )
@@ -1,3 +1,275 @@
-from django.test import TestCase
+from mock import patch
+from model_mommy import mommy
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection, IntegrityError, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+
+from activitylog.helpers import buffered_activity_log, log_activity
+from activitylog.middleware import ActivityLogMiddleware
+from activitylog.models import ActivityLog, EMPTY_CRON_LOGS
+from activitylog.search import get_search_terms, search_logs
+
+
+class LogActivityTests(TestCase):
+
+    def test_log_saved_immediately_without_buffer(self):
+        with self.assertNumQueries(1):
+            log_activity('Test log')
+        self.assertEqual(ActivityLog.objects.get().log, 'Test log')
+
+    def test_structured_fields(self):
+        user = mommy.make(User)
+        log_activity('Test log', actor=user, obj=user, action='updated')
+        log = ActivityLog.objects.get(log='Test log')
+        self.assertEqual(log.actor, user)
+        self.assertEqual(log.object_type, 'auth.user')
+        self.assertEqual(log.object_id, user.id)
+        self.assertEqual(log.action, 'updated')
+
+    def test_anonymous_actor(self):
+        log_activity('Test log', actor=AnonymousUser())
+        self.assertIsNone(ActivityLog.objects.get().actor)
+
+    def test_buffered_logs_written_in_one_query(self):
+        with self.assertNumQueries(1):
+            with buffered_activity_log():
+                for i in range(10):
+                    log_activity('Test log {}'.format(i))
+        self.assertEqual(
+            list(ActivityLog.objects.order_by('id')
+                 .values_list('log', flat=True)),
+            ['Test log {}'.format(i) for i in range(10)]
+        )
+
+    def test_nested_buffers_written_by_outer_buffer(self):
+        with buffered_activity_log():
+            log_activity('Outer log')
+            with buffered_activity_log():
+                log_activity('Inner log')
+            self.assertFalse(ActivityLog.objects.exists())
+        self.assertEqual(ActivityLog.objects.count(), 2)
+
+    def test_buffered_decorator(self):
+        @buffered_activity_log()
+        def handle():
+            log_activity('Test log 1')
+            log_activity('Test log 2')
+
+        with self.assertNumQueries(1):
+            handle()
+        with self.assertNumQueries(1):
+            handle()
+        self.assertEqual(ActivityLog.objects.count(), 4)
+
+    def test_buffered_logs_written_on_exception(self):
+        with self.assertRaises(ValueError):
+            with buffered_activity_log():
+                log_activity('Test log')
+                raise ValueError
+        self.assertEqual(ActivityLog.objects.count(), 1)
+
+    def test_buffer_closed_on_interrupt(self):
+        with self.assertRaises(KeyboardInterrupt):
+            with buffered_activity_log():
+                log_activity('Test log 1')
+                raise KeyboardInterrupt
+        self.assertEqual(ActivityLog.objects.count(), 1)
+        log_activity('Test log 2')
+        self.assertEqual(ActivityLog.objects.count(), 2)
+
+    def test_buffered_logs_discarded_on_broken_transaction(self):
+        user = mommy.make(User)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                with buffered_activity_log():
+                    log_activity('Test log')
+                    User.objects.create(username=user.username)
+        self.assertFalse(ActivityLog.objects.filter(log='Test log').exists())
+
+
+class BufferedLogTransactionTests(TransactionTestCase):
+
+    def test_logs_for_rolled_back_work_discarded(self):
+        with buffered_activity_log():
+            log_activity('Test log 1')
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    log_activity('Test log 2')
+                    raise ValueError
+            with transaction.atomic():
+                log_activity('Test log 3')
+                with self.assertRaises(ValueError):
+                    with transaction.atomic():
+                        log_activity('Test log 4')
+                        raise ValueError
+            self.assertFalse(ActivityLog.objects.exists())
+        self.assertEqual(
+            sorted(ActivityLog.objects.values_list('log', flat=True)),
+            ['Test log 1', 'Test log 3']
+        )
+
+
+class ActivityLogMiddlewareTests(TestCase):
+
+    def test_logs_buffered_until_response(self):
+        middleware = ActivityLogMiddleware()
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        log_activity('Test log 1')
+        log_activity('Test log 2')
+        self.assertFalse(ActivityLog.objects.exists())
+
+        with self.assertNumQueries(1):
+            middleware.process_response(request, HttpResponse())
+        self.assertEqual(ActivityLog.objects.count(), 2)
+
+        # logs are saved immediately again after the request
+        log_activity('Test log 3')
+        self.assertEqual(ActivityLog.objects.count(), 3)
+
+    def test_stale_buffer_discarded_on_next_request(self):
+        middleware = ActivityLogMiddleware()
+        middleware.process_request(RequestFactory().get('/'))
+        log_activity('Test log 1')
+
+        # the first request's response is never processed
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        log_activity('Test log 2')
+        middleware.process_response(request, HttpResponse())
+        self.assertEqual(
+            list(ActivityLog.objects.values_list('log', flat=True)),
+            ['Test log 2']
+        )
+
+        log_activity('Test log 3')
+        self.assertEqual(ActivityLog.objects.count(), 2)
+
+    def test_response_without_request_processing(self):
+        middleware = ActivityLogMiddleware()
+        request = RequestFactory().get('/')
+        middleware.process_response(request, HttpResponse())
+        log_activity('Test log')
+        self.assertEqual(ActivityLog.objects.count(), 1)
+
+
+class EmptyCronFlagTests(TestCase):
+
+    def test_empty_cron_logs_flagged(self):
+        ActivityLog.objects.create(log=EMPTY_CRON_LOGS[0])
+        ActivityLog.objects.create(log='Booking cancelled')
+        self.assertEqual(
+            list(ActivityLog.objects.filter(empty_cron=True)
+                 .values_list('log', flat=True)),
+            [EMPTY_CRON_LOGS[0]]
+        )
+
+    def test_buffered_empty_cron_logs_flagged(self):
+        with buffered_activity_log():
+            log_activity(EMPTY_CRON_LOGS[1])
+            log_activity('Booking cancelled')
+        self.assertEqual(
+            list(ActivityLog.objects.filter(empty_cron=True)
+                 .values_list('log', flat=True)),
+            [EMPTY_CRON_LOGS[1]]
+        )
+
+
+class SearchLogsTests(TestCase):
+
+    def setUp(self):
+        self.log1 = mommy.make(
+            ActivityLog, log='Booking id 1 cancelled by admin user test_1'
+        )
+        self.log2 = mommy.make(
+            ActivityLog, log='Block id 2 for user test_2 created'
+        )
+
+    def _search(self, text):
+        return sorted(
+            search_logs(ActivityLog.objects.all(), text)
+            .values_list('id', flat=True)
+        )
+
+    def test_search_whole_and_partial_words(self):
+        self.assertEqual(self._search('cancelled'), [self.log1.id])
+        self.assertEqual(self._search('cancel'), [self.log1.id])
+        self.assertEqual(self._search('BOOKING'), [self.log1.id])
+        self.assertEqual(self._search('id'), [self.log1.id, self.log2.id])
+
+    def test_search_all_words_must_match(self):
+        self.assertEqual(self._search('block user'), [self.log2.id])
+        self.assertEqual(self._search('block cancelled'), [])
+
+    def test_search_ignores_punctuation(self):
+        self.assertEqual(self._search('"user" (test_2)'), [self.log2.id])
+        self.assertEqual(
+            self._search('*'), [self.log1.id, self.log2.id]
+        )
+
+    def test_search_index_updated(self):
+        self.log1.log = 'Booking id 1 reopened'
+        self.log1.save()
+        self.assertEqual(self._search('cancelled'), [])
+        self.assertEqual(self._search('reopened'), [self.log1.id])
+
+        self.log1.delete()
+        self.assertEqual(self._search('reopened'), [])
+
+    def test_bulk_created_logs_indexed(self):
+        with buffered_activity_log():
+            log_activity('Event cancelled')
+            log_activity('Event created')
+        self.assertEqual(
+            len(self._search('event')), 2
+        )
+
+    @patch('activitylog.search._sqlite_fts_available', return_value=False)
+    def test_search_without_index(self, mock_fts_available):
+        self.assertEqual(self._search('cancel'), [self.log1.id])
+        # falls back to substring matching
+        self.assertEqual(self._search('ancel'), [self.log1.id])
+
+    def test_search_email(self):
+        log = mommy.make(ActivityLog, log='Email sent to foo@bar.com')
+        self.assertEqual(self._search('foo@bar.com'), [log.id])
+        self.assertEqual(self._search('bar.com'), [log.id])
+
+
+class PostgresSearchLogsTests(TestCase):
+    """
+    The PostgreSQL query can't be run against the test database, so check
+    the query that is built
+    """
+
+    def _sql(self, text):
+        with patch.object(connection, 'vendor', 'postgresql'):
+            queryset = search_logs(ActivityLog.objects.all(), text)
+        return queryset.query.sql_with_params()
+
+    def test_search_terms(self):
+        self.assertEqual(
+            get_search_terms('"user" (test_2) foo@bar.com, example.com'),
+            (['user', 'test_2'], ['foo@bar.com', 'example.com'])
+        )
+
+    def test_terms_match_substrings(self):
+        sql, params = self._sql('john foo@bar.com test_2')
+        self.assertEqual(sql.count('activitylog_activitylog.log ILIKE %s'), 3)
+        self.assertNotIn('search_vector', sql)
+        self.assertIn('%john%', params)
+        self.assertIn('%foo@bar.com%', params)
+        # LIKE wildcards in the search text are matched literally
+        self.assertIn('%test\\_2%', params)
+
+    def test_short_words_match_prefixes(self):
+        sql, params = self._sql('id 12 cancel')
+        self.assertIn(
+            "activitylog_activitylog.search_vector @@ "
+            "to_tsquery('simple', %s)",
+            sql
+        )
+        self.assertIn('id:* & 12:*', params)
+        self.assertIn('%cancel%', params)
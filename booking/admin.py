@@ -299,14 +299,14 @@ class BlockFilter(admin.SimpleListFilter):
         )
 
     def queryset(self, request, queryset):
-        active_ids = [obj.id for obj in queryset if obj.active_block()]
+        active_ids = Block.objects.active().values('id')
         if self.value() == 'active':
             return queryset.filter(id__in=active_ids)
         if self.value() == 'inactive':
             return queryset.exclude(id__in=active_ids)
         if self.value() == 'unpaid':
-            unpaid_ids = [obj.id for obj in queryset if not obj.full
-            and not obj.expired and not obj.paid]
+            unpaid_ids = Block.objects.unexpired().not_full()\
+                .filter(paid=False).values('id')
             return queryset.filter(id__in=unpaid_ids)
         return queryset
 
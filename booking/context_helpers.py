@@ -3,29 +3,157 @@ Helper functions to return context and reduce logic in templates
 """
 import pytz
 
+from collections import OrderedDict
 from datetime import timedelta
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Prefetch
 from django.utils import timezone
 from django.core.urlresolvers import reverse
 
-from booking.models import Block, BlockType, Booking, WaitingListUser
+from accounts import auth_cache
+from accounts.models import OnlineDisclaimer, PrintDisclaimer
+from booking.models import Block, BlockType, Booking, Event, WaitingListUser
+
+
+def _exists_sql(queryset):
+    """
+    Return sql and params for an EXISTS subquery on queryset, for use in
+    QuerySet.extra(select=...)
+    """
+    sql, params = queryset.order_by().values('id').query.sql_with_params()
+    return 'EXISTS ({})'.format(sql), params
+
+
+def annotate_user_event_state(queryset, user):
+    """
+    Annotate an Event queryset with the user's waiting list status as an
+    EXISTS subquery, and prefetch the user's booking for each event into
+    user_bookings.  Use UserEventState to read the results.
+    """
+    qn = connection.ops.quote_name
+    waiting_list = WaitingListUser.objects.filter(user=user).extra(
+        where=['{}.{} = {}.{}'.format(
+            qn(WaitingListUser._meta.db_table), qn('event_id'),
+            qn(Event._meta.db_table), qn('id')
+        )]
+    )
+    waiting_list_sql, params = _exists_sql(waiting_list)
+
+    return queryset.extra(
+        select={'user_on_waiting_list': waiting_list_sql},
+        select_params=params
+    ).prefetch_related(
+        Prefetch(
+            'bookings', queryset=Booking.objects.filter(user=user),
+            to_attr='user_bookings'
+        )
+    )
 
-def get_event_context(context, event, user):
 
-    disclaimer = False
-    try:
-        user.online_disclaimer
-        disclaimer = True
-    except ObjectDoesNotExist:
-        pass
+class UserEventState(object):
+    """
+    The user's booking state for an event fetched with
+    annotate_user_event_state
+    """
 
-    try:
-        user.print_disclaimer
-        disclaimer = True
-    except ObjectDoesNotExist:
-        pass
+    def __init__(self, event, user):
+        # users can only have one booking per event
+        self.booking = event.user_bookings[0] if event.user_bookings else None
+        self.booked = bool(self.booking) and self.booking.status == 'OPEN' \
+            and not self.booking.no_show
+        self.cancelled = bool(self.booking) and (
+            self.booking.status == 'CANCELLED' or self.booking.no_show
+        )
+        self.on_waiting_list = bool(event.user_on_waiting_list)
+        self.has_disclaimer = user.has_disclaimer()
+        self.is_regular_student = user.is_regular_student()
+
+
+def annotate_user_flags(queryset):
+    """
+    Annotate a User queryset with EXISTS subqueries for the flags shown in
+    lists of users (user_is_regular_student, user_has_online_disclaimer,
+    user_has_print_disclaimer, user_is_subscribed and user_has_booked_class).
+    The User methods and bookingtags filters for these flags read the
+    annotations when present instead of querying for each user.
+    """
+    qn = connection.ops.quote_name
+    user_table = qn(User._meta.db_table)
+
+    def for_user(qs):
+        return qs.extra(where=['{}.{} = {}.{}'.format(
+            qn(qs.model._meta.db_table), qn('user_id'), user_table, qn('id')
+        )])
+
+    UserPermission = User.user_permissions.through
+    UserGroup = User.groups.through
+
+    subqueries = OrderedDict([
+        ('user_is_regular_student', [
+            UserPermission.objects.filter(
+                permission__content_type__app_label='booking',
+                permission__codename='is_regular_student'
+            ),
+            UserGroup.objects.filter(
+                group__permissions__content_type__app_label='booking',
+                group__permissions__codename='is_regular_student'
+            )
+        ]),
+        ('user_has_online_disclaimer', [OnlineDisclaimer.objects.all()]),
+        ('user_has_print_disclaimer', [PrintDisclaimer.objects.all()]),
+        ('user_is_subscribed', [
+            UserGroup.objects.filter(group__name='subscribed')
+        ]),
+        ('user_has_booked_class', [
+            Booking.objects.filter(event__event_type__event_type='CL')
+        ]),
+    ])
+
+    select = OrderedDict()
+    select_params = []
+    for name, querysets in subqueries.items():
+        sql = []
+        for qs in querysets:
+            exists_sql, params = _exists_sql(for_user(qs))
+            sql.append(exists_sql)
+            select_params.extend(params)
+        select[name] = ' OR '.join(sql)
+
+    return queryset.extra(select=select, select_params=select_params)
+
+
+def set_transferred_bookings(blocks):
+    """
+    Fetch the bookings that transferred blocks were created from in one query
+    and set them on each block as transferred_booking (None if there is no
+    booking), for the transferred_from and format_block_type_id_user filters.
+    Returns the blocks as a list.
+    """
+    blocks = list(blocks)
+    booking_ids = {
+        block.transferred_booking_id for block in blocks
+        if block.transferred_booking_id
+    }
+    bookings = Booking.objects.select_related('event').in_bulk(
+        booking_ids
+    ) if booking_ids else {}
+    for block in blocks:
+        block.transferred_booking = bookings.get(block.transferred_booking_id)
+    return blocks
+
+
+def get_event_context(context, event, user):
 
+    if not hasattr(event, 'user_bookings'):
+        event = annotate_user_event_state(
+            Event.objects.select_related('event_type').filter(id=event.id),
+            user
+        )[0]
+    user_state = UserEventState(event, user)
+
+    disclaimer = user_state.has_disclaimer
     context['disclaimer'] = disclaimer
 
     if event.event_type.event_type == 'CL':
@@ -56,22 +184,11 @@ def get_event_context(context, event, user):
     context['payment_text'] = payment_text
 
     # booked flag
-    user_bookings = Booking.objects.filter(
-        event=event, user=user, status='OPEN', no_show=False
-    )
-    user_cancelled = Booking.objects.filter(
-        event=event, user=user, status='CANCELLED'
-    ).exists()
-    user_no_show = Booking.objects.filter(
-        event=event, user=user, status='OPEN', no_show=True
-    ).exists()
-    booked = bool(user_bookings)
-    cancelled = user_cancelled or user_no_show
+    booked = user_state.booked
+    cancelled = user_state.cancelled
 
     # waiting_list flag
-    context['waiting_list'] = WaitingListUser.objects.filter(
-        user=user, event=event
-    ).exists()
+    context['waiting_list'] = user_state.on_waiting_list
 
     # booking info text and bookable
     booking_info_text = ""
@@ -80,7 +197,7 @@ def get_event_context(context, event, user):
         context['bookable'] = False
         booking_info_text = "You have booked for this {}.".format(event_type_str)
         context['booked'] = True
-        context['booking'] = user_bookings[0]
+        context['booking'] = user_state.booking
     elif not disclaimer:
         booking_info_text = "<strong>Please complete a <a href='{}' " \
                             "target=_blank>disclaimer form</a> before " \
@@ -88,7 +205,7 @@ def get_event_context(context, event, user):
                                 reverse('disclaimer_form')
                             )
     elif event.event_type.subtype == "Pole practice" \
-        and not user.has_perm("booking.is_regular_student"):
+        and not user_state.is_regular_student:
         context['bookable'] = False
         context['unbookable_pole_practice'] = True
         booking_info_text = "<span class='cancel-warning'>NOT AVAILABLE FOR BOOKING</br>" \
@@ -144,16 +261,11 @@ def get_booking_create_context(event, request, context):
     context['event'] = event
     user_blocks = Block.objects.filter(
         user=request.user, block_type__event_type=event.event_type
-    )
-    active_user_block = [block for block in user_blocks if block.active_block()]
-    if active_user_block:
+    ).unexpired().not_full()
+    if user_blocks.filter(paid=True).exists():
         context['active_user_block'] = True
 
-    active_user_block_unpaid = [
-        block for block in user_blocks if not block.expired
-        and not block.full and not block.paid
-         ]
-    if active_user_block_unpaid:
+    if user_blocks.filter(paid=False).exists():
         context['active_user_block_unpaid'] = True
 
     if event.event_type.event_type == 'EV':
@@ -166,7 +278,9 @@ def get_booking_create_context(event, request, context):
     context['ev_type'] = ev_type
 
     if event.event_type.subtype in ["Pole level class", "Pole practice"] \
-            and request.user.has_perm('booking.can_request_free_class'):
+            and auth_cache.has_perm(
+                request.user, 'booking.can_request_free_class'
+            ):
         context['can_be_free_class'] = True
 
     bookings_count = event.bookings.filter(status='OPEN').count()
@@ -208,12 +322,8 @@ def get_paypal_dict(
 
 
 def get_blocktypes_available_to_book(user):
-    user_blocks = user.blocks.all()
-
-    available_block_event_types = [block.block_type.event_type
-                                   for block in user_blocks
-                                   if not block.expired
-                                   and not block.full]
+    available_block_event_types = user.blocks.unexpired().not_full()\
+        .values_list('block_type__event_type', flat=True)
     return BlockType.objects.filter(active=True).exclude(
-        event_type__in=available_block_event_types
+        event_type__in=list(available_block_event_types)
     )
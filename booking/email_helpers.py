@@ -1,9 +1,57 @@
+from functools import wraps
+
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import get_connection
+from django.db import transaction
 from django.core.mail.message import EmailMessage, EmailMultiAlternatives
 from django.template.loader import get_template
 
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
+from booking.models import OutboxEmail
+
+
+def send_message(msg, fail_silently=False):
+    """
+    Send an EmailMessage now, or if settings.USE_EMAIL_OUTBOX is set, queue it
+    in the outbox to be sent by the run_outbox command.  Queued emails are
+    saved in the current transaction, so they are only sent if the changes
+    that triggered them are committed.
+    """
+    if settings.USE_EMAIL_OUTBOX:
+        OutboxEmail.from_message(msg).save()
+        return 1
+    return msg.send(fail_silently=fail_silently)
+
+
+def outbox_atomic(func):
+    """
+    Run func in a transaction if settings.USE_EMAIL_OUTBOX is set, so emails
+    it queues are only saved with the changes that triggered them.  Without
+    the outbox emails are sent inline, and the transaction (with any row locks
+    it holds) would stay open while waiting for the mail server.
+    """
+    atomic_func = transaction.atomic(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if settings.USE_EMAIL_OUTBOX:
+            return atomic_func(*args, **kwargs)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def send_mail(subject, message, from_email, recipient_list,
+              fail_silently=False, html_message=None):
+    """
+    Replacement for django.core.mail.send_mail that goes through
+    send_message, so the email is queued if the outbox is in use
+    """
+    msg = EmailMultiAlternatives(
+        subject, message, from_email, recipient_list
+    )
+    if html_message:
+        msg.attach_alternative(html_message, "text/html")
+    return send_message(msg, fail_silently=fail_silently)
 
 
 def send_support_email(e, module_name="", extra_subject=""):
@@ -17,8 +65,8 @@ def send_support_email(e, module_name="", extra_subject=""):
             [settings.SUPPORT_EMAIL],
             fail_silently=True)
     except Exception as ex:
-        ActivityLog.objects.create(
-            log="Problem sending an email ({}: {})".format(
+        log_activity(
+            "Problem sending an email ({}: {})".format(
                 module_name, ex
             )
         )
@@ -44,4 +92,88 @@ def send_waiting_list_email(
         ),
         "text/html"
     )
-    msg.send(fail_silently=False)
+    send_message(msg, fail_silently=False)
+
+
+class EmailBatch(object):
+    """
+    Build a batch of emails from the same txt/html templates and send them
+    over a single mail connection.  Templates are loaded once for the batch.
+
+    Each message is added with a key (e.g. the booking it is for) so that
+    callers can tell which messages were sent; a failure sending one message
+    is recorded and does not stop the rest of the batch.  If
+    settings.USE_EMAIL_OUTBOX is set, the messages are queued in the outbox
+    instead (see send_message), and all count as sent.
+
+        batch = EmailBatch('booking/email/reminder.txt',
+                           'booking/email/reminder.html')
+        for booking in bookings:
+            batch.add(booking, subject, [booking.user.email], {...})
+        sent, failed = batch.send()
+    """
+
+    def __init__(self, txt_template, html_template=None):
+        self.txt_template = get_template(txt_template)
+        self.html_template = get_template(html_template) \
+            if html_template else None
+        self.messages = []
+
+    def __len__(self):
+        return len(self.messages)
+
+    def add(self, key, subject, to, ctx, from_email=None):
+        msg = EmailMultiAlternatives(
+            subject,
+            self.txt_template.render(ctx),
+            from_email or settings.DEFAULT_FROM_EMAIL,
+            to
+        )
+        if self.html_template:
+            msg.attach_alternative(self.html_template.render(ctx), "text/html")
+        self.messages.append((key, msg))
+
+    def send(self, on_sent=None):
+        """
+        Send all messages; returns a list of the keys that were sent and a
+        list of (key, exception) for those that failed.  on_sent, if given, is
+        called with each key as soon as its message is sent, so callers can
+        record it even if the batch is interrupted.
+        """
+        sent = []
+        failed = []
+        if not self.messages:
+            return sent, failed
+
+        if settings.USE_EMAIL_OUTBOX:
+            OutboxEmail.objects.bulk_create([
+                OutboxEmail.from_message(msg) for key, msg in self.messages
+            ])
+            sent = [key for key, msg in self.messages]
+            if on_sent:
+                for key in sent:
+                    on_sent(key)
+            return sent, failed
+
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            return sent, [(key, e) for key, msg in self.messages]
+
+        try:
+            for key, msg in self.messages:
+                try:
+                    connection.send_messages([msg])
+                except Exception as e:
+                    failed.append((key, e))
+                else:
+                    sent.append(key)
+                    if on_sent:
+                        on_sent(key)
+        finally:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        return sent, failed
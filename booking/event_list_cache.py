@@ -0,0 +1,42 @@
+"""
+Cache for the public event, class and room hire listings.
+
+Cached values are stored under a version number that is bumped whenever an
+event or booking changes (see the receivers in booking.models), so a change
+makes every cached listing stale at once.  Changes that bypass signals
+(e.g. QuerySet.update) and events moving into the past are covered by the
+short timeout.
+"""
+import hashlib
+
+from pipsevents import cache_versions
+
+
+EVENT_LIST_CACHE_TIMEOUT = 60
+_VERSION_KEY = 'event_list_cache_version'
+
+
+def get_version():
+    return cache_versions.get_version(_VERSION_KEY)
+
+
+def bump_version():
+    cache_versions.bump_version(_VERSION_KEY)
+
+
+def make_key(prefix, ev_type, name):
+    return 'event_list_{}_{}_{}_{}'.format(
+        prefix, get_version(), ev_type,
+        hashlib.md5((name or '').encode('utf-8')).hexdigest()
+    )
+
+
+def make_row_keys(ev_type, event_ids):
+    """
+    Keys for the shared cells of each event's row in a listing, by event id
+    """
+    version = get_version()
+    return {
+        event_id: 'event_list_row_{}_{}_{}'.format(version, ev_type, event_id)
+        for event_id in event_ids
+    }
@@ -10,7 +10,7 @@ from django.core.management.base import BaseCommand
 from booking.models import BlockType
 from booking.email_helpers import send_support_email
 
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 class Command(BaseCommand):
@@ -39,7 +39,7 @@ class Command(BaseCommand):
                 'activated' if action == 'on' else 'deactivated',
                 ', '.join([str(bt.id) for bt in blocktypes])
                 )
-            ActivityLog.objects.create(log=message)
+            log_activity(message)
             self.stdout.write(message)
 
             try:
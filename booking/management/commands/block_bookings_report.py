@@ -13,130 +13,223 @@ payment, in which case it won't be cancelled and won't count towards the block
 which it probably should
 If paid, check that it also has an associated paypal txn id; if not, it's likely
 been unassigned by an unidentified bug
+
+The bookings for all active blocks are found with a single query joining the
+blocks to their users' bookings.  Use --format csv or --format json for
+machine-readable output, and --output to write the report to a file.
 '''
+import csv
+import json
+
+from collections import OrderedDict
+from io import StringIO
+
 from django.conf import settings
 from django.core.mail import send_mail
+from django.db.models import F
 
 from django.core.management.base import BaseCommand
-from django.core import management
 
 from booking.models import Block, Booking
-from activitylog.models import ActivityLog
+from activitylog.helpers import buffered_activity_log, log_activity
 from payments.models import PaypalBookingTransaction
 
+
+CSV_COLUMNS = [
+    'user', 'user_id', 'block_id', 'block_subtype', 'booking_ids',
+    'unpaid_booking_ids', 'paid_booking_ids', 'paypal_paid_booking_ids'
+]
+
+
+def get_bookings_without_block():
+    """
+    Return an OrderedDict of active block id: list of (booking id, paid,
+    payment_confirmed) for the user's open, non-free bookings of the block's
+    subtype that were made since the block start date without using a block,
+    in one query
+    """
+    rows = Booking.objects.filter(
+        block__isnull=True, status='OPEN', free_class=False,
+        user__blocks__in=Block.objects.active(),
+        user__blocks__start_date__lte=F('date_booked'),
+        user__blocks__block_type__event_type__subtype=F(
+            'event__event_type__subtype'
+        )
+    ).order_by('user__blocks__id', 'id').values_list(
+        'user__blocks__id', 'id', 'paid', 'payment_confirmed'
+    )
+    bookings_by_block = OrderedDict()
+    for block_id, booking_id, paid, payment_confirmed in rows:
+        bookings_by_block.setdefault(block_id, []).append(
+            (booking_id, paid, payment_confirmed)
+        )
+    return bookings_by_block
+
+
+def format_text(report):
+    lines = []
+    for row in report:
+        num_bookings = len(row['booking_ids'])
+        lines.append(
+            'User {} ({}) has {} booking{} made for class type {} without '
+            'using the active block {}'.format(
+                row['user'], row['user_id'], num_bookings,
+                '' if num_bookings == 1 else 's', row['block_subtype'],
+                row['block_id']
+            )
+        )
+        unpaid = row['unpaid_booking_ids']
+        if unpaid:
+            lines.append(
+                '{} booking{} unpaid or not marked as '
+                'payment_confirmed (ids {})'.format(
+                    len(unpaid), ' is' if len(unpaid) == 1 else 's are',
+                    ', '.join(unpaid)
+                )
+            )
+        paid = row['paid_booking_ids']
+        if paid:
+            lines.append(
+                '{} booking{} paid (ids {})'.format(
+                    len(paid), ' is' if len(paid) == 1 else 's are',
+                    ', '.join(paid)
+                )
+            )
+        if row['paypal_paid_booking_ids']:
+            lines.append(
+                'Paid booking ids that have been paid directly with '
+                'paypal: {}'.format(', '.join(row['paypal_paid_booking_ids']))
+            )
+    if not report:
+        lines.append('No issues to report for users with blocks')
+    return ''.join(line + '\n' for line in lines)
+
+
+def format_csv(report):
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_COLUMNS)
+    for row in report:
+        writer.writerow([
+            ' '.join(row[column]) if isinstance(row[column], list)
+            else row[column]
+            for column in CSV_COLUMNS
+        ])
+    return output.getvalue()
+
+
+def format_json(report):
+    return json.dumps(report, indent=2) + '\n'
+
+
+FORMATTERS = OrderedDict([
+    ('text', format_text), ('csv', format_csv), ('json', format_json)
+])
+
+
 class Command(BaseCommand):
     help = 'run reports on users with active blocks'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=list(FORMATTERS.keys()),
+            default='text',
+            help='Output format for the report (default text)'
+        )
+        parser.add_argument(
+            '--output',
+            help='File path to write the report to (default stdout)'
+        )
+
+    @buffered_activity_log()
     def handle(self, *args, **options):
 
-        active_blocks = [
-            block for block in Block.objects.all() if block.active_block()
-        ]
+        bookings_by_block = get_bookings_without_block()
+        blocks = Block.objects.filter(
+            id__in=bookings_by_block.keys()
+        ).select_related('user', 'block_type__event_type')
 
-        blocks_with_issues = []
-        for block in active_blocks:
+        paid_booking_ids = [
+            booking_id for bookings in bookings_by_block.values()
+            for booking_id, paid, _ in bookings if paid
+        ]
+        paid_with_paypal_ids = set(
+            PaypalBookingTransaction.objects.filter(
+                booking_id__in=paid_booking_ids, transaction_id__isnull=False
+            ).values_list('booking_id', flat=True)
+        ) if paid_booking_ids else set()
+
+        report = []
+        for block in blocks:
+            bookings_without_block = bookings_by_block[block.id]
             block_subtype = block.block_type.event_type.subtype
 
-            open_user_bookings_since_block_start = Booking.objects.filter(
-                user=block.user, date_booked__gte=block.start_date,
-                status='OPEN', event__event_type__subtype=block_subtype
-            )
-
-            bookings_without_block = [
-                booking for booking in open_user_bookings_since_block_start
-                if booking.block == None and not booking.free_class
+            unpaid_bookings = [
+                str(booking_id) for booking_id, paid, payment_confirmed
+                in bookings_without_block if not paid or not payment_confirmed
             ]
+            paid_bookings = [
+                str(booking_id) for booking_id, paid, _
+                in bookings_without_block if paid
+            ]
+            paid_with_paypal = [
+                str(booking_id) for booking_id, _, _
+                in bookings_without_block if booking_id in paid_with_paypal_ids
+            ]
+            report.append(OrderedDict([
+                ('user', block.user.username),
+                ('user_id', block.user.id),
+                ('block_id', block.id),
+                ('block_subtype', block_subtype),
+                ('booking_ids', [
+                    str(booking_id) for booking_id, _, _
+                    in bookings_without_block
+                ]),
+                ('unpaid_booking_ids', unpaid_bookings),
+                ('paid_booking_ids', paid_bookings),
+                ('paypal_paid_booking_ids', paid_with_paypal),
+            ]))
+
+            send_mail('{} Block issues report for user {}'.format(
+                settings.ACCOUNT_EMAIL_SUBJECT_PREFIX, block.user.username),
+                'Possible issues for user {block_user}: \n'
+                'Has block: {blockstr} (id {blockid})\n'
+                '{num_unpaid} unpaid/unconfirmed bookings booked since '
+                'the block start date but not using block: '
+                'ids {unpaid_ids}\n'
+                '{num_paid} paid bookings booked since the block start '
+                'date but not using block: ids {paid_ids}\n'
+                'Paid bookings that were paid directly with paypal: '
+                'ids {paypal_paid_ids}\n'
+                'Check bookings for the users associated with these '
+                ' blocks'.format(
+                    block_user=block.user.username,
+                    blockstr=block, blockid=block.id,
+                    num_unpaid=len(unpaid_bookings),
+                    unpaid_ids=',' .join(unpaid_bookings),
+                    num_paid=len(paid_bookings),
+                    paid_ids=', '.join(paid_bookings),
+                    paypal_paid_ids=', '.join(paid_with_paypal)
+                ),
+                settings.DEFAULT_FROM_EMAIL,
+                [settings.SUPPORT_EMAIL],
+                fail_silently=True
+            )
 
-            if bookings_without_block:
-                blocks_with_issues.append(block.id)
-
-                self.stdout.write(
-                    'User {} ({}) has {} booking{} made for class '
-                    'type {} without using the active block {}'.format(
-                        block.user.username, block.user.id,
-                        len(bookings_without_block), ''
-                        if len(bookings_without_block) == 1 else 's',
-                        block_subtype, block.id
-                    )
-                )
-
-                unpaid_bookings = sorted([
-                    str(booking.id) for booking in bookings_without_block if
-                    not booking.paid or not booking.payment_confirmed
-                ])
-                paid_booking_ids = sorted([
-                    booking.id for booking in bookings_without_block if
-                    booking.paid
-                ])
-                paid_bookings = sorted([
-                    str(id) for id in paid_booking_ids
-                ])
-
-                ppbs = PaypalBookingTransaction.objects.filter(
-                    booking_id__in=paid_booking_ids
-                )
-                paid_with_paypal = [str(ppb.booking_id) for ppb in ppbs if
-                                    ppb.transaction_id is not None]
-                if unpaid_bookings:
-                    self.stdout.write(
-                        '{} booking{} unpaid or not marked as '
-                        'payment_confirmed (ids {})'.format(
-                            len(unpaid_bookings),
-                            ' is' if len(unpaid_bookings) == 1 else 's are',
-                            ', '.join(unpaid_bookings)
-                        )
-                    )
-                if paid_bookings:
-                    self.stdout.write(
-                        '{} booking{} paid (ids {})'.format(
-                            len(paid_bookings),
-                            ' is' if len(paid_bookings) == 1 else 's are',
-                            ', '.join(paid_bookings)
-                        )
-                    )
-                if paid_with_paypal:
-                    self.stdout.write(
-                        'Paid booking ids that have been paid directly with '
-                        'paypal: {}'.format(
-                            ', '.join(paid_with_paypal)
-                        )
-                    )
-
-                send_mail('{} Block issues report for user {}'.format(
-                    settings.ACCOUNT_EMAIL_SUBJECT_PREFIX, block.user.username),
-                    'Possible issues for user {block_user}: \n'
-                    'Has block: {blockstr} (id {blockid})\n'
-                    '{num_unpaid} unpaid/unconfirmed bookings booked since '
-                    'the block start date but not using block: '
-                    'ids {unpaid_ids}\n'
-                    '{num_paid} paid bookings booked since the block start '
-                    'date but not using block: ids {paid_ids}\n'
-                    'Paid bookings that were paid directly with paypal: '
-                    'ids {paypal_paid_ids}\n'
-                    'Check bookings for the users associated with these '
-                    ' blocks'.format(
-                        block_user=block.user.username,
-                        blockstr=block, blockid=block.id,
-                        num_unpaid=len(unpaid_bookings),
-                        unpaid_ids=',' .join(unpaid_bookings),
-                        num_paid=len(paid_bookings),
-                        paid_ids=', '.join(paid_bookings),
-                        paypal_paid_ids=', '.join(paid_with_paypal)
-                    ),
-                    settings.DEFAULT_FROM_EMAIL,
-                    [settings.SUPPORT_EMAIL],
-                    fail_silently=True
-                )
-
-
-                ActivityLog.objects.create(
-                    log='Possible issues with bookings for user {}. Check '
-                        'bookings since {} block ({}) start that are not '
-                        'assigned to the block (support notified by '
-                        'email)'.format(
-                        block.user.username, block_subtype, block.id
-                    )
-                )
+            log_activity(
+                'Possible issues with bookings for user {}. Check '
+                'bookings since {} block ({}) start that are not '
+                'assigned to the block (support notified by '
+                'email)'.format(
+                    block.user.username, block_subtype, block.id
+                ),
+                obj=block
+            )
 
-        if not blocks_with_issues:
-            self.stdout.write('No issues to report for users with blocks')
+        output = FORMATTERS[options['format']](report)
+        if options['output']:
+            with open(options['output'], 'w', newline='') as outfile:
+                outfile.write(output)
+        else:
+            self.stdout.write(output, ending='')
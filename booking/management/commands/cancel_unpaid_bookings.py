@@ -11,9 +11,12 @@ date - cancellation_period < timezone.now()
 OR
 timezone.now() - date_booked/rebooked > payment_time_allowed
 )
-Email user that their booking has been cancelled
+Bookings are cancelled with a single update; email users that their booking
+has been cancelled and email the waiting list once for each event that was
+full before the cancellations
 '''
 import logging
+from collections import Counter, OrderedDict
 from datetime import timedelta
 
 from django.utils import timezone
@@ -22,117 +25,206 @@ from django.core.mail import send_mail
 from django.template.loader import get_template
 from django.core.management.base import BaseCommand
 from django.core import management
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
 
-from booking.models import Booking, WaitingListUser
-from booking.email_helpers import send_support_email, send_waiting_list_email
-from activitylog.models import ActivityLog
+from booking import event_list_cache
+from booking.models import Booking, Event, WaitingListUser
+from booking.email_helpers import EmailBatch, send_support_email, \
+    send_waiting_list_email
+from activitylog.helpers import buffered_activity_log, log_activity
 
 
 logger = logging.getLogger(__name__)
 
 
+def _last_booked_before(date):
+    # date_rebooked if the booking has been rebooked, otherwise date_booked
+    return Q(date_rebooked__isnull=True, date_booked__lt=date) | \
+        Q(date_rebooked__lt=date)
+
+
+def get_bookings_to_cancel(now):
+    """
+    Return a queryset of the unpaid bookings to cancel (see module
+    docstring).  The cancellation period and payment time allowed are set in
+    hours on each event, so the filters for them are built for each distinct
+    value on the candidate bookings' events (one query).
+    """
+    candidates = Booking.objects.filter(
+        event__date__gte=now,
+        event__advance_payment_required=True,
+        status='OPEN',
+        paid=False,
+        payment_confirmed=False,
+        date_booked__lte=now - timedelta(hours=6)
+    ).exclude(
+        # ignore any which have been rebooked in the past 6 hrs
+        date_rebooked__gte=now - timedelta(hours=6)
+    )
+
+    cancellation_periods = set()
+    payment_times_allowed = set()
+    for cancellation_period, payment_time_allowed in candidates.values_list(
+            'event__cancellation_period', 'event__payment_time_allowed'
+    ).distinct():
+        cancellation_periods.add(cancellation_period)
+        if payment_time_allowed:
+            payment_times_allowed.add(payment_time_allowed)
+
+    # cancellation period has passed and a warning has been sent
+    cancellation_period_passed = Q(pk__in=[])
+    for hours in cancellation_periods:
+        cancellation_period_passed |= Q(
+            event__cancellation_period=hours,
+            event__date__lt=now + timedelta(hours=hours)
+        )
+    cancellation_period_passed &= Q(warning_sent=True)
+
+    # payment due date has passed and a warning has been sent
+    payment_due_date_passed = Q(
+        event__payment_due_date__lt=now, warning_sent=True
+    )
+
+    # if there's a payment time allowed, cancel bookings booked longer ago
+    # than this, without checking for warnings (unless there's a payment due
+    # date with a warning sent, which is checked above instead).  For free
+    # class requests, always allow 24 hrs so admin have time to mark classes
+    # as free (i.e. paid)
+    payment_time_passed = Q(pk__in=[])
+    for hours in payment_times_allowed:
+        payment_time_passed |= Q(
+            event__payment_time_allowed=hours,
+            free_class_requested=False
+        ) & _last_booked_before(now - timedelta(hours=hours))
+    payment_time_passed |= Q(
+        event__payment_time_allowed__gt=0, free_class_requested=True
+    ) & _last_booked_before(now - timedelta(hours=24))
+    payment_time_passed &= ~Q(
+        event__payment_due_date__isnull=False, warning_sent=True
+    )
+
+    return candidates.filter(
+        cancellation_period_passed | payment_due_date_passed |
+        payment_time_passed
+    )
+
+
 class Command(BaseCommand):
     help = 'Cancel unpaid bookings that are past payment_due_date, ' \
            'payment_time_allowed or cancellation_period'
 
+    @buffered_activity_log()
     def handle(self, *args, **options):
 
-        bookings = []
-        for booking in Booking.objects.filter(
-            event__date__gte=timezone.now(),
-            event__advance_payment_required=True,
-            status='OPEN',
-            paid=False,
-            payment_confirmed=False,
-            date_booked__lte=timezone.now() - timedelta(hours=6)):
-
-            # ignore any which have been rebooked in the past 6 hrs
-            if booking.date_rebooked and \
-                    (booking.date_rebooked >=
-                         (timezone.now() - timedelta(hours=6))):
-                pass
-            elif booking.event.date - timedelta(
-                    hours=booking.event.cancellation_period
-            ) < timezone.now() and booking.warning_sent:
-                bookings.append(booking)
-            elif booking.event.payment_due_date and booking.warning_sent:
-                if booking.event.payment_due_date < timezone.now():
-                    bookings.append(booking)
-            elif booking.event.payment_time_allowed:
-                # if there's a payment time allowed, cancel bookings booked
-                # longer ago than this (bookings already filtered out
-                # any booked or rebooked within 6 hrs)
-                # don't check for warning sent this time
-                # for free class requests, always allow them 24 hrs so admin
-                # have time to mark classes as free (i.e.paid)
-                last_booked_date = booking.date_rebooked \
-                        if booking.date_rebooked else booking.date_booked
-                if booking.free_class_requested:
-                    if last_booked_date < timezone.now() - timedelta(hours=24):
-                        bookings.append(booking)
-                elif last_booked_date < timezone.now() \
-                        - timedelta(hours=booking.event.payment_time_allowed):
-                        bookings.append(booking)
+        with transaction.atomic():
+            bookings = list(
+                get_bookings_to_cancel(timezone.now())
+                .select_for_update()
+                .select_related('event__event_type', 'user')
+                .order_by('event_id', 'id')
+            )
+            if bookings:
+                # cancel all of the bookings with one update; Booking.save
+                # isn't called, so adjust the events' open booking counts
+                # here, with one update for each distinct change in count
+                Booking.objects.filter(
+                    id__in=[booking.id for booking in bookings]
+                ).update(status='CANCELLED', block=None)
+                cancelled_counts = Counter(
+                    booking.event_id for booking in bookings
+                    if booking._counts_as_open()
+                )
+                events_by_delta = {}
+                for event_id, count in cancelled_counts.items():
+                    events_by_delta.setdefault(count, []).append(event_id)
+                for count, event_ids in events_by_delta.items():
+                    Event.objects.filter(id__in=event_ids).update(
+                        open_booking_count=Greatest(
+                            F('open_booking_count') - count, 0
+                        )
+                    )
+                event_list_cache.bump_version()
 
+        # group the cancelled bookings by event
+        events = OrderedDict()
         for booking in bookings:
-            event_was_full = booking.event.spaces_left == 0
+            events.setdefault(booking.event_id, booking.event)
 
+        batch = EmailBatch(
+            'booking/email/booking_auto_cancelled.txt',
+            'booking/email/booking_auto_cancelled.html'
+        )
+        for booking in bookings:
             ctx = {
                   'booking': booking,
                   'event': booking.event,
                   'date': booking.event.date.strftime('%A %d %B'),
                   'time': booking.event.date.strftime('%I:%M %p'),
             }
-            # send mails to users
-            try:
-                send_mail('{} Booking cancelled: {}'.format(
-                    settings.ACCOUNT_EMAIL_SUBJECT_PREFIX, booking.event.name),
-                    get_template(
-                        'booking/email/booking_auto_cancelled.txt'
-                    ).render(ctx),
-                    settings.DEFAULT_FROM_EMAIL,
-                    [booking.user.email],
-                    html_message=get_template(
-                        'booking/email/booking_auto_cancelled.html'
-                        ).render(ctx),
-                    fail_silently=False)
-            except Exception as e:
-                # send mail to tech support with Exception
-                send_support_email(
-                    e, __name__, "Automatic cancel job - cancelled email"
-                )
+            # emails to users are sent together once all bookings are
+            # cancelled
+            batch.add(
+                booking,
+                '{} Booking cancelled: {}'.format(
+                    settings.ACCOUNT_EMAIL_SUBJECT_PREFIX, booking.event.name
+                ),
+                [booking.user.email],
+                ctx
+            )
             booking.status = 'CANCELLED'
             booking.block = None
-            booking.save()
-            ActivityLog.objects.create(
-                log='Unpaid booking id {} for event {}, user {} '
+            log_activity(
+                'Unpaid booking id {} for event {}, user {} '
                     'automatically cancelled'.format(
                         booking.id, booking.event, booking.user
-                )
+                ),
+                obj=booking, action='cancelled'
             )
-            if event_was_full:
-                waiting_list_users = WaitingListUser.objects.filter(
-                    event=booking.event
+
+        # events that were full before the cancellations (the events were
+        # loaded with their counts from before the update) now have spaces;
+        # email each one's waiting list once
+        freed_events = [
+            event for event in events.values() if event.spaces_left == 0
+        ]
+        waiting_lists = OrderedDict((event.id, []) for event in freed_events)
+        for wluser in WaitingListUser.objects.filter(
+                event__in=freed_events
+        ).select_related('user'):
+            waiting_lists[wluser.event_id].append(wluser.user)
+        for event in freed_events:
+            waiting_list_users = waiting_lists[event.id]
+            try:
+                send_waiting_list_email(event, waiting_list_users)
+                log_activity(
+                    'Waiting list email sent to user(s) {} for '
+                    'event {}'.format(
+                        ', '.join(
+                            [user.username for user in waiting_list_users]
+                        ),
+                        event
+                    ),
+                    obj=event, action='email_sent'
                 )
-                try:
-                    send_waiting_list_email(
-                        booking.event, [user.user for user in waiting_list_users]
-                    )
-                    ActivityLog.objects.create(
-                        log='Waiting list email sent to user(s) {} for '
-                        'event {}'.format(
-                            ', '.join(
-                                [wluser.user.username for \
-                                    wluser in waiting_list_users]
-                            ),
-                            booking.event
-                        )
-                    )
-                except Exception as e:
-                    # send mail to tech support with Exception
-                    send_support_email(
-                        e, __name__, "Automatic cancel job - waiting list email"
-                    )
+            except Exception as e:
+                # send mail to tech support with Exception
+                send_support_email(
+                    e, __name__, "Automatic cancel job - waiting list email"
+                )
+
+        # send mails to users
+        sent, failed = batch.send()
+        if failed:
+            # send mail to tech support with Exceptions
+            send_support_email(
+                '; '.join(
+                    ['booking id {}: {}'.format(booking.id, e)
+                     for booking, e in failed]
+                ),
+                __name__, "Automatic cancel job - cancelled email"
+            )
 
         if bookings:
             if settings.SEND_ALL_STUDIO_EMAILS:
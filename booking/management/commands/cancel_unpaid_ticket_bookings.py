@@ -31,7 +31,7 @@ from django.core import management
 
 from booking.models import TicketBooking, TicketedEvent
 from booking.email_helpers import send_support_email, send_waiting_list_email
-from activitylog.models import ActivityLog
+from activitylog.helpers import buffered_activity_log, log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -40,6 +40,7 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Cancel unpaid ticket bookings that are past payment_due_date or '
     'payment time allowed'
+    @buffered_activity_log()
     def handle(self, *args, **options):
 
         # get relevant ticketed_events
@@ -105,13 +106,14 @@ class Command(BaseCommand):
             ticket_booking.cancelled = True
             ticket_booking.save()
 
-            ActivityLog.objects.create(
-                log='Unpaid ticket booking ref {} for event {}, user {} '
+            log_activity(
+                'Unpaid ticket booking ref {} for event {}, user {} '
                     'automatically cancelled'.format(
                     ticket_booking.booking_reference,
                     ticket_booking.ticketed_event,
                     ticket_booking.user.username
-                )
+                ),
+                obj=ticket_booking, action='cancelled'
             )
 
         if bookings_to_cancel:
@@ -1,8 +1,12 @@
 '''
 Create free 5-class blocks for users in 'free_monthly_blocks' group
 Will be run on 1st of each month as cron job
+Members without an active free block are found with one query and their
+blocks are created in bulk.  Use --dry-run to report which users would get
+a block without creating anything.
 '''
 import datetime
+import time
 
 from django.contrib.auth.models import User, Group
 from django.conf import settings
@@ -12,24 +16,44 @@ from django.utils import timezone
 
 from booking.models import Block, BlockType, EventType
 
-from activitylog.models import ActivityLog
+from activitylog.helpers import buffered_activity_log, log_activity
 
 
 class Command(BaseCommand):
     help = 'create free monthly blocks for selected users'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Report the users who would get free blocks without '
+                 'creating them'
+        )
+
+    @buffered_activity_log()
     def handle(self, *args, **options):
+        start_time = time.time()
         event_type = EventType.objects.get(subtype='Pole level class')
-        free_blocktype, _ = BlockType.objects.get_or_create(
+        free_blocktype_fields = dict(
             identifier='Free - 5 classes', active=False, cost=0, duration=1,
             size=5, event_type=event_type
         )
+        if options['dry_run']:
+            # don't create the block type on a dry run; if it doesn't exist
+            # yet, no one has an active free block
+            free_blocktype = BlockType.objects.filter(
+                **free_blocktype_fields
+            ).first()
+        else:
+            free_blocktype, _ = BlockType.objects.get_or_create(
+                **free_blocktype_fields
+            )
 
-        users = []
         group = None
         try:
             group = Group.objects.get(name='free_monthly_blocks')
-            users = group.user_set.all()
         except Group.DoesNotExist:
             error_msg = "Group named 'free_monthly_blocks' does not exist"
             self.stdout.write(error_msg)
@@ -44,37 +68,52 @@ class Command(BaseCommand):
             )
 
         if group:
-            created_users = []
-            already_active_users = []
-
-            for user in users:
-                active_free_blocks = [
-                    block for block in
-                    Block.objects.filter(block_type=free_blocktype, user=user)
-                    if block.active_block()
-                ]
-                if active_free_blocks:
-                    already_active_users.append(user)
-                else:
-                    # Block expiry is set to the end of the date it's created
-                    # create new block with start date previous day, so when
-                    # we run this command on 1st of the month, it
-                    # expires on last day of that month, not 1st of next month
-                    Block.objects.create(
-                        block_type=free_blocktype, user=user, paid=True,
-                        start_date=(timezone.now() - datetime.timedelta(1))
-                        .replace(hour=23, minute=59, second=59)
-                    )
-                    created_users.append(user)
+            members = group.user_set.order_by('id')
+            if free_blocktype is None:
+                created_users = list(members)
+                already_active_users = []
+            else:
+                active_free_blocks = Block.objects.active().filter(
+                    block_type=free_blocktype
+                )
+                created_users = list(
+                    members.exclude(blocks__in=active_free_blocks)
+                )
+                already_active_users = list(
+                    members.filter(blocks__in=active_free_blocks).distinct()
+                )
+
+            if options['dry_run']:
+                self.report_dry_run(created_users, already_active_users)
+                self.write_timing(start_time)
+                return
 
             if created_users:
+                # Block expiry is set to the end of the date it's created
+                # create new block with start date previous day, so when
+                # we run this command on 1st of the month, it
+                # expires on last day of that month, not 1st of next month
+                start_date = (timezone.now() - datetime.timedelta(1))\
+                    .replace(hour=23, minute=59, second=59)
+                new_blocks = [
+                    Block(
+                        block_type=free_blocktype, user=user, paid=True,
+                        start_date=start_date
+                    ) for user in created_users
+                ]
+                # bulk_create doesn't call Block.save, so set the expiry date
+                # here
+                for block in new_blocks:
+                    block.expiry_date = block._calculate_expiry_date()
+                Block.objects.bulk_create(new_blocks)
+
                 message = 'Free 5 class blocks created for {}'.format(
                     ', '.join(
                         ['{} {}'.format(user.first_name, user.last_name)
                          for user in created_users]
                     )
                 )
-                ActivityLog.objects.create(log=message)
+                log_activity(message)
                 self.stdout.write(message)
                 send_mail(
                     '{} Free blocks created'.format(
@@ -94,7 +133,7 @@ class Command(BaseCommand):
                          for user in already_active_users]
                     )
                 )
-                ActivityLog.objects.create(log=message)
+                log_activity(message)
                 self.stdout.write(message)
                 send_mail(
                     '{} Free blocks not created'.format(
@@ -117,3 +156,32 @@ class Command(BaseCommand):
                     [settings.SUPPORT_EMAIL],
                     fail_silently=False
                 )
+
+            self.write_timing(start_time)
+
+    def report_dry_run(self, users_to_create, already_active_users):
+        self.stdout.write(
+            'Dry run: free 5 class blocks would be created for {} user{}{}'
+            .format(
+                len(users_to_create),
+                '' if len(users_to_create) == 1 else 's',
+                ': {}'.format(', '.join(
+                    ['{} {}'.format(user.first_name, user.last_name)
+                     for user in users_to_create]
+                )) if users_to_create else ''
+            )
+        )
+        if already_active_users:
+            self.stdout.write(
+                'Dry run: active free block already exists for {}'.format(
+                    ', '.join(
+                        ['{} {}'.format(user.first_name, user.last_name)
+                         for user in already_active_users]
+                    )
+                )
+            )
+
+    def write_timing(self, start_time):
+        self.stdout.write(
+            'Completed in {:.2f} seconds'.format(time.time() - start_time)
+        )
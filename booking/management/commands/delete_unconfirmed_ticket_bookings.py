@@ -17,7 +17,7 @@ from django.core import management
 
 from booking.models import TicketBooking, TicketedEvent
 from booking.email_helpers import send_support_email, send_waiting_list_email
-from activitylog.models import ActivityLog
+from activitylog.helpers import buffered_activity_log, log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -29,6 +29,7 @@ class Command(BaseCommand):
            'during booking process and booking aborted without using cancel ' \
            'button'
 
+    @buffered_activity_log()
     def handle(self, *args, **options):
 
         # get relevant ticket_bookings
@@ -42,14 +43,15 @@ class Command(BaseCommand):
 
             ticket_booking.delete()
 
-            ActivityLog.objects.create(
-                log='Aborted (purchase unconfirmed) ticket booking ref {} '
+            log_activity(
+                'Aborted (purchase unconfirmed) ticket booking ref {} '
                     'for event {}, user {} automatically deleted '
                     'after 1 hr'.format(
                     ticket_booking.booking_reference,
                     ticket_booking.ticketed_event,
                     ticket_booking.user.username
-                )
+                ),
+                action='deleted'
             )
 
         if bookings_to_delete:
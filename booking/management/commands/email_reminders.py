@@ -5,34 +5,33 @@ Check for events with date within:
 Email all users on event.bookings where booking.status == 'OPEN'
 Add reminder_sent flag to booking model so we don't keep sending
 '''
-from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import get_template
 from django.core.management.base import BaseCommand
 from django.core import management
+from booking.email_helpers import EmailBatch, send_support_email
 from booking.templatetags.bookingtags import format_cancellation
-from booking.models import Booking, Event
-from activitylog.models import ActivityLog
+from booking.models import Booking
+from booking.utils import get_events_cancellation_period_within
+from activitylog.helpers import buffered_activity_log, log_activity
 
 class Command(BaseCommand):
     help = 'email reminders for upcoming bookings'
 
+    @buffered_activity_log()
     def handle(self, *args, **options):
-        events = [
-            event for event in Event.objects.all() if
-            event.date >= timezone.now() and
-            (event.date - timedelta(hours=(event.cancellation_period + 24)))
-            <= timezone.now()
-        ]
-
         upcoming_bookings = Booking.objects.filter(
-            event__in=events,
+            event__in=get_events_cancellation_period_within(
+                24, timezone.now()
+            ),
             status='OPEN',
             reminder_sent=False
-            )
+            ).select_related('event', 'event__event_type', 'user')
 
+        batch = EmailBatch(
+            'booking/email/booking_reminder.txt',
+            'booking/email/booking_reminder.html'
+        )
         for booking in upcoming_bookings:
             ctx = {
                   'booking': booking,
@@ -48,31 +47,46 @@ class Command(BaseCommand):
                         booking.event.cancellation_period
                         )
             }
-            send_mail('{} Reminder: {}'.format(
-                settings.ACCOUNT_EMAIL_SUBJECT_PREFIX, booking.event.name),
-                get_template('booking/email/booking_reminder.txt').render(ctx),
-                settings.DEFAULT_FROM_EMAIL,
+            batch.add(
+                booking,
+                '{} Reminder: {}'.format(
+                    settings.ACCOUNT_EMAIL_SUBJECT_PREFIX, booking.event.name
+                ),
                 [booking.user.email],
-                html_message=get_template(
-                    'booking/email/booking_reminder.html'
-                    ).render(ctx),
-                fail_silently=False)
-            booking.reminder_sent = True
-            booking.save()
-
-            ActivityLog.objects.create(
-                log='Reminder email sent for booking id {} for event {}, '
-                'user {}'.format(
-                    booking.id, booking.event, booking.user.username
-                )
+                ctx
             )
 
-        if upcoming_bookings:
+        # mark each booking as soon as its email is sent so that it isn't
+        # emailed again if the command is interrupted
+        sent, failed = batch.send(
+            on_sent=lambda booking: Booking.objects.filter(id=booking.id)
+            .update(reminder_sent=True)
+        )
+
+        if sent:
+            for booking in sent:
+                log_activity(
+                    'Reminder email sent for booking id {} for event {}, '
+                    'user {}'.format(
+                        booking.id, booking.event, booking.user.username
+                    ),
+                    obj=booking, action='email_sent'
+                )
             self.stdout.write(
                 'Reminder emails sent for booking ids {}'.format(
-                    ', '.join([str(booking.id) for booking in upcoming_bookings])
+                    ', '.join([str(booking.id) for booking in sent])
                 )
             )
 
-        else:
+        if failed:
+            errors = '; '.join(
+                ['booking id {}: {}'.format(booking.id, e)
+                 for booking, e in failed]
+            )
+            self.stdout.write(
+                'Reminder emails could not be sent for {}'.format(errors)
+            )
+            send_support_email(errors, __name__, "Email reminders")
+
+        if not upcoming_bookings:
             self.stdout.write('No reminders to send')
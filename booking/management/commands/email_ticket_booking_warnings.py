@@ -17,19 +17,19 @@ import pytz
 from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import get_template
 from django.core.management.base import BaseCommand
 from django.core import management
 
+from booking.email_helpers import EmailBatch, send_support_email
 from booking.templatetags.bookingtags import format_cancellation
 from booking.models import TicketedEvent, TicketBooking
-from activitylog.models import ActivityLog
+from activitylog.helpers import buffered_activity_log, log_activity
 
 
 class Command(BaseCommand):
     help = 'email warnings for unpaid ticket bookings'
 
+    @buffered_activity_log()
     def handle(self, *args, **options):
         # send warning 2 days prior to cancellation period or payment due
         # date
@@ -59,12 +59,16 @@ def get_bookings(num_hrs):
         paid=False,
         warning_sent=False,
         date_booked__lte=timezone.now() - timedelta(hours=2)
-        )
+        ).select_related('ticketed_event', 'user')
 
 
 def send_warning_email(self, upcoming_bookings):
+    batch = EmailBatch(
+        'booking/email/ticket_booking_warning.txt',
+        'booking/email/ticket_booking_warning.html'
+    )
+    uk_tz = pytz.timezone('Europe/London')
     for ticket_booking in upcoming_bookings:
-        uk_tz = pytz.timezone('Europe/London')
         due_datetime = ticket_booking.ticketed_event.payment_due_date
         due_datetime = due_datetime.astimezone(uk_tz)
 
@@ -73,38 +77,52 @@ def send_warning_email(self, upcoming_bookings):
               'event': ticket_booking.ticketed_event,
               'due_datetime': due_datetime.strftime('%A %d %B %H:%M'),
         }
-
-        send_mail('{} Reminder: Ticket booking ref {} is not yet paid'.format(
-            settings.ACCOUNT_EMAIL_SUBJECT_PREFIX,
-            ticket_booking.booking_reference
-        ),
-            get_template('booking/email/ticket_booking_warning.txt').render(ctx),
-            settings.DEFAULT_FROM_EMAIL,
+        batch.add(
+            ticket_booking,
+            '{} Reminder: Ticket booking ref {} is not yet paid'.format(
+                settings.ACCOUNT_EMAIL_SUBJECT_PREFIX,
+                ticket_booking.booking_reference
+            ),
             [ticket_booking.user.email],
-            html_message=get_template(
-                'booking/email/ticket_booking_warning.html'
-                ).render(ctx),
-            fail_silently=False)
-        ticket_booking.warning_sent = True
-        ticket_booking.save()
-
-        ActivityLog.objects.create(
-            log='Warning email sent for booking ref {}, '
-            'for event {}, user {}'.format(
-                ticket_booking.booking_reference,
-                ticket_booking.ticketed_event, ticket_booking.user.username
-            )
+            ctx
         )
 
-    if upcoming_bookings:
+    # mark each booking as soon as its email is sent so that it isn't
+    # emailed again if the command is interrupted
+    sent, failed = batch.send(
+        on_sent=lambda ticket_booking: TicketBooking.objects.filter(
+            id=ticket_booking.id
+        ).update(warning_sent=True)
+    )
+
+    if sent:
+        for ticket_booking in sent:
+            log_activity(
+                'Warning email sent for booking ref {}, '
+                'for event {}, user {}'.format(
+                    ticket_booking.booking_reference,
+                    ticket_booking.ticketed_event, ticket_booking.user.username
+                ),
+                obj=ticket_booking, action='email_sent'
+            )
         self.stdout.write(
             'Warning emails sent for booking refs {}'.format(
                 ', '.join(
                     [str(ticket_booking.booking_reference)
-                     for ticket_booking in upcoming_bookings]
+                     for ticket_booking in sent]
                 )
             )
         )
 
-    else:
+    if failed:
+        errors = '; '.join(
+            ['booking ref {}: {}'.format(ticket_booking.booking_reference, e)
+             for ticket_booking, e in failed]
+        )
+        self.stdout.write(
+            'Warning emails could not be sent for {}'.format(errors)
+        )
+        send_support_email(errors, __name__, "Email ticket booking warnings")
+
+    if not upcoming_bookings:
         self.stdout.write('No warnings to send')
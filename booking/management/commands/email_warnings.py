@@ -13,19 +13,21 @@ import pytz
 from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import get_template
 from django.core.management.base import BaseCommand
 from django.core import management
+from django.db.models import Q
 
+from booking.email_helpers import EmailBatch, send_support_email
 from booking.templatetags.bookingtags import format_cancellation
 from booking.models import Booking, Event
-from activitylog.models import ActivityLog
+from booking.utils import get_events_cancellation_period_within
+from activitylog.helpers import buffered_activity_log, log_activity
 
 
 class Command(BaseCommand):
     help = 'email warnings for unpaid bookings'
 
+    @buffered_activity_log()
     def handle(self, *args, **options):
         # send warning 2 days prior to cancellation period or payment due
         # date
@@ -34,37 +36,32 @@ class Command(BaseCommand):
 
 
 def get_bookings(num_hrs):
-    events_cancellation_period_soon = [
-        event for event in Event.objects.all() if event.cancellation_period and
-        event.date >= timezone.now() and
-        (event.date - timedelta(hours=(event.cancellation_period + num_hrs)))
-        <= timezone.now()
-    ]
-
-    events_with_payment_due_dates = [
-        event for event in Event.objects.all() if event.payment_due_date]
-    events_payment_due_soon = [
-        event for event in events_with_payment_due_dates if
-        event.date >= timezone.now() and
-        (event.payment_due_date - timedelta(hours=num_hrs)) <= timezone.now()
-    ]
-    events = list(
-        set(events_payment_due_soon) | set(events_cancellation_period_soon)
-        )
+    now = timezone.now()
+    events_cancellation_period_soon = get_events_cancellation_period_within(
+        num_hrs, now
+    ).exclude(cancellation_period=0)
+    events_payment_due_soon = Event.objects.filter(
+        date__gte=now, payment_due_date__lte=now + timedelta(hours=num_hrs)
+    )
 
     return Booking.objects.filter(
-        event__in=events,
+        Q(event__in=events_cancellation_period_soon) |
+        Q(event__in=events_payment_due_soon),
         status='OPEN',
         event__cost__gt=0,
         payment_confirmed=False,
         warning_sent=False,
-        date_booked__lte=timezone.now() - timedelta(hours=2)
-        )
+        date_booked__lte=now - timedelta(hours=2)
+        ).select_related('event', 'event__event_type', 'user')
 
 
 def send_warning_email(self, upcoming_bookings):
+    batch = EmailBatch(
+        'booking/email/booking_warning.txt',
+        'booking/email/booking_warning.html'
+    )
+    uk_tz = pytz.timezone('Europe/London')
     for booking in upcoming_bookings:
-        uk_tz = pytz.timezone('Europe/London')
         due_datetime = booking.event.date - timedelta(hours=(booking.event.cancellation_period))
         if booking.event.payment_due_date and booking.event.payment_due_date < due_datetime:
             due_datetime = booking.event.payment_due_date
@@ -87,32 +84,46 @@ def send_warning_email(self, upcoming_bookings):
                     ) if booking.event.payment_due_date else None,
               'due_datetime': due_datetime.strftime('%A %d %B %H:%M'),
         }
-
-        send_mail('{} Reminder: {}'.format(
-            settings.ACCOUNT_EMAIL_SUBJECT_PREFIX, booking.event.name),
-            get_template('booking/email/booking_warning.txt').render(ctx),
-            settings.DEFAULT_FROM_EMAIL,
+        batch.add(
+            booking,
+            '{} Reminder: {}'.format(
+                settings.ACCOUNT_EMAIL_SUBJECT_PREFIX, booking.event.name
+            ),
             [booking.user.email],
-            html_message=get_template(
-                'booking/email/booking_warning.html'
-                ).render(ctx),
-            fail_silently=False)
-        booking.warning_sent = True
-        booking.save()
-
-        ActivityLog.objects.create(
-            log='Warning email sent for booking id {}, '
-            'for event {}, user {}'.format(
-                booking.id, booking.event, booking.user.username
-            )
+            ctx
         )
 
-    if upcoming_bookings:
+    # mark each booking as soon as its email is sent so that it isn't
+    # emailed again if the command is interrupted
+    sent, failed = batch.send(
+        on_sent=lambda booking: Booking.objects.filter(id=booking.id)
+        .update(warning_sent=True)
+    )
+
+    if sent:
+        for booking in sent:
+            log_activity(
+                'Warning email sent for booking id {}, '
+                'for event {}, user {}'.format(
+                    booking.id, booking.event, booking.user.username
+                ),
+                obj=booking, action='email_sent'
+            )
         self.stdout.write(
             'Warning emails sent for booking ids {}'.format(
-                ', '.join([str(booking.id) for booking in upcoming_bookings])
+                ', '.join([str(booking.id) for booking in sent])
             )
         )
 
-    else:
+    if failed:
+        errors = '; '.join(
+            ['booking id {}: {}'.format(booking.id, e)
+             for booking, e in failed]
+        )
+        self.stdout.write(
+            'Warning emails could not be sent for {}'.format(errors)
+        )
+        send_support_email(errors, __name__, "Email warnings")
+
+    if not upcoming_bookings:
         self.stdout.write('No warnings to send')
@@ -0,0 +1,74 @@
+'''
+Check the denormalised Event.open_booking_count against the actual number of
+open (non no-show) bookings for each event and repair any that have drifted.
+Use --dry-run to report drift without changing anything.
+'''
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, IntegerField, Sum, When
+
+from booking.models import Event
+
+from activitylog.helpers import log_activity
+
+
+class Command(BaseCommand):
+    help = 'reconcile stored open booking counts on events'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Report events with incorrect counts without fixing them'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        with transaction.atomic():
+            events = Event.objects.annotate(
+                actual_count=Sum(
+                    Case(
+                        When(
+                            bookings__status='OPEN', bookings__no_show=False,
+                            then=1
+                        ),
+                        default=0, output_field=IntegerField()
+                    )
+                )
+            ).values_list('id', 'name', 'open_booking_count', 'actual_count')
+
+            drifted = [
+                (ev_id, name, stored, actual or 0)
+                for ev_id, name, stored, actual in events
+                if stored != (actual or 0)
+            ]
+
+            if not drifted:
+                self.stdout.write('All event booking counts are correct')
+                return
+
+            for ev_id, name, stored, actual in drifted:
+                self.stdout.write(
+                    'Event id {} ({}): stored count {}, actual count '
+                    '{}'.format(ev_id, name, stored, actual)
+                )
+                if not dry_run:
+                    Event.objects.filter(id=ev_id).update(
+                        open_booking_count=actual
+                    )
+
+            if dry_run:
+                self.stdout.write(
+                    '{} event(s) with incorrect booking counts; run without '
+                    '--dry-run to fix'.format(len(drifted))
+                )
+            else:
+                message = 'Open booking counts reconciled for event ids ' \
+                          '{}'.format(
+                    ', '.join([str(ev[0]) for ev in drifted])
+                )
+                log_activity(message)
+                self.stdout.write(message)
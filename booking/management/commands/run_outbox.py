@@ -0,0 +1,158 @@
+'''
+Send queued emails from the outbox (see settings.USE_EMAIL_OUTBOX)
+
+Emails that fail are retried with exponential backoff; after --max-attempts
+failures they are marked as FAILED and left for an admin user to check and
+retry from the studioadmin outbox page.
+
+Run from cron (e.g. every minute), or continuously with --loop.
+'''
+import time
+
+from datetime import timedelta
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from booking.models import OutboxEmail
+from activitylog.helpers import log_activity
+
+
+# seconds to wait before the first retry; doubled for each failed attempt
+RETRY_BACKOFF = 60
+MAX_RETRY_DELAY = 60 * 60 * 6
+# how long a worker has to send an email it has claimed before another worker
+# can pick it up
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def get_retry_delay(attempts):
+    return timedelta(
+        seconds=min(RETRY_BACKOFF * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    )
+
+
+def claim_due_emails(batch_size):
+    """
+    Mark a batch of due emails as SENDING and return them.  Each email is
+    claimed with a conditional update so that concurrent workers never send
+    the same email; emails claimed by a worker that died are picked up again
+    once the claim expires.
+    """
+    now = timezone.now()
+    due = Q(status=OutboxEmail.QUEUED) | Q(status=OutboxEmail.SENDING)
+    candidate_ids = OutboxEmail.objects.filter(due, next_attempt__lte=now)\
+        .order_by('next_attempt', 'id').values_list('id', flat=True)[:batch_size]
+
+    claimed_ids = [
+        email_id for email_id in candidate_ids
+        if OutboxEmail.objects.filter(
+            due, id=email_id, next_attempt__lte=now
+        ).update(status=OutboxEmail.SENDING, next_attempt=now + CLAIM_TIMEOUT)
+    ]
+    return OutboxEmail.objects.filter(id__in=claimed_ids).order_by('id')
+
+
+class Command(BaseCommand):
+    help = 'send emails queued in the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            dest='batch_size',
+            default=100,
+            help='Maximum number of emails to send in each batch'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            dest='max_attempts',
+            default=5,
+            help='Number of attempts before an email is marked as failed'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            dest='loop',
+            default=False,
+            help='Keep running, checking for new emails every --interval '
+                 'seconds'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            dest='interval',
+            default=10,
+            help='Seconds to wait between checks when running with --loop'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent, retrying, failed = self.send_batch(
+                options['batch_size'], options['max_attempts']
+            )
+            if sent or retrying or failed:
+                message = 'Outbox run: {} email(s) sent, {} to retry, {} ' \
+                          'failed'.format(sent, retrying, failed)
+                log_activity(message)
+                self.stdout.write(message)
+            elif not options['loop']:
+                self.stdout.write('No emails to send')
+
+            if not options['loop']:
+                break
+            if not (sent or retrying or failed):
+                time.sleep(options['interval'])
+
+    def send_batch(self, batch_size, max_attempts):
+        emails = list(claim_due_emails(batch_size))
+        sent = retrying = failed = 0
+        if not emails:
+            return sent, retrying, failed
+
+        connection = get_connection()
+        try:
+            connection.open()
+            connection_error = None
+        except Exception as e:
+            connection_error = e
+
+        try:
+            for email in emails:
+                email.attempts += 1
+                try:
+                    if connection_error:
+                        raise connection_error
+                    connection.send_messages([email.get_message()])
+                except Exception as e:
+                    email.last_error = str(e)
+                    if email.attempts >= max_attempts:
+                        email.status = OutboxEmail.FAILED
+                        failed += 1
+                    else:
+                        email.status = OutboxEmail.QUEUED
+                        email.next_attempt = timezone.now() + \
+                            get_retry_delay(email.attempts)
+                        retrying += 1
+                else:
+                    email.status = OutboxEmail.SENT
+                    email.sent_date = timezone.now()
+                    email.last_error = ''
+                    sent += 1
+                email.save(
+                    update_fields=[
+                        'attempts', 'status', 'last_error', 'next_attempt',
+                        'sent_date'
+                    ]
+                )
+        finally:
+            if not connection_error:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+        return sent, retrying, failed
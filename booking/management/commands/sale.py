@@ -11,7 +11,7 @@ from django.utils import timezone
 from booking.models import Event
 from booking.email_helpers import send_support_email
 
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 class Command(BaseCommand):
@@ -55,7 +55,7 @@ class Command(BaseCommand):
                 'sale' if action == 'on' else 'non-sale',
                 ', '.join([str(pc.id) for pc in pole_classes])
                 )
-            ActivityLog.objects.create(log=message)
+            log_activity(message)
             self.stdout.write(message)
 
         if pole_practices:
@@ -64,7 +64,7 @@ class Command(BaseCommand):
                 'sale' if action == 'on' else 'non-sale',
                 ', '.join([str(pp.id) for pp in pole_practices])
             )
-            ActivityLog.objects.create(log=message)
+            log_activity(message)
             self.stdout.write(message)
 
         if pole_classes or pole_practices:
@@ -7,7 +7,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 
 from booking.models import Block, BlockType, Booking, Event
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 class Command(BaseCommand):
@@ -49,8 +49,8 @@ class Command(BaseCommand):
                 )
             )
             if created:
-                ActivityLog.objects.create(
-                    log="User {} with email {} created".format(
+                log_activity(
+                    "User {} with email {} created".format(
                         user.username, user.email
                     )
                 )
@@ -77,8 +77,8 @@ class Command(BaseCommand):
                 class_blocks_used = int(line[5]) # the number of dummy classes to make
 
                 if block_created:
-                    ActivityLog.objects.create(
-                        log="Block {} set up ({} total, {} already used)".format(
+                    log_activity(
+                        "Block {} set up ({} total, {} already used)".format(
                             block,
                             class_block,
                             class_blocks_used
@@ -123,8 +123,8 @@ class Command(BaseCommand):
                         )
                     )
                     if created:
-                        ActivityLog.objects.create(
-                            log="Booking for user {}, class {} created".format(
+                        log_activity(
+                            "Booking for user {}, class {} created".format(
                                 user.username,
                                 event
                             )
@@ -152,8 +152,8 @@ class Command(BaseCommand):
                 practice_blocks_used = int(line[11]) # the number of dummy classes to make
 
                 if block_created:
-                    ActivityLog.objects.create(
-                        log="Block {} set up ({} total, {} already used)".format(
+                    log_activity(
+                        "Block {} set up ({} total, {} already used)".format(
                             block,
                             practice_block,
                             practice_blocks_used
@@ -202,8 +202,8 @@ class Command(BaseCommand):
                         )
                     )
                     if created:
-                        ActivityLog.objects.create(
-                            log="Booking for user {}, {} created".format(
+                        log_activity(
+                            "Booking for user {}, {} created".format(
                                 user.username,
                                 event)
                         )
@@ -238,8 +238,8 @@ class Command(BaseCommand):
                         )
                     )
                     if created:
-                        ActivityLog.objects.create(
-                            log="Booking for user {}, class {} created".format(
+                        log_activity(
+                            "Booking for user {}, class {} created".format(
                                 user.username,
                                 event
                             )
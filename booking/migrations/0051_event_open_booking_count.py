@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.1 on 2026-10-18 19:28
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_open_booking_count(apps, schema_editor):
+    Event = apps.get_model('booking', 'Event')
+    Booking = apps.get_model('booking', 'Booking')
+
+    counts = Booking.objects.filter(status='OPEN', no_show=False)\
+        .values('event').annotate(count=models.Count('id'))
+    for count in counts:
+        Event.objects.filter(id=count['event'])\
+            .update(open_booking_count=count['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0050_auto_20160707_2143'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='open_booking_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(
+            populate_open_booking_count,
+            reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.1 on 2026-10-18 20:02
+from __future__ import unicode_literals
+
+from datetime import timedelta
+from dateutil.relativedelta import relativedelta
+
+from django.db import migrations, models
+
+
+def populate_block_expiry_date(apps, schema_editor):
+    Block = apps.get_model('booking', 'Block')
+
+    for block in Block.objects.select_related(
+            'block_type', 'parent__block_type'
+    ):
+        duration = block.block_type.duration
+        if block.parent:
+            duration = block.parent.block_type.duration
+        expiry_datetime = block.start_date + relativedelta(months=duration)
+        next_day = (expiry_datetime + timedelta(days=1)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        block.expiry_date = next_day - timedelta(seconds=1)
+        block.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0051_event_open_booking_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='block',
+            name='expiry_date',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(
+            populate_block_expiry_date, reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.1 on 2026-10-18 23:49
+from __future__ import unicode_literals
+
+import booking.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0053_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='slug',
+            field=booking.models.EventSlugField(blank=True, editable=False, max_length=40, populate_from=['name', 'date'], unique=True),
+        ),
+    ]
@@ -2,17 +2,24 @@
 
 import logging
 import pytz
+import re
 import shortuuid
 
-from django.db import models
+from collections import OrderedDict
+
+from django.db import connections, models, transaction
 from django.conf import settings
 from django.contrib.auth.models import Group, User
 from django.core.exceptions import ValidationError
+from django.core.mail import EmailMultiAlternatives
 from django.core.urlresolvers import reverse
-from django.db.models.signals import pre_save, post_save
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.functional import cached_property
+from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy as _
 
 from django_extensions.db.fields import AutoSlugField
@@ -20,7 +27,8 @@ from django_extensions.db.fields import AutoSlugField
 from datetime import timedelta
 from dateutil.relativedelta import relativedelta
 
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
+from booking import event_list_cache
 
 
 logger = logging.getLogger(__name__)
@@ -67,6 +75,104 @@ class EventType(models.Model):
         unique_together = ('event_type', 'subtype')
 
 
+class EventQuerySet(models.QuerySet):
+
+    def _unique_slugs(self, events):
+        """
+        Generate unique slugs for unsaved events, in the same form as
+        Event.slug would on save, but checking for existing slugs with one
+        query per batch of events rather than one or more queries per event.
+        """
+        max_length = self.model._meta.get_field('slug').max_length
+
+        def clean(slug):
+            return re.sub('-{2,}', '-', slug).strip('-')
+
+        base_slugs = [
+            clean('-'.join([slugify(event.name), slugify(str(event.date))])
+                  [:max_length])
+            for event in events
+        ]
+
+        # every slug generated for a base slug (with a numbered suffix of up
+        # to 3 characters) starts with this prefix
+        prefixes = sorted({
+            clean(base_slug[:max_length - 4]) for base_slug in base_slugs
+        })
+        taken = set()
+        # in batches to stay within SQLite's limit of 999 query parameters
+        for i in range(0, len(prefixes), 500):
+            prefix_filter = models.Q()
+            for prefix in prefixes[i:i + 500]:
+                prefix_filter |= models.Q(slug__startswith=prefix)
+            taken.update(
+                self.model.objects.filter(prefix_filter)
+                .values_list('slug', flat=True)
+            )
+
+        slugs = []
+        for base_slug in base_slugs:
+            slug = base_slug
+            suffix = 2
+            while slug in taken:
+                slug = '{}-{}'.format(
+                    clean(base_slug[:max_length - len(str(suffix)) - 1]),
+                    suffix
+                )
+                suffix += 1
+            taken.add(slug)
+            slugs.append(slug)
+        return slugs
+
+    def bulk_create_with_slugs(self, events):
+        """
+        Insert new events with bulk_create, in batches, with their slugs
+        generated up front (see EventSlugField).  Returns the saved events
+        (with ids) in the same order.
+        """
+        if not events:
+            return []
+        for event, slug in zip(events, self._unique_slugs(events)):
+            event.set_dependent_fields()
+            event.slug = slug
+            event.slug_is_unique = True
+
+        fields = [
+            field for field in self.model._meta.concrete_fields
+            if not isinstance(field, models.AutoField)
+        ]
+        batch_size = max(
+            connections[self.db].ops.bulk_batch_size(fields, events), 1
+        )
+        saved = {}
+        with transaction.atomic(using=self.db, savepoint=False):
+            for i in range(0, len(events), batch_size):
+                batch = events[i:i + batch_size]
+                self.bulk_create(batch)
+                # bulk_create doesn't set the ids (except on PostgreSQL), so
+                # fetch the saved events
+                saved.update(
+                    (event.slug, event) for event in
+                    self.filter(slug__in=[event.slug for event in batch])
+                )
+        # post_save isn't sent for the inserted events
+        event_list_cache.bump_version()
+        return [saved[event.slug] for event in events]
+
+
+class EventSlugField(AutoSlugField):
+    """
+    An AutoSlugField that keeps the slug of a new event marked with
+    slug_is_unique, as set by EventQuerySet.bulk_create_with_slugs, rather
+    than generating and checking it again for each event inserted.
+    """
+
+    def create_slug(self, model_instance, add):
+        if add and getattr(model_instance, 'slug_is_unique', False):
+            return getattr(model_instance, self.attname)
+        return super(EventSlugField, self).create_slug(model_instance, add)
+
+
 class Event(models.Model):
     name = models.CharField(max_length=255)
     event_type = models.ForeignKey(EventType)
@@ -107,7 +213,7 @@ class Event(models.Model):
         help_text='Run by external instructor; booking and payment to be made '
                   'with instructor directly')
     email_studio_when_booked = models.BooleanField(default=False)
-    slug = AutoSlugField(
+    slug = EventSlugField(
         populate_from=['name', 'date'], max_length=40, unique=True
     )
     cancelled = models.BooleanField(default=False)
@@ -117,6 +223,12 @@ class Event(models.Model):
         help_text='Email for the paypal account to be used for payment.  '
                   'Check this carefully!'
     )
+    # Denormalised count of open, non-no-show bookings; maintained by
+    # Booking.save and the booking post_delete signal.  Use the
+    # reconcile_event_counters command to detect and repair drift.
+    open_booking_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = EventQuerySet.as_manager()
 
     class Meta:
         ordering = ['-date']
@@ -124,12 +236,25 @@ class Event(models.Model):
     @cached_property
     def spaces_left(self):
         if self.max_participants:
-            booked_number = Booking.objects.filter(
-                event__id=self.id, status='OPEN', no_show=False).count()
-            return self.max_participants - booked_number
+            return self.max_participants - self.open_booking_count
         else:
             return 100
 
+    def _adjust_open_booking_count(self, delta):
+        """
+        Apply delta to the stored open booking count with a single UPDATE,
+        and to this instance's open_booking_count.  Changes made through other
+        instances of the event aren't seen; reload the event for those.
+        """
+        # the count is a positive integer; if it has drifted, clamp it at 0
+        # rather than fail the update
+        Event.objects.filter(id=self.id).update(
+            open_booking_count=Greatest(F('open_booking_count') + delta, 0)
+        )
+        self.open_booking_count = max(self.open_booking_count + delta, 0)
+        for attr in ['spaces_left', 'bookable']:
+            self.__dict__.pop(attr, None)
+
     @cached_property
     def bookable(self):
         return self.booking_open and self.spaces_left > 0
@@ -150,7 +275,11 @@ class Event(models.Model):
             ).strftime('%d %b %Y, %H:%M')
         )
 
-    def save(self, *args, **kwargs):
+    def set_dependent_fields(self):
+        """
+        Make the payment and booking fields consistent with the cost, payment
+        due date and external instructor settings
+        """
         if not self.cost:
             self.advance_payment_required = False
             self.payment_open = False
@@ -175,7 +304,31 @@ class Event(models.Model):
             # are False
             self.payment_open = False
             self.booking_open = False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Event, cls).from_db(db, field_names, values)
+        # the id of the stored row; see save()
+        instance._saved_id = instance.id
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.set_dependent_fields()
+        if self.id is not None \
+                and self.id == getattr(self, '_saved_id', None) \
+                and not kwargs.get('update_fields') \
+                and not kwargs.get('force_insert'):
+            # open_booking_count is only ever changed by booking updates;
+            # don't overwrite it with a possibly stale value on edits.  Only
+            # done when the event was loaded or saved with this id, so new
+            # events, events whose id has been changed and deleted events
+            # (delete() clears the id) are saved as usual.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'open_booking_count'
+            ]
         super(Event, self).save(*args, **kwargs)
+        self._saved_id = self.id
 
 
 class BlockType(models.Model):
@@ -211,6 +364,19 @@ class BlockType(models.Model):
             self.size
         )
 
+    def save(self, *args, **kwargs):
+        duration_changed = self.pk and BlockType.objects.filter(
+            pk=self.pk
+        ).exclude(duration=self.duration).exists()
+        super(BlockType, self).save(*args, **kwargs)
+        if duration_changed:
+            # recalculate stored expiry dates for blocks of this type and
+            # free blocks that use their parent's duration
+            for block in Block.objects.filter(
+                    models.Q(block_type=self) | models.Q(parent__block_type=self)
+            ):
+                block.save(update_fields=['expiry_date'])
+
 
 @receiver(pre_save)
 def check_duplicate_blocktype(sender, instance, **kwargs):
@@ -232,6 +398,36 @@ def check_duplicate_blocktype(sender, instance, **kwargs):
                     )
 
 
+class BlockQuerySet(models.QuerySet):
+
+    def with_usage(self):
+        """
+        Annotate each block with the number of bookings made against it
+        (bookings_used)
+        """
+        if 'bookings_used' in self.query.annotations:
+            return self
+        return self.annotate(bookings_used=models.Count('bookings'))
+
+    def unexpired(self):
+        return self.filter(expiry_date__gte=timezone.now())
+
+    def not_full(self):
+        # filter on a subquery so that the usage annotation isn't carried on
+        # the returned blocks, where it could go stale once they're booked
+        not_full_blocks = Block.objects.with_usage().filter(
+            bookings_used__lt=F('block_type__size')
+        ).values('id')
+        return self.filter(id__in=not_full_blocks)
+
+    def active(self):
+        """
+        Blocks that are paid, unexpired and not full; the queryset equivalent
+        of Block.active_block()
+        """
+        return self.unexpired().not_full().filter(paid=True)
+
+
 class Block(models.Model):
     """
     Block booking
@@ -249,6 +445,13 @@ class Block(models.Model):
         'self', blank=True, null=True, related_name='children'
     )
     transferred_booking_id = models.PositiveIntegerField(blank=True, null=True)
+    # calculated from start date and block type duration on save so that
+    # active blocks can be queried in the database
+    expiry_date = models.DateTimeField(
+        null=True, blank=True, editable=False, db_index=True
+    )
+
+    objects = BlockQuerySet.as_manager()
 
     class Meta:
         ordering = ['user__username']
@@ -264,8 +467,7 @@ class Block(models.Model):
             self.start_date.strftime('%d %b %Y')
         )
 
-    @property
-    def expiry_date(self):
+    def _calculate_expiry_date(self):
         # replace block expiry date with very end of day
         # move forwards 1 day and set hrs/min/sec/microsec to 0, then move
         # back 1 sec
@@ -289,6 +491,9 @@ class Block(models.Model):
 
     @property
     def full(self):
+        if hasattr(self, 'bookings_used'):
+            # annotated by BlockQuerySet.with_usage()
+            return self.bookings_used >= self.block_type.size
         return Booking.objects.select_related('block', 'block__block_type')\
                    .filter(block__id=self.id).count() >= self.block_type.size
 
@@ -307,6 +512,9 @@ class Block(models.Model):
         """
         Number of bookings made against block
         """
+        if hasattr(self, 'bookings_used'):
+            # annotated by BlockQuerySet.with_usage()
+            return self.bookings_used
         return Booking.objects.filter(block__id=self.id).count()
 
     def get_absolute_url(self):
@@ -320,8 +528,8 @@ class Block(models.Model):
                 booking.payment_confirmed = False
                 booking.block = None
                 booking.save()
-            ActivityLog.objects.create(
-                log='Booking id {} booked with deleted block {} has been reset to '
+            log_activity(
+                'Booking id {} booked with deleted block {} has been reset to '
                 'unpaid'.format(booking.id, self.id)
             )
         super(Block, self).delete(*args, **kwargs)
@@ -332,6 +540,7 @@ class Block(models.Model):
             self.start_date = self.parent.start_date
         if self.block_type.cost == 0:
             self.paid = True
+        self.expiry_date = self._calculate_expiry_date()
         super(Block, self).save(*args, **kwargs)
 
 
@@ -392,8 +601,8 @@ class Booking(models.Model):
             self.paid = True
             self.payment_confirmed = True
             self.save()
-            ActivityLog.objects.create(
-                log='Space confirmed manually for Booking {} ({})'.format(
+            log_activity(
+                'Space confirmed manually for Booking {} ({})'.format(
                     self.id, self.event)
             )
 
@@ -408,6 +617,10 @@ class Booking(models.Model):
             or self.payment_confirmed
     space_confirmed.boolean = True
 
+    def _counts_as_open(self):
+        # bookings included in the event's open_booking_count
+        return self.status == 'OPEN' and not self.no_show
+
     def _old_booking(self):
         if self.pk:
             return Booking.objects.get(pk=self.pk)
@@ -431,16 +644,25 @@ class Booking(models.Model):
         return self._old_booking().status == 'OPEN' \
             and self.status == 'CANCELLED'
 
+    def _event_full(self):
+        # check against the stored count rather than self.event, which may
+        # be a stale instance
+        if not self.event.max_participants:
+            return False
+        open_booking_count = Event.objects.filter(id=self.event_id)\
+            .values_list('open_booking_count', flat=True)[0]
+        return self.event.max_participants - open_booking_count == 0
+
     def clean(self):
         if self._is_rebooking():
-            if self.event.spaces_left == 0:
+            if self._event_full():
                 raise ValidationError(
                     _('Attempting to reopen booking for full '
                       'event %s' % self.event.id)
                 )
 
-        if self._is_new_booking() and self.status != "CANCELLED" and \
-                self.event.spaces_left == 0:
+        if self._is_new_booking() and self._counts_as_open() and \
+                self._event_full():
                     raise ValidationError(
                         _('Attempting to create booking for full '
                           'event %s' % self.event.id)
@@ -474,8 +696,8 @@ class Booking(models.Model):
                         free_booking.block = orig.block
                         free_booking.free_class = False
                         free_booking.save()
-                        ActivityLog.objects.create(
-                            log="Booking {} cancelled from block {} (user {}); "
+                        log_activity(
+                            "Booking {} cancelled from block {} (user {}); "
                                 "free booking {} moved to parent block".format(
                                 self.id, orig.block.id, self.user.username,
                                 free_booking.id
@@ -483,8 +705,8 @@ class Booking(models.Model):
                         )
                     else:
                         free_class_block.delete()
-                        ActivityLog.objects.create(
-                            log="Booking {} cancelled from block {} (user {}); unused "
+                        log_activity(
+                            "Booking {} cancelled from block {} (user {}); unused "
                                 "free class block deleted".format(
                                 self.id, orig.block.id, self.user.username
                             )
@@ -504,8 +726,37 @@ class Booking(models.Model):
             self.date_payment_confirmed = timezone.now()
 
         # Done with changes to current booking; call super to save the
-        # booking so we can check block status
-        super(Booking, self).save(*args, **kwargs)
+        # booking so we can check block status.  The event's open booking
+        # count is updated in the same transaction.
+        with transaction.atomic():
+            super(Booking, self).save(*args, **kwargs)
+            if orig and orig.event_id != self.event_id:
+                if orig._counts_as_open():
+                    orig.event._adjust_open_booking_count(-1)
+                if self._counts_as_open():
+                    self.event._adjust_open_booking_count(1)
+            else:
+                delta = int(self._counts_as_open()) - \
+                    int(bool(orig) and orig._counts_as_open())
+                if delta:
+                    self.event._adjust_open_booking_count(delta)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def bump_event_list_cache_version(sender, instance, **kwargs):
+    # spaces left and event details are shown in the cached event listings
+    event_list_cache.bump_version()
+
+
+@receiver(post_delete, sender=Booking)
+def update_event_open_booking_count(sender, instance, **kwargs):
+    if instance._counts_as_open():
+        Event.objects.filter(id=instance.event_id).update(
+            open_booking_count=Greatest(F('open_booking_count') - 1, 0)
+        )
 
 
 @receiver(post_save, sender=Booking)
@@ -532,8 +783,8 @@ def update_free_blocks(sender, instance, **kwargs):
                     user=instance.user, parent=instance.block,
                     block_type=free_blocktype
                 )
-                ActivityLog.objects.create(
-                    log='Free class block created with booking {}. '
+                log_activity(
+                    'Free class block created with booking {}. '
                         'Block id {}, parent block id {}, user {}'.format(
                             instance.id,
                             free_block.id, instance.block.id,
@@ -552,8 +803,8 @@ def add_to_mailing_list(sender, instance, **kwargs):
         if not user_class_bookings:
             group, _ = Group.objects.get_or_create(name='subscribed')
             group.user_set.add(instance.user)
-            ActivityLog.objects.create(
-                log='First class booking created; {} {} ({}) has been '
+            log_activity(
+                'First class booking created; {} {} ({}) has been '
                     'added to subscribed group for mailing list.'.format(
                         instance.user.first_name,
                         instance.user.last_name,
@@ -572,6 +823,35 @@ class WaitingListUser(models.Model):
     date_joined = models.DateTimeField(default=timezone.now)
 
 
+class TicketedEventQuerySet(models.QuerySet):
+
+    def with_ticket_counts(self):
+        """
+        Annotate each ticketed event with the number of tickets in confirmed,
+        uncancelled ticket bookings (tickets_booked) and whether it has any
+        confirmed ticket bookings (has_confirmed_ticket_bookings)
+        """
+        qn = connections[self.db].ops.quote_name
+        tables = {
+            'event': qn(TicketedEvent._meta.db_table),
+            'ticket_booking': qn(TicketBooking._meta.db_table),
+            'ticket': qn(Ticket._meta.db_table),
+        }
+        select = OrderedDict([
+            ('tickets_booked',
+             'SELECT COUNT(*) FROM {ticket} INNER JOIN {ticket_booking} '
+             'ON {ticket}.ticket_booking_id = {ticket_booking}.id '
+             'WHERE {ticket_booking}.ticketed_event_id = {event}.id '
+             'AND {ticket_booking}.cancelled = %s '
+             'AND {ticket_booking}.purchase_confirmed = %s'.format(**tables)),
+            ('has_confirmed_ticket_bookings',
+             'EXISTS (SELECT 1 FROM {ticket_booking} '
+             'WHERE {ticket_booking}.ticketed_event_id = {event}.id '
+             'AND {ticket_booking}.purchase_confirmed = %s)'.format(**tables)),
+        ])
+        return self.extra(select=select, select_params=[False, True, True])
+
+
 class TicketedEvent(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, default="")
@@ -641,11 +921,16 @@ class TicketedEvent(models.Model):
                   'Check this carefully!'
     )
 
+    objects = TicketedEventQuerySet.as_manager()
+
     class Meta:
         ordering = ['-date']
 
     def tickets_left(self):
         if self.max_tickets:
+            if hasattr(self, 'tickets_booked'):
+                # annotated by TicketedEventQuerySet.with_ticket_counts()
+                return self.max_tickets - self.tickets_booked
             ticket_bookings = TicketBooking.objects.filter(
                 ticketed_event__id=self.id, cancelled=False,
                 purchase_confirmed=True
@@ -815,3 +1100,75 @@ class UsedEventVoucher(models.Model):
 class UsedBlockVoucher(models.Model):
     voucher = models.ForeignKey(BlockVoucher)
     user = models.ForeignKey(User)
+
+
+class OutboxEmail(models.Model):
+    """
+    A rendered email waiting to be delivered by the run_outbox command.
+    Emails are queued in the same transaction as the change that triggered
+    them and moved to FAILED after max attempts so they can be inspected and
+    retried from studioadmin.
+    """
+    QUEUED = 'QUEUED'
+    SENDING = 'SENDING'
+    SENT = 'SENT'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    # comma separated email addresses
+    to = models.TextField(blank=True)
+    cc = models.TextField(blank=True)
+    bcc = models.TextField(blank=True)
+    reply_to = models.TextField(blank=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    # when the email should next be tried; for SENDING emails this is when
+    # the worker's claim expires
+    next_attempt = models.DateTimeField(default=timezone.now)
+    sent_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        index_together = ('status', 'next_attempt')
+        ordering = ('-created',)
+
+    def __str__(self):
+        return '{} - {} ({})'.format(self.subject, self.to, self.status)
+
+    @classmethod
+    def from_message(cls, msg):
+        html_body = ''
+        for content, mimetype in getattr(msg, 'alternatives', []):
+            if mimetype == 'text/html':
+                html_body = content
+        return cls(
+            subject=msg.subject, body=msg.body, html_body=html_body,
+            from_email=msg.from_email, to=','.join(msg.to),
+            cc=','.join(msg.cc), bcc=','.join(msg.bcc),
+            reply_to=','.join(msg.reply_to)
+        )
+
+    def get_message(self):
+        def _split(addresses):
+            return [address for address in addresses.split(',') if address]
+
+        msg = EmailMultiAlternatives(
+            self.subject, self.body, self.from_email, _split(self.to),
+            cc=_split(self.cc), bcc=_split(self.bcc),
+            reply_to=_split(self.reply_to)
+        )
+        if self.html_body:
+            msg.attach_alternative(self.html_body, "text/html")
+        return msg
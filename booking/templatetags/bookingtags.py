@@ -4,11 +4,11 @@ import pytz
 from datetime import datetime
 
 from django.conf import settings
-from django.contrib.auth.models import Group
 from django import template
 from django.utils import timezone
 from django.utils.safestring import mark_safe
 
+from accounts import auth_cache
 from accounts.models import OnlineDisclaimer, PrintDisclaimer
 
 from booking.models import Booking, EventVoucher, UsedBlockVoucher, \
@@ -74,9 +74,8 @@ def get_index_open(event, extraline_index):
 
 @register.filter
 def bookings_count(event):
-    return Booking.objects.select_related('event', 'event__type', 'user').filter(
-        event=event, status='OPEN', no_show=False
-    ).count()
+    # open, non-no-show bookings, kept up to date on the event
+    return event.open_booking_count
 
 
 @register.filter
@@ -95,6 +94,7 @@ def formatted_uk_date(date):
 
 @register.filter
 def total_ticket_cost(ticket_booking):
+    # tickets.count() uses prefetched tickets if present
     num_tickets = ticket_booking.tickets.count()
     return ticket_booking.ticketed_event.ticket_cost * num_tickets
 
@@ -150,8 +150,7 @@ def sale_text():
 
 @register.filter(name='in_group')
 def in_group(user, group_name):
-    group = Group.objects.get(name=group_name)
-    return True if group in user.groups.all() else False
+    return auth_cache.in_group(user, group_name)
 
 
 @register.filter
@@ -168,17 +167,23 @@ def format_block(block):
 
 @register.filter
 def has_print_disclaimer(user):
+    if hasattr(user, 'user_has_print_disclaimer'):
+        # annotated by context_helpers.annotate_user_flags
+        return bool(user.user_has_print_disclaimer)
     return PrintDisclaimer.objects.filter(user=user).exists()
 
 
 @register.filter
 def has_online_disclaimer(user):
-    return OnlineDisclaimer.objects.filter(user=user)
+    if hasattr(user, 'user_has_online_disclaimer'):
+        # annotated by context_helpers.annotate_user_flags
+        return bool(user.user_has_online_disclaimer)
+    return OnlineDisclaimer.objects.filter(user=user).exists()
 
 
 @register.filter
 def has_disclaimer(user):
-    return has_online_disclaimer(user) or has_print_disclaimer(user)
+    return user.has_disclaimer()
 
 
 @register.filter
@@ -205,27 +210,50 @@ def format_event_types(ev_types):
         ['{}<br/>'.format(ev_type.subtype) for ev_type in ev_types]
     ))
 
+def _times_voucher_used(voucher):
+    if hasattr(voucher, 'times_used'):
+        # annotated in the studioadmin voucher lists
+        return voucher.times_used
+    if isinstance(voucher, EventVoucher):
+        return UsedEventVoucher.objects.filter(voucher=voucher).count()
+    return UsedBlockVoucher.objects.filter(voucher=voucher).count()
+
+
 @register.filter
 def times_voucher_used(voucher):
-    return UsedEventVoucher.objects.filter(voucher=voucher).count()
+    return _times_voucher_used(voucher)
 
 @register.filter
 def times_block_voucher_used(voucher):
-    return UsedBlockVoucher.objects.filter(voucher=voucher).count()
+    return _times_voucher_used(voucher)
 
 @register.filter
 def subscribed(user):
-    group, _ = Group.objects.get_or_create(name='subscribed')
-    return group in user.groups.all()
+    return user.subscribed()
 
 
 @register.filter
 def has_booked_class(user):
+    if hasattr(user, 'user_has_booked_class'):
+        # annotated by context_helpers.annotate_user_flags
+        return bool(user.user_has_booked_class)
     return Booking.objects.filter(
         user=user, event__event_type__event_type='CL'
     ).exists()
 
 
+def _transferred_booking(block):
+    if hasattr(block, 'transferred_booking'):
+        # set by context_helpers.set_transferred_bookings
+        return block.transferred_booking
+    try:
+        return Booking.objects.select_related('event').get(
+            id=block.transferred_booking_id
+        )
+    except Booking.DoesNotExist:
+        return None
+
+
 @register.filter
 def format_block_type_id_user(block):
     if block.block_type.identifier \
@@ -233,13 +261,12 @@ def format_block_type_id_user(block):
         return '(free class)'
     elif block.block_type.identifier \
             and block.block_type.identifier == 'transferred':
-        try:
-            booking = Booking.objects.get(id=block.transferred_booking_id)
+        booking = _transferred_booking(block)
+        if booking:
             return '(transferred from {} {})'.format(
                 booking.event.name, booking.event.date.strftime('%d%b%y')
             )
-        except Booking.DoesNotExist:
-            return '(transferred)'
+        return '(transferred)'
     return ''
 
 
@@ -270,14 +297,13 @@ def format_paid_status(booking):
 @register.filter
 def transferred_from(block):
     if block.transferred_booking_id:
-        try:
-            bk = Booking.objects.get(id=block.transferred_booking_id)
+        bk = _transferred_booking(block)
+        if bk:
             return '{} {} ({})'.format(
                 bk.event.name, bk.event.date.strftime('%d%b%y'),
                 block.transferred_booking_id
             )
-        except Booking.DoesNotExist:
-            return '({})'.format(block.transferred_booking_id)
+        return '({})'.format(block.transferred_booking_id)
     return ''
 
 
@@ -292,13 +318,7 @@ def voucher_expired(voucher):
     if voucher.expiry_date and voucher.expiry_date < timezone.now():
         return True
     elif voucher.max_vouchers:
-        if isinstance(voucher, EventVoucher):
-            times_used = UsedEventVoucher.objects.filter(voucher=voucher)\
-                .count()
-        else:
-            times_used = UsedBlockVoucher.objects.filter(voucher=voucher)\
-                .count()
-
+        times_used = _times_voucher_used(voucher)
         if times_used and times_used >= voucher.max_vouchers:
             return True
 
@@ -306,10 +326,14 @@ def voucher_expired(voucher):
 
 @register.inclusion_tag('booking/includes/payment_button.html')
 def get_payment_button(event, user):
-    booking = Booking.objects.get(event=event, user=user)
+    if getattr(event, 'user_bookings', None):
+        # the user's booking, prefetched for lists of events
+        booking = event.user_bookings[0]
+    else:
+        booking = Booking.objects.get(event=event, user=user)
     if not (booking.paid and booking.payment_confirmed):
         return {
             'booking_id': booking.id,
-            'payment_open': booking.event.payment_open
+            'payment_open': event.payment_open
         }
     return {}
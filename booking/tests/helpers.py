@@ -4,6 +4,7 @@ from model_mommy import mommy
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.conf import settings
+from django.core.cache import cache
 from django.test import RequestFactory
 from django.utils.html import strip_tags
 
@@ -47,6 +48,17 @@ class TestSetupMixin(object):
         )
         mommy.make(PrintDisclaimer, user=cls.user)
 
+    def _pre_setup(self):
+        # per-user values such as has_disclaimer are cached by user id, and
+        # ids are reused after each test's transaction is rolled back; the
+        # class's user is also shared between tests, so reset the values
+        # memoized on it too
+        cache.clear()
+        if hasattr(self, 'user'):
+            self.user.__dict__.pop('_has_disclaimer', None)
+            self.user.__dict__.pop('_auth_cache', None)
+        super(TestSetupMixin, self)._pre_setup()
+
 
 def format_content(content):
     # strip tags, \n, \t and extra whitespace from content
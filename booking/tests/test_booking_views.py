@@ -6,7 +6,9 @@ from model_mommy import mommy
 from django.conf import settings
 from django.core import mail
 from django.core.urlresolvers import reverse
-from django.test import TestCase, RequestFactory
+from django.db import connection
+from django.http import Http404
+from django.test import TestCase, RequestFactory, override_settings
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.utils import timezone
 from django.contrib.auth.models import Permission, User
@@ -15,15 +17,16 @@ from activitylog.models import ActivityLog
 from accounts.models import OnlineDisclaimer
 
 from booking.models import Block, BlockType, Event, EventType, Booking, \
-    Block, EventVoucher,UsedEventVoucher,  WaitingListUser
+    Block, EventVoucher, OutboxEmail, UsedEventVoucher,  WaitingListUser
 from booking.views import BookingListView, BookingHistoryListView, \
     BookingCreateView, BookingDeleteView, BookingUpdateView, \
     duplicate_booking, fully_booked, cancellation_period_past, \
-    update_booking_cancelled
+    update_booking_cancelled, booking_paypal_form
 from booking.tests.helpers import _create_session, TestSetupMixin, \
     format_content
 
 from payments.helpers import create_booking_paypal_transaction
+from payments.models import PaypalBookingTransaction
 
 
 class BookingListViewTests(TestSetupMixin, TestCase):
@@ -281,6 +284,105 @@ class BookingListViewTests(TestSetupMixin, TestCase):
         self.assertIn('<strong>N/A</strong>', resp.rendered_content)
 
 
+    def test_booking_list_does_not_create_paypal_transactions(self):
+        Booking.objects.update(paid=False)
+        Event.objects.update(cost=10, payment_open=True)
+        resp = self._get_response(self.user)
+        resp.render()
+        self.assertFalse(PaypalBookingTransaction.objects.exists())
+        self.assertIn('pay_now_button', resp.rendered_content)
+        booking = Booking.objects.filter(user=self.user).first()
+        self.assertIn(
+            'data-paypal_form_url="{}"'.format(
+                reverse('booking:booking_paypal_form', args=[booking.id])
+            ),
+            resp.rendered_content
+        )
+
+    def test_booking_list_query_count_independent_of_bookings(self):
+        # bookings, active blocks and waiting list entries, plus 4 queries
+        # from the base template navigation
+        with self.assertNumQueries(7):
+            self._get_response(self.user).render()
+
+        for event in mommy.make_recipe('booking.future_PC', _quantity=5):
+            mommy.make_recipe('booking.booking', user=self.user, event=event)
+            mommy.make(WaitingListUser, user=self.user, event=event)
+        # the base template's disclaimer and group checks are cached now
+        with self.assertNumQueries(4):
+            self._get_response(self.user).render()
+
+
+class BookingPaypalFormTests(TestSetupMixin, TestCase):
+
+    def _get_response(self, user, booking):
+        url = reverse('booking:booking_paypal_form', args=[booking.id])
+        request = self.factory.post(url)
+        request.user = user
+        return booking_paypal_form(request, pk=booking.id)
+
+    def test_paypal_transaction_created_on_request(self):
+        booking = mommy.make_recipe(
+            'booking.booking', user=self.user, event__cost=10,
+            event__payment_open=True
+        )
+        self.assertFalse(PaypalBookingTransaction.objects.exists())
+        resp = self._get_response(self.user, booking)
+        self.assertEqual(resp.status_code, 200)
+        pptrans = PaypalBookingTransaction.objects.get(booking=booking)
+        self.assertIn(pptrans.invoice_id, resp.content.decode('utf-8'))
+        self.assertIn('paypal-btn-form', resp.content.decode('utf-8'))
+
+        # requesting the form again reuses the existing transaction
+        self._get_response(self.user, booking)
+        self.assertEqual(
+            PaypalBookingTransaction.objects.filter(booking=booking).count(), 1
+        )
+
+    def test_no_paypal_form_for_paid_or_cancelled_booking(self):
+        paid_booking = mommy.make_recipe(
+            'booking.booking', user=self.user, event__cost=10,
+            event__payment_open=True, paid=True
+        )
+        cancelled_booking = mommy.make_recipe(
+            'booking.booking', user=self.user, event__cost=10,
+            event__payment_open=True, status='CANCELLED'
+        )
+        for booking in [paid_booking, cancelled_booking]:
+            resp = self._get_response(self.user, booking)
+            self.assertEqual(resp.status_code, 400)
+        self.assertFalse(PaypalBookingTransaction.objects.exists())
+
+    def test_no_paypal_form_for_free_event(self):
+        booking = mommy.make_recipe(
+            'booking.booking', user=self.user, event__cost=0,
+            event__payment_open=True
+        )
+        resp = self._get_response(self.user, booking)
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(PaypalBookingTransaction.objects.exists())
+
+    def test_paypal_form_requires_post(self):
+        booking = mommy.make_recipe(
+            'booking.booking', user=self.user, event__cost=10,
+            event__payment_open=True
+        )
+        url = reverse('booking:booking_paypal_form', args=[booking.id])
+        request = self.factory.get(url)
+        request.user = self.user
+        resp = booking_paypal_form(request, pk=booking.id)
+        self.assertEqual(resp.status_code, 405)
+        self.assertFalse(PaypalBookingTransaction.objects.exists())
+
+    def test_cannot_get_paypal_form_for_another_users_booking(self):
+        booking = mommy.make_recipe(
+            'booking.booking', event__cost=10, event__payment_open=True
+        )
+        with self.assertRaises(Http404):
+            self._get_response(self.user, booking)
+        self.assertFalse(PaypalBookingTransaction.objects.exists())
+
+
 class BookingHistoryListViewTests(TestSetupMixin, TestCase):
 
     @classmethod
@@ -535,6 +637,38 @@ class BookingCreateViewTests(TestSetupMixin, TestCase):
         # email to student only
         self.assertEqual(len(mail.outbox), 1)
 
+    @patch('booking.views.booking_views.send_mail')
+    def test_create_booking_email_sent_outside_transaction(
+            self, mock_send_mail
+    ):
+        # without the outbox the email is sent inline, so the view shouldn't
+        # hold a transaction open while it is sent
+        depth = len(connection.savepoint_ids)
+        savepoints = []
+        mock_send_mail.side_effect = lambda *args, **kwargs: \
+            savepoints.append(len(connection.savepoint_ids))
+        event = mommy.make_recipe('booking.future_EV', max_participants=3)
+        self._post_response(self.user, event)
+        self.assertEqual(savepoints, [depth])
+
+        savepoints.clear()
+        with override_settings(USE_EMAIL_OUTBOX=True):
+            event = mommy.make_recipe(
+                'booking.future_EV', max_participants=3
+            )
+            self._post_response(self.user, event)
+        self.assertEqual(savepoints, [depth + 1])
+
+    @override_settings(USE_EMAIL_OUTBOX=True)
+    def test_create_booking_queues_email_in_outbox(self):
+        event = mommy.make_recipe('booking.future_EV', max_participants=3)
+        self._post_response(self.user, event)
+        self.assertEqual(Booking.objects.all().count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboxEmail.objects.get()
+        self.assertEqual(queued.status, OutboxEmail.QUEUED)
+        self.assertEqual(queued.to, self.user.email)
+
     def test_create_booking_sends_email_to_studio_if_set(self):
         """
         Test creating a booking send email to user and studio if flag sent on
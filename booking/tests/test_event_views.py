@@ -6,14 +6,17 @@ from model_mommy import mommy
 from datetime import datetime, timedelta
 from bs4 import BeautifulSoup
 
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase, RequestFactory, override_settings
-from django.contrib.auth.models import Permission
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import Permission, User
 from django.utils import timezone
 
 from accounts.models import PrintDisclaimer, OnlineDisclaimer
 
-from booking.models import Event, Booking
+from booking.models import Event, Booking, WaitingListUser
 from booking.views import EventListView, EventDetailView
 from booking.tests.helpers import TestSetupMixin, format_content
 
@@ -68,6 +71,123 @@ class EventListViewTests(TestSetupMixin, TestCase):
         # event listing should still only show future events
         self.assertFalse('booked_events' in resp.context)
 
+    def test_anonymous_event_list_cached(self):
+        url = reverse('booking:events')
+        resp = self.client.get(url)
+        self.assertIn('ETag', resp)
+        self.assertIn('Last-Modified', resp)
+
+        with self.assertNumQueries(0):
+            cached_resp = self.client.get(url)
+        self.assertEqual(cached_resp.status_code, 200)
+        self.assertEqual(cached_resp.content, resp.content)
+        self.assertEqual(cached_resp['ETag'], resp['ETag'])
+
+    def test_anonymous_event_list_cached_by_name_filter(self):
+        event = Event.objects.filter(event_type__event_type='EV').first()
+        Event.objects.filter(id=event.id).update(name='Workshop')
+        url = reverse('booking:events')
+        self.client.get(url)
+        resp = self.client.get(url + '?name=Workshop')
+        self.assertEqual(resp.context['events'].count(), 1)
+
+    def test_anonymous_event_list_conditional_get(self):
+        url = reverse('booking:events')
+        resp = self.client.get(url)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag']).status_code,
+            304
+        )
+        self.assertEqual(
+            self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=resp['Last-Modified']
+            ).status_code,
+            304
+        )
+
+    def test_anonymous_event_list_cache_invalidated_by_booking(self):
+        url = reverse('booking:events')
+        self.client.get(url)
+        event = Event.objects.filter(event_type__event_type='EV').first()
+        mommy.make_recipe('booking.booking', event=event)
+        # rendered again, not served from the cache
+        resp = self.client.get(url)
+        self.assertIsNotNone(resp.context)
+
+    def _event_list_queries(self):
+        # fresh user instance and empty cache, so the per-user checks are
+        # counted each time
+        cache.clear()
+        user = User.objects.get(id=self.user.id)
+        with CaptureQueriesContext(connection) as queries:
+            self._get_response(user, 'events').render()
+        return len(queries)
+
+    def test_number_of_queries_for_logged_in_user(self):
+        """
+        The user's booked and waiting list events don't add queries per
+        event listed
+        """
+        few_events_queries = self._event_list_queries()
+        for event in mommy.make_recipe('booking.future_EV', _quantity=5):
+            mommy.make_recipe('booking.booking', user=self.user, event=event)
+            mommy.make(WaitingListUser, user=self.user, event=event)
+        self.assertEqual(self._event_list_queries(), few_events_queries)
+
+    def test_shared_event_rows_cached(self):
+        event = Event.objects.filter(event_type__event_type='EV').first()
+        resp = self._get_response(self.user, 'events')
+        self.assertIn(event.name, resp.rendered_content)
+
+        # changes that don't send signals are picked up when the cached
+        # rows expire
+        Event.objects.filter(id=event.id).update(name='Renamed event')
+        resp = self._get_response(self.user, 'events')
+        self.assertNotIn('>Renamed event</a>', resp.rendered_content)
+
+        # saving an event makes the cached rows stale
+        event.refresh_from_db()
+        event.save()
+        resp = self._get_response(self.user, 'events')
+        self.assertIn('>Renamed event</a>', resp.rendered_content)
+
+    def test_shared_event_rows_fetched_in_one_cache_call(self):
+        mommy.make_recipe('booking.future_EV', _quantity=5)
+        self._get_response(self.user, 'events').render()
+        with patch(
+                'booking.views.event_views.cache', wraps=cache
+        ) as mock_cache:
+            resp = self._get_response(self.user, 'events')
+            resp.render()
+        self.assertEqual(mock_cache.get_many.call_count, 1)
+        self.assertFalse(mock_cache.get.called)
+        self.assertFalse(mock_cache.set_many.called)
+        self.assertEqual(
+            resp.rendered_content.count('id="book_button"'), 8
+        )
+
+    def test_booked_column_not_shared(self):
+        event = Event.objects.filter(event_type__event_type='EV').first()
+        mommy.make_recipe('booking.booking', user=self.user, event=event)
+        other_user = mommy.make_recipe('booking.user')
+        mommy.make(PrintDisclaimer, user=other_user)
+
+        resp = self._get_response(self.user, 'events')
+        self.assertEqual(resp.context_data['booked_events'], {event.id})
+        resp = self._get_response(other_user, 'events')
+        self.assertEqual(resp.context_data['booked_events'], set())
+        self.assertEqual(
+            resp.rendered_content.count('id="book_button"'), 3
+        )
+
+    def test_logged_in_event_list_not_cached(self):
+        self.client.login(username=self.user.username, password='test')
+        url = reverse('booking:events')
+        resp = self.client.get(url)
+        self.assertNotIn('ETag', resp)
+        resp = self.client.get(url)
+        self.assertEqual(resp.context['events'].count(), 3)
+
     def test_event_list_with_logged_in_user(self):
         """
         Test that booked_events in context
@@ -306,6 +426,41 @@ class EventDetailViewTests(TestSetupMixin, TestCase):
         self.assertFalse('booked' in resp.context_data)
         self.assertEquals(resp.context_data['booking_info_text'], '')
 
+    def test_event_detail_query_count(self):
+        """
+        The event and all of the user's state for it are fetched with a
+        fixed number of queries, whether or not the user has booked
+        """
+        pp_event_type = mommy.make_recipe(
+            'booking.event_type_OC', subtype="Pole practice"
+        )
+        pole_practice = mommy.make_recipe(
+            'booking.future_CL', event_type=pp_event_type, max_participants=10
+        )
+        mommy.make_recipe(
+            'booking.booking', event=pole_practice, _quantity=5
+        )
+        mommy.make_recipe(
+            'booking.waiting_list_user', event=pole_practice, _quantity=5
+        )
+        # fresh user instance, so that permissions aren't already cached on it
+        user = User.objects.get(id=self.user.id)
+        # event query, user's booking, 2 disclaimer checks, 2 permission
+        # queries for the regular student check, plus 2 for the base
+        # template's navigation (facebook app, instructors group)
+        with self.assertNumQueries(8):
+            resp = self._get_response(user, pole_practice, 'lesson')
+            resp.render()
+
+        mommy.make_recipe(
+            'booking.booking', user=self.user, event=pole_practice, paid=True
+        )
+        # the disclaimer, permission and group checks are cached now
+        with self.assertNumQueries(3):
+            resp = self._get_response(user, pole_practice, 'lesson')
+            resp.render()
+        self.assertTrue(resp.context_data['booked'])
+
     def test_pole_practice_context_without_permission(self):
         pp_event_type = mommy.make_recipe('booking.event_type_OC', subtype="Pole practice")
         pole_practice = mommy.make_recipe('booking.future_CL', event_type=pp_event_type)
@@ -1,3 +1,4 @@
+import json
 import sys
 
 from datetime import datetime, timedelta
@@ -6,9 +7,12 @@ from mock import patch
 from model_mommy import mommy
 
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
 from django.core import management
 from django.core import mail
+from django.core.mail import get_connection
+from django.db import connection
 from django.db.models import Q
 from django.contrib.auth.models import Group, User
 from django.utils import timezone
@@ -16,8 +20,10 @@ from django.utils import timezone
 from allauth.socialaccount.models import SocialApp
 
 from activitylog.models import ActivityLog
+from booking.management.commands.email_warnings import get_bookings
+from booking.email_helpers import EmailBatch, send_mail as queue_mail
 from booking.models import Event, Block, Booking, EventType, BlockType, \
-    TicketBooking, Ticket
+    OutboxEmail, TicketBooking, Ticket
 from payments.models import PaypalBookingTransaction
 
 
@@ -182,6 +188,106 @@ class EmailReminderAndWarningTests(TestCase):
         # emails are only sent for event1
         self.assertEquals(len(mail.outbox), 5)
 
+    @patch('booking.management.commands.email_reminders.timezone')
+    def test_email_reminders_sent_over_one_connection(self, mock_tz):
+        mock_tz.now.return_value = datetime(
+            2015, 2, 10, 19, 0, tzinfo=timezone.utc
+            )
+        event = mommy.make_recipe(
+            'booking.future_EV',
+            date=datetime(2015, 2, 12, 18, 0, tzinfo=timezone.utc),
+            cancellation_period=24)
+        mommy.make_recipe('booking.booking', event=event, _quantity=5)
+
+        with patch(
+                'booking.email_helpers.get_connection',
+                wraps=get_connection
+        ) as mock_get_connection:
+            management.call_command('email_reminders')
+        self.assertEqual(mock_get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+
+    @patch('booking.management.commands.email_reminders.timezone')
+    def test_email_reminders_failure_does_not_stop_batch(self, mock_tz):
+        mock_tz.now.return_value = datetime(
+            2015, 2, 10, 19, 0, tzinfo=timezone.utc
+            )
+        event = mommy.make_recipe(
+            'booking.future_EV',
+            date=datetime(2015, 2, 12, 18, 0, tzinfo=timezone.utc),
+            cancellation_period=24)
+        bookings = [
+            mommy.make_recipe(
+                'booking.booking', event=event,
+                user__email='test{}@test.com'.format(i)
+            ) for i in range(3)
+        ]
+        failing = bookings[1]
+        connection = get_connection()
+        send_messages = connection.send_messages
+
+        def send_or_fail(messages):
+            if messages[0].to == [failing.user.email]:
+                raise Exception('Error sending email')
+            return send_messages(messages)
+
+        connection.send_messages = send_or_fail
+        with patch(
+                'booking.email_helpers.get_connection',
+                return_value=connection
+        ):
+            management.call_command('email_reminders')
+
+        # 2 reminders sent, 1 email to support reporting the failure
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[2].to, [settings.SUPPORT_EMAIL])
+        self.assertIn(
+            'booking id {}: Error sending email'.format(failing.id),
+            mail.outbox[2].body
+        )
+        for booking in bookings:
+            booking.refresh_from_db()
+            self.assertEqual(booking.reminder_sent, booking != failing)
+
+    @patch('booking.management.commands.email_reminders.timezone')
+    def test_email_reminders_marked_as_sent_if_batch_interrupted(
+            self, mock_tz
+    ):
+        mock_tz.now.return_value = datetime(
+            2015, 2, 10, 19, 0, tzinfo=timezone.utc
+            )
+        event = mommy.make_recipe(
+            'booking.future_EV',
+            date=datetime(2015, 2, 12, 18, 0, tzinfo=timezone.utc),
+            cancellation_period=24)
+        for i in range(3):
+            mommy.make_recipe(
+                'booking.booking', event=event,
+                user__email='test{}@test.com'.format(i)
+            )
+        connection = get_connection()
+        send_messages = connection.send_messages
+
+        def send_or_interrupt(messages):
+            if len(mail.outbox) == 2:
+                raise KeyboardInterrupt
+            return send_messages(messages)
+
+        connection.send_messages = send_or_interrupt
+        with patch(
+                'booking.email_helpers.get_connection',
+                return_value=connection
+        ):
+            with self.assertRaises(KeyboardInterrupt):
+                management.call_command('email_reminders')
+
+        sent_to = [msg.to[0] for msg in mail.outbox]
+        self.assertEqual(len(sent_to), 2)
+        for booking in Booking.objects.select_related('user'):
+            self.assertEqual(
+                booking.reminder_sent, booking.user.email in sent_to
+            )
+
     @patch('booking.management.commands.email_reminders.timezone')
     def test_email_reminders_not_sent_for_past_events(self, mock_tz):
         mock_tz.now.return_value = datetime(
@@ -548,6 +654,84 @@ class EmailReminderAndWarningTests(TestCase):
         self.assertFalse(booking2.warning_sent)
 
 
+    def _seed_events_and_bookings(self, now):
+        """
+        Seed 3 years of daily events (2 past, 1 future) with a mix of
+        cancellation periods, each with one unpaid open booking
+        """
+        event_type = mommy.make_recipe('booking.event_type_PC')
+        user = mommy.make_recipe('booking.user')
+        cancellation_periods = [0, 1, 24, 48, 72]
+        start = now - timedelta(days=730)
+        Event.objects.bulk_create([
+            Event(
+                name='Event {}'.format(i), slug='event-{}'.format(i),
+                event_type=event_type, cost=10,
+                date=start + timedelta(days=i, hours=18),
+                cancellation_period=cancellation_periods[i % 5]
+            ) for i in range(1095)
+        ])
+        Booking.objects.bulk_create([
+            Booking(
+                user=user, event=event, paid=False, payment_confirmed=False,
+                date_booked=now - timedelta(days=1)
+            ) for event in Event.objects.all()
+        ])
+
+    @patch('booking.management.commands.email_reminders.timezone')
+    def test_email_reminders_event_selection_benchmark(self, mock_tz):
+        now = datetime(2015, 2, 10, tzinfo=timezone.utc)
+        mock_tz.now.return_value = now
+        self._seed_events_and_bookings(now)
+        expected = [
+            booking.id for booking in Booking.objects.select_related('event')
+            if booking.event.date >= now and (
+                booking.event.date - timedelta(
+                    hours=booking.event.cancellation_period + 24
+                )
+            ) <= now
+        ]
+        self.assertEqual(len(expected), 1)
+
+        # with reminders already sent, the command only selects bookings:
+        # the cancellation periods, then bookings with their events and users
+        Booking.objects.update(reminder_sent=True)
+        with self.assertNumQueries(2):
+            management.call_command('email_reminders', stdout=StringIO())
+
+        Booking.objects.update(reminder_sent=False)
+        management.call_command('email_reminders', stdout=StringIO())
+        self.assertEqual(
+            sorted(
+                Booking.objects.filter(reminder_sent=True)
+                .values_list('id', flat=True)
+            ),
+            sorted(expected)
+        )
+
+    @patch('booking.management.commands.email_warnings.timezone')
+    def test_email_warnings_event_selection_benchmark(self, mock_tz):
+        now = datetime(2015, 2, 10, tzinfo=timezone.utc)
+        mock_tz.now.return_value = now
+        self._seed_events_and_bookings(now)
+        expected = [
+            booking.id for booking in Booking.objects.select_related('event')
+            if booking.event.cancellation_period and
+            booking.event.date >= now and (
+                booking.event.date - timedelta(
+                    hours=booking.event.cancellation_period + 48
+                )
+            ) <= now
+        ]
+        self.assertEqual(len(expected), 4)
+
+        with self.assertNumQueries(2):
+            bookings = list(get_bookings(48))
+        self.assertEqual(
+            sorted([booking.id for booking in bookings]), sorted(expected)
+        )
+
+
 class CancelUnpaidBookingsTests(TestCase):
 
     def setUp(self):
@@ -604,6 +788,20 @@ class CancelUnpaidBookingsTests(TestCase):
             paid_booking.status, 'OPEN', paid_booking.status
         )
 
+    @patch('booking.management.commands.cancel_unpaid_bookings.timezone')
+    def test_cancel_unpaid_bookings_with_drifted_count(self, mock_tz):
+        mock_tz.now.return_value = datetime(
+            2015, 2, 10, tzinfo=timezone.utc
+        )
+        Event.objects.filter(id=self.event.id).update(open_booking_count=0)
+        management.call_command('cancel_unpaid_bookings')
+        self.assertEqual(
+            Booking.objects.get(id=self.unpaid.id).status, 'CANCELLED'
+        )
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 0
+        )
+
     @patch('booking.management.commands.cancel_unpaid_bookings.timezone')
     def test_dont_cancel_if_advance_payment_not_required(self, mock_tz):
         """
@@ -831,14 +1029,19 @@ class CancelUnpaidBookingsTests(TestCase):
             sorted([email.to for email in mail.outbox])
         )
 
+    @patch('booking.email_helpers.get_connection')
     @patch('booking.management.commands.cancel_unpaid_bookings.send_mail')
     @patch('booking.management.commands.cancel_unpaid_bookings.'
            'send_waiting_list_email')
     @patch('booking.management.commands.cancel_unpaid_bookings.timezone')
-    def test_email_errors(self, mock_tz, mock_send, mock_send_waiting_list):
+    def test_email_errors(
+            self, mock_tz, mock_send_waiting_list, mock_send, mock_connection
+    ):
         mock_tz.now.return_value = datetime(
             2015, 2, 10, tzinfo=timezone.utc
         )
+        mock_connection.return_value.send_messages.side_effect = \
+            Exception('Error sending email')
         mock_send.side_effect = Exception('Error sending email')
         mock_send_waiting_list.side_effect = Exception('Error sending email')
         # make full event (setup has one paid and one unpaid)
@@ -880,8 +1083,10 @@ class CancelUnpaidBookingsTests(TestCase):
         # emails are sent to user per cancelled booking (1) and
         # one email with bcc to waiting list (1) and studio (1)
         self.assertEqual(len(mail.outbox), 3)
+        waiting_list_emails = [email for email in mail.outbox if email.bcc]
+        self.assertEqual(len(waiting_list_emails), 1)
         self.assertEqual(
-            sorted(mail.outbox[1].bcc),
+            sorted(waiting_list_emails[0].bcc),
             ['test0@test.com', 'test1@test.com', 'test2@test.com']
         )
 
@@ -923,12 +1128,12 @@ class CancelUnpaidBookingsTests(TestCase):
         # one email with bcc to waiting list (1) and studio (1)
         # waiting list email sent after the first cancelled booking
         self.assertEqual(len(mail.outbox), 4)
+        waiting_list_emails = [email for email in mail.outbox if email.bcc]
+        self.assertEqual(len(waiting_list_emails), 1)
         self.assertEqual(
-            sorted(mail.outbox[1].bcc),
+            sorted(waiting_list_emails[0].bcc),
             ['test0@test.com', 'test1@test.com', 'test2@test.com']
         )
-        for email in [mail.outbox[0], mail.outbox[2], mail.outbox[3]]:
-            self.assertEqual(email.bcc, [])
 
         self.assertEqual(Booking.objects.filter(status='CANCELLED').count(), 2)
 
@@ -1155,6 +1360,62 @@ class CancelUnpaidBookingsTests(TestCase):
         # even though warning has not been sent
         self.assertFalse(self.unpaid.warning_sent)
 
+    @patch('booking.management.commands.cancel_unpaid_bookings.timezone')
+    def test_cancelling_for_several_events(self, mock_tz):
+        """
+        Bookings for several events are cancelled with a constant number of
+        queries and a single update, and each full event's waiting list is
+        emailed once
+        """
+        mock_tz.now.return_value = datetime(
+            2015, 2, 13, 17, 15, tzinfo=timezone.utc
+        )
+        self.event.max_participants = 2
+        self.event.save()
+        mommy.make_recipe('booking.waiting_list_user', event=self.event)
+        with CaptureQueriesContext(connection) as single_event_queries:
+            management.call_command('cancel_unpaid_bookings')
+        self.assertEqual(len(mail.outbox), 3)
+        mail.outbox = []
+
+        events = mommy.make_recipe(
+            'booking.future_EV', _quantity=3,
+            date=datetime(2015, 2, 13, 18, 0, tzinfo=timezone.utc),
+            payment_open=True, cost=10, advance_payment_required=True,
+            cancellation_period=1, max_participants=2
+        )
+        for event in events:
+            mommy.make_recipe(
+                'booking.booking', event=event, paid=False,
+                payment_confirmed=False, status='OPEN',
+                date_booked=datetime(2015, 2, 9, 18, 0, tzinfo=timezone.utc),
+                warning_sent=True, _quantity=2
+            )
+            mommy.make_recipe('booking.waiting_list_user', event=event)
+        for event in events:
+            event.refresh_from_db()
+            self.assertEqual(event.open_booking_count, 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            management.call_command('cancel_unpaid_bookings')
+
+        self.assertEqual(len(queries), len(single_event_queries))
+        booking_updates = [
+            query for query in queries
+            if query['sql'].startswith('UPDATE "booking_booking"')
+        ]
+        self.assertEqual(len(booking_updates), 1)
+        for event in events:
+            event.refresh_from_db()
+            self.assertEqual(event.open_booking_count, 0)
+            self.assertFalse(
+                event.bookings.filter(status='OPEN').exists()
+            )
+        # emails to users for each cancelled booking (6), one email with bcc
+        # to each event's waiting list (3) and studio (1)
+        self.assertEqual(len(mail.outbox), 10)
+        self.assertEqual(len([email for email in mail.outbox if email.bcc]), 3)
+
 
 class TicketBookingWarningTests(TestCase):
 
@@ -2164,6 +2425,72 @@ class BlockBookingsReportTests(TestCase):
             'No issues to report for users with blocks\n'
         )
 
+    def test_block_booking_report_csv(self):
+        management.call_command('block_bookings_report', format='csv')
+        self.assertEqual(
+            self.output.getvalue().splitlines(),
+            [
+                'user,user_id,block_id,block_subtype,booking_ids,'
+                'unpaid_booking_ids,paid_booking_ids,paypal_paid_booking_ids',
+                '{},{},{},{},{},{},,'.format(
+                    self.user1.username, self.user1.id,
+                    self.user1_active_block.id, self.event_type.subtype,
+                    self.user1_booking_not_on_block.id,
+                    self.user1_booking_not_on_block.id
+                )
+            ]
+        )
+        # support is still emailed
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_block_booking_report_json(self):
+        management.call_command('block_bookings_report', format='json')
+        report = json.loads(self.output.getvalue())
+        self.assertEqual(
+            report,
+            [{
+                'user': self.user1.username,
+                'user_id': self.user1.id,
+                'block_id': self.user1_active_block.id,
+                'block_subtype': self.event_type.subtype,
+                'booking_ids': [str(self.user1_booking_not_on_block.id)],
+                'unpaid_booking_ids': [
+                    str(self.user1_booking_not_on_block.id)
+                ],
+                'paid_booking_ids': [],
+                'paypal_paid_booking_ids': [],
+            }]
+        )
+
+    def test_block_booking_report_number_of_queries(self):
+        mommy.make_recipe(
+            'booking.booking', user=self.user1,
+            event__event_type=self.event_type,
+            date_booked=timezone.now() - timedelta(8),
+            paid=True, payment_confirmed=True
+        )
+        with CaptureQueriesContext(connection) as single_block_queries:
+            management.call_command('block_bookings_report')
+
+        # more users with active blocks and bookings made without them
+        for _ in range(3):
+            block = mommy.make_recipe(
+                'booking.block_5', start_date=timezone.now() - timedelta(10),
+                block_type__event_type=self.event_type, paid=True
+            )
+            paid_booking = mommy.make_recipe(
+                'booking.booking', user=block.user,
+                event__event_type=self.event_type,
+                date_booked=timezone.now() - timedelta(8),
+                paid=True, payment_confirmed=True
+            )
+            mommy.make(PaypalBookingTransaction, booking=paid_booking)
+
+        with CaptureQueriesContext(connection) as queries:
+            management.call_command('block_bookings_report')
+        self.assertEqual(len(queries), len(single_block_queries))
+        self.assertEqual(len(mail.outbox), 5)
+
 
 class CreateSaleBlockTypesTests(TestCase):
 
@@ -2189,6 +2516,225 @@ class CreateSaleBlockTypesTests(TestCase):
         )
 
 
+class ReconcileEventCountersTests(TestCase):
+
+    def setUp(self):
+        self.event = mommy.make_recipe('booking.future_EV', max_participants=5)
+        mommy.make_recipe('booking.booking', event=self.event, _quantity=3)
+        mommy.make_recipe(
+            'booking.booking', event=self.event, status='CANCELLED'
+        )
+        mommy.make_recipe('booking.booking', event=self.event, no_show=True)
+
+    def test_reconcile_counts_correct(self):
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 3
+        )
+        management.call_command('reconcile_event_counters')
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 3
+        )
+        self.assertFalse(
+            ActivityLog.objects.filter(
+                log__startswith='Open booking counts reconciled'
+            ).exists()
+        )
+
+    def test_reconcile_fixes_drift(self):
+        Event.objects.filter(id=self.event.id).update(open_booking_count=1)
+        event_no_bookings = mommy.make_recipe('booking.future_EV')
+        Event.objects.filter(id=event_no_bookings.id).update(
+            open_booking_count=2
+        )
+
+        management.call_command('reconcile_event_counters')
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 3
+        )
+        self.assertEqual(
+            Event.objects.get(id=event_no_bookings.id).open_booking_count, 0
+        )
+        log = ActivityLog.objects.last().log
+        self.assertTrue(
+            log.startswith('Open booking counts reconciled for event ids')
+        )
+        self.assertIn(str(self.event.id), log)
+        self.assertIn(str(event_no_bookings.id), log)
+
+    def test_reconcile_dry_run(self):
+        Event.objects.filter(id=self.event.id).update(open_booking_count=1)
+        management.call_command('reconcile_event_counters', dry_run=True)
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 1
+        )
+        self.assertFalse(
+            ActivityLog.objects.filter(
+                log__startswith='Open booking counts reconciled'
+            ).exists()
+        )
+
+
+class RunOutboxTests(TestCase):
+
+    def _queue_email(self, to='test@test.com'):
+        with override_settings(USE_EMAIL_OUTBOX=True):
+            queue_mail(
+                'Test subject', 'Test message', 'from@test.com', [to],
+                html_message='<p>Test message</p>'
+            )
+
+    def test_emails_queued_when_outbox_enabled(self):
+        self._queue_email()
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.status, OutboxEmail.QUEUED)
+        self.assertEqual(email.to, 'test@test.com')
+
+    def test_emails_sent_directly_when_outbox_disabled(self):
+        queue_mail('Test subject', 'Test message', 'from@test.com', ['a@b.com'])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_email_batch_queued_when_outbox_enabled(self):
+        batch = EmailBatch('booking/email/waiting_list_email.txt')
+        for i in range(3):
+            batch.add(
+                i, 'Test subject', ['test{}@test.com'.format(i)],
+                {'event': 'Test event', 'host': 'http://test.com'}
+            )
+        with override_settings(USE_EMAIL_OUTBOX=True):
+            sent, failed = batch.send()
+        self.assertEqual(sent, [0, 1, 2])
+        self.assertEqual(failed, [])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(OutboxEmail.objects.values_list('to', flat=True)),
+            ['test0@test.com', 'test1@test.com', 'test2@test.com']
+        )
+
+    def test_run_outbox_sends_queued_emails(self):
+        self._queue_email('test1@test.com')
+        self._queue_email('test2@test.com')
+        management.call_command('run_outbox')
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            sorted(email.to[0] for email in mail.outbox),
+            ['test1@test.com', 'test2@test.com']
+        )
+        self.assertEqual(
+            mail.outbox[0].alternatives, [('<p>Test message</p>', 'text/html')]
+        )
+        self.assertEqual(
+            OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 2
+        )
+        self.assertIsNotNone(OutboxEmail.objects.first().sent_date)
+        self.assertEqual(
+            ActivityLog.objects.last().log,
+            'Outbox run: 2 email(s) sent, 0 to retry, 0 failed'
+        )
+
+        # nothing sent again on the next run
+        management.call_command('run_outbox')
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_run_outbox_sends_over_one_connection(self):
+        for i in range(3):
+            self._queue_email('test{}@test.com'.format(i))
+        with patch(
+            'booking.management.commands.run_outbox.get_connection',
+            wraps=get_connection
+        ) as mock_get_connection:
+            management.call_command('run_outbox')
+        self.assertEqual(mock_get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_run_outbox_batch_size(self):
+        for i in range(3):
+            self._queue_email('test{}@test.com'.format(i))
+        management.call_command('run_outbox', batch_size=2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            OutboxEmail.objects.filter(status=OutboxEmail.QUEUED).count(), 1
+        )
+
+    def test_emails_not_due_are_not_sent(self):
+        self._queue_email()
+        OutboxEmail.objects.update(
+            next_attempt=timezone.now() + timedelta(minutes=5)
+        )
+        management.call_command('run_outbox')
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_expired_claims_are_resent(self):
+        self._queue_email('test1@test.com')
+        self._queue_email('test2@test.com')
+        # one claimed by a worker that died, one currently being sent by
+        # another worker
+        email1, email2 = OutboxEmail.objects.order_by('id')
+        OutboxEmail.objects.filter(id=email1.id).update(
+            status=OutboxEmail.SENDING,
+            next_attempt=timezone.now() - timedelta(minutes=1)
+        )
+        OutboxEmail.objects.filter(id=email2.id).update(
+            status=OutboxEmail.SENDING,
+            next_attempt=timezone.now() + timedelta(minutes=5)
+        )
+        management.call_command('run_outbox')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['test1@test.com'])
+
+    @patch('booking.management.commands.run_outbox.get_connection')
+    def test_failed_emails_retried_with_backoff(self, mock_get_connection):
+        mock_get_connection.return_value.send_messages.side_effect = \
+            Exception('Error sending mail')
+        self._queue_email()
+
+        now = timezone.now()
+        management.call_command('run_outbox')
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.status, OutboxEmail.QUEUED)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.last_error, 'Error sending mail')
+        self.assertTrue(
+            now + timedelta(seconds=60) <= email.next_attempt <=
+            now + timedelta(seconds=70)
+        )
+
+        # second failure doubles the delay
+        OutboxEmail.objects.update(next_attempt=timezone.now())
+        now = timezone.now()
+        management.call_command('run_outbox')
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.attempts, 2)
+        self.assertTrue(
+            now + timedelta(seconds=120) <= email.next_attempt <=
+            now + timedelta(seconds=130)
+        )
+
+    @patch('booking.management.commands.run_outbox.get_connection')
+    def test_emails_failed_after_max_attempts(self, mock_get_connection):
+        mock_get_connection.return_value.open.side_effect = \
+            Exception('Connection refused')
+        self._queue_email()
+        OutboxEmail.objects.update(attempts=2)
+
+        management.call_command('run_outbox', max_attempts=3)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.status, OutboxEmail.FAILED)
+        self.assertEqual(email.attempts, 3)
+        self.assertEqual(email.last_error, 'Connection refused')
+        self.assertEqual(
+            ActivityLog.objects.last().log,
+            'Outbox run: 0 email(s) sent, 0 to retry, 1 failed'
+        )
+
+        # failed emails are not picked up again
+        OutboxEmail.objects.update(next_attempt=timezone.now())
+        management.call_command('run_outbox')
+        self.assertEqual(OutboxEmail.objects.get().attempts, 3)
+
+
 class ActivateBlockTypeTests(TestCase):
 
     def test_activate_blocktypes(self):
@@ -2705,3 +3251,90 @@ class CreateFreeMonthlyBlocksTests(TestCase):
             self.assertEqual(Block.objects.filter(paid=False).count(), 0)
             management.call_command('create_free_monthly_blocks')
         self.assertEqual(Block.objects.count(), 3)
+
+    def test_free_blocks_expiry_date(self):
+        group = Group.objects.create(name='free_monthly_blocks')
+        user = mommy.make(User)
+        user.groups.add(group)
+        management.call_command('create_free_monthly_blocks')
+
+        # blocks are bulk created, bypassing Block.save
+        block = Block.objects.get(user=user)
+        self.assertTrue(block.paid)
+        self.assertIsNotNone(block.expiry_date)
+        self.assertEqual(block.expiry_date, block._calculate_expiry_date())
+        self.assertTrue(block.active_block())
+
+    def test_number_of_queries(self):
+        group = Group.objects.create(name='free_monthly_blocks')
+        mommy.make(User).groups.add(group)
+        management.call_command('create_free_monthly_blocks')
+
+        # one block created, one user with an active block already
+        mommy.make(User).groups.add(group)
+        with CaptureQueriesContext(connection) as single_user_queries:
+            management.call_command('create_free_monthly_blocks')
+
+        for user in mommy.make(User, _quantity=5):
+            user.groups.add(group)
+        with CaptureQueriesContext(connection) as queries:
+            management.call_command('create_free_monthly_blocks')
+        self.assertEqual(len(queries), len(single_user_queries))
+        self.assertEqual(Block.objects.count(), 7)
+
+    def test_dry_run(self):
+        group = Group.objects.create(name='free_monthly_blocks')
+        user1 = mommy.make(User, first_name='Test', last_name='User1')
+        user2 = mommy.make(User, first_name='Test', last_name='User2')
+        for user in [user1, user2]:
+            user.groups.add(group)
+        mommy.make_recipe(
+            'booking.block_5', user=user2, paid=True,
+            start_date=timezone.now() - timedelta(1),
+            block_type=BlockType.objects.create(
+                identifier='Free - 5 classes', active=False, cost=0,
+                duration=1, size=5, event_type=self.event_type
+            )
+        )
+
+        log_count = ActivityLog.objects.count()
+        output = StringIO()
+        management.call_command(
+            'create_free_monthly_blocks', dry_run=True, stdout=output
+        )
+        self.assertEqual(Block.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(ActivityLog.objects.count(), log_count)
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(
+            lines[0],
+            'Dry run: free 5 class blocks would be created for 1 user: '
+            'Test User1'
+        )
+        self.assertEqual(
+            lines[1],
+            'Dry run: active free block already exists for Test User2'
+        )
+        self.assertTrue(lines[2].startswith('Completed in '))
+
+    def test_dry_run_does_not_create_block_type(self):
+        group = Group.objects.create(name='free_monthly_blocks')
+        user = mommy.make(User, first_name='Test', last_name='User1')
+        user.groups.add(group)
+        self.assertFalse(
+            BlockType.objects.filter(identifier='Free - 5 classes').exists()
+        )
+
+        output = StringIO()
+        management.call_command(
+            'create_free_monthly_blocks', dry_run=True, stdout=output
+        )
+        self.assertFalse(
+            BlockType.objects.filter(identifier='Free - 5 classes').exists()
+        )
+        self.assertEqual(
+            output.getvalue().splitlines()[0],
+            'Dry run: free 5 class blocks would be created for 1 user: '
+            'Test User1'
+        )
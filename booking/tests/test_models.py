@@ -131,6 +131,33 @@ class EventTests(TestCase):
             reverse('booking:event_detail', kwargs={'slug': self.event.slug})
         )
 
+    def test_bulk_create_with_slugs_matches_saved_slugs(self):
+        """
+        Events created in bulk get the same unique slugs as events saved one
+        at a time
+        """
+        name = 'A class with a very long name that will be truncated'
+        date = datetime(2016, 1, 4, 18, tzinfo=timezone.utc)
+        event_type = self.event.event_type
+
+        def new_events():
+            return [
+                Event(name=name, date=date, event_type=event_type)
+                for _ in range(3)
+            ]
+
+        created = Event.objects.bulk_create_with_slugs(new_events())
+        bulk_slugs = [event.slug for event in created]
+        Event.objects.filter(id__in=[event.id for event in created]).delete()
+
+        saved_slugs = []
+        for event in new_events():
+            event.save()
+            saved_slugs.append(event.slug)
+
+        self.assertEqual(bulk_slugs, saved_slugs)
+        self.assertEqual(len(set(bulk_slugs)), 3)
+
     def test_str(self):
         event = mommy.make_recipe(
             'booking.past_event',
@@ -148,6 +175,9 @@ class BookingTests(TestCase):
         cls.subscribed = mommy.make(Group, name='subscribed')
 
     def setUp(self):
+        # bookings update the event's count in memory; use a fresh instance
+        # in each test
+        self.event = Event.objects.get(id=self.event.id)
         mommy.make_recipe('booking.user', _quantity=15)
         self.users = User.objects.all()
         self.event_with_cost = mommy.make_recipe('booking.future_EV',
@@ -192,6 +222,105 @@ class BookingTests(TestCase):
         self.assertEqual(event.bookings.count(), 17)
         self.assertEqual(event.spaces_left, 5)
 
+    def test_event_open_booking_count_updated_on_booking_changes(self):
+        """
+        Test that the stored open booking count follows booking status and
+        no-show changes
+        """
+        booking = mommy.make_recipe(
+            'booking.booking', user=self.users[0], event=self.event
+        )
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 1
+        )
+
+        booking.status = 'CANCELLED'
+        booking.save()
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 0
+        )
+
+        # rebooking
+        booking.status = 'OPEN'
+        booking.save()
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 1
+        )
+
+        booking.no_show = True
+        booking.save()
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 0
+        )
+
+        booking.no_show = False
+        booking.save()
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 1
+        )
+
+        # saving without changes doesn't change count
+        booking.paid = True
+        booking.save()
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 1
+        )
+
+        booking.delete()
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 0
+        )
+
+    def test_event_save_does_not_overwrite_open_booking_count(self):
+        event = Event.objects.get(id=self.event.id)
+        mommy.make_recipe(
+            'booking.booking', user=self.users[0], event=self.event
+        )
+        # event instance is stale; saving it keeps the stored count
+        event.name = 'new name'
+        event.save()
+        event = Event.objects.get(id=self.event.id)
+        self.assertEqual(event.name, 'new name')
+        self.assertEqual(event.open_booking_count, 1)
+
+    def test_event_open_booking_count_updated_in_memory(self):
+        booking = mommy.make_recipe(
+            'booking.booking', user=self.users[0], event=self.event
+        )
+        self.assertEqual(self.event.open_booking_count, 1)
+        booking.status = 'CANCELLED'
+        booking.save()
+        self.assertEqual(self.event.open_booking_count, 0)
+
+    def test_event_open_booking_count_not_negative(self):
+        booking = mommy.make_recipe(
+            'booking.booking', user=self.users[0], event=self.event
+        )
+        # count has drifted
+        Event.objects.filter(id=self.event.id).update(open_booking_count=0)
+        event = Event.objects.get(id=self.event.id)
+        event._adjust_open_booking_count(-1)
+        self.assertEqual(event.open_booking_count, 0)
+
+        booking.delete()
+        self.assertEqual(
+            Event.objects.get(id=self.event.id).open_booking_count, 0
+        )
+
+    def test_event_save_after_delete(self):
+        """
+        A deleted event, or one with its id changed, is saved as a new row
+        """
+        event = Event.objects.get(id=self.event.id)
+        event.delete()
+        event.save()
+        self.assertTrue(Event.objects.filter(id=event.id).exists())
+
+        event = Event.objects.get(id=event.id)
+        event.id = None
+        event.save()
+        self.assertEqual(Event.objects.filter(name=event.name).count(), 2)
+
     def test_space_confirmed_no_cost(self):
         """
         Test that a booking for an event with no cost is automatically confirmed
@@ -468,6 +597,58 @@ class BlockTests(TestCase):
         self.small_block.paid=True
         self.assertTrue(self.small_block.active_block())
 
+    @patch.object(timezone, 'now',
+                  return_value=datetime(2015, 3, 2, tzinfo=timezone.utc))
+    def test_active_blocks_queryset(self, mock_now):
+        """
+        Test that Block.objects.active() matches Block.active_block()
+        """
+        self.small_block.paid = True
+        self.small_block.save()
+        self.large_block.paid = True
+        self.large_block.save()
+        # small block has expired
+        self.assertEqual(list(Block.objects.active()), [self.large_block])
+
+        # unpaid blocks are not active
+        unpaid_block = mommy.make_recipe(
+            'booking.block_10',
+            start_date=datetime(2015, 3, 1, tzinfo=timezone.utc)
+        )
+        self.assertEqual(list(Block.objects.active()), [self.large_block])
+        self.assertIn(unpaid_block, Block.objects.unexpired().not_full())
+
+        # full blocks are not active
+        for pc in Event.objects.all():
+            mommy.make_recipe(
+                'booking.booking', user=self.large_block.user,
+                block=self.large_block, event=pc
+            )
+        self.assertFalse(Block.objects.active().exists())
+
+    def test_blocks_with_usage(self):
+        for pc in Event.objects.all()[:3]:
+            mommy.make_recipe(
+                'booking.booking', user=self.small_block.user,
+                block=self.small_block, event=pc
+            )
+        blocks = Block.objects.with_usage()
+        self.assertEqual(
+            blocks.get(id=self.small_block.id).bookings_used, 3
+        )
+        self.assertEqual(
+            blocks.get(id=self.large_block.id).bookings_used, 0
+        )
+
+        for pc in Event.objects.all()[3:5]:
+            mommy.make_recipe(
+                'booking.booking', user=self.small_block.user,
+                block=self.small_block, event=pc
+            )
+        small_block = blocks.get(id=self.small_block.id)
+        self.assertEqual(small_block.bookings_used, 5)
+        self.assertTrue(small_block.full)
+
     @patch.object(timezone, 'now',
                   return_value=datetime(2015, 3, 2, tzinfo=timezone.utc))
     def test_active_large_block(self, mock_now):
@@ -1329,6 +1510,22 @@ class BlockTypeTests(TestCase):
         self.assertEqual(BlockType.objects.count(), 2)
 
 
+    def test_changing_duration_updates_block_expiry_dates(self):
+        block = mommy.make_recipe('booking.block_5')
+        self.assertEqual(
+            block.expiry_date,
+            datetime(2015, 3, 1, 23, 59, 59, tzinfo=timezone.utc)
+        )
+        block_type = block.block_type
+        block_type.duration = 1
+        block_type.save()
+        block.refresh_from_db()
+        self.assertEqual(
+            block.expiry_date,
+            datetime(2015, 2, 1, 23, 59, 59, tzinfo=timezone.utc)
+        )
+
+
 class VoucherTests(TestCase):
 
     @patch('booking.models.timezone')
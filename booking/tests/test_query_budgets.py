@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+Query budgets for every page in the booking, studioadmin, accounts (profile)
+and payments urls.
+
+Each page is requested against a realistically sized dataset and its number
+of queries is checked against the budgets in query_budgets.json, so that
+changes which add queries per row (N+1 queries) fail here rather than in
+production.  Every page is requested inside a savepoint that is rolled back,
+so pages that change data (toggling a user's settings, deleting a booking)
+don't affect the counts for the pages after them.  After a change that
+intentionally alters the queries for a page, re-record the budgets with:
+
+    RECORD_QUERY_BUDGETS=1 python manage.py test booking.tests.test_query_budgets
+"""
+import json
+import os
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.urlresolvers import RegexURLResolver, get_resolver, reverse
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import OnlineDisclaimer, PrintDisclaimer
+from activitylog.models import ActivityLog
+from booking.models import Block, BlockType, BlockVoucher, Booking, Event, \
+    EventType, EventVoucher, TicketBooking, TicketedEvent, UsedBlockVoucher, \
+    UsedEventVoucher, WaitingListUser
+from booking.templatetags.bookingtags import encode
+from booking.tests.helpers import set_up_fb
+from timetable.models import Session
+
+
+BUDGET_FILE = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+
+# url namespaces covered, with the user the pages are requested as
+NAMESPACES = {
+    'booking': 'user',
+    'studioadmin': 'staff',
+    'profile': 'user',
+    'payments': 'user',
+}
+
+# public pages that are also checked without logging in
+ANONYMOUS_PAGES = [
+    'booking:events', 'booking:lessons', 'booking:room_hires',
+    'booking:ticketed_events', 'booking:event_detail',
+    'booking:lesson_detail',
+]
+
+NUM_USERS = 2000
+CLASSES_PER_DAY = 2
+BOOKINGS_PER_EVENT = 10
+NUM_BLOCK_USERS = 500
+NUM_DISCLAIMER_USERS = 1000
+NUM_SUBSCRIBED_USERS = 500
+NUM_TICKETED_EVENTS = 12
+TICKET_BOOKINGS_PER_EVENT = 20
+NUM_VOUCHERS = 20
+NUM_ACTIVITY_LOGS = 5000
+
+
+def get_url_names():
+    """
+    Names of all named urls in the covered namespaces
+    """
+    url_names = []
+    for resolver in get_resolver(None).url_patterns:
+        if isinstance(resolver, RegexURLResolver) and \
+                resolver.namespace in NAMESPACES:
+            for pattern in resolver.url_patterns:
+                if pattern.name:
+                    url_names.append(
+                        '{}:{}'.format(resolver.namespace, pattern.name)
+                    )
+    return url_names
+
+
+def load_budgets():
+    with open(BUDGET_FILE) as budget_file:
+        return json.load(budget_file)
+
+
+class QueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        set_up_fb()
+        now = timezone.now()
+        password = make_password('test')
+
+        User.objects.bulk_create([
+            User(
+                username='user{}'.format(i), first_name='First{}'.format(i),
+                last_name='Last{}'.format(i),
+                email='user{}@test.com'.format(i), password=password
+            )
+            for i in range(NUM_USERS)
+        ])
+        users = list(User.objects.order_by('id'))
+        cls.user = users[0]
+        cls.staff_user = User.objects.create_user(
+            username='staff', email='staff@test.com', password='test',
+            is_staff=True
+        )
+        Group.objects.get_or_create(name='instructors')
+        subscribed, _ = Group.objects.get_or_create(name='subscribed')
+        subscribed.user_set.add(*users[:NUM_SUBSCRIBED_USERS])
+
+        OnlineDisclaimer.objects.bulk_create([
+            OnlineDisclaimer(
+                user=user, name='{} {}'.format(user.first_name, user.last_name),
+                dob=now.date() - timedelta(days=365 * 30), address='1 Street',
+                postcode='AB1 2CD', mobile_phone='0123',
+                emergency_contact1_name='a',
+                emergency_contact1_relationship='b',
+                emergency_contact1_phone='1',
+                emergency_contact2_name='c',
+                emergency_contact2_relationship='d',
+                emergency_contact2_phone='2',
+                medical_conditions=False, joint_problems=False,
+                allergies=False, medical_treatment_permission=True,
+                terms_accepted=True, age_over_18_confirmed=True
+            )
+            for user in users[:NUM_DISCLAIMER_USERS]
+        ])
+        PrintDisclaimer.objects.bulk_create([
+            PrintDisclaimer(user=user)
+            for user in users[NUM_DISCLAIMER_USERS:NUM_DISCLAIMER_USERS + 200]
+        ])
+
+        class_type = EventType.objects.create(
+            event_type='CL', subtype='Pole level class'
+        )
+        event_type = EventType.objects.create(
+            event_type='EV', subtype='Workshop'
+        )
+        room_hire_type = EventType.objects.create(
+            event_type='RH', subtype='Studio hire'
+        )
+
+        # a year of events, half past and half upcoming
+        start = (now - timedelta(days=182)).replace(
+            hour=18, minute=0, second=0, microsecond=0
+        )
+        events = []
+        for day in range(365):
+            date = start + timedelta(days=day)
+            for i in range(CLASSES_PER_DAY):
+                events.append(Event(
+                    name='Pole Level {}'.format(i + 1),
+                    event_type=class_type, date=date + timedelta(hours=i),
+                    cost=Decimal('7.00'), max_participants=15,
+                    payment_open=True
+                ))
+            if day % 7 == 0:
+                events.append(Event(
+                    name='Workshop', event_type=event_type, date=date,
+                    cost=Decimal('20.00'), max_participants=20,
+                    payment_open=True
+                ))
+            if day % 30 == 0:
+                events.append(Event(
+                    name='Studio hire', event_type=room_hire_type, date=date,
+                    cost=Decimal('10.00')
+                ))
+        events = Event.objects.bulk_create_with_slugs(events)
+
+        block_type = BlockType.objects.create(
+            event_type=class_type, size=10, cost=Decimal('60.00'), duration=4
+        )
+        BlockType.objects.create(
+            event_type=event_type, size=5, cost=Decimal('90.00'), duration=2
+        )
+        blocks = []
+        for user in users[:NUM_BLOCK_USERS]:
+            block = Block(
+                user=user, block_type=block_type, paid=True,
+                start_date=now - timedelta(days=7)
+            )
+            block.expiry_date = block._calculate_expiry_date()
+            blocks.append(block)
+        Block.objects.bulk_create(blocks)
+        blocks_by_user = {
+            block.user_id: block for block in Block.objects.all()
+        }
+
+        # bookings for the main user on every class, and other users spread
+        # across the events
+        bookings = []
+        for i, event in enumerate(events):
+            booked_users = [cls.user] + [
+                users[(i * BOOKINGS_PER_EVENT + j) % NUM_USERS]
+                for j in range(1, BOOKINGS_PER_EVENT)
+            ]
+            for user in booked_users:
+                block = blocks_by_user.get(user.id) \
+                    if event.event_type == class_type else None
+                bookings.append(Booking(
+                    user=user, event=event, paid=bool(block),
+                    payment_confirmed=bool(block), block=block,
+                    date_booked=event.date - timedelta(days=2)
+                ))
+        Booking.objects.bulk_create(bookings)
+        Event.objects.update(open_booking_count=BOOKINGS_PER_EVENT)
+        WaitingListUser.objects.bulk_create([
+            WaitingListUser(user=user, event=event)
+            for event in events[::10] for user in users[-5:]
+        ])
+
+        Session.objects.bulk_create([
+            Session(
+                name='Pole Level {}'.format(i), day=day, event_type=class_type,
+                time=(start + timedelta(hours=i % 4)).time()
+            )
+            for i, (day, _) in enumerate(Session.DAY_CHOICES * 3)
+        ])
+
+        ticketed_events = []
+        for i in range(NUM_TICKETED_EVENTS):
+            ticketed_events.append(TicketedEvent.objects.create(
+                name='Show {}'.format(i), date=now + timedelta(days=30 * i),
+                ticket_cost=Decimal('5.00'), max_tickets=100
+            ))
+        ticket_bookings = []
+        for ticketed_event in ticketed_events:
+            for user in users[:TICKET_BOOKINGS_PER_EVENT]:
+                ticket_booking = TicketBooking(
+                    user=user, ticketed_event=ticketed_event,
+                    purchase_confirmed=True
+                )
+                ticket_booking.set_booking_reference()
+                ticket_bookings.append(ticket_booking)
+        TicketBooking.objects.bulk_create(ticket_bookings)
+
+        for i in range(NUM_VOUCHERS):
+            voucher = EventVoucher.objects.create(
+                code='event{}'.format(i), discount=10
+            )
+            voucher.event_types.add(class_type)
+            UsedEventVoucher.objects.bulk_create([
+                UsedEventVoucher(voucher=voucher, user=user)
+                for user in users[i * 20:(i + 1) * 20]
+            ])
+            block_voucher = BlockVoucher.objects.create(
+                code='block{}'.format(i), discount=10
+            )
+            block_voucher.block_types.add(block_type)
+            UsedBlockVoucher.objects.bulk_create([
+                UsedBlockVoucher(voucher=block_voucher, user=user)
+                for user in users[i * 20:(i + 1) * 20]
+            ])
+
+        ActivityLog.objects.bulk_create([
+            ActivityLog(log='Activity {}'.format(i))
+            for i in range(NUM_ACTIVITY_LOGS)
+        ])
+
+        upcoming = [event for event in events if event.date > now]
+        cls.lesson = next(
+            event for event in upcoming if event.event_type == class_type
+        )
+        cls.event = next(
+            event for event in upcoming if event.event_type == event_type
+        )
+        cls.room_hire = next(
+            event for event in upcoming if event.event_type == room_hire_type
+        )
+        cls.booking = Booking.objects.get(user=cls.user, event=cls.lesson)
+        cls.block = blocks_by_user[cls.user.id]
+        cls.session = Session.objects.first()
+        cls.ticketed_event = ticketed_events[1]
+        cls.ticket_booking = TicketBooking.objects.filter(
+            user=cls.user, ticketed_event=cls.ticketed_event
+        ).first()
+        cls.event_voucher = EventVoucher.objects.first()
+        cls.block_voucher = BlockVoucher.objects.first()
+
+    def get_url_kwargs(self):
+        """
+        Kwargs for urls with parameters, from the seeded data
+        """
+        user_id = {'user_id': self.user.id}
+        encoded_user_id = {'encoded_user_id': encode(self.user.id)}
+        booking = {'pk': self.booking.id}
+        lesson_slug = {'event_slug': self.lesson.slug}
+        ticketed_event_slug = {'slug': self.ticketed_event.slug}
+        register = {'event_slug': self.lesson.slug, 'status_choice': 'OPEN'}
+        event_register = {
+            'event_slug': self.event.slug, 'status_choice': 'OPEN'
+        }
+        return {
+            'studioadmin:confirm-payment': booking,
+            'studioadmin:confirm-refund': booking,
+            'studioadmin:edit_event': {'slug': self.event.slug},
+            'studioadmin:cancel_event': {'slug': self.event.slug},
+            'studioadmin:event_register': event_register,
+            'studioadmin:event_register_print': event_register,
+            'studioadmin:edit_lesson': {'slug': self.lesson.slug},
+            'studioadmin:class_register': register,
+            'studioadmin:class_register_print': register,
+            'studioadmin:edit_session': {'pk': self.session.id},
+            'studioadmin:unsubscribe': user_id,
+            'studioadmin:user_bookings_list': dict(
+                user_id, booking_status='future'
+            ),
+            'studioadmin:user_blocks_list': user_id,
+            'studioadmin:toggle_regular_student': user_id,
+            'studioadmin:toggle_print_disclaimer': user_id,
+            'studioadmin:toggle_subscribed': user_id,
+            'studioadmin:user_disclaimer': encoded_user_id,
+            'studioadmin:update_user_disclaimer': encoded_user_id,
+            'studioadmin:delete_user_disclaimer': encoded_user_id,
+            'studioadmin:event_waiting_list': {'event_id': self.lesson.id},
+            'studioadmin:edit_ticketed_event': ticketed_event_slug,
+            'studioadmin:ticketed_event_bookings': ticketed_event_slug,
+            'studioadmin:cancel_ticketed_event': ticketed_event_slug,
+            'studioadmin:confirm_ticket_booking_refund': {
+                'pk': self.ticket_booking.id
+            },
+            'studioadmin:edit_voucher': {'pk': self.event_voucher.id},
+            'studioadmin:voucher_uses': {'pk': self.event_voucher.id},
+            'studioadmin:edit_block_voucher': {'pk': self.block_voucher.id},
+            'studioadmin:block_voucher_uses': {'pk': self.block_voucher.id},
+            'booking:update_booking': booking,
+            'booking:update_booking_cancelled': booking,
+            'booking:already_paid': booking,
+            'booking:booking_paypal_form': booking,
+            'booking:delete_booking': booking,
+            'booking:already_cancelled': booking,
+            'booking:cancellation_period_past': lesson_slug,
+            'booking:duplicate_booking': lesson_slug,
+            'booking:fully_booked': lesson_slug,
+            'booking:book_event': lesson_slug,
+            'booking:event_detail': {'slug': self.event.slug},
+            'booking:lesson_detail': {'slug': self.lesson.slug},
+            'booking:room_hire_detail': {'slug': self.room_hire.slug},
+            'booking:delete_block': {'pk': self.block.id},
+            'booking:book_ticketed_event': {
+                'event_slug': self.ticketed_event.slug
+            },
+            'booking:ticket_booking': {
+                'ref': self.ticket_booking.booking_reference
+            },
+            'booking:cancel_ticket_booking': {'pk': self.ticket_booking.id},
+            'booking:ticket_purchase_expired': ticketed_event_slug,
+        }
+
+    def get_session_data(self):
+        """
+        Session data for pages that are only reached from another page
+        """
+        return {
+            'studioadmin:email_users_view': {
+                'users_to_email': list(
+                    User.objects.values_list('id', flat=True)[:200]
+                )
+            },
+        }
+
+    def get_pages(self):
+        """
+        (budget name, url, user, session data) for each page to check
+        """
+        url_kwargs = self.get_url_kwargs()
+        session_data = self.get_session_data()
+        users = {'user': self.user, 'staff': self.staff_user}
+        pages = []
+        for url_name in get_url_names():
+            url = reverse(url_name, kwargs=url_kwargs.get(url_name))
+            user = users[NAMESPACES[url_name.split(':')[0]]]
+            pages.append((url_name, url, user, session_data.get(url_name)))
+            if url_name in ANONYMOUS_PAGES:
+                pages.append(
+                    ('{} (anonymous)'.format(url_name), url, None, None)
+                )
+        return pages
+
+    def measure(self, url, user, session_data=None):
+        with transaction.atomic():
+            num_queries = self._measure(url, user, session_data)
+            # undo any changes the page made
+            transaction.set_rollback(True)
+        return num_queries
+
+    def _measure(self, url, user, session_data):
+        self.client.logout()
+        if user:
+            self.client.login(username=user.username, password='test')
+        if session_data:
+            session = self.client.session
+            session.update(session_data)
+            session.save()
+        # per-user checks and listings are cached; measure every page with
+        # an empty cache so the counts don't depend on the pages before it
+        cache.clear()
+        # the query log is capped, and stops counting once full
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+            if hasattr(resp, 'render'):
+                resp.render()
+        self.assertLess(resp.status_code, 500, url)
+        return len(queries)
+
+    def test_all_urls_have_budgets(self):
+        budgets = load_budgets()
+        missing = [
+            url_name for url_name in get_url_names()
+            if url_name not in budgets
+        ]
+        self.assertEqual(
+            missing, [],
+            'No query budget for {}; re-record the budgets (see {})'.format(
+                ', '.join(missing), __name__
+            )
+        )
+
+    def test_query_budgets(self):
+        recording = bool(os.environ.get('RECORD_QUERY_BUDGETS'))
+        budgets = {} if recording else load_budgets()
+        over_budget = []
+
+        for name, url, user, session_data in self.get_pages():
+            num_queries = self.measure(url, user, session_data)
+            if recording:
+                budgets[name] = num_queries
+                continue
+            budget = budgets.get(name)
+            if budget is None:
+                continue
+            if num_queries > budget:
+                over_budget.append(
+                    '{} ({}): {} queries, budget {}'.format(
+                        name, url, num_queries, budget
+                    )
+                )
+
+        if recording:
+            with open(BUDGET_FILE, 'w') as budget_file:
+                json.dump(budgets, budget_file, indent=2, sort_keys=True)
+                budget_file.write('\n')
+        self.assertEqual(
+            over_budget, [], 'Pages over budget:\n{}'.format(
+                '\n'.join(over_budget)
+            )
+        )
@@ -1,14 +1,20 @@
 from datetime import datetime
 from model_mommy import mommy
 
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, Permission, User
 from django.core.urlresolvers import reverse
+from django.db.models import Count
 from django.test import TestCase, RequestFactory
 from django.utils import timezone
 
+from accounts.models import OnlineDisclaimer, PrintDisclaimer
 from activitylog.models import ActivityLog
 
-from booking.models import Ticket, TicketBooking
+from booking.context_helpers import annotate_user_flags, \
+    set_transferred_bookings
+from booking.models import BlockVoucher, EventVoucher, Ticket, \
+    TicketBooking, UsedBlockVoucher, UsedEventVoucher
+from booking.templatetags import bookingtags
 from booking.views import EventDetailView
 from booking.tests.helpers import TestSetupMixin, format_content
 
@@ -127,3 +133,120 @@ class BookingtagTests(TestSetupMixin, TestCase):
             resp.rendered_content
         )
 
+
+    def test_user_flag_filters_use_annotations(self):
+        regular_student = Permission.objects.get(codename='is_regular_student')
+        subscribed, _ = Group.objects.get_or_create(name='subscribed')
+        regular_students, _ = Group.objects.get_or_create(
+            name='regular_students'
+        )
+        regular_students.permissions.add(regular_student)
+
+        flagged_user = mommy.make_recipe('booking.user')
+        mommy.make(OnlineDisclaimer, user=flagged_user)
+        mommy.make(PrintDisclaimer, user=flagged_user)
+        subscribed.user_set.add(flagged_user)
+        flagged_user.user_permissions.add(regular_student)
+        mommy.make_recipe(
+            'booking.booking', user=flagged_user,
+            event=mommy.make_recipe('booking.future_PC')
+        )
+        # regular student via a group
+        group_user = mommy.make_recipe('booking.user')
+        regular_students.user_set.add(group_user)
+        mommy.make_recipe(
+            'booking.booking', user=group_user,
+            event=mommy.make_recipe('booking.future_EV')
+        )
+        unflagged_user = mommy.make_recipe('booking.user')
+
+        users = {
+            user.id: user for user in annotate_user_flags(
+                User.objects.filter(
+                    id__in=[flagged_user.id, group_user.id, unflagged_user.id]
+                )
+            )
+        }
+        with self.assertNumQueries(0):
+            for user_id, flags in [
+                (flagged_user.id, [True, True, True, True, True]),
+                (group_user.id, [True, False, False, False, False]),
+                (unflagged_user.id, [False, False, False, False, False]),
+            ]:
+                user = users[user_id]
+                self.assertEqual(
+                    [
+                        user.is_regular_student(),
+                        bookingtags.has_online_disclaimer(user),
+                        bookingtags.has_print_disclaimer(user),
+                        bookingtags.subscribed(user),
+                        bookingtags.has_booked_class(user),
+                    ],
+                    flags
+                )
+
+    def test_transferred_block_filters_use_fetched_bookings(self):
+        booking = mommy.make_recipe(
+            'booking.booking',
+            event__date=datetime(2016, 1, 1, 18, 0, tzinfo=timezone.utc),
+            event__name='Pole Level 1'
+        )
+        transfer_block = mommy.make_recipe(
+            'booking.block', block_type__identifier='transferred',
+            transferred_booking_id=booking.id
+        )
+        deleted_transfer_block = mommy.make_recipe(
+            'booking.block', block_type__identifier='transferred',
+            transferred_booking_id=booking.id + 1
+        )
+        set_transferred_bookings([transfer_block, deleted_transfer_block])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                bookingtags.transferred_from(transfer_block),
+                'Pole Level 1 01Jan16 ({})'.format(booking.id)
+            )
+            self.assertEqual(
+                bookingtags.format_block_type_id_user(transfer_block),
+                '(transferred from Pole Level 1 01Jan16)'
+            )
+            self.assertEqual(
+                bookingtags.transferred_from(deleted_transfer_block),
+                '({})'.format(booking.id + 1)
+            )
+            self.assertEqual(
+                bookingtags.format_block_type_id_user(deleted_transfer_block),
+                '(transferred)'
+            )
+
+    def test_voucher_filters_use_annotations(self):
+        voucher = mommy.make(EventVoucher, max_vouchers=2)
+        mommy.make(UsedEventVoucher, voucher=voucher, _quantity=2)
+        block_voucher = mommy.make(BlockVoucher, max_vouchers=2)
+        mommy.make(UsedBlockVoucher, voucher=block_voucher)
+
+        voucher = EventVoucher.objects.annotate(
+            times_used=Count('usedeventvoucher')
+        ).get(id=voucher.id)
+        block_voucher = BlockVoucher.objects.annotate(
+            times_used=Count('usedblockvoucher')
+        ).get(id=block_voucher.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(bookingtags.times_voucher_used(voucher), 2)
+            self.assertTrue(bookingtags.voucher_expired(voucher))
+            self.assertEqual(
+                bookingtags.times_block_voucher_used(block_voucher), 1
+            )
+            self.assertFalse(bookingtags.voucher_expired(block_voucher))
+
+    def test_bookings_count(self):
+        event = mommy.make_recipe('booking.future_EV')
+        mommy.make_recipe('booking.booking', event=event, _quantity=2)
+        mommy.make_recipe(
+            'booking.booking', event=event, status='CANCELLED'
+        )
+        mommy.make_recipe('booking.booking', event=event, no_show=True)
+        event.refresh_from_db()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(bookingtags.bookings_count(event), 2)
@@ -1,4 +1,6 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from datetime import datetime, timedelta
 from model_mommy import mommy
@@ -232,6 +234,109 @@ class UtilsTests(TestCase):
         self.assertEquals(wed_classes.count(), 0)
         self.assertEquals(Event.objects.count(), 3)
 
+    def test_upload_timetable_returns_created_and_existing_classes(self):
+        start_date = datetime(2016, 3, 21, tzinfo=timezone.utc) # monday
+        end_date = datetime(2016, 3, 22, tzinfo=timezone.utc) # tuesday
+        mommy.make_recipe('booking.mon_session', _quantity=2)
+        mommy.make_recipe('booking.tue_session', _quantity=2)
+        session_ids = [session.id for session in Session.objects.all()]
+
+        created, existing = upload_timetable(
+            start_date, start_date, session_ids
+        )
+        self.assertEqual(len(created), 2)
+        self.assertEqual(existing, [])
+        self.assertTrue(all(event.id for event in created))
+
+        created1, existing1 = upload_timetable(
+            start_date, end_date, session_ids
+        )
+        self.assertEqual(len(created1), 2)
+        self.assertEqual(existing1, created)
+        self.assertEqual(Event.objects.count(), 4)
+
+    def test_upload_timetable_number_of_queries(self):
+        """
+        Uploading a term's timetable takes the same number of queries as
+        uploading a single day, apart from inserting the new classes in
+        batches
+        """
+        for day in [Session.MON, Session.TUE, Session.WED, Session.THU]:
+            for hour in range(10):
+                mommy.make(
+                    Session, name='Class {}'.format(hour),
+                    event_type__event_type='CL', day=day,
+                    time=datetime(2016, 1, 1, 9 + hour).time()
+                )
+        session_ids = [session.id for session in Session.objects.all()]
+
+        def get_queries(start_date, end_date):
+            with CaptureQueriesContext(connection) as queries:
+                created, _ = upload_timetable(
+                    start_date, end_date, session_ids
+                )
+            inserts = [
+                query['sql'] for query in queries.captured_queries
+                if query['sql'].startswith('INSERT INTO "booking_event"')
+            ]
+            batch_fetches = [
+                query['sql'] for query in queries.captured_queries
+                if '"booking_event"."slug" IN' in query['sql']
+            ]
+            self.assertEqual(len(inserts), len(batch_fetches))
+            return len(created), len(queries) - 2 * len(inserts)
+
+        start_date = datetime(2016, 3, 21, tzinfo=timezone.utc) # monday
+        created, day_queries = get_queries(start_date, start_date)
+        self.assertEqual(created, 10)
+
+        start_date = datetime(2016, 4, 4, tzinfo=timezone.utc) # monday
+        end_date = start_date + timedelta(weeks=12) - timedelta(days=1)
+        created, term_queries = get_queries(start_date, end_date)
+        self.assertEqual(created, 480)
+        self.assertEqual(Event.objects.count(), 490)
+        self.assertEqual(term_queries, day_queries)
+
+    def test_upload_timetable_generates_unique_slugs(self):
+        long_name = 'A class with a very long name that will be truncated'
+        mommy.make_recipe('booking.mon_session', name=long_name, _quantity=2)
+        session_ids = [session.id for session in Session.objects.all()]
+        # an existing event with the slug that would be generated first
+        existing = mommy.make_recipe(
+            'booking.future_PC', name=long_name,
+            date=datetime(2016, 1, 4, 18, tzinfo=timezone.utc)
+        )
+
+        start_date = datetime(2016, 3, 21, tzinfo=timezone.utc) # monday
+        end_date = datetime(2016, 3, 28, tzinfo=timezone.utc) # monday
+        created, _ = upload_timetable(start_date, end_date, session_ids)
+        self.assertEqual(len(created), 4)
+        slugs = [event.slug for event in created]
+        self.assertEqual(len(set(slugs + [existing.slug])), 5)
+        for slug in slugs:
+            self.assertTrue(slug.startswith(existing.slug[:37]))
+            self.assertLessEqual(len(slug), 40)
+
+    def test_create_classes_applies_event_payment_rules(self):
+        """
+        Classes created in bulk get the same payment fields as saved events,
+        and aren't created again on the next run
+        """
+        date = datetime(2016, 3, 22, tzinfo=timezone.utc)
+        mommy.make_recipe(
+            'booking.mon_session', cost=0, payment_open=True,
+            advance_payment_required=True
+        )
+        created, existing = create_classes(input_date=date)
+        self.assertEqual(len(created), 1)
+        self.assertFalse(created[0].payment_open)
+        self.assertFalse(created[0].advance_payment_required)
+
+        created, existing = create_classes(input_date=date)
+        self.assertEqual(created, [])
+        self.assertEqual(len(existing), 1)
+        self.assertEqual(Event.objects.count(), 1)
+
     def _start_of_day(self, date):
         return date.replace(hour=0, minute=0, second=0, microsecond=0)
 
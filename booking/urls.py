@@ -1,6 +1,7 @@
 from django.conf.urls import url
 from django.views.generic import RedirectView
 from booking.views import already_cancelled, already_paid, \
+    booking_paypal_form, \
     disclaimer_required, \
     EventListView, EventDetailView, BookingListView, \
     BookingHistoryListView, BookingCreateView, BookingUpdateView, \
@@ -22,6 +23,8 @@ urlpatterns = [
         name='update_booking_cancelled'),
     url(r'^booking/update/(?P<pk>\d+)/paid/$',
         already_paid, name='already_paid'),
+    url(r'^booking/(?P<pk>\d+)/paypal-form/$', booking_paypal_form,
+        name='booking_paypal_form'),
     url(r'^booking/cancel/(?P<pk>\d+)/$', BookingDeleteView.as_view(),
         name='delete_booking'),
     url(r'^booking/cancel/(?P<pk>\d+)/already_cancelled/$',
@@ -3,15 +3,100 @@
 import logging
 import pytz
 
+from collections import defaultdict
 from datetime import timedelta, datetime, date
+from django.db.models import Q
 from booking.models import Event
 from timetable.models import Session
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 logger = logging.getLogger(__name__)
 
 
+# session fields copied to the classes created from the timetable
+SESSION_EVENT_FIELDS = [
+    'description', 'max_participants', 'contact_person', 'contact_email',
+    'cost', 'payment_open', 'advance_payment_required', 'booking_open',
+    'payment_info', 'cancellation_period', 'external_instructor',
+    'email_studio_when_booked', 'allow_booking_cancellation',
+    'payment_time_allowed', 'paypal_email'
+]
+
+# fields used to identify a class that has already been created from a session
+EVENT_MATCH_FIELDS = ['name', 'event_type_id', 'date', 'location']
+
+DAYLIST = ['01MON', '02TUE', '03WED', '04THU', '05FRI', '06SAT', '07SUN']
+
+LOCAL_TZ = pytz.timezone('Europe/London')
+
+
+def _event_key(obj, match_fields):
+    return tuple(getattr(obj, field) for field in match_fields)
+
+
+def create_events_from_sessions(occurrences, match_fields=EVENT_MATCH_FIELDS):
+    """
+    Create classes for a list of (session, date) occurrences, unless a class
+    with the same match_fields already exists.  Existing classes are found
+    with a single query over the date range, and the missing ones are
+    inserted in bulk.  Returns lists of the created and existing classes in
+    the order of the occurrences.
+    """
+    planned = []
+    for session, day in occurrences:
+        # create date in Europe/London, convert to UTC
+        local_date = LOCAL_TZ.localize(datetime.combine(day, session.time))
+        event = Event(
+            name=session.name, event_type_id=session.event_type_id,
+            date=local_date.astimezone(pytz.utc), location=session.location,
+            **{field: getattr(session, field) for field in SESSION_EVENT_FIELDS}
+        )
+        # as it will be saved, so that it can be compared with existing classes
+        event.set_dependent_fields()
+        planned.append(event)
+
+    if not planned:
+        return [], []
+
+    existing_events = Event.objects.filter(
+        date__gte=min(event.date for event in planned),
+        date__lte=max(event.date for event in planned),
+        name__in={event.name for event in planned},
+        event_type_id__in={event.event_type_id for event in planned},
+        location__in={event.location for event in planned},
+    ).order_by('id')
+    events_by_key = {}
+    for event in existing_events:
+        events_by_key.setdefault(_event_key(event, match_fields), event)
+
+    keys = []
+    created_keys = set()
+    to_create = []
+    for event in planned:
+        key = _event_key(event, match_fields)
+        if key not in events_by_key:
+            # later occurrences of the same class match this one, as they
+            # would have matched a class created by get_or_create
+            events_by_key[key] = event
+            created_keys.add(key)
+            to_create.append(event)
+        keys.append(key)
+
+    for event in Event.objects.bulk_create_with_slugs(to_create):
+        events_by_key[_event_key(event, match_fields)] = event
+
+    created_classes = []
+    existing_classes = []
+    for key in keys:
+        if key in created_keys:
+            created_classes.append(events_by_key[key])
+            created_keys.remove(key)
+        else:
+            existing_classes.append(events_by_key[key])
+    return created_classes, existing_classes
+
+
 def create_classes(week='this', input_date=None):
     """
     Creates a week's classes (mon-sun) from any given date.  Will create classes
@@ -24,66 +109,19 @@ def create_classes(week='this', input_date=None):
         input_date = input_date + timedelta(7)
 
     mon = input_date - timedelta(days=input_date.weekday())
-    tues = mon + timedelta(days=1)
-    wed = mon + timedelta(days=2)
-    thurs = mon + timedelta(days=3)
-    fri = mon + timedelta(days=4)
-    sat = mon + timedelta(days=5)
-    sun = mon + timedelta(days=6)
-
-    date_dict = {
-        '01MON': mon,
-        '02TUE': tues,
-        '03WED': wed,
-        '04THU': thurs,
-        '05FRI': fri,
-        '06SAT': sat,
-        '07SUN': sun}
+    date_dict = {day: mon + timedelta(days=i) for i, day in enumerate(DAYLIST)}
 
     timetable = Session.objects.all()
 
-    created_classes = []
-    existing_classes = []
-
-    for session in timetable:
-
-        # create date in Europe/London, convert to UTC
-        localtz = pytz.timezone('Europe/London')
-        local_date = localtz.localize(
-            datetime.combine(date_dict[session.day], session.time)
-        )
-        converted_date = local_date.astimezone(pytz.utc)
-
-        cl, created = Event.objects.get_or_create(
-            name=session.name,
-            event_type=session.event_type,
-            date=converted_date,
-            description=session.description,
-            max_participants=session.max_participants,
-            location=session.location,
-            contact_person=session.contact_person,
-            contact_email=session.contact_email,
-            cost=session.cost,
-            payment_open=session.payment_open,
-            advance_payment_required=session.advance_payment_required,
-            booking_open=session.booking_open,
-            payment_info=session.payment_info,
-            cancellation_period=session.cancellation_period,
-            external_instructor=session.external_instructor,
-            email_studio_when_booked=session.email_studio_when_booked,
-            allow_booking_cancellation=session.allow_booking_cancellation,
-            payment_time_allowed=session.payment_time_allowed,
-            paypal_email=session.paypal_email
-
-            )
-        if created:
-            created_classes.append(cl)
-        else:
-            existing_classes.append(cl)
+    # an existing class only matches if all of the session's details match
+    created_classes, existing_classes = create_events_from_sessions(
+        [(session, date_dict[session.day]) for session in timetable],
+        match_fields=EVENT_MATCH_FIELDS + SESSION_EVENT_FIELDS
+    )
 
     if created_classes:
-        ActivityLog.objects.create(
-            log='Classes created from timetable for week beginning {}'.format(
+        log_activity(
+            'Classes created from timetable for week beginning {}'.format(
                 mon.strftime('%A %d %B %Y')
             )
         )
@@ -92,65 +130,26 @@ def create_classes(week='this', input_date=None):
 
 def upload_timetable(start_date, end_date, session_ids, user=None):
 
-    daylist = [
-        '01MON',
-        '02TUE',
-        '03WED',
-        '04THU',
-        '05FRI',
-        '06SAT',
-        '07SUN'
-        ]
-
-    created_classes = []
-    existing_classes = []
+    sessions_by_day = defaultdict(list)
+    for session in Session.objects.filter(id__in=session_ids):
+        sessions_by_day[session.day].append(session)
 
+    occurrences = []
     d = start_date
     delta = timedelta(days=1)
     while d <= end_date:
-        sessions_to_create = Session.objects.filter(
-            day=daylist[d.weekday()], id__in=session_ids
+        occurrences.extend(
+            (session, d) for session in sessions_by_day[DAYLIST[d.weekday()]]
         )
-        for session in sessions_to_create:
-
-            # create date in Europe/London, convert to UTC
-            localtz = pytz.timezone('Europe/London')
-            local_date = localtz.localize(datetime.combine(d,
-                session.time))
-            converted_date = local_date.astimezone(pytz.utc)
-
-            cl, created = Event.objects.get_or_create(
-                name=session.name,
-                event_type=session.event_type,
-                date=converted_date,
-                location=session.location
-            )
-            if created:
-                cl.description = session.description
-                cl.max_participants = session.max_participants
-                cl.contact_person = session.contact_person
-                cl.contact_email = session.contact_email
-                cl.cost = session.cost
-                cl.payment_open = session.payment_open
-                cl.advance_payment_required = session.advance_payment_required
-                cl.booking_open = session.booking_open
-                cl.payment_info = session.payment_info
-                cl.cancellation_period = session.cancellation_period
-                cl.external_instructor = session.external_instructor
-                cl.email_studio_when_booked = session.email_studio_when_booked
-                cl.payment_time_allowed = session.payment_time_allowed
-                cl.allow_booking_cancellation = session.allow_booking_cancellation
-                cl.paypal_email = session.paypal_email
-                cl.save()
-
-                created_classes.append(cl)
-            else:
-                existing_classes.append(cl)
         d += delta
 
+    created_classes, existing_classes = create_events_from_sessions(
+        occurrences
+    )
+
     if created_classes:
-        ActivityLog.objects.create(
-            log='Timetable uploaded for {} to {} {}'.format(
+        log_activity(
+            'Timetable uploaded for {} to {} {}'.format(
                 start_date.strftime('%a %d %B %Y'),
                 end_date.strftime('%a %d %B %Y'),
                 'by admin user {}'.format(user.username) if user else ''
@@ -158,3 +157,23 @@ def upload_timetable(start_date, end_date, session_ids, user=None):
         )
 
     return created_classes, existing_classes
+
+
+def get_events_cancellation_period_within(num_hrs, now):
+    """
+    Returns a queryset of upcoming events whose cancellation period starts
+    within num_hrs of now, i.e. date - (cancellation_period + num_hrs) <= now.
+
+    The comparison is done in the database: each distinct cancellation period
+    on upcoming events is turned into a date range condition, so events
+    are never loaded into python to calculate the cutoff.
+    """
+    cancellation_periods = Event.objects.filter(date__gte=now).order_by()\
+        .values_list('cancellation_period', flat=True).distinct()
+    period_filter = Q(id__in=[])
+    for cancellation_period in cancellation_periods:
+        period_filter |= Q(
+            cancellation_period=cancellation_period,
+            date__lte=now + timedelta(hours=(cancellation_period + num_hrs))
+        )
+    return Event.objects.filter(period_filter, date__gte=now)
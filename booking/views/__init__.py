@@ -2,7 +2,7 @@ from django.shortcuts import render
 
 from booking.views.event_views import EventDetailView, EventListView
 from booking.views.booking_views import already_cancelled, already_paid, \
-    BookingCreateView, BookingDeleteView, \
+    booking_paypal_form, BookingCreateView, BookingDeleteView, \
     BookingHistoryListView, BookingListView, BookingUpdateView, \
     disclaimer_required, \
     duplicate_booking, update_booking_cancelled, fully_booked, \
@@ -15,7 +15,7 @@ from booking.views.ticketed_views import TicketBookingListView, \
 
 
 __all__ = [
-    'already_cancelled', 'already_paid',
+    'already_cancelled', 'already_paid', 'booking_paypal_form',
     'EventListView', 'EventDetailView', 'BookingListView',
     'BookingHistoryListView', 'BookingCreateView', 'BookingUpdateView',
     'BookingDeleteView', 'disclaimer_required', 'duplicate_booking',
@@ -4,7 +4,6 @@ from decimal import Decimal
 
 from django.conf import settings
 from django.contrib import messages
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 
 from django.db.models import Q
@@ -17,13 +16,13 @@ from django.template.response import TemplateResponse
 from braces.views import LoginRequiredMixin
 
 from payments.forms import PayPalPaymentsListForm
-from booking.models import Booking, Block, BlockVoucher, UsedBlockVoucher
+from booking.models import Block, BlockVoucher, UsedBlockVoucher
 from booking.forms import BlockCreateForm, VoucherForm
 import booking.context_helpers as context_helpers
 from booking.views.views_utils import DisclaimerRequiredMixin
 from payments.helpers import create_block_paypal_transaction
 
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 logger = logging.getLogger(__name__)
 
@@ -72,8 +71,8 @@ class BlockCreateView(DisclaimerRequiredMixin, LoginRequiredMixin, CreateView):
         ):
             self.request.session['no_available_block'] = True
 
-        ActivityLog.objects.create(
-            log='Block {} created; Block type: {}; by user: {}'.format(
+        log_activity(
+            'Block {} created; Block type: {}; by user: {}'.format(
                 block.id, block.block_type, self.request.user.username
             )
         )
@@ -173,17 +172,8 @@ class BlockListView(LoginRequiredMixin, ListView):
 
     def get_extra_context(self, **kwargs):
         context = {}
-        try:
-            self.request.user.online_disclaimer
+        if self.request.user.has_disclaimer():
             context['disclaimer'] = True
-        except ObjectDoesNotExist:
-            pass
-
-        try:
-            self.request.user.print_disclaimer
-            context['disclaimer'] = True
-        except ObjectDoesNotExist:
-            pass
 
         types_available_to_book = context_helpers.\
             get_blocktypes_available_to_book(self.request.user)
@@ -204,7 +194,11 @@ class BlockListView(LoginRequiredMixin, ListView):
             context['valid_voucher'] = valid_voucher
 
         blockformlist = []
-        for block in self.get_queryset():
+        blocks = context_helpers.set_transferred_bookings(
+            self.get_queryset().select_related('block_type__event_type')
+            .with_usage()
+        )
+        for block in blocks:
             expired = block.expiry_date < timezone.now()
             paypal_cost = None
             voucher_applied = False
@@ -236,8 +230,7 @@ class BlockListView(LoginRequiredMixin, ListView):
                 )
             else:
                 paypal_form = None
-            full = Booking.objects.filter(
-                block__id=block.id).count() >= block.block_type.size
+            full = block.bookings_used >= block.block_type.size
             blockform = {
                 'block': block,
                 'voucher_applied': voucher_applied,
@@ -273,8 +266,8 @@ class BlockDeleteView(LoginRequiredMixin, DisclaimerRequiredMixin, DeleteView):
         block_user = self.block.user.username
         block_type = self.block.block_type
 
-        ActivityLog.objects.create(
-            log='User {} deleted unpaid and unused block {} ({})'.format(
+        log_activity(
+            'User {} deleted unpaid and unused block {} ({})'.format(
                 block_user, block_id, block_type
             )
         )
@@ -6,20 +6,20 @@ from decimal import Decimal
 
 from datetime import timedelta
 
-from operator import itemgetter
-
 from django.conf import settings
 from django.contrib import messages
+from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.db.models import Q
+from django.http import HttpResponse
 from django.shortcuts import HttpResponseRedirect, render, get_object_or_404
+from django.views.decorators.http import require_POST
 from django.views.generic import (
     ListView, CreateView, UpdateView, DeleteView
 )
 from django.utils import timezone
 from django.utils.safestring import mark_safe
-from django.core.mail import send_mail
 from django.template.loader import get_template
 from django.template.response import TemplateResponse
 from braces.views import LoginRequiredMixin
@@ -33,11 +33,12 @@ from booking.models import (
 )
 from booking.forms import BookingCreateForm, VoucherForm
 import booking.context_helpers as context_helpers
-from booking.email_helpers import send_support_email, send_waiting_list_email
+from booking.email_helpers import outbox_atomic, send_mail, \
+    send_support_email, send_waiting_list_email
 from booking.views.views_utils import DisclaimerRequiredMixin
 
 from payments.helpers import create_booking_paypal_transaction
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 logger = logging.getLogger(__name__)
 
@@ -51,44 +52,32 @@ class BookingListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         return Booking.objects.filter(
             Q(event__date__gte=timezone.now()) & Q(user=self.request.user)
+        ).select_related(
+            'event__event_type', 'block__block_type'
         ).order_by('event__date')
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
         context = super(BookingListView, self).get_context_data(**kwargs)
 
-        user_blocks = self.request.user.blocks.all()
         active_block_event_types = [
-            block.block_type.event_type for block in user_blocks
-            if block.active_block()
+            block.block_type.event_type for block in
+            self.request.user.blocks.active().select_related(
+                'block_type__event_type'
+            )
         ]
+        waiting_list_event_ids = set(
+            WaitingListUser.objects.filter(
+                user=self.request.user,
+                event_id__in=[booking.event_id for booking in self.object_list]
+            ).values_list('event_id', flat=True)
+        )
 
         bookingformlist = []
         for booking in self.object_list:
-            if booking.event.event_type not in active_block_event_types \
-                    and booking.status == 'OPEN' and not booking.paid:
-                # ONLY DO THIS IF PAYPAL BUTTON NEEDED
-                invoice_id = create_booking_paypal_transaction(
-                    self.request.user, booking).invoice_id
-                host = 'http://{}'.format(self.request.META.get('HTTP_HOST'))
-                paypal_form = PayPalPaymentsListForm(
-                    initial=context_helpers.get_paypal_dict(
-                        host,
-                        booking.event.cost,
-                        booking.event,
-                        invoice_id,
-                        '{} {}'.format('booking', booking.id),
-                        paypal_email=booking.event.paypal_email,
-                    )
-                )
-            else:
-                paypal_form = None
-
-            try:
-                WaitingListUser.objects.get(user=self.request.user, event=booking.event)
-                on_waiting_list = True
-            except WaitingListUser.DoesNotExist:
-                on_waiting_list = False
+            # paypal transactions and forms are only created when the user
+            # asks to pay (see booking_paypal_form), not on every list view
+            on_waiting_list = booking.event_id in waiting_list_event_ids
 
             can_cancel = booking.event.allow_booking_cancellation and \
                          booking.event.can_cancel() and \
@@ -113,7 +102,6 @@ class BookingListView(LoginRequiredMixin, ListView):
                 (booking.status == 'CANCELLED' or booking.no_show) else 'OPEN',
                 'ev_type': booking.event.event_type.event_type,
                 'booking': booking,
-                'paypalform': paypal_form,
                 'has_available_block': booking.event.event_type in
                 active_block_event_types,
                 'can_cancel': can_cancel,
@@ -134,7 +122,9 @@ class BookingHistoryListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         return Booking.objects.filter(
             event__date__lte=timezone.now(), user=self.request.user
-        ).order_by('-event__date')
+        ).select_related('event__event_type', 'block__block_type').order_by(
+            '-event__date'
+        )
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
@@ -178,7 +168,7 @@ class BookingCreateView(DisclaimerRequiredMixin, LoginRequiredMixin, CreateView)
             return HttpResponseRedirect(reverse('booking:permission_denied'))
 
         if self.event.event_type.subtype == "Pole practice" \
-                and not self.request.user.has_perm("booking.is_regular_student"):
+                and not self.request.user.is_regular_student():
             return HttpResponseRedirect(reverse('booking:permission_denied'))
 
         # don't redirect fully/already booked if trying to join/leave waiting
@@ -239,8 +229,8 @@ class BookingCreateView(DisclaimerRequiredMixin, LoginRequiredMixin, CreateView)
                 msg = 'You have been added to the waiting list for {}. ' \
                     ' We will email you if a space becomes ' \
                     'available.'.format(self.event)
-                ActivityLog.objects.create(
-                    log='User {} has joined the waiting list '
+                log_activity(
+                    'User {} has joined the waiting list '
                     'for {}'.format(
                         request.user.username, self.event
                     )
@@ -266,8 +256,8 @@ class BookingCreateView(DisclaimerRequiredMixin, LoginRequiredMixin, CreateView)
                 waitinglistuser.delete()
                 msg = 'You have been removed from the waiting list ' \
                     'for {}. '.format(self.event)
-                ActivityLog.objects.create(
-                    log='User {} has left the waiting list '
+                log_activity(
+                    'User {} has left the waiting list '
                     'for {}'.format(
                         request.user.username, self.event
                     )
@@ -295,6 +285,7 @@ class BookingCreateView(DisclaimerRequiredMixin, LoginRequiredMixin, CreateView)
         )
         return updated_context
 
+    @outbox_atomic
     def form_valid(self, form):
         booking = form.save(commit=False)
         try:
@@ -357,8 +348,8 @@ class BookingCreateView(DisclaimerRequiredMixin, LoginRequiredMixin, CreateView)
 
         try:
             booking.save()
-            ActivityLog.objects.create(
-                log='Booking {} {} for "{}" by user {}'.format(
+            log_activity(
+                'Booking {} {} for "{}" by user {}'.format(
                     booking.id,
                     'created' if not
                     (previously_cancelled or previously_no_show)
@@ -510,8 +501,8 @@ class BookingCreateView(DisclaimerRequiredMixin, LoginRequiredMixin, CreateView)
                 user=booking.user, event=booking.event
             )
             waiting_list_user.delete()
-            ActivityLog.objects.create(
-                log='User {} removed from waiting list '
+            log_activity(
+                'User {} removed from waiting list '
                 'for {}'.format(
                     booking.user.username, booking.event
                 )
@@ -718,24 +709,17 @@ def _get_active_user_block(user, booking):
     """
     return the active block for this booking with the soonest expiry date
     """
-    blocks = user.blocks.all()
-    active_blocks = [
-        (block, block.expiry_date)
-        for block in blocks if block.active_block()
-        and block.block_type.event_type == booking.event.event_type
-    ]
     # use the block with the soonest expiry date
-    if active_blocks:
-        return min(active_blocks, key=itemgetter(1))[0]
-    else:
-        return None
+    return user.blocks.active().filter(
+        block_type__event_type=booking.event.event_type
+    ).order_by('expiry_date').first()
 
 
 def _email_free_class_request(request, booking, booking_status):
     # if user is requesting a free class, send email to studio and
     # make booking unpaid (admin will update)
-    ActivityLog.objects.create(
-        log='Free class requested ({}) by user {}'.format(
+    log_activity(
+        'Free class requested ({}) by user {}'.format(
             booking.event, request.user.username)
     )
     booking.free_class_requested = True
@@ -787,8 +771,8 @@ def _get_block_status(booking, request):
     if booking.block:
         blocks_used = booking.block.bookings_made()
         total_blocks = booking.block.block_type.size
-        ActivityLog.objects.create(
-            log='Block used for booking id {} (for {}). Block id {}, '
+        log_activity(
+            'Block used for booking id {} (for {}). Block id {}, '
             'by user {}'.format(
                 booking.id, booking.event, booking.block.id,
                 request.user.username
@@ -824,6 +808,7 @@ class BookingDeleteView(DisclaimerRequiredMixin, LoginRequiredMixin, DeleteView)
         context['booked_with_block'] = booking.block is not None
         return context
 
+    @outbox_atomic
     def delete(self, request, *args, **kwargs):
         booking = self.get_object()
 
@@ -937,8 +922,8 @@ class BookingDeleteView(DisclaimerRequiredMixin, LoginRequiredMixin, DeleteView)
                 self.request,
                 self.success_message.format(booking.event)
             )
-            ActivityLog.objects.create(
-                log='Booking id {} for event {}, user {}, was cancelled by user '
+            log_activity(
+                'Booking id {} for event {}, user {}, was cancelled by user '
                     '{}'.format(
                         booking.id, booking.event, booking.user.username,
                         self.request.user.username
@@ -946,8 +931,8 @@ class BookingDeleteView(DisclaimerRequiredMixin, LoginRequiredMixin, DeleteView)
             )
 
             if transfer_block_created:
-                ActivityLog.objects.create(
-                    log='Transfer block created for user {} (for {}; transferred '
+                log_activity(
+                    'Transfer block created for user {} (for {}; transferred '
                         'booking id {} '.format(
                             booking.user.username, booking.event.event_type.subtype,
                             booking.id
@@ -971,8 +956,8 @@ class BookingDeleteView(DisclaimerRequiredMixin, LoginRequiredMixin, DeleteView)
                     self.request,
                     self.success_message.format(booking.event)
                 )
-                ActivityLog.objects.create(
-                    log='Booking id {} for event {}, user {}, was cancelled by user '
+                log_activity(
+                    'Booking id {} for event {}, user {}, was cancelled by user '
                         '{}'.format(
                             booking.id, booking.event, booking.user.username,
                             self.request.user.username
@@ -989,8 +974,8 @@ class BookingDeleteView(DisclaimerRequiredMixin, LoginRequiredMixin, DeleteView)
                         ' Please note that this booking is not eligible for refunds '
                         'or transfer credit.'
                     )
-                    ActivityLog.objects.create(
-                        log='Booking id {} for NON-CANCELLABLE event {}, user {}, '
+                    log_activity(
+                        'Booking id {} for NON-CANCELLABLE event {}, user {}, '
                             'was cancelled and set to no-show'.format(
                                 booking.id, booking.event, booking.user.username,
                                 self.request.user.username
@@ -1004,8 +989,8 @@ class BookingDeleteView(DisclaimerRequiredMixin, LoginRequiredMixin, DeleteView)
                         'refunds or transfer credit as the allowed '
                         'cancellation period has passed.'
                     )
-                    ActivityLog.objects.create(
-                        log='Booking id {} for event {}, user {}, was cancelled '
+                    log_activity(
+                        'Booking id {} for event {}, user {}, was cancelled '
                             'after the cancellation period and set to '
                             'no-show'.format(
                                 booking.id, booking.event, booking.user.username,
@@ -1025,8 +1010,8 @@ class BookingDeleteView(DisclaimerRequiredMixin, LoginRequiredMixin, DeleteView)
                         [wluser.user for wluser in waiting_list_users],
                         host='http://{}'.format(request.META.get('HTTP_HOST'))
                     )
-                    ActivityLog.objects.create(
-                        log='Waiting list email sent to user(s) {} for '
+                    log_activity(
+                        'Waiting list email sent to user(s) {} for '
                         'event {}'.format(
                             ', '.join(
                                 [wluser.user.username for \
@@ -1110,5 +1095,41 @@ def already_paid(request, pk):
     return render(request, 'booking/already_paid.html', context)
 
 
+@login_required
+@require_POST
+def booking_paypal_form(request, pk):
+    """
+    Create the paypal transaction for a booking and return the paypal form.
+    Called (POST, as it creates the transaction) from the bookings list when
+    the user clicks to pay, so that invoice ids are only generated for
+    bookings the user is actually paying for.
+    """
+    booking = get_object_or_404(
+        Booking.objects.select_related('event'), pk=pk, user=request.user
+    )
+    if booking.status == 'CANCELLED' or booking.paid \
+            or booking.event.cancelled or not booking.event.payment_open \
+            or not booking.event.cost:
+        return HttpResponse(status=400)
+
+    invoice_id = create_booking_paypal_transaction(
+        request.user, booking
+    ).invoice_id
+    host = 'http://{}'.format(request.META.get('HTTP_HOST'))
+    paypal_form = PayPalPaymentsListForm(
+        initial=context_helpers.get_paypal_dict(
+            host,
+            booking.event.cost,
+            booking.event,
+            invoice_id,
+            '{} {}'.format('booking', booking.id),
+            paypal_email=booking.event.paypal_email,
+        )
+    )
+    return render(
+        request, 'payments/payment.html', {'paypalform': paypal_form}
+    )
+
+
 def disclaimer_required(request):
     return render(request, 'booking/disclaimer_required.html')
@@ -1,14 +1,23 @@
+import hashlib
 import logging
+import time
 
-from django.db.models import Q
-from django.core.exceptions import ObjectDoesNotExist
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db.models import Prefetch, Q
+from django.http import HttpResponse
 from django.shortcuts import HttpResponseRedirect, render, get_object_or_404
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.safestring import mark_safe
 from django.views.generic import (
     ListView, DetailView, CreateView, UpdateView, DeleteView
 )
 from django.utils import timezone
 from braces.views import LoginRequiredMixin
 
+from booking import event_list_cache
 from booking.models import Booking, Event, WaitingListUser
 from booking.forms import EventFilter, LessonFilter, RoomHireFilter
 import booking.context_helpers as context_helpers
@@ -22,6 +31,46 @@ class EventListView(ListView):
     context_object_name = 'events'
     template_name = 'booking/events.html'
 
+    def _anonymous_cacheable(self):
+        # the page is the same for all anonymous visitors, unless there are
+        # messages to show or query parameters other than the name filter
+        return self.request.user.is_anonymous() \
+            and set(self.request.GET.keys()) <= {'name'} \
+            and not len(get_messages(self.request))
+
+    def get(self, request, *args, **kwargs):
+        if not self._anonymous_cacheable():
+            return super(EventListView, self).get(request, *args, **kwargs)
+
+        key = event_list_cache.make_key(
+            'anonymous', self.kwargs['ev_type'], request.GET.get('name')
+        )
+        cached = cache.get(key)
+        if cached is None:
+            response = super(EventListView, self).get(
+                request, *args, **kwargs
+            )
+            response.render()
+            cached = {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'etag': hashlib.md5(response.content).hexdigest(),
+                'last_modified': int(time.time()),
+            }
+            cache.set(
+                key, cached, event_list_cache.EVENT_LIST_CACHE_TIMEOUT
+            )
+        else:
+            response = HttpResponse(
+                cached['content'], content_type=cached['content_type']
+            )
+        response['ETag'] = quote_etag(cached['etag'])
+        response['Last-Modified'] = http_date(cached['last_modified'])
+        return get_conditional_response(
+            request, etag=cached['etag'],
+            last_modified=cached['last_modified'], response=response
+        )
+
     def get_queryset(self):
         if self.kwargs['ev_type'] == 'events':
             ev_abbr = 'EV'
@@ -32,38 +81,76 @@ class EventListView(ListView):
 
         name = self.request.GET.get('name')
 
-        if name:
-            return Event.objects.select_related('event_type').filter(
-                event_type__event_type=ev_abbr,
-                date__gte=timezone.now(),
-                name=name,
-                cancelled=False
-            ).order_by('date')
-        return Event.objects.select_related('event_type').filter(
+        queryset = Event.objects.select_related('event_type').filter(
             event_type__event_type=ev_abbr,
             date__gte=timezone.now(),
             cancelled=False
         ).order_by('date')
+        if name:
+            queryset = queryset.filter(name=name)
+        if not self.request.user.is_anonymous():
+            # the user's booking for each event, for the payment buttons
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'bookings',
+                    queryset=Booking.objects.filter(user=self.request.user),
+                    to_attr='user_bookings'
+                )
+            )
+        return queryset
+
+    def _add_shared_cells(self, events):
+        """
+        Attach the cells of each event's row that are the same for all users
+        (date, name, cost, spaces etc) as event.shared_cells.  The rendered
+        cells are cached, and fetched for all the listed events at once.
+        """
+        ev_type = self.kwargs['ev_type']
+        keys = event_list_cache.make_row_keys(
+            ev_type, [event.id for event in events]
+        )
+        cached = cache.get_many(keys.values()) if keys else {}
+        missing = {}
+        for event in events:
+            cells = cached.get(keys[event.id])
+            if cells is None:
+                cells = render_to_string(
+                    'booking/includes/event_list_row.html',
+                    {'event': event, 'type': ev_type}
+                )
+                missing[keys[event.id]] = cells
+            event.shared_cells = mark_safe(cells)
+        if missing:
+            cache.set_many(
+                missing, event_list_cache.EVENT_LIST_CACHE_TIMEOUT
+            )
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
         context = super(EventListView, self).get_context_data(**kwargs)
         if not self.request.user.is_anonymous():
-            # Add in the booked_events
-            user_booked_events = Booking.objects.select_related()\
-                .filter(user=self.request.user, status='OPEN', no_show=False)\
-                .values_list('event__id', flat=True)
-            booked_events = Event.objects.select_related()\
-                .filter(id__in=user_booked_events).values_list('id', flat=True)
-            waiting_list_events = WaitingListUser.objects\
-                .filter(user=self.request.user)\
-                .values_list('event__id', flat=True)
-            context['booked_events'] = booked_events
-            context['waiting_list_events'] = waiting_list_events
-            context['is_regular_student'] = self.request.user.has_perm(
-                "booking.is_regular_student"
-            )
+            # The user's state for the listed events, shown in the Booked
+            # column; the rest of each row is shared by all users (see
+            # _add_shared_cells).  Booked events come from the prefetched user
+            # bookings, and waiting list events from a single query.
+            events = context['events']
+            context['booked_events'] = {
+                event.id for event in events
+                if any(
+                    booking.status == 'OPEN' and not booking.no_show
+                    for booking in event.user_bookings
+                )
+            }
+            context['waiting_list_events'] = set(
+                WaitingListUser.objects.filter(
+                    user=self.request.user,
+                    event__in=[event.id for event in events]
+                ).values_list('event_id', flat=True)
+            ) if events else set()
+            context['is_regular_student'] = \
+                self.request.user.is_regular_student()
         context['type'] = self.kwargs['ev_type']
+        self._add_shared_cells(context['events'])
 
         event_name = self.request.GET.get('name', '')
         if self.kwargs['ev_type'] == 'events':
@@ -74,18 +161,9 @@ class EventListView(ListView):
             form = RoomHireFilter(initial={'name': event_name})
         context['form'] = form
 
-        if not self.request.user.is_anonymous():
-            try:
-                self.request.user.online_disclaimer
-                context['disclaimer'] = True
-            except ObjectDoesNotExist:
-                pass
-
-            try:
-                self.request.user.print_disclaimer
-                context['disclaimer'] = True
-            except ObjectDoesNotExist:
-                pass
+        if not self.request.user.is_anonymous() \
+                and self.request.user.has_disclaimer():
+            context['disclaimer'] = True
 
         return context
 
@@ -103,7 +181,12 @@ class EventDetailView(LoginRequiredMixin, DetailView):
             ev_abbr = 'CL'
         else:
             ev_abbr = 'RH'
-        queryset = Event.objects.filter(event_type__event_type=ev_abbr)
+        queryset = context_helpers.annotate_user_event_state(
+            Event.objects.select_related('event_type').filter(
+                event_type__event_type=ev_abbr
+            ),
+            self.request.user
+        )
 
         return get_object_or_404(queryset, slug=self.kwargs['slug'])
 
@@ -23,7 +23,7 @@ from booking.email_helpers import send_support_email, send_waiting_list_email
 from payments.forms import PayPalPaymentsUpdateForm, PayPalPaymentsListForm
 from payments.helpers import create_ticket_booking_paypal_transaction
 
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 logger = logging.getLogger(__name__)
 
@@ -181,8 +181,8 @@ class TicketCreateView(LoginRequiredMixin, TemplateView):
                         ticket.delete()
 
                 if old_ticket_count > 0:
-                    ActivityLog.objects.create(
-                        log="Ticket quantity updated on booking ref {}".format(
+                    log_activity(
+                        "Ticket quantity updated on booking ref {}".format(
                             self.ticket_booking.booking_reference
                             )
                     )
@@ -222,8 +222,8 @@ class TicketCreateView(LoginRequiredMixin, TemplateView):
                 context['purchase_confirmed'] = True
                 self.ticket_booking.date_booked = timezone.now()
                 self.ticket_booking.save()
-                ActivityLog.objects.create(
-                    log="Ticket Purchase confirmed: event {}, user {}, "
+                log_activity(
+                    "Ticket Purchase confirmed: event {}, user {}, "
                         "booking ref {}".format(
                             self.ticketed_event.name, request.user.username,
                             self.ticket_booking.booking_reference
@@ -312,7 +312,8 @@ class TicketBookingListView(LoginRequiredMixin, ListView):
         return TicketBooking.objects.filter(
             ticketed_event__date__gte=timezone.now(), user=self.request.user,
             purchase_confirmed=True
-        ).order_by('ticketed_event__date')
+        ).select_related('ticketed_event').prefetch_related('tickets')\
+            .order_by('ticketed_event__date')
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
@@ -359,7 +360,8 @@ class TicketBookingHistoryListView(LoginRequiredMixin, ListView):
         return TicketBooking.objects.filter(
             ticketed_event__date__lt=timezone.now(), user=self.request.user,
             purchase_confirmed=True
-        ).order_by('ticketed_event__date')
+        ).select_related('ticketed_event').prefetch_related('tickets')\
+            .order_by('ticketed_event__date')
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
@@ -418,8 +420,8 @@ class TicketBookingView(LoginRequiredMixin, TemplateView):
                 else:
                     ticket_formset.save()
 
-                    ActivityLog.objects.create(
-                        log="Ticket info updated by {} for booking ref {}".format(
+                    log_activity(
+                        "Ticket info updated by {} for booking ref {}".format(
                             request.user.username,
                             self.ticket_booking.booking_reference
                         )
@@ -485,8 +487,8 @@ class TicketBookingCancelView(LoginRequiredMixin, UpdateView):
 
             ticket_booking.cancelled = True
             ticket_booking.save()
-            ActivityLog.objects.create(
-                log='Ticket booking ref {} (for {}) has been cancelled by '
+            log_activity(
+                'Ticket booking ref {} (for {}) has been cancelled by '
                     'user {}'.format(
                         ticket_booking.booking_reference,
                         ticket_booking.ticketed_event,
@@ -1,4 +1,3 @@
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 from django.shortcuts import HttpResponseRedirect
 
@@ -7,20 +6,6 @@ class DisclaimerRequiredMixin(object):
 
     def dispatch(self, request, *args, **kwargs):
         # check if the user has a disclaimer
-
-        disclaimer = False
-        try:
-            request.user.online_disclaimer
-            disclaimer = True
-        except ObjectDoesNotExist:
-            pass
-
-        try:
-            request.user.print_disclaimer
-            disclaimer = True
-        except ObjectDoesNotExist:
-            pass
-
-        if not disclaimer:
+        if not request.user.has_disclaimer():
             return HttpResponseRedirect(reverse('booking:disclaimer_required'))
         return super(DisclaimerRequiredMixin, self).dispatch(request, *args, **kwargs)
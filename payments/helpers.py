@@ -1,45 +1,69 @@
-import random
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q
 
 from payments.models import PaypalBookingTransaction, PaypalBlockTransaction, \
     PaypalTicketBookingTransaction
 
 
+# number of times to retry allocating a counter if a concurrent request
+# creates a transaction for the same object at the same time
+MAX_ALLOCATION_ATTEMPTS = 5
+
+
+def _create_paypal_transaction(model, obj_field, obj, id_string):
+    """
+    Return the unpaid transaction for obj with an invoice id starting with
+    id_string, or create a new one with the next counter for obj.
+
+    Invoice ids are id_string followed by the counter padded to 3 digits.  If
+    that invoice id is already used by a different object (e.g. two events
+    with the same initials on the same date) the object id is added to make
+    it unique.  Concurrent requests for the same object are protected by the
+    unique (object, counter) constraint; the loser retries and picks up the
+    transaction that was just created.
+    """
+    obj_transactions = model.objects.filter(**{obj_field: obj})
+
+    for attempt in range(MAX_ALLOCATION_ATTEMPTS):
+        # Paypal transactions are created when the view is called, not when
+        # payment is made.  If there is no transaction id stored against an
+        # existing one, we shouldn't need to make a new one
+        unpaid = obj_transactions.filter(
+            Q(transaction_id__isnull=True) | Q(transaction_id=''),
+            invoice_id__startswith=id_string
+        ).order_by('counter').first()
+        if unpaid:
+            return unpaid
+
+        last_counter = obj_transactions.aggregate(
+            last_counter=Max('counter')
+        )['last_counter']
+        counter = (last_counter or 0) + 1
+        counter_str = str(counter).zfill(3)
+
+        invoice_id = id_string + counter_str
+        if model.objects.filter(invoice_id=invoice_id).exists():
+            invoice_id = '{}{}-{}'.format(id_string, obj.id, counter_str)
+
+        try:
+            with transaction.atomic():
+                return model.objects.create(
+                    invoice_id=invoice_id, counter=counter,
+                    **{obj_field: obj}
+                )
+        except IntegrityError:
+            if attempt == MAX_ALLOCATION_ATTEMPTS - 1:
+                raise
+
+
 def create_booking_paypal_transaction(user, booking):
     id_string = "-".join([user.username] +
                          ["".join([word[0] for word in
                                    booking.event.name.split()])] +
                          [booking.event.date.strftime("%d%m%y%H%M")] + ['inv#'])
-    existing = PaypalBookingTransaction.objects.filter(
-        invoice_id__contains=id_string, booking=booking).order_by('-invoice_id')
-
-    if existing:
-        # PaypalBookingTransaction is created when the view is called, not when
-        # payment is made.  If there is no transaction id stored against it,
-        # we shouldn't need to make a new one
-        for transaction in existing:
-            if not transaction.transaction_id:
-                return transaction
-        existing_counter = existing[0].invoice_id[-3:]
-        counter = str(int(existing_counter) + 1).zfill(len(existing_counter))
-    else:
-        counter = '001'
-
-    invoice_id = id_string + counter
-    existing_inv = PaypalBookingTransaction.objects.filter(
-        invoice_id=invoice_id
-    )
-    if existing_inv:
-        # in case we already have the same invoice id for a different
-        # booking (the check for existing above checked for this exact
-        # combination of invoice id and booking
-        random_prefix = random.randrange(100, 999)
-        invoice_id = id_string + str(random_prefix) + counter
-
-    pbt = PaypalBookingTransaction.objects.create(
-        invoice_id=invoice_id, booking=booking
+    return _create_paypal_transaction(
+        PaypalBookingTransaction, 'booking', booking, id_string
     )
-    return pbt
 
 
 def create_block_paypal_transaction(user, block):
@@ -49,71 +73,15 @@ def create_block_paypal_transaction(user, block):
                           block.block_type.event_type.subtype.split()])] +
                          [str(block.block_type.size)] +
                          [block.start_date.strftime("%d%m%y%H%M")] + ['inv#'])
-
-    existing = PaypalBlockTransaction.objects.filter(
-        invoice_id__contains=id_string, block=block).order_by('-invoice_id')
-
-    if existing:
-        # PaypalBlockTransaction is created when the view is called, not when
-        # payment is made.  If there is no transaction id stored against it,
-        # we shouldn't need to make a new one
-        for transaction in existing:
-            if not transaction.transaction_id:
-                return transaction
-        existing_counter = existing[0].invoice_id[-3:]
-        counter = str(int(existing_counter) + 1).zfill(len(existing_counter))
-    else:
-        counter = '001'
-
-    invoice_id = id_string + counter
-    existing_inv = PaypalBlockTransaction.objects.filter(
-        invoice_id=invoice_id
+    return _create_paypal_transaction(
+        PaypalBlockTransaction, 'block', block, id_string
     )
 
-    if existing_inv:
-        # in case we already have the same invoice id for a different
-        # block (the check for existing above checked for this exact
-        # combination of invoice id and block
-        random_prefix = random.randrange(100, 999)
-        invoice_id = id_string + str(random_prefix) + counter
-
-    pbt = PaypalBlockTransaction.objects.create(
-        invoice_id=invoice_id, block=block
-    )
-    return pbt
-
 
 def create_ticket_booking_paypal_transaction(user, ticket_booking):
-
-    existing = PaypalTicketBookingTransaction.objects.filter(
-        invoice_id__contains=ticket_booking.booking_reference,
-        ticket_booking=ticket_booking).order_by('-invoice_id')
-
-    if existing:
-        # PaypalTicketBookingTransaction is created when the view is called,
-        # not when payment is made.  If people change their minds about the
-        # quantity of tickets, we don't need to make a new one - check if
-        # there is no transaction id stored against it,
-        for transaction in existing:
-            if not transaction.transaction_id:
-                return transaction
-        existing_counter = existing[0].invoice_id[-3:]
-        counter = str(int(existing_counter) + 1).zfill(len(existing_counter))
-    else:
-        counter = '001'
-
-    invoice_id = ticket_booking.booking_reference + counter
-    existing_inv = PaypalTicketBookingTransaction.objects.filter(
-        invoice_id=invoice_id
-    )
-    if existing_inv:
-        # in case we already have the same invoice id for a different
-        # booking (the check for existing above checked for this exact
-        # combination of invoice id and booking
-        random_prefix = random.randrange(100, 999)
-        invoice_id = ticket_booking.booking_reference + str(random_prefix) + counter
-
-    pbt = PaypalTicketBookingTransaction.objects.create(
-        invoice_id=invoice_id, ticket_booking=ticket_booking
+    # If people change their minds about the quantity of tickets, the unpaid
+    # transaction is reused
+    return _create_paypal_transaction(
+        PaypalTicketBookingTransaction, 'ticket_booking', ticket_booking,
+        ticket_booking.booking_reference
     )
-    return pbt
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.1 on 2026-10-18 20:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    for model_name, fk in [
+        ('PaypalBookingTransaction', 'booking_id'),
+        ('PaypalBlockTransaction', 'block_id'),
+        ('PaypalTicketBookingTransaction', 'ticket_booking_id'),
+    ]:
+        Transaction = apps.get_model('payments', model_name)
+        last_obj_id = None
+        counter = 0
+        for txn_id, obj_id in Transaction.objects.exclude(
+                **{'{}__isnull'.format(fk): True}
+        ).order_by(fk, 'id').values_list('id', fk):
+            counter = counter + 1 if obj_id == last_obj_id else 1
+            last_obj_id = obj_id
+            Transaction.objects.filter(id=txn_id).update(counter=counter)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_paypalblocktransaction_voucher_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paypalblocktransaction',
+            name='counter',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paypalbookingtransaction',
+            name='counter',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paypalticketbookingtransaction',
+            name='counter',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(
+            populate_counters, reverse_code=migrations.RunPython.noop
+        ),
+        migrations.AlterUniqueTogether(
+            name='paypalblocktransaction',
+            unique_together=set([('block', 'counter')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='paypalbookingtransaction',
+            unique_together=set([('booking', 'counter')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='paypalticketbookingtransaction',
+            unique_together=set([('ticket_booking', 'counter')]),
+        ),
+    ]
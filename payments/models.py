@@ -4,7 +4,6 @@ import logging
 
 from django.db import models
 from django.conf import settings
-from django.core.mail import send_mail
 from django.utils import timezone
 from django.template.loader import get_template
 
@@ -15,7 +14,8 @@ from paypal.standard.ipn.signals import valid_ipn_received, invalid_ipn_received
 from booking.models import Booking, Block, TicketBooking, BlockVoucher, \
     EventVoucher, UsedBlockVoucher, UsedEventVoucher
 
-from activitylog.models import ActivityLog
+from booking.email_helpers import send_mail
+from activitylog.helpers import log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -30,6 +30,12 @@ class PaypalBookingTransaction(models.Model):
     booking = models.ForeignKey(Booking, null=True)
     transaction_id = models.CharField(max_length=255, null=True, blank=True, unique=True)
     voucher_code = models.CharField(max_length=255, null=True, blank=True)
+    # sequence number of this transaction for the booking; the last part of
+    # the invoice id
+    counter = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('booking', 'counter')
 
     def __str__(self):
         return self.invoice_id
@@ -40,6 +46,12 @@ class PaypalBlockTransaction(models.Model):
     block = models.ForeignKey(Block, null=True)
     transaction_id = models.CharField(max_length=255, null=True, blank=True, unique=True)
     voucher_code = models.CharField(max_length=255, null=True, blank=True)
+    # sequence number of this transaction for the block; the last part of
+    # the invoice id
+    counter = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('block', 'counter')
 
     def __str__(self):
         return self.invoice_id
@@ -49,6 +61,12 @@ class PaypalTicketBookingTransaction(models.Model):
     invoice_id = models.CharField(max_length=255, null=True, blank=True, unique=True)
     ticket_booking = models.ForeignKey(TicketBooking, null=True)
     transaction_id = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    # sequence number of this transaction for the ticket booking; the last
+    # part of the invoice id
+    counter = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('ticket_booking', 'counter')
 
     def __str__(self):
         return self.invoice_id
@@ -361,8 +379,8 @@ def payment_received(sender, **kwargs):
 
         if ipn_obj.payment_status == ST_PP_REFUNDED:
             if obj_type == 'paypal_test':
-                ActivityLog.objects.create(
-                    log='Test payment (invoice {} for paypal email {} has '
+                log_activity(
+                    'Test payment (invoice {} for paypal email {} has '
                         'been refunded from paypal; paypal transaction '
                         'id {}'.format(
                             additional_data['test_invoice'],
@@ -398,8 +416,8 @@ def payment_received(sender, **kwargs):
                 obj.paid = False
                 obj.save()
 
-                ActivityLog.objects.create(
-                    log='{} id {} for user {} has been refunded from paypal; '
+                log_activity(
+                    '{} id {} for user {} has been refunded from paypal; '
                         'paypal transaction id {}, invoice id {}.{}'.format(
                             obj_type.title(), obj.id, obj.user.username,
                             ipn_obj.txn_id, paypal_trans.invoice_id,
@@ -413,8 +431,8 @@ def payment_received(sender, **kwargs):
 
         elif ipn_obj.payment_status == ST_PP_PENDING:
             if obj_type == 'paypal_test':
-                ActivityLog.objects.create(
-                    log='Test payment (invoice {} for paypal email {} has '
+                log_activity(
+                    'Test payment (invoice {} for paypal email {} has '
                         '"pending" status; email address may not be '
                         'verified. PayPal transaction id {}'.format(
                             additional_data['test_invoice'],
@@ -424,8 +442,8 @@ def payment_received(sender, **kwargs):
                 )
                 send_processed_test_pending_emails(additional_data)
             else:
-                ActivityLog.objects.create(
-                    log='PayPal payment returned with status PENDING for {} {}; '
+                log_activity(
+                    'PayPal payment returned with status PENDING for {} {}; '
                         'ipn obj id {} (txn id {})'.format(
                          obj_type, obj.id, ipn_obj.id, ipn_obj.txn_id
                         )
@@ -445,8 +463,8 @@ def payment_received(sender, **kwargs):
             # encrypted), mc_gross, mc_currency, item_name and item_number are all
             # correct
             if obj_type == 'paypal_test':
-                ActivityLog.objects.create(
-                    log='Test payment (invoice {} for paypal email {} has '
+                log_activity(
+                    'Test payment (invoice {} for paypal email {} has '
                         'been paid and completed by PayPal; PayPal '
                         'transaction id {}'.format(
                             additional_data['test_invoice'],
@@ -478,8 +496,8 @@ def payment_received(sender, **kwargs):
                 paypal_trans.transaction_id = ipn_obj.txn_id
                 paypal_trans.save()
 
-                ActivityLog.objects.create(
-                    log='{} id {} for user {} paid by PayPal; paypal '
+                log_activity(
+                    '{} id {} for user {} paid by PayPal; paypal '
                         '{} id {}'.format(
                         obj_type.title(), obj.id, obj.user.username, obj_type,
                         paypal_trans.id,
@@ -506,8 +524,8 @@ def payment_received(sender, **kwargs):
                     paypal_trans.voucher_code = voucher_code
                     paypal_trans.save()
 
-                    ActivityLog.objects.create(
-                        log='Voucher code {} used for {} id {} by user {}'.format(
+                    log_activity(
+                        'Voucher code {} used for {} id {} by user {}'.format(
                             voucher_code, obj_type, obj.id, obj.user.username
                         )
                     )
@@ -535,8 +553,8 @@ def payment_received(sender, **kwargs):
 
         else:  # any other status
             if obj_type == 'paypal_test':
-                ActivityLog.objects.create(
-                    log='Test payment (invoice {} for paypal email {} '
+                log_activity(
+                    'Test payment (invoice {} for paypal email {} '
                         'processed with unexpected payment status {}; PayPal '
                         'transaction id {}'.format(
                             additional_data['test_invoice'],
@@ -550,8 +568,8 @@ def payment_received(sender, **kwargs):
                 )
 
             else:
-                ActivityLog.objects.create(
-                    log='Unexpected payment status {} for {} {}; '
+                log_activity(
+                    'Unexpected payment status {} for {} {}; '
                         'ipn obj id {} (txn id {})'.format(
                          obj_type, obj.id,
                          ipn_obj.payment_status.upper(), ipn_obj.id, ipn_obj.txn_id
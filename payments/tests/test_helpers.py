@@ -1,6 +1,8 @@
 from datetime import datetime
+from mock import patch
 from model_mommy import mommy
 
+from django.db.models.query import QuerySet
 from django.test import TestCase, Client
 from django.utils import timezone
 
@@ -170,15 +172,13 @@ class TestHelpers(TestCase):
 
         booking1_txn = helpers.create_booking_paypal_transaction(user, booking1)
         self.assertEqual(booking1_txn.booking, booking1)
-        self.assertNotEqual(
+        # to avoid duplication, the booking id is added before the counter
+        self.assertEqual(
             booking1_txn.invoice_id,
-            'testuser-te-{}-inv#001'.format(
-                booking1.event.date.strftime("%d%m%y%H%M")
+            'testuser-te-{}-inv#{}-001'.format(
+                booking1.event.date.strftime("%d%m%y%H%M"), booking1.id
             )
         )
-        # to avoid duplication, the counter is set to 6 digits, the first 3
-        # random between 100 and 999
-        self.assertEqual(len(booking1_txn.invoice_id.split('#')[-1]), 6)
 
     def test_create_existing_block_transaction_with_txn_id(self):
         user = mommy.make_recipe('booking.user', username="testuser")
@@ -235,9 +235,13 @@ class TestHelpers(TestCase):
         second_block_txn = helpers.create_block_paypal_transaction(user, block1)
         self.assertEqual(PaypalBlockTransaction.objects.count(), 2)
         self.assertNotEqual(block_txn, second_block_txn)
-        # to avoid duplication, the counter is set to 6 digits, the first 3
-        # random between 100 and 999
-        self.assertEqual(len(second_block_txn.invoice_id.split('#')[-1]), 6)
+        # to avoid duplication, the block id is added before the counter
+        self.assertEqual(
+            second_block_txn.invoice_id,
+            'testuser-PLC-10-{}-inv#{}-001'.format(
+                block1.start_date.strftime("%d%m%y%H%M"), block1.id
+            )
+        )
 
     def test_create_ticket_booking_with_duplicate_invoice_number(self):
         user = mommy.make_recipe('booking.user', username="testuser")
@@ -269,10 +273,12 @@ class TestHelpers(TestCase):
                 tbooking.booking_reference
             )
         )
-        # to avoid duplication, the counter is set to 6 digits, the first 3
-        # random between 100 and 999
-        self.assertEqual(len(tbooking_txn.invoice_id), 6)
-        self.assertEqual(len(tbooking1_txn.invoice_id), 9)
+        # to avoid duplication, the ticket booking id is added before the
+        # counter
+        self.assertEqual(tbooking_txn.invoice_id, 'ref001')
+        self.assertEqual(
+            tbooking1_txn.invoice_id, 'ref{}-001'.format(tbooking1.id)
+        )
 
     def test_create_existing_ticket_booking_transation_with_txn_id(self):
         user = mommy.make_recipe('booking.user', username="testuser")
@@ -297,3 +303,68 @@ class TestHelpers(TestCase):
         self.assertEqual(
             second_tbooking_txn.invoice_id, '{}002'.format(tbooking.booking_reference)
         )
+
+    def test_counter_continues_after_username_change(self):
+        """
+        A transaction created under an old username is not reused, but the
+        new one continues the counter for the booking
+        """
+        user = mommy.make_recipe('booking.user', username="oldname")
+        booking = mommy.make_recipe(
+            'booking.booking', user=user, event__name='test event'
+        )
+        booking_txn = helpers.create_booking_paypal_transaction(user, booking)
+        self.assertEqual(booking_txn.counter, 1)
+
+        user.username = 'newname'
+        user.save()
+        new_booking_txn = helpers.create_booking_paypal_transaction(
+            user, booking
+        )
+        self.assertNotEqual(booking_txn, new_booking_txn)
+        self.assertEqual(new_booking_txn.counter, 2)
+        self.assertEqual(
+            new_booking_txn.invoice_id,
+            'newname-te-{}-inv#002'.format(
+                booking.event.date.strftime("%d%m%y%H%M")
+            )
+        )
+
+    def test_concurrent_transaction_creation_reuses_new_transaction(self):
+        """
+        If another request creates a transaction for the same booking between
+        checking for an existing one and inserting, the insert fails on the
+        unique (booking, counter) constraint and the other request's
+        transaction is returned
+        """
+        user = mommy.make_recipe('booking.user', username="testuser")
+        booking = mommy.make_recipe(
+            'booking.booking', user=user, event__name='test event'
+        )
+        invoice_id = 'testuser-te-{}-inv#001'.format(
+            booking.event.date.strftime("%d%m%y%H%M")
+        )
+        aggregate = QuerySet.aggregate
+        calls = []
+
+        def concurrent_aggregate(queryset, *args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                # the other request inserts its transaction after this one
+                # has read the last counter
+                result = aggregate(queryset, *args, **kwargs)
+                PaypalBookingTransaction.objects.create(
+                    booking=booking, counter=1, invoice_id=invoice_id
+                )
+                return result
+            return aggregate(queryset, *args, **kwargs)
+
+        with patch.object(
+                QuerySet, 'aggregate', autospec=True,
+                side_effect=concurrent_aggregate
+        ):
+            booking_txn = helpers.create_booking_paypal_transaction(
+                user, booking
+            )
+        self.assertEqual(PaypalBookingTransaction.objects.count(), 1)
+        self.assertEqual(booking_txn.invoice_id, invoice_id)
@@ -0,0 +1,31 @@
+"""
+Version counters for invalidating groups of cached values.  Cached values
+include the current version in their keys; bumping the version makes all of
+them stale at once, and they expire from the cache in their own time.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def _new_version():
+    # start from the current time rather than 1, so a version that has been
+    # evicted from the cache never matches older cached values
+    return int(time.time() * 1000)
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # no version cached yet
+            cache.set(key, _new_version(), None)
@@ -19,7 +19,8 @@ env = environ.Env(DEBUG=(bool, False),
                   USE_MAILCATCHER=(bool, False),
                   TRAVIS=(bool, False),
                   HEROKU=(bool, False),
-                  SEND_ALL_STUDIO_EMAILS=(bool, False)
+                  SEND_ALL_STUDIO_EMAILS=(bool, False),
+                  USE_EMAIL_OUTBOX=(bool, False)
                   )
 
 environ.Env.read_env(root('pipsevents/.env'))  # reading .env file
@@ -86,6 +87,7 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'responsive.middleware.DeviceInfoMiddleware',
+    'activitylog.middleware.ActivityLogMiddleware',
 )
 
 
@@ -194,6 +196,9 @@ DEFAULT_FROM_EMAIL = 'watermelon.bookings@gmail.com'
 DEFAULT_STUDIO_EMAIL = 'thewatermelonstudio@hotmail.com'
 SUPPORT_EMAIL = 'rebkwok@gmail.com'
 SEND_ALL_STUDIO_EMAILS = env('SEND_ALL_STUDIO_EMAILS')
+# queue emails sent from views and paypal signals in the database; the
+# run_outbox command must then be run (e.g. every minute) to send them
+USE_EMAIL_OUTBOX = env('USE_EMAIL_OUTBOX')
 
 # #####LOGGING######
 if not env('HEROKU') and not env('TRAVIS'):  # pragma: no cover
@@ -0,0 +1,46 @@
+/*
+  This file must be imported immediately-before the close-</body> tag,
+  and after JQuery and Underscore.js are imported.
+*/
+/**
+  The number of milliseconds to ignore clicks on the *same* button,
+  after a button *that was not ignored* was clicked. Used by
+  `$(document).ready()`.
+  Equal to <code>500</code>.
+ */
+var MILLS_TO_IGNORE = 500;
+
+/**
+   Fetches the paypal form for a booking. Triggered by clicks on the pay now
+   buttons; the paypal transaction is only created at this point, so the
+   form is requested with a POST.
+ */
+var processPayNow = function()  {
+   var $button_just_clicked_on = $(this);
+   //The value of the "data-booking_id" attribute.
+   var booking_id = $button_just_clicked_on.data('booking_id');
+   //The value of the "data-paypal_form_url" attribute.
+   var paypal_form_url = $button_just_clicked_on.data('paypal_form_url');
+
+   var processResult = function(
+       result, status, jqXHR)  {
+      $('#paypal_form_' + booking_id).html(result);
+   }
+
+   $.ajax(
+       {
+          url: paypal_form_url,
+          type: 'POST',
+          data: {
+             csrfmiddlewaretoken: $button_just_clicked_on.data('csrf_token')
+          },
+          dataType: 'html',
+          success: processResult
+       }
+    );
+};
+
+$(document).ready(function()  {
+  $('.pay_now_button').click(_.debounce(processPayNow,
+      MILLS_TO_IGNORE, true));
+});
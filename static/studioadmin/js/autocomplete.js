@@ -0,0 +1,59 @@
+/*
+  Search-as-you-type for select elements rendered by
+  studioadmin.widgets.AutocompleteSelect.  A search box is added before each
+  select with a data-autocomplete-url attribute, and the select's options are
+  replaced with the JSON results for the search text.
+
+  This file must be imported after JQuery.
+*/
+
+/**
+  Milliseconds to wait after the last keypress before searching.
+ */
+var AUTOCOMPLETE_DELAY = 250;
+
+/**
+  Minimum number of characters to search for.
+ */
+var AUTOCOMPLETE_MIN_LENGTH = 2;
+
+var setupAutocomplete = function() {
+   var $select = $(this);
+   var url = $select.data('autocomplete-url');
+   var timer = null;
+
+   var $search = $('<input type="text" class="form-control input-xs studioadmin-list" placeholder="Search name">');
+   $search.css('max-width', $select.css('max-width'));
+   $select.before($search);
+
+   var processResult = function(result) {
+      var $empty = $select.find('option[value=""]').first().clone();
+      $select.empty().append($empty);
+      $.each(result.results, function(i, item) {
+         $select.append($('<option>').val(item.id).text(item.text));
+      });
+      if (result.results.length === 1) {
+         $select.val(result.results[0].id);
+      }
+   };
+
+   $search.on('input', function() {
+      var text = $.trim($search.val());
+      clearTimeout(timer);
+      if (text.length < AUTOCOMPLETE_MIN_LENGTH) {
+         return;
+      }
+      timer = setTimeout(function() {
+         $.ajax({
+            url: url,
+            data: {q: text},
+            dataType: 'json',
+            success: processResult
+         });
+      }, AUTOCOMPLETE_DELAY);
+   });
+};
+
+$(document).ready(function() {
+   $('select[data-autocomplete-url]').each(setupAutocomplete);
+});
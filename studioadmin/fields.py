@@ -23,6 +23,12 @@ class UserChoiceField(forms.ChoiceField):
         return super(UserChoiceField, self).has_changed(initial, data)
 
 
+class UserModelChoiceField(forms.ModelChoiceField):
+
+    def label_from_instance(self, obj):
+        return '{} {}'.format(obj.first_name, obj.last_name)
+
+
 class BlockChoiceField(forms.ChoiceField):
 
     def to_python(self, value):
@@ -42,13 +48,34 @@ class BlockChoiceField(forms.ChoiceField):
 
 class UserBlockModelChoiceField(forms.ModelChoiceField):
 
+    def __init__(self, *args, **kwargs):
+        # blocks that are already loaded (with usage) can be passed instead
+        # of a queryset; the choices are built from them so rendering the
+        # field doesn't query again
+        blocks = kwargs.pop('blocks', None)
+        if blocks is not None:
+            kwargs['queryset'] = Block.objects.filter(
+                id__in=[block.id for block in blocks]
+            )
+        super(UserBlockModelChoiceField, self).__init__(*args, **kwargs)
+        if blocks is not None:
+            choices = [
+                (block.id, self.label_from_instance(block)) for block in blocks
+            ]
+            if self.empty_label is not None:
+                choices.insert(0, ('', self.empty_label))
+            self.choices = choices
+
     def label_from_instance(self, obj):
         return "{}{}; exp {}; {} left".format(
             obj.block_type.event_type.subtype,
             " ({})".format(obj.block_type.identifier)
             if obj.block_type.identifier else '',
             obj.expiry_date.strftime('%d/%m'),
-            obj.block_type.size - obj.bookings_made()
+            obj.block_type.size - (
+                obj.bookings_used if hasattr(obj, 'bookings_used')
+                else obj.bookings_made()
+            )
         )
 
     def to_python(self, value):
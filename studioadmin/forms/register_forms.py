@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
+from collections import defaultdict
 from datetime import datetime, date
 
 from django import forms
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.urlresolvers import reverse
 from django.forms.models import inlineformset_factory, BaseInlineFormSet
 from django.utils.translation import ugettext_lazy as _
 
@@ -12,7 +14,8 @@ from booking.models import Block, Booking, Event
 from payments.models import PaypalBookingTransaction
 
 from studioadmin.fields import BlockChoiceField, UserBlockModelChoiceField, \
-    UserChoiceField
+    UserChoiceField, UserModelChoiceField
+from studioadmin.widgets import AutocompleteSelect
 
 
 class BookingRegisterInlineFormSet(BaseInlineFormSet):
@@ -20,27 +23,39 @@ class BookingRegisterInlineFormSet(BaseInlineFormSet):
     def __init__(self, *args, **kwargs):
         super(BookingRegisterInlineFormSet, self).__init__(*args, **kwargs)
 
-        self.user_choices = [
-            (user.id, '{} {}'.format(user.first_name, user.last_name))
-            for user in User.objects.all().order_by('first_name')
-            ]
-        self.user_choices.insert(0, ('', '--------'))
+        # new bookings can be made for any user not already booked; users are
+        # searched for by name with the autocomplete endpoint rather than
+        # listing every user in each form
+        booked_user_ids = Booking.objects.filter(
+            status='OPEN', event=self.instance
+        ).values('user_id')
+        self.new_user_queryset = User.objects.exclude(
+            id__in=booked_user_ids
+        ).order_by('first_name', 'last_name')
+        self.user_search_url = '{}?event={}'.format(
+            reverse('studioadmin:autocomplete_users'), self.instance.id
+        )
 
-        booked_user_ids = Booking.objects.select_related(
-                'event', 'event__event_type', 'user'
-            ).filter(status='OPEN', event=self.instance).values_list(
-                'user__id', flat=True
+        # fetch the blocks used by the bookings, and the active blocks for all
+        # users with bookings on the event, at once rather than per form
+        self.active_blocks = defaultdict(list)
+        if self.instance.id:
+            blocks = Block.objects.select_related(
+                'block_type__event_type'
+            ).with_usage()
+            for block in blocks.active().filter(
+                user__bookings__event=self.instance,
+                block_type__event_type_id=self.instance.event_type_id
+            ).order_by('id'):
+                self.active_blocks[block.user_id].append(block)
+
+            bookings = self.get_queryset()
+            booked_blocks = blocks.in_bulk(
+                {booking.block_id for booking in bookings if booking.block_id}
             )
-        self.new_user_choices = []
-        for user in self.user_choices:
-            if user[0] in booked_user_ids:
-                continue
-            self.new_user_choices.append(user)
-
-        self.block_choices = [
-            (block.id, block.id) for block in Block.objects.all()
-        ]
-        self.block_choices.insert(0, ('', '--------'))
+            for booking in bookings:
+                if booking.block_id:
+                    booking.block = booked_blocks[booking.block_id]
 
         if self.instance.max_participants:
             self.extra = self.instance.spaces_left
@@ -60,29 +75,23 @@ class BookingRegisterInlineFormSet(BaseInlineFormSet):
 
         if form.instance.id:
             user = form.instance.user
-            event_type = form.instance.event.event_type
 
             if form.instance.block:
                 form.available_block = form.instance.block
                 form.fields['block'] = BlockChoiceField(
-                    choices=self.block_choices,
+                    choices=[
+                        ('', '--------'),
+                        (form.instance.block.id, form.instance.block.id)
+                    ],
                     initial=form.instance.block.id,
                     widget=forms.Select(attrs={'class': 'hide'}),
                 )
             else:
-                available_block = [
-                    block for block in Block.objects.select_related(
-                        'block_type', 'block_type__event_type', 'user'
-                    ).filter(user=user) if
-                    block.active_block()
-                    and block.block_type.event_type == event_type
-                ]
+                available_block = self.active_blocks.get(user.id)
                 if available_block:
                     form.available_block = available_block[0]
-                    available_block_ids = [block.id for block in available_block]
-
                     form.fields['block'] = UserBlockModelChoiceField(
-                    queryset=Block.objects.filter(id__in=available_block_ids),
+                    blocks=available_block,
                     widget=forms.Select(
                         attrs={'class': 'form-control input-xs studioadmin-list'}),
                     required=False,
@@ -91,30 +100,33 @@ class BookingRegisterInlineFormSet(BaseInlineFormSet):
                 else:
                     form.available_block = None
                     form.fields['block'] = BlockChoiceField(
-                        choices=self.block_choices,
+                        choices=[('', '--------')],
                         widget=forms.Select(attrs={'class': 'hide'}),
                         required=False
                     )
 
             form.fields['user'] = UserChoiceField(
-                choices=self.user_choices,
+                choices=[
+                    (user.id, '{} {}'.format(user.first_name, user.last_name))
+                ],
                 initial=user,
                 widget=forms.Select(attrs={'class': 'hide'}),
             )
 
         else:
-            form.fields['user'] = UserChoiceField(
-                choices=self.new_user_choices,
-                widget=forms.Select(
+            form.fields['user'] = UserModelChoiceField(
+                queryset=self.new_user_queryset,
+                widget=AutocompleteSelect(
+                    self.user_search_url,
                     attrs={
                         'class': 'form-control input-xs studioadmin-list',
                         'style': 'max-width: 150px'
                     }
                 ),
-                initial=''
+                empty_label='--------'
             )
             form.fields['block'] = BlockChoiceField(
-                choices=self.block_choices,
+                choices=[('', '--------')],
                 widget=forms.Select(attrs={'class': 'hide'}),
                 required=False
             )
@@ -12,7 +12,6 @@ from django.utils.translation import ugettext_lazy as _
 from ckeditor.widgets import CKEditorWidget
 
 from booking.models import TicketedEvent, TicketBooking
-from payments.models import PaypalTicketBookingTransaction
 
 
 class TicketedEventBaseFormSet(BaseModelFormSet):
@@ -48,10 +47,16 @@ class TicketedEventBaseFormSet(BaseModelFormSet):
             )
             form.advance_payment_required_id = 'advance_payment_required_{}'.format(index)
 
-            confirmed_ticket_bookings = form.instance.ticket_bookings.filter(
-                purchase_confirmed=True
-            )
-            if confirmed_ticket_bookings:
+            if hasattr(form.instance, 'has_confirmed_ticket_bookings'):
+                # annotated by TicketedEventQuerySet.with_ticket_counts()
+                has_confirmed_ticket_bookings = \
+                    form.instance.has_confirmed_ticket_bookings
+            else:
+                has_confirmed_ticket_bookings = \
+                    form.instance.ticket_bookings.filter(
+                        purchase_confirmed=True
+                    ).exists()
+            if has_confirmed_ticket_bookings:
                 form.cannot_delete = True
 
             form.fields['DELETE'] = forms.BooleanField(
@@ -427,9 +432,9 @@ class TicketBookingInlineBaseFormSet(BaseInlineFormSet):
     def add_fields(self, form, index):
         super(TicketBookingInlineBaseFormSet, self).add_fields(form, index)
 
-        pptbs = PaypalTicketBookingTransaction.objects.filter(
-            ticket_booking__id=form.instance.id
-        )
+        # uses prefetched transactions if present
+        pptbs = form.instance.paypalticketbookingtransaction_set.all() \
+            if form.instance.id else []
         pptbs_paypal =[True for pptb in pptbs if pptb.transaction_id]
         form.paypal = True if pptbs_paypal else False
 
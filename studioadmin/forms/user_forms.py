@@ -15,74 +15,99 @@ class UserBookingInlineFormSet(BaseInlineFormSet):
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
         super(UserBookingInlineFormSet, self).__init__(*args, **kwargs)
+        self._load_related()
         for form in self.forms:
             form.empty_permitted = True
 
+    def _load_related(self):
+        # load the paypal transactions and blocks for all of the bookings
+        # once, rather than for each form
+        bookings = self.get_queryset()
+        self.paypal_booking_ids = set(
+            PaypalBookingTransaction.objects.filter(
+                booking__in=bookings, transaction_id__isnull=False
+            ).values_list('booking_id', flat=True)
+        )
+        blocks = Block.objects.with_usage().select_related(
+            'user', 'block_type__event_type'
+        )
+        self.active_blocks = list(
+            blocks.active().filter(user=self.user).order_by('id')
+        )
+        self.blocks_by_id = {block.id: block for block in self.active_blocks}
+        booking_block_ids = {
+            booking.block_id for booking in bookings
+            if booking.block_id and booking.block_id not in self.blocks_by_id
+        }
+        if booking_block_ids:
+            self.blocks_by_id.update(blocks.in_bulk(booking_block_ids))
+        for booking in bookings:
+            if booking.block_id:
+                booking.block = self.blocks_by_id[booking.block_id]
+
+    def _block_field(self, blocks, **kwargs):
+        return UserBlockModelChoiceField(
+            blocks=blocks, required=False, **kwargs
+        )
+
     def add_fields(self, form, index):
         super(UserBookingInlineFormSet, self).add_fields(form, index)
 
         if form.instance.id:
-            ppbs = PaypalBookingTransaction.objects.filter(
-                booking_id=form.instance.id
-            )
-            ppbs_paypal =[True for ppb in ppbs if ppb.transaction_id]
-            form.paypal = True if ppbs_paypal else False
+            form.paypal = form.instance.id in self.paypal_booking_ids
 
             cancelled_class = 'expired' if \
                 form.instance.status == 'CANCELLED' else 'none'
 
-            if form.instance.block is None:
+            if form.instance.block_id is None:
                 if form.instance.status == 'OPEN':
                     active_user_blocks = [
-                        block.id for block in Block.objects.filter(
-                            user=form.instance.user,
-                            block_type__event_type=form.instance.event.event_type)
-                        if block.active_block()
+                        block for block in self.active_blocks
+                        if block.block_type.event_type_id ==
+                        form.instance.event.event_type_id
                     ]
-                    form.has_available_block = True if active_user_blocks else False
-                    form.fields['block'] = (UserBlockModelChoiceField(
-                        queryset=Block.objects.filter(id__in=active_user_blocks),
+                    form.has_available_block = bool(active_user_blocks)
+                    form.fields['block'] = self._block_field(
+                        active_user_blocks,
                         widget=forms.Select(attrs={'class': '{} form-control input-sm'.format(cancelled_class)}),
-                        required=False,
                         empty_label="--------None--------"
-                    ))
+                    )
+                else:
+                    # cancelled bookings can't be assigned to a block; the
+                    # (hidden) field would otherwise list every block
+                    form.fields['block'] = self._block_field([])
             else:
-                form.fields['block'] = (UserBlockModelChoiceField(
-                    queryset=Block.objects.filter(id=form.instance.block.id),
+                form.fields['block'] = self._block_field(
+                    [self.blocks_by_id[form.instance.block_id]],
                     widget=forms.Select(attrs={'class': '{} form-control input-sm'.format(cancelled_class)}),
-                    required=False,
                     empty_label="---REMOVE BLOCK (TO CHANGE BLOCK, REMOVE AND SAVE FIRST)---",
-                    initial=form.instance.block.id
-                ))
+                    initial=form.instance.block_id
+                )
 
         else:
-            active_blocks = [
-                block.id for block in Block.objects.filter(user=self.user)
-                    if block.active_block()
-            ]
-            form.fields['block'] = (UserBlockModelChoiceField(
-                queryset=Block.objects.filter(id__in=active_blocks),
+            form.fields['block'] = self._block_field(
+                self.active_blocks,
                 widget=forms.Select(attrs={'class': 'form-control input-sm'}),
-                required=False,
                 empty_label="---Choose from user's active blocks---"
-            ))
+            )
 
         if form.instance.id is None:
-            already_booked = [
-                booking.event.id for booking
-                in Booking.objects.filter(user=self.user)
-            ]
+            already_booked = Booking.objects.filter(user=self.user)\
+                .values_list('event_id', flat=True)
 
             form.fields['event'] = forms.ModelChoiceField(
                 queryset=Event.objects.filter(
                     date__gte=timezone.now()
                 ).filter(booking_open=True, cancelled=False).exclude(
-                    id__in=already_booked).order_by('date'),
+                    id__in=list(already_booked)).order_by('date'),
                 widget=forms.Select(attrs={'class': 'form-control input-sm'}),
             )
         else:
+            # the event can't be changed on existing bookings, so it's posted
+            # as a hidden input rather than a (hidden) select of every event
             form.fields['event'] = (forms.ModelChoiceField(
                 queryset=Event.objects.all(),
+                widget=forms.HiddenInput()
             ))
 
         form.fields['paid'] = forms.BooleanField(
@@ -159,7 +184,7 @@ class UserBookingInlineFormSet(BaseInlineFormSet):
                     })
 
 
-            if form.instance.status == 'CANCELLED' or form.instance.block:
+            if form.instance.status == 'CANCELLED' or form.instance.block_id:
                 # also disable payment and free class fields for cancelled and
                 # block bookings
 
@@ -308,14 +333,12 @@ class UserBlockInlineFormSet(BaseInlineFormSet):
     def add_fields(self, form, index):
         super(UserBlockInlineFormSet, self).add_fields(form, index)
 
-        user_blocks = Block.objects.filter(user=self.user)
         # get the event types for the user's blocks that are currently active
         # or awaiting payment
-        user_block_event_types = [
-            block.block_type.event_type for block in user_blocks
-            if block.active_block() or
-            (not block.expired and not block.paid and not block.full)
-        ]
+        user_block_event_types = list(
+            Block.objects.filter(user=self.user).unexpired().not_full()
+            .values_list('block_type__event_type', flat=True)
+        )
         free_class_block = BlockType.objects.filter(identifier='free class')
         available_block_types = BlockType.objects.filter(active=True).exclude(
             event_type__in=user_block_event_types
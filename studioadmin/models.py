@@ -1,18 +1,33 @@
 from django.contrib.auth.models import Group, User
+from accounts import auth_cache
 from accounts.models import PrintDisclaimer
 
 
+# The user_* attributes below are annotated on users by
+# booking.context_helpers.annotate_user_flags, for lists of users.
+
 def is_regular_student(self):
-    return self.has_perm('booking.is_regular_student')
+    if hasattr(self, 'user_is_regular_student'):
+        return self.is_active and (
+            self.is_superuser or bool(self.user_is_regular_student)
+        )
+    return auth_cache.has_perm(self, 'booking.is_regular_student')
 
 
 def has_print_disclaimer(self):
+    if hasattr(self, 'user_has_print_disclaimer'):
+        return bool(self.user_has_print_disclaimer)
     return PrintDisclaimer.objects.filter(user=self).exists()
 
 
 def subscribed(self):
-    group, _ = Group.objects.get_or_create(name='subscribed')
-    return group in self.groups.all()
+    if hasattr(self, 'user_is_subscribed'):
+        return bool(self.user_is_subscribed)
+
+    def check():
+        group, _ = Group.objects.get_or_create(name='subscribed')
+        return group in self.groups.all()
+    return auth_cache.cached_user_check(self, 'in_group_subscribed', check)
 
 
 User.add_to_class("is_regular_student", is_regular_student)
@@ -133,6 +133,59 @@ class SimpleBookingRegisterFormSetTests(TestCase):
         block_field = form.fields['block']
         self.assertEquals(set(block_field.queryset), {self.active_block})
 
+    def test_block_choices_for_booking_with_block(self):
+        """
+        A booking that already has a block only gets that block as a choice
+        """
+        self.booking.block = self.active_block
+        self.booking.save()
+        mommy.make_recipe('booking.block', paid=True, _quantity=3)
+        formset = SimpleBookingRegisterFormSet(data=self.formset_data(),
+                                               instance=self.event)
+        block_field = formset.forms[0].fields['block']
+        self.assertEqual(
+            block_field.choices,
+            [('', '--------'), (self.active_block.id, self.active_block.id)]
+        )
+
+    def test_new_booking_user_field(self):
+        """
+        New bookings can be made for any user not already booked on the event,
+        but only the selected user is rendered in the dropdown
+        """
+        users = mommy.make_recipe('booking.user', _quantity=5)
+        formset = SimpleBookingRegisterFormSet(
+            data=self.formset_data({
+                'bookings-TOTAL_FORMS': 2,
+                'bookings-1-user': users[0].id
+            }),
+            instance=self.event
+        )
+        self.assertTrue(formset.is_valid(), formset.errors)
+        user_field = formset.forms[1].fields['user']
+        self.assertEqual(
+            set(user_field.queryset), set(users)
+        )
+
+        rendered = str(formset.forms[1]['user'])
+        self.assertIn('data-autocomplete-url="/studioadmin/autocomplete/users/?event={}"'.format(
+            self.event.id
+        ), rendered)
+        self.assertIn('value="{}"'.format(users[0].id), rendered)
+        for user in users[1:]:
+            self.assertNotIn('value="{}"'.format(user.id), rendered)
+
+    def test_cannot_add_booking_for_booked_user(self):
+        formset = SimpleBookingRegisterFormSet(
+            data=self.formset_data({
+                'bookings-TOTAL_FORMS': 2,
+                'bookings-1-user': self.user.id
+            }),
+            instance=self.event
+        )
+        self.assertFalse(formset.is_valid())
+        self.assertIn('user', formset.forms[1].errors)
+
     def test_adding_more_bookings_than_max_participants(self):
         self.event.max_participants = 2
         self.event.save()
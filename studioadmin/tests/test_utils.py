@@ -1,8 +1,12 @@
+from datetime import timedelta
 from model_mommy import mommy
 
 from django.test import TestCase
+from django.utils import timezone
 
+from booking.models import Event
 from studioadmin.utils import dechaffify, chaffify, int_str, str_int
+from studioadmin.views.helpers import KeysetPaginator
 
 
 class ObscureUserIdTests(TestCase):
@@ -36,3 +40,74 @@ class ObscureUserIdTests(TestCase):
         # with non-matching chaff
         with self.assertRaises(ValueError):
             dechaffify(str_int(encoded_id), 1234)
+
+
+class KeysetPaginatorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # 3 events on each of 4 dates
+        dates = [
+            timezone.now() - timedelta(days=i) for i in range(4)
+        ]
+        for date in dates:
+            mommy.make_recipe('booking.past_class', date=date, _quantity=3)
+        cls.expected = list(Event.objects.order_by('-date', 'id'))
+
+    def _get_all_pages(self, paginator):
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(after=pages[-1].next_cursor))
+        return pages
+
+    def test_pages_forwards(self):
+        paginator = KeysetPaginator(
+            Event.objects.all(), 5, ordering=('-date', 'id')
+        )
+        pages = self._get_all_pages(paginator)
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(
+            [event for page in pages for event in page], self.expected
+        )
+        self.assertFalse(pages[0].has_previous())
+        self.assertTrue(pages[1].has_previous())
+        self.assertEqual(len(pages[2]), 2)
+
+    def test_pages_backwards(self):
+        paginator = KeysetPaginator(
+            Event.objects.all(), 5, ordering=('-date', 'id')
+        )
+        last_page = self._get_all_pages(paginator)[-1]
+        page = paginator.page(before=last_page.previous_cursor)
+        self.assertEqual(list(page), self.expected[5:10])
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.has_previous())
+
+        page = paginator.page(before=page.previous_cursor)
+        self.assertEqual(list(page), self.expected[:5])
+        self.assertFalse(page.has_previous())
+
+    def test_page_query_count(self):
+        paginator = KeysetPaginator(
+            Event.objects.all(), 5, ordering=('-date', 'id')
+        )
+        cursor = paginator.page().next_cursor
+        with self.assertNumQueries(1):
+            paginator.page(after=cursor)
+
+    def test_invalid_cursor_returns_first_page(self):
+        paginator = KeysetPaginator(
+            Event.objects.all(), 5, ordering=('-date', 'id')
+        )
+        for cursor in ['invalid', 'WyJmb28iXQ', 'WyJmb28iLCAxXQ']:
+            page = paginator.page(after=cursor)
+            self.assertEqual(list(page), self.expected[:5])
+            self.assertFalse(page.has_previous())
+
+    def test_count(self):
+        paginator = KeysetPaginator(
+            Event.objects.all(), 5, ordering=('-date', 'id'),
+            estimate_count=True
+        )
+        # estimated counts are only used on postgres
+        self.assertEqual(paginator.count, 12)
@@ -1,5 +1,6 @@
 from model_mommy import mommy
 
+from django.core.cache import cache
 from django.test import RequestFactory
 from django.test.client import Client
 from django.contrib.auth.models import Permission, Group, User
@@ -10,6 +11,8 @@ from booking.tests.helpers import set_up_fb
 class TestPermissionMixin(object):
 
     def setUp(self):
+        # cached staff and disclaimer checks are keyed by user id
+        cache.clear()
         set_up_fb()
         self.factory = RequestFactory()
         self.user =User.objects.create_user(
@@ -100,6 +100,29 @@ class ActivityLogListViewTests(TestPermissionMixin, TestCase):
         )
         self.assertEqual(len(resp.context_data['logs']), 8)
 
+    def test_pagination_with_identical_timestamps(self):
+        timestamp = timezone.now()
+        mommy.make(ActivityLog, timestamp=timestamp, _quantity=25)
+        expected = list(
+            ActivityLog.objects.filter(empty_cron=False)
+            .order_by('-timestamp', '-id')
+        )
+        self.assertEqual(len(expected), 33)
+
+        resp = self._get_response(self.staff_user)
+        self.assertEqual(list(resp.context_data['logs']), expected[:20])
+        self.assertEqual(resp.context_data['count_label'], 'about 33 logs')
+
+        page = resp.context_data['page_obj']
+        resp = self._get_response(self.staff_user, {'after': page.next_cursor})
+        self.assertEqual(list(resp.context_data['logs']), expected[20:])
+
+        page = resp.context_data['page_obj']
+        resp = self._get_response(
+            self.staff_user, {'before': page.previous_cursor}
+        )
+        self.assertEqual(list(resp.context_data['logs']), expected[:20])
+
     def test_search_text(self):
         resp = self._get_response(self.staff_user, {
             'search_submitted': 'Search',
@@ -0,0 +1,98 @@
+import json
+
+from model_mommy import mommy
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from booking.tests.helpers import _create_session
+from studioadmin.views import autocomplete_users
+
+from studioadmin.tests.test_views.helpers import TestPermissionMixin
+
+
+class AutocompleteUsersViewTests(TestPermissionMixin, TestCase):
+
+    def setUp(self):
+        super(AutocompleteUsersViewTests, self).setUp()
+        self.alice = mommy.make_recipe(
+            'booking.user', first_name='Alice', last_name='Smith',
+            username='asmith'
+        )
+        self.alison = mommy.make_recipe(
+            'booking.user', first_name='Alison', last_name='Jones',
+            username='ajones'
+        )
+        self.bob = mommy.make_recipe(
+            'booking.user', first_name='Bob', last_name='Alington',
+            username='bobby'
+        )
+
+    def _get_response(self, user, params):
+        url = reverse('studioadmin:autocomplete_users')
+        request = self.factory.get(url, params)
+        request.session = _create_session()
+        request.user = user
+        return autocomplete_users(request)
+
+    def _get_results(self, params):
+        resp = self._get_response(self.staff_user, params)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(resp.content.decode('utf-8'))['results']
+
+    def test_cannot_access_if_not_logged_in(self):
+        url = reverse('studioadmin:autocomplete_users')
+        resp = self.client.get(url, {'q': 'ali'})
+        redirected_url = reverse('account_login') + "?next={}".format(url)
+        self.assertEqual(resp.status_code, 302)
+        self.assertIn(redirected_url, resp.url)
+
+    def test_cannot_access_if_not_staff(self):
+        resp = self._get_response(self.user, {'q': 'ali'})
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp.url, reverse('booking:permission_denied'))
+
+    def test_can_access_as_instructor(self):
+        resp = self._get_response(self.instructor_user, {'q': 'ali'})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_search_by_name_prefix(self):
+        results = self._get_results({'q': 'ali'})
+        # first name or last name starts with 'ali'
+        self.assertEqual(
+            results,
+            [
+                {'id': self.alice.id, 'text': 'Alice Smith'},
+                {'id': self.alison.id, 'text': 'Alison Jones'},
+                {'id': self.bob.id, 'text': 'Bob Alington'},
+            ]
+        )
+
+    def test_search_by_username_prefix(self):
+        results = self._get_results({'q': 'AJ'})
+        self.assertEqual([res['id'] for res in results], [self.alison.id])
+
+    def test_search_matches_all_words(self):
+        results = self._get_results({'q': 'ali smi'})
+        self.assertEqual([res['id'] for res in results], [self.alice.id])
+
+    def test_no_search_text(self):
+        self.assertEqual(self._get_results({'q': '  '}), [])
+        self.assertEqual(self._get_results({}), [])
+
+    def test_excludes_users_booked_on_event(self):
+        event = mommy.make_recipe('booking.future_EV')
+        mommy.make_recipe('booking.booking', event=event, user=self.alice)
+        mommy.make_recipe(
+            'booking.booking', event=event, user=self.alison,
+            status='CANCELLED'
+        )
+        results = self._get_results({'q': 'ali', 'event': event.id})
+        # cancelled bookings can be reopened from the register
+        self.assertEqual(
+            [res['id'] for res in results], [self.alison.id, self.bob.id]
+        )
+
+    def test_number_of_results_limited(self):
+        mommy.make_recipe('booking.user', first_name='Alistair', _quantity=25)
+        self.assertEqual(len(self._get_results({'q': 'ali'})), 20)
@@ -196,8 +196,8 @@ class EventAdminListViewTests(TestPermissionMixin, TestCase):
         self.assertIn('Scheduled Events', resp.rendered_content)
         self.assertNotIn('Past Events', resp.rendered_content)
 
-    def test_past_with_invalid_page(self):
-        mommy.make_recipe('booking.past_class', _quantity=25)
+    def test_past_pagination(self):
+        past_classes = mommy.make_recipe('booking.past_class', _quantity=25)
         url = reverse('studioadmin:lessons')
         self.client.login(
             username=self.staff_user.username, password='test'
@@ -205,39 +205,55 @@ class EventAdminListViewTests(TestPermissionMixin, TestCase):
 
         self.assertEqual(Event.objects.count(), 26)
 
-        # get only shows future unless page is specified (only past events
-        # paginated)
+        # get only shows future unless a page cursor is specified (only past
+        # events paginated)
         resp = self.client.get(url)
         eventsformset = resp.context_data['eventformset']
         self.assertEqual(eventsformset.queryset.count(), 0)
 
-        resp = self.client.get(url + '?page=1')
-        eventsformset = resp.context_data['eventformset']
-        self.assertEqual(eventsformset.queryset.count(), 20)
-        paginator = resp.context_data['events']
-        self.assertEqual(paginator.number, 1)
-
-        # default shows page 1 of 2
+        # default shows first page of most recent events
         resp = self.client.post(url, {'past': 'Show past'})
         eventsformset = resp.context_data['eventformset']
         self.assertEqual(eventsformset.queryset.count(), 20)
-        paginator = resp.context_data['events']
-        self.assertEqual(paginator.number, 1)
+        page = resp.context_data['events']
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+        newest_first = sorted(
+            past_classes, key=lambda ev: (ev.date, ev.id), reverse=True
+        )
+        self.assertEqual(
+            [ev.id for ev in eventsformset.queryset],
+            [ev.id for ev in newest_first[:20]]
+        )
 
-        # page not a number shows page 1
-        resp = self.client.post(url + '?page=one', {'past': 'Show past'})
+        # next page
+        resp = self.client.get(url, {'after': page.next_cursor})
         eventsformset = resp.context_data['eventformset']
-        self.assertEqual(eventsformset.queryset.count(), 20)
-        paginator = resp.context_data['events']
-        self.assertEqual(paginator.number, 1)
+        self.assertEqual(
+            [ev.id for ev in eventsformset.queryset],
+            [ev.id for ev in newest_first[20:]]
+        )
+        page = resp.context_data['events']
+        self.assertTrue(page.has_previous())
+        self.assertFalse(page.has_next())
+        self.assertIn('before=', resp.rendered_content)
 
-        # page out of range shows last page
-        resp = self.client.post(url + '?page=3', {'past': 'Show past'})
+        # and back again
+        resp = self.client.get(url, {'before': page.previous_cursor})
+        eventsformset = resp.context_data['eventformset']
+        self.assertEqual(
+            [ev.id for ev in eventsformset.queryset],
+            [ev.id for ev in newest_first[:20]]
+        )
+        self.assertFalse(resp.context_data['events'].has_previous())
 
+        # invalid cursor shows first page
+        resp = self.client.get(url, {'after': 'invalid'})
         eventsformset = resp.context_data['eventformset']
-        self.assertEqual(eventsformset.queryset.count(), 5)
-        paginator = resp.context_data['events']
-        self.assertEqual(paginator.number, 2)
+        self.assertEqual(
+            [ev.id for ev in eventsformset.queryset],
+            [ev.id for ev in newest_first[:20]]
+        )
 
     def test_cancel_button_shown_for_events_with_bookings(self):
         """
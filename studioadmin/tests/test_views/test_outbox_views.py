@@ -0,0 +1,95 @@
+from model_mommy import mommy
+
+from django.core.urlresolvers import reverse
+from django.http import Http404
+from django.test import TestCase
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.utils import timezone
+
+from activitylog.models import ActivityLog
+from booking.models import OutboxEmail
+from booking.tests.helpers import _create_session
+from studioadmin.views import outbox_view
+
+from studioadmin.tests.test_views.helpers import TestPermissionMixin
+
+
+class OutboxViewTests(TestPermissionMixin, TestCase):
+
+    def setUp(self):
+        super(OutboxViewTests, self).setUp()
+        mommy.make(OutboxEmail, status=OutboxEmail.QUEUED, _quantity=3)
+        mommy.make(OutboxEmail, status=OutboxEmail.SENT, _quantity=2)
+        self.failed = mommy.make(
+            OutboxEmail, status=OutboxEmail.FAILED, attempts=5,
+            last_error='Connection refused'
+        )
+
+    def _get_response(self, user, post_data=None):
+        url = reverse('studioadmin:outbox')
+        session = _create_session()
+        if post_data is None:
+            request = self.factory.get(url)
+        else:
+            request = self.factory.post(url, post_data)
+        request.session = session
+        request.user = user
+        messages = FallbackStorage(request)
+        request._messages = messages
+        return outbox_view(request)
+
+    def test_cannot_access_if_not_logged_in(self):
+        url = reverse('studioadmin:outbox')
+        resp = self.client.get(url)
+        redirected_url = reverse('account_login') + "?next={}".format(url)
+        self.assertEquals(resp.status_code, 302)
+        self.assertIn(redirected_url, resp.url)
+
+    def test_cannot_access_if_not_staff(self):
+        resp = self._get_response(self.user)
+        self.assertEquals(resp.status_code, 302)
+        self.assertEquals(resp.url, reverse('booking:permission_denied'))
+
+    def test_instructor_group_cannot_access(self):
+        resp = self._get_response(self.instructor_user)
+        self.assertEquals(resp.status_code, 302)
+        self.assertEquals(resp.url, reverse('booking:permission_denied'))
+
+    def test_can_access_as_staff_user(self):
+        resp = self._get_response(self.staff_user)
+        self.assertEquals(resp.status_code, 200)
+
+    def test_queue_depth_and_failures(self):
+        resp = self._get_response(self.staff_user)
+        self.assertEqual(
+            resp.context_data['status_counts'],
+            [('Queued', 3), ('Sending', 0), ('Sent', 2), ('Failed', 1)]
+        )
+        self.assertEqual(
+            resp.context_data['oldest_queued'],
+            OutboxEmail.objects.filter(status=OutboxEmail.QUEUED)
+            .order_by('created').first().created
+        )
+        self.assertEqual(
+            [email.id for email in resp.context_data['failed_emails']],
+            [self.failed.id]
+        )
+
+    def test_retry_failed_email(self):
+        self._get_response(self.staff_user, {'retry': self.failed.id})
+        self.failed.refresh_from_db()
+        self.assertEqual(self.failed.status, OutboxEmail.QUEUED)
+        self.assertEqual(self.failed.attempts, 0)
+        self.assertTrue(self.failed.next_attempt <= timezone.now())
+        self.assertEqual(
+            ActivityLog.objects.last().log,
+            'Failed email id {} requeued by admin user {}'.format(
+                self.failed.id, self.staff_user.username
+            )
+        )
+
+    def test_retry_invalid_email_id(self):
+        with self.assertRaises(Http404):
+            self._get_response(self.staff_user, {'retry': 'abc'})
+        self.failed.refresh_from_db()
+        self.assertEqual(self.failed.status, OutboxEmail.FAILED)
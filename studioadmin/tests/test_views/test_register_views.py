@@ -5,8 +5,12 @@ from datetime import  date, datetime
 from mock import patch
 from model_mommy import mommy
 
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.utils import timezone
 
@@ -487,7 +491,8 @@ class EventRegisterViewTests(TestPermissionMixin, TestCase):
             BlockType, event_type=self.event.event_type
         )
         block = mommy.make_recipe(
-            'booking.block', block_type=block_type, user=self.user, paid=True
+            'booking.block', block_type=block_type, user=self.booking1.user,
+            paid=True
         )
         self.assertTrue(block.active_block())
 
@@ -510,7 +515,8 @@ class EventRegisterViewTests(TestPermissionMixin, TestCase):
             BlockType, event_type=self.event.event_type
         )
         block = mommy.make_recipe(
-            'booking.block', block_type=block_type, user=self.user, paid=True
+            'booking.block', block_type=block_type, user=self.booking1.user,
+            paid=True
         )
         self.assertTrue(block.active_block())
 
@@ -803,6 +809,71 @@ class EventRegisterViewTests(TestPermissionMixin, TestCase):
             content
         )
 
+    def test_new_booking_user_choices_not_listed(self):
+        """
+        Users for new bookings are searched for; the register doesn't list
+        every user in each new booking form
+        """
+        mommy.make_recipe(
+            'booking.user', first_name='Unbooked', _quantity=5
+        )
+        resp = self._get_response(
+            self.staff_user, self.event.slug, status_choice='OPEN'
+        )
+        resp.render()
+        self.assertNotIn('Unbooked', resp.rendered_content)
+        self.assertIn(
+            'data-autocomplete-url="{}?event={}"'.format(
+                reverse('studioadmin:autocomplete_users'), self.event.id
+            ),
+            resp.rendered_content
+        )
+
+    def test_print_register_includes_autocomplete_script(self):
+        resp = self._get_response(
+            self.staff_user, self.event.slug, print_view=True,
+            status_choice='OPEN'
+        )
+        resp.render()
+        self.assertIn('studioadmin/js/autocomplete.js', resp.rendered_content)
+
+    def _register_queries(self):
+        cache.clear()
+        user = User.objects.get(id=self.staff_user.id)
+        with CaptureQueriesContext(connection) as queries:
+            self._get_response(
+                user, self.event.slug, status_choice='OPEN'
+            ).render()
+        return len(queries)
+
+    def test_number_of_queries(self):
+        """
+        The number of queries doesn't depend on the number of bookings or
+        blocks shown
+        """
+        def make_block(booking):
+            return mommy.make_recipe(
+                'booking.block', user=booking.user, paid=True,
+                block_type__event_type=self.event.event_type,
+                block_type__size=5, start_date=timezone.now()
+            )
+
+        self.booking1.block = make_block(self.booking1)
+        self.booking1.paid = True
+        self.booking1.save()
+        few_bookings_queries = self._register_queries()
+
+        for booking in mommy.make_recipe(
+            'booking.booking', event=self.event, _quantity=6
+        ):
+            block = make_block(booking)
+            if booking.id % 2:
+                booking.block = block
+                booking.paid = True
+                booking.save()
+
+        self.assertEqual(self._register_queries(), few_bookings_queries)
+
     def test_disclaimer_display(self):
         event = mommy.make_recipe(
             'booking.future_EV', max_participants=1
@@ -1379,6 +1450,90 @@ class RegisterByDateTests(TestPermissionMixin, TestCase):
         self.assertNotIn('>Block size<', resp.rendered_content)
         self.assertNotIn('>Bookings used<', resp.rendered_content)
 
+    def test_print_shows_users_available_block(self):
+        event = mommy.make_recipe(
+            'booking.future_PC',
+            date=datetime(
+                year=2015, month=9, day=7,
+                hour=18, minute=0, tzinfo=timezone.utc
+            ),
+        )
+        block_type = mommy.make_recipe(
+            'booking.blocktype5', event_type=event.event_type
+        )
+        block = mommy.make_recipe(
+            'booking.block', block_type=block_type, paid=True,
+            start_date=timezone.now()
+        )
+        mommy.make_recipe('booking.booking', block=block, user=block.user)
+        mommy.make_recipe('booking.booking', event=event, user=block.user)
+
+        resp = self._post_response(
+            self.staff_user, {
+                'register_date': 'Mon 07 Sep 2015',
+                'exclude_ext_instructor': True,
+                'register_format': 'full',
+                'print': 'print',
+                'select_events': [event.id]
+            }
+        )
+        bookings = resp.context_data['events'][0]['bookings']
+        self.assertEqual(bookings[0]['available_block'], block)
+        self.assertEqual(bookings[0]['available_block'].bookings_used, 1)
+        self.assertIn(
+            block.expiry_date.strftime('%a %d %b %Y'), resp.rendered_content
+        )
+
+    def _print_day_queries(self, num_events, num_bookings):
+        event_type = mommy.make_recipe('booking.event_type_PC')
+        mommy.make_recipe('booking.blocktype5', event_type=event_type)
+        events = mommy.make_recipe(
+            'booking.future_PC', event_type=event_type,
+            date=datetime(
+                year=2015, month=9, day=7,
+                hour=18, minute=0, tzinfo=timezone.utc
+            ),
+            max_participants=25, _quantity=num_events
+        )
+        for event in events:
+            for booking in mommy.make_recipe(
+                'booking.booking', event=event, _quantity=num_bookings
+            ):
+                mommy.make(OnlineDisclaimer, user=booking.user)
+                mommy.make_recipe(
+                    'booking.block', user=booking.user, paid=True,
+                    block_type__event_type=event_type,
+                    block_type__size=5, start_date=timezone.now()
+                )
+
+        # fresh user instance and empty cache so that cached permission and
+        # disclaimer checks are counted the same way each time
+        cache.clear()
+        user = User.objects.get(id=self.staff_user.id)
+        with CaptureQueriesContext(connection) as queries:
+            resp = self._post_response(
+                user, {
+                    'register_date': 'Mon 07 Sep 2015',
+                    'exclude_ext_instructor': True,
+                    'register_format': 'full',
+                    'print': 'print',
+                    'select_events': [event.id for event in events]
+                }
+            )
+            resp.render()
+        self.assertEqual(len(resp.context_data['events']), num_events)
+        return len(queries)
+
+    def test_print_day_number_of_queries(self):
+        """
+        A full day of registers (12 classes with 20 bookings each) takes the
+        same number of queries to build as a single register
+        """
+        single_register_queries = self._print_day_queries(1, 1)
+        Event.objects.all().delete()
+        full_day_queries = self._print_day_queries(12, 20)
+        self.assertEqual(full_day_queries, single_register_queries)
+
     def test_print_with_invalid_date_format(self):
         mommy.make_recipe(
             'booking.future_EV',
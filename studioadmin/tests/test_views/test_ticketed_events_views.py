@@ -7,13 +7,16 @@ from model_mommy import mommy
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.core import mail
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.messages.storage.fallback import FallbackStorage
 
 from django.utils import timezone
 
 from booking.models import TicketedEvent, TicketBooking, Ticket
 from booking.tests.helpers import _create_session, format_content
+from payments.models import PaypalTicketBookingTransaction
 
 from studioadmin.views import (
     ConfirmTicketBookingRefundView,
@@ -171,6 +174,45 @@ class TicketedEventAdminListViewTests(TestPermissionMixin, TestCase):
         )
         self.assertIn('cancel_button', resp.rendered_content)
 
+    def test_tickets_left_shown(self):
+        """
+        Tickets left counts tickets on confirmed, uncancelled bookings only
+        """
+        for confirmed, cancelled in [(True, False), (True, True), (False, False)]:
+            ticket_booking = mommy.make(
+                TicketBooking, ticketed_event=self.ticketed_event,
+                purchase_confirmed=confirmed, cancelled=cancelled
+            )
+            mommy.make(Ticket, ticket_booking=ticket_booking, _quantity=2)
+
+        resp = self._get_response(self.staff_user)
+        formset = resp.context_data['ticketed_event_formset']
+        self.assertEqual(formset.forms[0].instance.tickets_left(), 8)
+        self.assertEqual(self.ticketed_event.tickets_left(), 8)
+
+    def test_number_of_queries(self):
+        """
+        The number of queries to list events doesn't depend on the number of
+        events or their bookings
+        """
+        # warm the cached per-user checks (staff, disclaimer) first
+        self._get_response(self.staff_user).render()
+        with CaptureQueriesContext(connection) as single_event_queries:
+            self._get_response(self.staff_user).render()
+
+        for ticketed_event in mommy.make_recipe(
+            'booking.ticketed_event_max10',
+            date=timezone.now() + timedelta(2), _quantity=5
+        ):
+            ticket_booking = mommy.make(
+                TicketBooking, ticketed_event=ticketed_event,
+                purchase_confirmed=True
+            )
+            mommy.make(Ticket, ticket_booking=ticket_booking, _quantity=2)
+        with CaptureQueriesContext(connection) as queries:
+            self._get_response(self.staff_user).render()
+        self.assertEqual(len(queries), len(single_event_queries))
+
     def test_can_edit_event(self):
         self.assertTrue(self.ticketed_event.show_on_site)
         self.assertTrue(self.ticketed_event.payment_open)
@@ -636,6 +678,36 @@ class TicketedEventBookingsListViewTests(TestPermissionMixin, TestCase):
             [self.ticket_booking.id]
         )
 
+    def test_number_of_queries(self):
+        """
+        The number of queries to list ticket bookings doesn't depend on the
+        number of bookings
+        """
+        # warm the cached per-user checks (staff, disclaimer) first
+        self._get_response(self.staff_user, self.ticketed_event).render()
+        with CaptureQueriesContext(connection) as single_booking_queries:
+            self._get_response(self.staff_user, self.ticketed_event).render()
+
+        for ticket_booking in mommy.make(
+            TicketBooking, ticketed_event=self.ticketed_event,
+            purchase_confirmed=True, _quantity=5
+        ):
+            mommy.make(Ticket, ticket_booking=ticket_booking)
+            mommy.make(
+                PaypalTicketBookingTransaction, ticket_booking=ticket_booking,
+                transaction_id='txn{}'.format(ticket_booking.id)
+            )
+        with CaptureQueriesContext(connection) as queries:
+            resp = self._get_response(self.staff_user, self.ticketed_event)
+            resp.render()
+        self.assertEqual(len(queries), len(single_booking_queries))
+        self.assertEqual(
+            len([
+                form for form in resp.context_data['ticket_booking_formset']
+                if form.paypal
+            ]), 5
+        )
+
     def test_exclude_cancelled_bookings(self):
         tb = mommy.make(
              TicketBooking, ticketed_event=self.ticketed_event,
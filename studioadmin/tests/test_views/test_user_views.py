@@ -5,10 +5,13 @@ from mock import patch
 from model_mommy import mommy
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.core import mail
+from django.db import connection
 from django.db.models import Q
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import Group, User, Permission
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.utils import timezone
@@ -17,6 +20,7 @@ from accounts.models import OnlineDisclaimer, PrintDisclaimer
 from booking.models import Booking, Block, BlockType, Event, EventType, \
     WaitingListUser
 from booking.tests.helpers import _create_session, format_content
+from payments.models import PaypalBookingTransaction
 from studioadmin.utils import int_str, chaffify
 from studioadmin.views import (
     UserListView,
@@ -82,6 +86,29 @@ class UserListViewTests(TestPermissionMixin, TestCase):
             list(resp.context_data['users']), list(User.objects.all())
         )
 
+    def test_users_paginated_by_first_name(self):
+        mommy.make_recipe('booking.user', first_name='Alice', _quantity=35)
+        expected = list(User.objects.order_by('first_name', 'id'))
+        self.assertEqual(len(expected), 38)
+
+        resp = self._get_response(self.staff_user)
+        self.assertTrue(resp.context_data['is_paginated'])
+        self.assertEqual(list(resp.context_data['users']), expected[:30])
+        page = resp.context_data['page_obj']
+
+        # next page continues within the users with the same first name
+        resp = self._get_response(
+            self.staff_user, {'after': page.next_cursor}
+        )
+        self.assertEqual(list(resp.context_data['users']), expected[30:])
+        self.assertFalse(resp.context_data['page_obj'].has_next())
+        self.assertIn(
+            'before={}'.format(
+                resp.context_data['page_obj'].previous_cursor
+            ),
+            resp.rendered_content
+        )
+
     def test_abbreviations_for_long_username(self):
         """
         Usernames > 15 characters are split to 2 lines
@@ -550,6 +577,35 @@ class UserListViewTests(TestPermissionMixin, TestCase):
         subscribed_user.refresh_from_db()
         self.assertIn(subscribed, subscribed_user.groups.all())
 
+    def _user_list_queries(self):
+        # fresh user instance and empty cache so that cached permission and
+        # disclaimer checks are counted the same way each time
+        cache.clear()
+        superuser = User.objects.get(id=self.superuser.id)
+        with CaptureQueriesContext(connection) as queries:
+            self._get_response(superuser).render()
+        return len(queries)
+
+    def test_number_of_queries(self):
+        """
+        The number of queries to list users doesn't depend on the number of
+        users shown
+        """
+        self.superuser = User.objects.create_superuser(
+            username='super', email='super@test.com', password='test'
+        )
+        few_users_queries = self._user_list_queries()
+
+        subscribed = mommy.make(Group, name='subscribed')
+        regular_student = Permission.objects.get(codename='is_regular_student')
+        for user in mommy.make_recipe('booking.user', _quantity=10):
+            mommy.make(OnlineDisclaimer, user=user)
+            subscribed.user_set.add(user)
+            user.user_permissions.add(regular_student)
+        mommy.make(PrintDisclaimer, user=self.user)
+
+        self.assertEqual(self._user_list_queries(), few_users_queries)
+
 
 class UserBookingsViewTests(TestPermissionMixin, TestCase):
 
@@ -646,6 +702,39 @@ class UserBookingsViewTests(TestPermissionMixin, TestCase):
             request, user_id, booking_status=booking_status
         )
 
+    def _user_bookings_queries(self):
+        cache.clear()
+        staff_user = User.objects.get(id=self.staff_user.id)
+        with CaptureQueriesContext(connection) as queries:
+            self._get_response(staff_user, self.user.id).render()
+        return len(queries)
+
+    def test_number_of_queries(self):
+        """
+        The number of queries doesn't depend on the number of bookings shown
+        """
+        few_bookings_queries = self._user_bookings_queries()
+
+        block = mommy.make_recipe(
+            'booking.block_10', user=self.user, paid=True,
+            start_date=timezone.now() - timedelta(1),
+            block_type__event_type=self.future_user_bookings[0].event.event_type
+        )
+        for event in mommy.make_recipe('booking.future_PC', _quantity=5):
+            mommy.make_recipe(
+                'booking.booking', user=self.user, event=event, block=block
+            )
+        for event in mommy.make_recipe('booking.future_PC', _quantity=5):
+            booking = mommy.make_recipe(
+                'booking.booking', user=self.user, event=event, paid=True
+            )
+            mommy.make(
+                PaypalBookingTransaction, booking=booking,
+                transaction_id='txn{}'.format(booking.id)
+            )
+
+        self.assertEqual(self._user_bookings_queries(), few_bookings_queries)
+
     def test_cannot_access_if_not_logged_in(self):
         """
         test that the page redirects if user is not logged in
@@ -730,6 +819,42 @@ class UserBookingsViewTests(TestPermissionMixin, TestCase):
                     ])
         )
 
+    def test_past_bookings_paginated(self):
+        past_classes = mommy.make_recipe('booking.past_class', _quantity=20)
+        for event in past_classes:
+            mommy.make_recipe('booking.booking', user=self.user, event=event)
+        all_past = sorted(
+            Booking.objects.filter(
+                user=self.user, event__date__lt=timezone.now()
+            ), key=lambda bk: (bk.event.date, bk.id), reverse=True
+        )
+        self.assertEqual(len(all_past), 24)
+
+        resp = self._get_response(self.staff_user, self.user.id, 'past')
+        booking_forms = resp.context_data['userbookingformset'].forms[:-1]
+        self.assertEqual(
+            [form.instance.id for form in booking_forms],
+            [bk.id for bk in all_past[:20]]
+        )
+        page = resp.context_data['bookings_page']
+        self.assertTrue(page.has_next())
+
+        url = reverse(
+            'studioadmin:user_bookings_list',
+            kwargs={'user_id': self.user.id, 'booking_status': 'past'}
+        )
+        request = self.factory.get(url, {'after': page.next_cursor})
+        request.session = _create_session()
+        request.user = self.staff_user
+        request._messages = FallbackStorage(request)
+        resp = user_bookings_view(request, self.user.id, booking_status='past')
+        booking_forms = resp.context_data['userbookingformset'].forms[:-1]
+        self.assertEqual(
+            [form.instance.id for form in booking_forms],
+            [bk.id for bk in all_past[20:]]
+        )
+        self.assertFalse(resp.context_data['bookings_page'].has_next())
+
     def test_can_update_booking(self):
         self.assertFalse(self.future_user_bookings[0].deposit_paid)
         self.assertTrue(self.future_user_bookings[0].paid)
@@ -3,8 +3,11 @@ from datetime import datetime, timedelta
 
 from model_mommy import mommy
 
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from booking.models import BlockVoucher, EventVoucher, UsedBlockVoucher, \
@@ -108,6 +111,38 @@ class VoucherListViewTests(TestPermissionMixin, TestCase):
         resp = self.client.get(self.url)
         self.assertIn('class="expired_block"', resp.rendered_content)
 
+    def _voucher_list_queries(self):
+        # cached staff and disclaimer checks are counted each time
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url).render()
+        return len(queries)
+
+    def test_number_of_queries(self):
+        """
+        The number of queries to list vouchers doesn't depend on the number
+        of vouchers or their uses
+        """
+        self.assertTrue(
+            self.client.login(
+                username=self.staff_user.username, password='test'
+            )
+        )
+        voucher = mommy.make(EventVoucher, max_vouchers=5)
+        voucher.event_types.add(self.pc_event_type)
+        single_voucher_queries = self._voucher_list_queries()
+
+        for voucher in mommy.make(EventVoucher, max_vouchers=5, _quantity=5):
+            voucher.event_types.add(self.pc_event_type)
+            mommy.make(UsedEventVoucher, voucher=voucher, _quantity=3)
+        self.assertEqual(self._voucher_list_queries(), single_voucher_queries)
+
+        resp = self.client.get(self.url)
+        self.assertEqual(
+            sorted(voucher.times_used for voucher in resp.context_data['vouchers']),
+            [0, 3, 3, 3, 3, 3]
+        )
+
 
 class VoucherCreateViewTests(TestPermissionMixin, TestCase):
 
@@ -18,6 +18,7 @@ from studioadmin.views import (ConfirmRefundView,
                                TicketedEventAdminCreateView,
                                TicketedEventAdminUpdateView,
                                TicketedEventBookingsListView,
+                               autocomplete_users,
                                cancel_event_view,
                                register_view,
                                register_print_day,
@@ -36,6 +37,7 @@ from studioadmin.views import (ConfirmRefundView,
                                cancel_ticketed_event_view,
                                print_tickets_list,
                                test_paypal_view,
+                               outbox_view,
                                user_disclaimer,
                                VoucherCreateView,
                                VoucherListView,
@@ -67,6 +69,8 @@ urlpatterns = [
         register_view, {'print_view': True}, name='event_register_print'),
     url(r'^event-registers/print-registers-by-date/$', register_print_day,
         name='register-day'),
+    url(r'^autocomplete/users/$', autocomplete_users,
+        name='autocomplete_users'),
     url(r'^events/new/$', EventAdminCreateView.as_view(),
         {'ev_type': 'event'}, name='add_event'),
     url(r'^classes/(?P<slug>[\w-]+)/edit$', EventAdminUpdateView.as_view(),
@@ -137,6 +141,7 @@ urlpatterns = [
     url(
         r'activitylog/$', ActivityLogListView.as_view(), name='activitylog'
     ),
+    url(r'^outbox/$', outbox_view, name='outbox'),
     url(
         r'^waitinglists/(?P<event_id>\d+)$',
         event_waiting_list_view, name='event_waiting_list'
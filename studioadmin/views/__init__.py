@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from studioadmin.views.activity_log import ActivityLogListView
+from studioadmin.views.autocomplete import autocomplete_users
 from studioadmin.views.blocks import BlockListView
 from studioadmin.views.disclaimers import DisclaimerUpdateView, \
     DisclaimerDeleteView, user_disclaimer
@@ -10,6 +11,7 @@ from studioadmin.views.events import cancel_event_view, event_admin_list, \
     EventAdminCreateView, EventAdminUpdateView
 from studioadmin.views.misc import ConfirmPaymentView, ConfirmRefundView, \
     test_paypal_view
+from studioadmin.views.outbox import outbox_view
 from studioadmin.views.register import EventRegisterListView, \
     register_print_day, register_view
 from studioadmin.views.ticketed_events import cancel_ticketed_event_view, \
@@ -30,7 +32,8 @@ from studioadmin.views.waiting_list import event_waiting_list_view
 
 
 __all__ = [
-    'ActivityLogListView', 'BlockListView', 'BlockVoucherCreateView',
+    'ActivityLogListView', 'autocomplete_users', 'BlockListView',
+    'BlockVoucherCreateView',
     'BlockVoucherDetailView',
     'BlockVoucherListView', 'BlockVoucherUpdateView',
     'cancel_ticketed_event_view',
@@ -40,7 +43,7 @@ __all__ = [
     'email_users_view', 'event_admin_list',
     'EventAdminCreateView', 'EventAdminUpdateView'
     'EventRegisterListView', 'EventVoucherDetailView',
-    'event_waiting_list_view', 'MailingListView',
+    'event_waiting_list_view', 'MailingListView', 'outbox_view',
     'print_tickets_list',
     'register_print_day', 'register_view', 'TicketedEventBookingsListView',
     'TicketedEventAdminUpdateView', 'TicketedEventAdminListView',
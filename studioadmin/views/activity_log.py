@@ -1,8 +1,6 @@
 import logging
-import operator
 
 from datetime import datetime
-from functools import reduce
 
 from django.contrib import messages
 from django.db.models import Q
@@ -11,31 +9,29 @@ from django.views.generic import ListView
 from braces.views import LoginRequiredMixin
 
 from studioadmin.forms import ActivityLogSearchForm
-from studioadmin.views.helpers import StaffUserMixin
+from studioadmin.views.helpers import KeysetPaginationMixin, StaffUserMixin
 from activitylog.models import ActivityLog
+from activitylog.search import search_logs
 
 
 logger = logging.getLogger(__name__)
 
 
-class ActivityLogListView(LoginRequiredMixin, StaffUserMixin, ListView):
+class ActivityLogListView(
+    LoginRequiredMixin, StaffUserMixin, KeysetPaginationMixin, ListView
+):
 
     model = ActivityLog
     template_name = 'studioadmin/activitylog.html'
     context_object_name = 'logs'
     paginate_by = 20
+    keyset_ordering = ('-timestamp', '-id')
+    estimate_count = True
 
     def get_queryset(self):
 
-        empty_text = [
-            'email_warnings job run; no unpaid booking warnings to send',
-            'cancel_unpaid_bookings job run; no bookings to cancel',
-            'deleted_unconfirmed_bookings job run; no bookings to cancel',
-            'email_ticket_booking_warnings job run; no unpaid booking warnings to send',
-            'cancel_unpaid_ticket_bookings job run; no bookings to cancel'
-        ]
-        queryset = ActivityLog.objects.exclude(
-            log__in=empty_text
+        queryset = ActivityLog.objects.filter(
+            empty_cron=False
         ).order_by('-timestamp')
 
         reset = self.request.GET.get('reset')
@@ -66,17 +62,17 @@ class ActivityLogListView(LoginRequiredMixin, StaffUserMixin, ListView):
                 return queryset
 
         if search_text:
-            search_words = search_text.split()
-            search_qs = reduce(
-                operator.and_, (Q(log__icontains=x) for x in search_words)
-            )
-            queryset = queryset.filter(search_qs)
+            queryset = search_logs(queryset, search_text)
 
         return queryset
 
     def get_context_data(self):
         context = super(ActivityLogListView, self).get_context_data()
         context['sidenav_selection'] = 'activitylog'
+        if context['is_paginated']:
+            context['count_label'] = 'about {} logs'.format(
+                context['paginator'].count
+            )
 
         search_submitted =  self.request.GET.get('search_submitted')
         hide_empty_cronjobs = self.request.GET.get('hide_empty_cronjobs') \
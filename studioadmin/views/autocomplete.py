@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import operator
+
+from functools import reduce
+
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.http import JsonResponse
+
+from booking.models import Booking
+from studioadmin.views.helpers import is_instructor_or_staff
+
+
+AUTOCOMPLETE_LIMIT = 20
+
+
+def search_users(queryset, search_text):
+    """
+    Filter users to those with a first name, last name or username starting
+    with each of the words in search_text.  Prefix matches can use the
+    indexes added in accounts migration 0004.
+    """
+    words = search_text.split()
+    if not words:
+        return queryset.none()
+    return queryset.filter(
+        reduce(
+            operator.and_,
+            (
+                Q(first_name__istartswith=word) |
+                Q(last_name__istartswith=word) |
+                Q(username__istartswith=word)
+                for word in words
+            )
+        )
+    )
+
+
+@login_required
+@is_instructor_or_staff
+def autocomplete_users(request):
+    """
+    JSON search for users to add to a register; excludes users already booked
+    on the event if an event id is given
+    """
+    queryset = User.objects.all()
+    event_id = request.GET.get('event')
+    if event_id and event_id.isdigit():
+        queryset = queryset.exclude(
+            id__in=Booking.objects.filter(
+                event_id=event_id, status='OPEN'
+            ).values('user_id')
+        )
+    users = search_users(queryset, request.GET.get('q', '')).order_by(
+        'first_name', 'last_name'
+    ).values_list('id', 'first_name', 'last_name')[:AUTOCOMPLETE_LIMIT]
+
+    return JsonResponse({
+        'results': [
+            {'id': user_id, 'text': '{} {}'.format(first_name, last_name)}
+            for user_id, first_name, last_name in users
+        ]
+    })
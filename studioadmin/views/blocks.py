@@ -4,6 +4,7 @@ from django.views.generic import ListView
 
 from braces.views import LoginRequiredMixin
 
+from booking.context_helpers import set_transferred_bookings
 from booking.models import Block
 
 from studioadmin.forms import BlockStatusFilter
@@ -22,40 +23,29 @@ class BlockListView(LoginRequiredMixin, StaffUserMixin, ListView):
 
     def get_queryset(self):
         block_status = self.request.GET.get('block_status', 'current')
-        all_blocks = Block.objects.all().order_by('user__first_name')
+        all_blocks = Block.objects.select_related(
+            'user', 'block_type__event_type'
+        ).with_usage().order_by('user__first_name')
         if block_status == 'all':
             return all_blocks
         elif block_status == 'current':
-            current = (block.id for block in all_blocks
-                      if not block.expired and not block.full)
-            return Block.objects.filter(id__in=current).order_by(
-                'user__first_name'
-            )
+            return all_blocks.unexpired().not_full()
         elif block_status == 'active':
-            active = (block.id for block in all_blocks if block.active_block())
-            return Block.objects.filter(id__in=active).order_by(
-                'user__first_name'
-            )
+            return all_blocks.active()
         elif block_status == 'transfers':
             return all_blocks.filter(
                 block_type__identifier='transferred'
             ).order_by('user__first_name')
         elif block_status == 'unpaid':
-            unpaid = (block.id for block in all_blocks
-                      if not block.expired and not block.paid
-                      and not block.full)
-            return Block.objects.filter(id__in=unpaid).order_by(
-                'user__first_name'
-            )
+            return all_blocks.unexpired().not_full().filter(paid=False)
         elif block_status == 'expired':
-            expired = (block.id for block in all_blocks if block.expired or block.full)
-            return Block.objects.filter(id__in=expired).order_by(
-                'user__first_name'
-            )
+            current = Block.objects.unexpired().not_full()
+            return all_blocks.exclude(id__in=current.values('id'))
 
     def get_context_data(self):
         context = super(BlockListView, self).get_context_data()
         context['sidenav_selection'] = 'blocks'
+        context['blocks'] = set_transferred_bookings(context['blocks'])
 
         block_status = self.request.GET.get('block_status', 'current')
         form = BlockStatusFilter(initial={'block_status': block_status})
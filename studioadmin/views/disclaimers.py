@@ -16,7 +16,7 @@ from studioadmin.forms import StudioadminDisclaimerForm
 from studioadmin.utils import str_int, dechaffify
 from studioadmin.views.helpers import is_instructor_or_staff, StaffUserMixin
 
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -72,8 +72,8 @@ class DisclaimerUpdateView(StaffUserMixin, UpdateView):
                         disclaimer.user.username
                     )
                 )
-                ActivityLog.objects.create(
-                    log="Online disclaimer for {} updated by admin "
+                log_activity(
+                    "Online disclaimer for {} updated by admin "
                         "user {} (user password supplied)".format(
                         disclaimer.user.username, self.request.user.username
                     )
@@ -119,8 +119,8 @@ class DisclaimerDeleteView(StaffUserMixin, DeleteView):
                 self.user.first_name, self.user.last_name, self.user.username
             )
         )
-        ActivityLog.objects.create(
-            log="Disclaimer deleted for {} {} ({}) by admin user {}".format(
+        log_activity(
+            "Disclaimer deleted for {} {} ({}) by admin user {}".format(
                 self.user.first_name, self.user.last_name, self.user.username,
                 self.request.user.username
             )
@@ -15,13 +15,13 @@ from django.utils.safestring import mark_safe
 from django.core.mail.message import EmailMultiAlternatives
 
 from booking.models import Event, Booking
-from booking.email_helpers import send_support_email
+from booking.email_helpers import send_message, send_support_email
 
 from studioadmin.forms import EmailUsersForm, ChooseUsersFormSet, \
     UserFilterForm
 from studioadmin.views.helpers import staff_required, url_with_querystring
 
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -187,11 +187,11 @@ def email_users_view(request, mailing_list=False,
                               ),
                             "text/html"
                         )
-                        msg.send(fail_silently=False)
+                        send_message(msg, fail_silently=False)
 
                         if not test_email:
-                            ActivityLog.objects.create(
-                                log='{} email with subject "{}" sent to users {} by'
+                            log_activity(
+                                '{} email with subject "{}" sent to users {} by'
                                     ' admin user {}'.format(
                                         'Mailing list' if mailing_list else 'Bulk',
                                         subject, ', '.join(email_list),
@@ -203,16 +203,16 @@ def email_users_view(request, mailing_list=False,
                     send_support_email(
                         e, __name__, "Bulk Email to students"
                     )
-                    ActivityLog.objects.create(
-                        log="Possible error with sending {} email; "
+                    log_activity(
+                        "Possible error with sending {} email; "
                             "notification sent to tech support".format(
                                 'mailing list' if mailing_list else 'bulk'
                         )
                     )
 
                     if not test_email:
-                        ActivityLog.objects.create(
-                            log='{} email error '
+                        log_activity(
+                            '{} email error '
                                 '(email subject "{}"), sent by '
                                 'by admin user {}'.format(
                                     'Mailing list' if mailing_list else 'Bulk',
@@ -2,11 +2,10 @@ import logging
 
 from datetime import timedelta
 
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.urlresolvers import reverse
 from django.template.loader import get_template
 from django.template.response import TemplateResponse
@@ -21,8 +20,9 @@ from braces.views import LoginRequiredMixin
 from booking.models import Block, BlockType, Booking, Event
 from booking.email_helpers import send_support_email
 from studioadmin.forms import EventFormSet,  EventAdminForm
-from studioadmin.views.helpers import staff_required, StaffUserMixin
-from activitylog.models import ActivityLog
+from studioadmin.views.helpers import get_keyset_querystring, \
+    KeysetPaginator, staff_required, StaffUserMixin
+from activitylog.helpers import log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -39,17 +39,15 @@ def _get_past_events(ev_type, request):
             date__lte=timezone.now()
         ).exclude(event_type__event_type='EV').order_by('-date')
 
-    paginator = Paginator(nonpag_events, 20)
-    page = request.GET.get('page')
-    try:
-        events = paginator.page(page)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page.
-        events = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range (e.g. 9999), deliver last page of results.
-        events = paginator.page(paginator.num_pages)
-    page_query = nonpag_events.filter(id__in=[obj.id for obj in events])
+    paginator = KeysetPaginator(nonpag_events, 20, ordering=('-date', '-id'))
+    events = paginator.page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+    page_query = nonpag_events.filter(
+        id__in=[obj.id for obj in events]
+    ).annotate(
+        waiting_list_count=Count('waitinglistusers')
+    ).order_by('-date', '-id')
     eventformset = EventFormSet(queryset=page_query)
     return events, eventformset
 
@@ -78,7 +76,9 @@ def event_admin_list(request, ev_type):
             events, eventformset = _get_past_events(ev_type, request)
         elif "upcoming" in request.POST:
             show_past = False
-            eventformset = EventFormSet(queryset=events)
+            eventformset = EventFormSet(queryset=events.annotate(
+                waiting_list_count=Count('waitinglistusers')
+            ))
         else:
             eventformset = EventFormSet(request.POST)
 
@@ -96,11 +96,13 @@ def event_admin_list(request, ev_type):
                                         )
                                     )
                                 )
-                                ActivityLog.objects.create(
-                                    log='{} {} (id {}) deleted by admin user {}'.format(
+                                log_activity(
+                                    '{} {} (id {}) deleted by admin user {}'.format(
                                         ev_type_text.title(), form.instance,
                                         form.instance.id, request.user.username
-                                    )
+                                    ),
+                                    actor=request.user, obj=form.instance,
+                                    action='deleted'
                                 )
                             else:
                                 for field in form.changed_data:
@@ -112,12 +114,14 @@ def event_admin_list(request, ev_type):
                                                 form.instance))
                                     )
 
-                                    ActivityLog.objects.create(
-                                        log='{} {} (id {}) updated by admin user {}: field_changed: {}'.format(
+                                    log_activity(
+                                        '{} {} (id {}) updated by admin user {}: field_changed: {}'.format(
                                             ev_type_text.title(),
                                             form.instance, form.instance.id,
                                             request.user.username, field.title().replace("_", " ")
-                                        )
+                                        ),
+                                        actor=request.user, obj=form.instance,
+                                        action='updated'
                                     )
 
                             form.save()
@@ -143,12 +147,14 @@ def event_admin_list(request, ev_type):
                 )
 
     else:
-        page = request.GET.get('page')  # only past is paginated
-        if page:
+        # only past is paginated
+        if request.GET.get('after') or request.GET.get('before'):
             show_past = True
             events, eventformset = _get_past_events(ev_type, request)
         else:
-            eventformset = EventFormSet(queryset=events)
+            eventformset = EventFormSet(queryset=events.annotate(
+                waiting_list_count=Count('waitinglistusers')
+            ))
 
     non_deletable_events = Booking.objects.select_related('event').filter(event__in=events).distinct().values_list('event__id', flat=True)
 
@@ -159,7 +165,8 @@ def event_admin_list(request, ev_type):
             'events': events,
             'sidenav_selection': ev_type,
             'show_past': show_past,
-            'non_deletable_events': non_deletable_events
+            'non_deletable_events': non_deletable_events,
+            'keyset_querystring': get_keyset_querystring(request)
             }
     )
 
@@ -199,11 +206,12 @@ class EventAdminUpdateView(LoginRequiredMixin, StaffUserMixin, UpdateView):
                 msg_ev_type, event.name
             )
             messages.success(self.request, mark_safe(msg))
-            ActivityLog.objects.create(
-                log='{} {} (id {}) updated by admin user {}'.format(
+            log_activity(
+                '{} {} (id {}) updated by admin user {}'.format(
                     msg_ev_type, event, event.id,
                     self.request.user.username
-                )
+                ),
+                actor=self.request.user, obj=event, action='updated'
             )
 
             if 'paypal_email' in form.changed_data and \
@@ -254,10 +262,11 @@ class EventAdminCreateView(LoginRequiredMixin, StaffUserMixin, CreateView):
         msg_ev_type = 'Event' if self.kwargs["ev_type"] == 'event' else 'Class'
         messages.success(self.request, mark_safe('<strong>{} {}</strong> has been '
                                     'created!'.format(msg_ev_type, event.name)))
-        ActivityLog.objects.create(
-            log='{} {} (id {}) created by admin user {}'.format(
+        log_activity(
+            '{} {} (id {}) created by admin user {}'.format(
                 msg_ev_type, event, event.id, self.request.user.username
-            )
+            ),
+            actor=self.request.user, obj=event, action='created'
         )
         if event.paypal_email != settings.DEFAULT_PAYPAL_EMAIL:
             messages.warning(
@@ -457,11 +466,12 @@ def cancel_event_view(request, slug):
                 ) + booking_cancelled_msg
             )
 
-            ActivityLog.objects.create(
-                log="{} {} cancelled by admin user {}; {}".format(
+            log_activity(
+                "{} {} cancelled by admin user {}; {}".format(
                     ev_type.title(), event, request.user.username,
                     booking_cancelled_msg
-                )
+                ),
+                actor=request.user, obj=event, action='cancelled'
             )
 
             return HttpResponseRedirect(
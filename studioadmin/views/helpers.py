@@ -1,26 +1,24 @@
+import base64
+import collections.abc
+import json
+import operator
 import urllib
 
-from functools import wraps
+from datetime import date
+from functools import reduce, wraps
 
-from django.core.cache import cache
-from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
+from django.db import connections
+from django.db.models import Q
 from django.shortcuts import HttpResponseRedirect
 
+from accounts import auth_cache
+
 
 def staff_required(func):
     def decorator(request, *args, **kwargs):
-        cached_is_staff = cache.get('user_%s_is_staff' % str(request.user.id))
-        if cached_is_staff is not None:
-            user_is_staff = bool(cached_is_staff)
-        else:
-            user_is_staff = request.user.is_staff
-            # cache for 30 mins
-            cache.set(
-                'user_%s_is_staff' % str(request.user.id), user_is_staff, 1800
-            )
-
-        if user_is_staff:
+        if auth_cache.is_staff(request.user):
             return func(request, *args, **kwargs)
         else:
             return HttpResponseRedirect(reverse('booking:permission_denied'))
@@ -29,21 +27,7 @@ def staff_required(func):
 
 def is_instructor_or_staff(func):
     def decorator(request, *args, **kwargs):
-        cached_is_instructor_or_staff = cache.get(
-            'user_%s_is_instructor_or_staff' % str(request.user.id)
-        )
-        if cached_is_instructor_or_staff is not None:
-            user_is_instructor_or_staff = bool(cached_is_instructor_or_staff)
-        else:
-            group = Group.objects.get(name='instructors')
-            user_is_instructor_or_staff = request.user.is_staff \
-                                          or group in request.user.groups.all()
-            cache.set(
-                'user_%s_is_instructor_or_staff' % str(request.user.id),
-                user_is_instructor_or_staff, 1800
-            )
-
-        if user_is_instructor_or_staff:
+        if auth_cache.is_instructor_or_staff(request.user):
             return func(request, *args, **kwargs)
         else:
             return HttpResponseRedirect(reverse('booking:permission_denied'))
@@ -53,15 +37,7 @@ def is_instructor_or_staff(func):
 class StaffUserMixin(object):
 
     def dispatch(self, request, *args, **kwargs):
-        cached_is_staff = cache.get('user_%s_is_staff' % str(request.user.id))
-        if cached_is_staff is not None:
-            user_is_staff = bool(cached_is_staff)
-        else:
-            user_is_staff = self.request.user.is_staff
-            cache.set(
-                'user_%s_is_staff' % str(request.user.id), user_is_staff, 1800
-            )
-        if not user_is_staff:
+        if not auth_cache.is_staff(request.user):
             return HttpResponseRedirect(reverse('booking:permission_denied'))
         return super(StaffUserMixin, self).dispatch(request, *args, **kwargs)
 
@@ -69,20 +45,7 @@ class StaffUserMixin(object):
 class InstructorOrStaffUserMixin(object):
 
     def dispatch(self, request, *args, **kwargs):
-        cached_is_instructor_or_staff = cache.get(
-            'user_%s_is_instructor_or_staff' % str(request.user.id)
-        )
-        if cached_is_instructor_or_staff is not None:
-            user_is_instructor_or_staff = bool(cached_is_instructor_or_staff)
-        else:
-            group = Group.objects.get(name='instructors')
-            user_is_instructor_or_staff = self.request.user.is_staff or \
-                        group in self.request.user.groups.all()
-            cache.set(
-                'user_%s_is_instructor_or_staff' % str(request.user.id),
-                user_is_instructor_or_staff, 1800
-            )
-        if user_is_instructor_or_staff:
+        if auth_cache.is_instructor_or_staff(request.user):
             return super(
                 InstructorOrStaffUserMixin, self
             ).dispatch(request, *args, **kwargs)
@@ -92,3 +55,199 @@ class InstructorOrStaffUserMixin(object):
 def url_with_querystring(path, **kwargs):
     return path + '?' + urllib.parse.urlencode(kwargs)
 
+
+
+def _get_field(model, name):
+    for part in name.split('__'):
+        field = model._meta.get_field(part)
+        model = field.related_model
+    return field
+
+
+def get_estimated_count(queryset):
+    """
+    Use the query planner's row estimate on PostgreSQL rather than counting
+    every matching row; other databases fall back to an exact count.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class KeysetPage(collections.abc.Sequence):
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.get_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.get_cursor(self.object_list[0])
+
+
+class KeysetPaginator(object):
+    """
+    Paginate by seeking past the last row shown, rather than with OFFSET, so
+    later pages are as cheap to fetch as the first.
+
+    ordering is a sequence of field names (prefixed with '-' for descending,
+    related fields with '__'); the last one must be unique (e.g. '-id').
+    Pages are requested with an opaque cursor: page(after=...) returns the
+    rows following the cursor row, page(before=...) those preceding it.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-id',),
+                 estimate_count=False):
+        self.queryset = queryset.order_by(*ordering)
+        self.per_page = per_page
+        self.ordering = [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering
+        ]
+        self.estimate_count = estimate_count
+
+    @property
+    def count(self):
+        if not hasattr(self, '_count'):
+            if self.estimate_count:
+                self._count = get_estimated_count(self.queryset)
+            else:
+                self._count = self.queryset.count()
+        return self._count
+
+    def _get_value(self, obj, name):
+        return reduce(getattr, name.split('__'), obj)
+
+    def get_cursor(self, obj):
+        values = []
+        for name, _ in self.ordering:
+            value = self._get_value(obj, name)
+            if isinstance(value, date):
+                value = value.isoformat()
+            values.append(value)
+        # padding is stripped so the cursor doesn't need escaping in urls
+        return base64.urlsafe_b64encode(
+            json.dumps(values).encode('utf-8')
+        ).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """
+        Return the field values encoded in cursor, or None if it is invalid
+        """
+        try:
+            values = json.loads(
+                base64.urlsafe_b64decode(
+                    (cursor + '=' * (-len(cursor) % 4)).encode('ascii')
+                ).decode('utf-8')
+            )
+            if len(values) != len(self.ordering):
+                return None
+            model = self.queryset.model
+            return [
+                _get_field(model, name).to_python(value)
+                for (name, _), value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError, UnicodeError):
+            return None
+
+    def _seek(self, values, forwards):
+        """
+        Q for rows after (forwards) or before the row with these key values
+        """
+        clauses = []
+        for i, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending == forwards else 'gt'
+            clause = {
+                self.ordering[j][0]: values[j] for j in range(i)
+            }
+            clause['{}__{}'.format(name, lookup)] = values[i]
+            clauses.append(Q(**clause))
+        return reduce(operator.or_, clauses)
+
+    def page(self, after=None, before=None):
+        after_values = self.decode_cursor(after) if after else None
+        before_values = self.decode_cursor(before) \
+            if before and not after_values else None
+
+        if before_values:
+            reverse_ordering = [
+                name if descending else '-' + name
+                for name, descending in self.ordering
+            ]
+            rows = list(
+                self.queryset.filter(self._seek(before_values, False))
+                .order_by(*reverse_ordering)[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            object_list = rows[:self.per_page][::-1]
+            return KeysetPage(object_list, self, True, has_previous)
+
+        queryset = self.queryset
+        if after_values:
+            queryset = queryset.filter(self._seek(after_values, True))
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return KeysetPage(
+            rows[:self.per_page], self, has_next, bool(after_values)
+        )
+
+
+class KeysetPaginationMixin(object):
+    """
+    Keyset pagination for ListViews.  The page is selected with the 'after'
+    and 'before' GET parameters, and the querystring for the other GET
+    parameters is added to the context as keyset_querystring for page links.
+    """
+    keyset_ordering = ('-id',)
+    estimate_count = False
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(
+            queryset, page_size, self.keyset_ordering, self.estimate_count
+        )
+        page = paginator.page(
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before')
+        )
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super(KeysetPaginationMixin, self).get_context_data(**kwargs)
+        context['keyset_querystring'] = get_keyset_querystring(self.request)
+        return context
+
+
+def get_keyset_querystring(request):
+    params = request.GET.copy()
+    for key in ['after', 'before', 'page']:
+        params.pop(key, None)
+    return params.urlencode()
@@ -20,7 +20,7 @@ from booking.context_helpers import get_paypal_dict
 from booking.models import Booking
 from studioadmin.forms import ConfirmPaymentForm
 from studioadmin.views.helpers import StaffUserMixin, staff_required
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 from payments.forms import PayPalPaymentsUpdateForm
 
 logger = logging.getLogger(__name__)
@@ -90,8 +90,8 @@ class ConfirmPaymentView(LoginRequiredMixin, StaffUserMixin, UpdateView):
                         'id {}'.format(e, booking.id)
                         )
 
-            ActivityLog.objects.create(
-                log='Payment status for booking id {} for event {}, '
+            log_activity(
+                'Payment status for booking id {} for event {}, '
                 'user {} updated by admin user {}'.format(
                 booking.id, booking.event, booking.user.username,
                 self.request.user.username
@@ -157,8 +157,8 @@ class ConfirmRefundView(LoginRequiredMixin, StaffUserMixin, UpdateView):
                     'studioadmin/email/confirm_refund.html').render(ctx),
                 fail_silently=False)
 
-            ActivityLog.objects.create(
-                log='Payment refund for {}booking id {} for event {}, '
+            log_activity(
+                'Payment refund for {}booking id {} for event {}, '
                     'user {} updated by admin user {}'.format(
                     '(free) ' if free else '',
                     booking.id, booking.event, booking.user.username,
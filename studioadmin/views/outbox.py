@@ -0,0 +1,67 @@
+import logging
+
+from django.contrib.auth.decorators import login_required
+from django.contrib import messages
+from django.db.models import Count, Min
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.utils import timezone
+
+from booking.models import OutboxEmail
+
+from studioadmin.views.helpers import staff_required
+from activitylog.helpers import log_activity
+
+
+logger = logging.getLogger(__name__)
+
+
+@login_required
+@staff_required
+def outbox_view(request):
+    if request.method == 'POST' and 'retry' in request.POST:
+        try:
+            email_id = int(request.POST['retry'])
+        except ValueError:
+            raise Http404('Invalid email id')
+        email = get_object_or_404(
+            OutboxEmail, id=email_id, status=OutboxEmail.FAILED
+        )
+        email.status = OutboxEmail.QUEUED
+        email.attempts = 0
+        email.next_attempt = timezone.now()
+        email.save(update_fields=['status', 'attempts', 'next_attempt'])
+        messages.success(
+            request, 'Email "{}" to {} has been queued for sending'.format(
+                email.subject, email.to
+            )
+        )
+        log_activity(
+            'Failed email id {} requeued by admin user {}'.format(
+                email.id, request.user.username
+            )
+        )
+
+    status_counts = dict(
+        OutboxEmail.objects.order_by().values_list('status')
+        .annotate(count=Count('id'))
+    )
+    oldest_queued = OutboxEmail.objects.filter(
+        status__in=[OutboxEmail.QUEUED, OutboxEmail.SENDING]
+    ).aggregate(oldest=Min('created'))['oldest']
+
+    failed_emails = OutboxEmail.objects.filter(status=OutboxEmail.FAILED)\
+        .order_by('-created')[:50]
+
+    return TemplateResponse(
+        request, 'studioadmin/outbox.html', {
+            'status_counts': [
+                (label, status_counts.get(status, 0))
+                for status, label in OutboxEmail.STATUS_CHOICES
+            ],
+            'oldest_queued': oldest_queued,
+            'failed_emails': failed_emails,
+            'sidenav_selection': 'outbox'
+        }
+    )
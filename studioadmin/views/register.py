@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 import logging
 
+from collections import defaultdict
 from datetime import datetime, time, timedelta
 
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.urlresolvers import reverse
+from django.db.models import Count, Prefetch
 from django.template.response import TemplateResponse
 from django.shortcuts import HttpResponseRedirect, get_object_or_404
 from django.views.generic import ListView
@@ -22,7 +24,7 @@ from studioadmin.forms import SimpleBookingRegisterFormSet, StatusFilter, \
 from studioadmin.views.helpers import is_instructor_or_staff, \
     InstructorOrStaffUserMixin
 
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -87,14 +89,16 @@ def register_view(request, event_slug, status_choice='OPEN', print_view=False):
                                 booking.save()
 
                             if new:
-                                ActivityLog.objects.create(
-                                    log='(Register) Booking id {} for event '
+                                log_activity(
+                                    '(Register) Booking id {} for event '
                                         '{}, user {} created by admin '
                                         'user {} '.format(
                                         booking.id, booking.event,
                                         booking.user.username,
                                         request.user.username
-                                    )
+                                    ),
+                                    actor=request.user, obj=booking,
+                                    action='created'
                                 )
                                 messages.success(
                                     request,
@@ -107,14 +111,16 @@ def register_view(request, event_slug, status_choice='OPEN', print_view=False):
                                 new_booking.attended = booking.attended
                                 new_booking.save()
 
-                                ActivityLog.objects.create(
-                                    log='(Register) Cancelled booking id {} '
+                                log_activity(
+                                    '(Register) Cancelled booking id {} '
                                         'for event {}, user {} reopened by '
                                         'admin user {}'.format(
                                         new_booking.id, new_booking.event,
                                         new_booking.user.username,
                                         request.user.username
-                                    )
+                                    ),
+                                    actor=request.user, obj=new_booking,
+                                    action='reopened'
                                 )
                                 messages.success(
                                     request,
@@ -129,14 +135,16 @@ def register_view(request, event_slug, status_choice='OPEN', print_view=False):
                             booking.payment_confirmed = bool(booking.block)
                             booking.save()
 
-                            ActivityLog.objects.create(
-                                log='(Register) Block {} for booking id {} for '
+                            log_activity(
+                                '(Register) Block {} for booking id {} for '
                                     'event {}, user {} by admin user {}'.format(
                                     'added' if booking.block else 'removed',
                                     booking.id, booking.event,
                                     booking.user.username,
                                     request.user.username
-                                )
+                                ),
+                                actor=request.user, obj=booking,
+                                action='updated'
                             )
                             updated.append(booking)
 
@@ -162,8 +170,8 @@ def register_view(request, event_slug, status_choice='OPEN', print_view=False):
                                 paid_updates[booking.user.username] = change
 
                 if deposit_updates:
-                    ActivityLog.objects.create(
-                        log='(Register) Deposit paid updated for user{} {} for '
+                    log_activity(
+                        '(Register) Deposit paid updated for user{} {} for '
                             'event {} by admin user {}'.format(
                                 's' if len(deposit_updates) > 1 else '',
                                 ', '.join(
@@ -172,12 +180,13 @@ def register_view(request, event_slug, status_choice='OPEN', print_view=False):
                                 ),
                                 booking.event,
                                 request.user.username
-                            )
+                            ),
+                        actor=request.user, obj=event, action='updated'
                         )
 
                 if paid_updates:
-                    ActivityLog.objects.create(
-                        log='(Register) Fully paid updated for user{} {} for '
+                    log_activity(
+                        '(Register) Fully paid updated for user{} {} for '
                             'event {} by admin user {}'.format(
                                 's' if len(paid_updates) > 1 else '',
                                 ', '.join(
@@ -186,7 +195,8 @@ def register_view(request, event_slug, status_choice='OPEN', print_view=False):
                                 ),
                                 booking.event,
                                 request.user.username
-                            )
+                            ),
+                        actor=request.user, obj=event, action='updated'
                         )
 
                 if updated:
@@ -205,13 +215,14 @@ def register_view(request, event_slug, status_choice='OPEN', print_view=False):
                             ', '.join(attended_checked)
                         )
                     )
-                    ActivityLog.objects.create(
-                        log="(Register) User{} {} marked as attended for "
+                    log_activity(
+                        "(Register) User{} {} marked as attended for "
                             "event {} by admin user {}".format(
                             's' if len(attended_checked) > 1 else '',
                             ', '.join(attended_checked),
                             booking.event, request.user.username
-                        )
+                        ),
+                        actor=request.user, obj=event, action='updated'
                     )
 
                 if attended_unchecked:
@@ -222,13 +233,14 @@ def register_view(request, event_slug, status_choice='OPEN', print_view=False):
                             ', '.join(attended_unchecked)
                         )
                     )
-                    ActivityLog.objects.create(
-                        log="(Register) User{} {} marked as unattended for "
+                    log_activity(
+                        "(Register) User{} {} marked as unattended for "
                             "event {} by admin user {}".format(
                             's' if len(attended_unchecked) > 1 else '',
                             ', '.join(attended_unchecked),
                             booking.event, request.user.username
-                        )
+                        ),
+                        actor=request.user, obj=event, action='updated'
                     )
                 if no_show_checked:
                     messages.success(
@@ -238,13 +250,14 @@ def register_view(request, event_slug, status_choice='OPEN', print_view=False):
                             ', '.join(no_show_checked)
                         )
                     )
-                    ActivityLog.objects.create(
-                        log="(Register) User{} {} marked as no-show for event "
+                    log_activity(
+                        "(Register) User{} {} marked as no-show for event "
                             "{} by admin user {}".format(
                             's' if len(no_show_checked) > 1 else '',
                             ', '.join(no_show_checked),
                             booking.event, request.user.username
-                        )
+                        ),
+                        actor=request.user, obj=event, action='updated'
                     )
 
                 if no_show_unchecked:
@@ -255,13 +268,14 @@ def register_view(request, event_slug, status_choice='OPEN', print_view=False):
                             ', '.join(no_show_unchecked)
                         )
                     )
-                    ActivityLog.objects.create(
-                        log="(Register) User{} {} unmarked as no-show for "
+                    log_activity(
+                        "(Register) User{} {} unmarked as no-show for "
                             "event {} by admin user {}".format(
                             's' if len(no_show_unchecked) > 1 else '',
                             ', '.join(no_show_unchecked),
                             booking.event, request.user.username
-                        )
+                        ),
+                        actor=request.user, obj=event, action='updated'
                     )
 
             register_url = 'studioadmin:event_register'
@@ -350,6 +364,101 @@ def register_view(request, event_slug, status_choice='OPEN', print_view=False):
     )
 
 
+def get_print_registers(events):
+    """
+    Build the context for printing the registers for a list of events.  Uses
+    a fixed number of queries however many events and bookings there are: the
+    bookings (with their users and disclaimers) are prefetched for all events
+    at once, and the blocks and block types for all events are fetched in bulk
+    and matched up in memory.
+    """
+    events = list(events.prefetch_related(
+        Prefetch(
+            'bookings',
+            queryset=Booking.objects.select_related(
+                'user', 'user__online_disclaimer', 'user__print_disclaimer'
+            ).order_by('id')
+        )
+    ))
+
+    open_bookings = {
+        event.id: [
+            booking for booking in event.bookings.all()
+            if booking.status == 'OPEN'
+        ]
+        for event in events
+    }
+    all_open_bookings = [
+        booking for bookings in open_bookings.values() for booking in bookings
+    ]
+    event_type_ids = {event.event_type_id for event in events}
+
+    block_types = defaultdict(list)
+    for block_type in BlockType.objects.filter(
+            event_type_id__in=event_type_ids
+    ):
+        block_types[block_type.event_type_id].append(block_type)
+
+    # blocks used for the bookings, plus each user's active blocks for the
+    # event types, annotated with the number of bookings made against them
+    booked_block_ids = {
+        booking.block_id for booking in all_open_bookings if booking.block_id
+    }
+    user_ids = {
+        booking.user_id for booking in all_open_bookings
+        if not booking.block_id
+    }
+    booked_blocks = {}
+    if booked_block_ids:
+        booked_blocks = {
+            block.id: block for block in Block.objects.filter(
+                id__in=booked_block_ids
+            ).select_related('block_type').with_usage()
+        }
+    active_blocks = {}
+    if user_ids:
+        for block in Block.objects.active().filter(
+            user_id__in=user_ids, block_type__event_type_id__in=event_type_ids
+        ).select_related('block_type').with_usage().order_by('id'):
+            active_blocks.setdefault(
+                (block.user_id, block.block_type.event_type_id), block
+            )
+
+    eventlist = []
+    for event in events:
+        bookinglist = []
+        for i, booking in enumerate(open_bookings[event.id]):
+            if booking.block_id:
+                available_block = booked_blocks.get(booking.block_id)
+            else:
+                available_block = active_blocks.get(
+                    (booking.user_id, event.event_type_id)
+                )
+            bookinglist.append({
+                'booking': booking, 'index': i+1,
+                'available_block': available_block,
+                'has_disclaimer': (
+                    hasattr(booking.user, 'online_disclaimer') or
+                    hasattr(booking.user, 'print_disclaimer')
+                ),
+            })
+
+        if event.max_participants:
+            extra_lines = event.spaces_left
+        elif len(event.bookings.all()) < 15:
+            extra_lines = 15 - len(open_bookings[event.id])
+        else:
+            extra_lines = 2
+
+        eventlist.append({
+            'event': event,
+            'bookings': bookinglist,
+            'available_block_type': block_types[event.event_type_id],
+            'extra_lines': extra_lines,
+        })
+    return eventlist
+
+
 @login_required
 @is_instructor_or_staff
 def register_print_day(request):
@@ -402,7 +511,7 @@ def register_print_day(request):
                     event_ids = form.cleaned_data['select_events']
                     events = Event.objects.filter(
                         id__in=event_ids
-                    ).order_by('date')
+                    ).select_related('event_type').order_by('date')
                 else:
                     messages.info(request, 'Please select at least one register to print')
                     form = RegisterDayForm(
@@ -417,48 +526,7 @@ def register_print_day(request):
                         {'form': form, 'sidenav_selection': 'register_day'}
                     )
 
-                eventlist = []
-                for event in events:
-                    bookings = [
-                        booking for booking in Booking.objects.filter(event=event, status='OPEN')
-                        ]
-
-                    bookinglist = []
-                    for i, booking in enumerate(bookings):
-                        available_block = [
-                            block for block in
-                            Block.objects.filter(user=booking.user) if
-                            block.active_block() and
-                            block.block_type.event_type == event.event_type
-                        ]
-                        available_block = booking.block or (
-                            available_block[0] if available_block else None
-                        )
-                        booking_ctx = {'booking': booking, 'index': i+1, 'available_block': available_block}
-                        bookinglist.append(booking_ctx)
-
-                    if event.max_participants:
-                        extra_lines = event.spaces_left
-                    elif event.bookings.count() < 15:
-                        open_bookings = [
-                            event for event in event.bookings.all() if event.status == 'OPEN'
-                        ]
-                        extra_lines = 15 - len(open_bookings)
-                    else:
-                        extra_lines = 2
-
-                    available_block_type = [
-                        block_type for block_type in
-                        BlockType.objects.filter(event_type=event.event_type)
-                    ]
-
-                    event_ctx = {
-                        'event': event,
-                        'bookings': bookinglist,
-                        'available_block_type': available_block_type,
-                        'extra_lines': extra_lines,
-                    }
-                    eventlist.append(event_ctx)
+                eventlist = get_print_registers(events)
 
                 context = {
                     'date': register_date, 'events': eventlist,
@@ -524,7 +592,7 @@ class EventRegisterListView(
             queryset = Event.objects.filter(
                 date__gte=timezone.now() - timedelta(hours=1)
             ).exclude(event_type__event_type='EV').order_by('date')
-        return queryset
+        return queryset.annotate(waiting_list_count=Count('waitinglistusers'))
 
     def get_context_data(self, **kwargs):
         context = super(EventRegisterListView, self).get_context_data(**kwargs)
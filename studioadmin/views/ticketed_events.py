@@ -23,7 +23,7 @@ from studioadmin.forms import TicketedEventFormSet, TicketedEventAdminForm, \
     TicketBookingInlineFormSet, PrintTicketsForm
 
 from studioadmin.views.helpers import staff_required, StaffUserMixin
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -42,13 +42,13 @@ class TicketedEventAdminListView(
 
         queryset = TicketedEvent.objects.filter(
                 date__gte=timezone.now()
-            ).order_by('date')
+            ).with_ticket_counts().order_by('date')
 
         if self.request.method == 'POST':
             if "past" in self.request.POST:
                 queryset = TicketedEvent.objects.filter(
                     date__lte=timezone.now()
-                ).order_by('date')
+                ).with_ticket_counts().order_by('date')
                 context['show_past'] = True
             elif "upcoming" in self.request.POST:
                 queryset = queryset
@@ -96,8 +96,8 @@ class TicketedEventAdminListView(
                                         )
                                     )
                                 )
-                                ActivityLog.objects.create(
-                                    log='Ticketed Event {} (id {}) deleted by '
+                                log_activity(
+                                    'Ticketed Event {} (id {}) deleted by '
                                         'admin user {}'.format(
                                         form.instance,
                                         form.instance.id, request.user.username
@@ -113,8 +113,8 @@ class TicketedEventAdminListView(
                                                 form.instance))
                                     )
 
-                                    ActivityLog.objects.create(
-                                        log='Ticketed Event {} (id {}) updated '
+                                    log_activity(
+                                        'Ticketed Event {} (id {}) updated '
                                             'by admin user {}: field_'
                                             'changed: {}'.format(
                                             form.instance, form.instance.id,
@@ -172,8 +172,8 @@ class TicketedEventAdminUpdateView(
             msg = 'Event <strong> {}</strong> has been updated!'.format(
                 ticketed_event.name
             )
-            ActivityLog.objects.create(
-                log='Ticketed event {} (id {}) updated by admin user {}'.format(
+            log_activity(
+                'Ticketed event {} (id {}) updated by admin user {}'.format(
                     ticketed_event, ticketed_event.id,
                     self.request.user.username
                 )
@@ -222,8 +222,8 @@ class TicketedEventAdminCreateView(
             self.request, mark_safe('Event <strong> {}</strong> has been '
                                     'created!'.format(ticketed_event.name))
         )
-        ActivityLog.objects.create(
-            log='Ticketed Event {} (id {}) created by admin user {}'.format(
+        log_activity(
+            'Ticketed Event {} (id {}) created by admin user {}'.format(
                 ticketed_event, ticketed_event.id, self.request.user.username
             )
         )
@@ -268,21 +268,17 @@ class TicketedEventBookingsListView(
         ).get_context_data(**kwargs)
 
         context['ticketed_event'] = self.ticketed_event
-        bookingids = [
-            tbk.id for tbk in
-            TicketBooking.objects.filter(
-                ticketed_event=self.ticketed_event, purchase_confirmed=True,
-            )
-            if tbk.tickets.exists()
-            ]
+        queryset = TicketBooking.objects.filter(
+            ticketed_event=self.ticketed_event, purchase_confirmed=True,
+            id__in=Ticket.objects.values('ticket_booking_id')
+        ).select_related('user').prefetch_related(
+            'tickets', 'paypalticketbookingtransaction_set'
+        )
 
         if 'show_cancelled' in self.request.POST:
-            queryset = TicketBooking.objects.filter(id__in=bookingids)
             context['show_cancelled_ctx'] = True
         else:
-            queryset = TicketBooking.objects.filter(
-                id__in=bookingids, cancelled=False
-            )
+            queryset = queryset.filter(cancelled=False)
 
         context['ticket_bookings'] = bool(queryset)
         context['ticket_booking_formset'] = TicketBookingInlineFormSet(
@@ -361,8 +357,8 @@ class TicketedEventBookingsListView(
                                         ticket_booking.date_booked = timezone.now()
                                         ticket_booking.warning_sent = False
 
-                                        ActivityLog.objects.create(
-                                            log='Ticketed Booking ref {} {} by '
+                                        log_activity(
+                                            'Ticketed Booking ref {} {} by '
                                                 'admin user {}'.format(
                                                 ticket_booking.booking_reference,
                                                 action,
@@ -380,8 +376,8 @@ class TicketedEventBookingsListView(
                                                         form.cleaned_data[field],
                                                         ticket_booking))
 
-                                            ActivityLog.objects.create(
-                                                log='Ticketed Booking ref {} (user {}, '
+                                            log_activity(
+                                                'Ticketed Booking ref {} (user {}, '
                                                     'event {}) updated by admin user '
                                                     '{}: field_changed: {}'.format(
                                                     ticket_booking.booking_reference,
@@ -591,8 +587,8 @@ def cancel_ticketed_event_view(request, slug):
                                         'event'.format(ticketed_event)
                 messages.info(request, booking_cancelled_msg)
 
-            ActivityLog.objects.create(
-                log="{} cancelled by admin user {}. {}".format(
+            log_activity(
+                "{} cancelled by admin user {}. {}".format(
                     ticketed_event, request.user.username,
                     booking_cancelled_msg
                 )
@@ -662,8 +658,8 @@ class ConfirmTicketBookingRefundView(
                     'studioadmin/email/confirm_ticket_booking_refund.html').render(ctx),
                 fail_silently=False)
 
-            ActivityLog.objects.create(
-                log='Payment refund for ticket booking ref {} for event {}, '
+            log_activity(
+                'Payment refund for ticket booking ref {} for event {}, '
                     '(user {}) updated by admin user {}'.format(
                     ticket_booking.booking_reference,
                     ticket_booking.ticketed_event, ticket_booking.user.username,
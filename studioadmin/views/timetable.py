@@ -16,7 +16,7 @@ from timetable.models import Session
 from studioadmin.forms import TimetableSessionFormSet, SessionAdminForm, \
     DAY_CHOICES, UploadTimetableForm
 from studioadmin.views.helpers import staff_required, StaffUserMixin
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -44,8 +44,8 @@ def timetable_admin_list(request):
                                     form.instance.time.strftime('%H:%M')
                                 ))
                             )
-                            ActivityLog.objects.create(
-                                log='Session {} (id {}) deleted by admin '
+                            log_activity(
+                                'Session {} (id {}) deleted by admin '
                                     'user {}'.format(
                                     form.instance, form.instance.id,
                                     request.user.username
@@ -62,8 +62,8 @@ def timetable_admin_list(request):
                                             )
                                     )
                                 )
-                                ActivityLog.objects.create(
-                                    log='Session {} (id {}) updated by admin '
+                                log_activity(
+                                    'Session {} (id {}) updated by admin '
                                         'user {}'.format(
                                         form.instance, form.instance.id,
                                         request.user.username
@@ -131,8 +131,8 @@ class TimetableSessionUpdateView(
                 session.name, DAY_CHOICES[session.day],
                 session.time.strftime('%H:%M')
             )
-            ActivityLog.objects.create(
-                log='Session {} (id {}) updated by admin user {}'.format(
+            log_activity(
+                'Session {} (id {}) updated by admin user {}'.format(
                     session, session.id, self.request.user.username
                 )
             )
@@ -182,8 +182,8 @@ class TimetableSessionCreateView(
             session.name, DAY_CHOICES[session.day],
             session.time.strftime('%H:%M')
         )
-        ActivityLog.objects.create(
-            log='Session {} (id {}) created by admin user {}'.format(
+        log_activity(
+            'Session {} (id {}) created by admin user {}'.format(
                 session, session.id, self.request.user.username
             )
         )
@@ -12,21 +12,25 @@ from django.shortcuts import HttpResponseRedirect, get_object_or_404, render_to_
 from django.views.generic import ListView
 from django.utils import timezone
 from django.utils.safestring import mark_safe
-from django.core.mail import send_mail
 
 from braces.views import LoginRequiredMixin
 
+from accounts import auth_cache
 from accounts.models import PrintDisclaimer
 
+from booking.context_helpers import annotate_user_flags, \
+    set_transferred_bookings
 from booking.models import Booking,  Block, BlockType, WaitingListUser
-from booking.email_helpers import send_support_email,  send_waiting_list_email
+from booking.email_helpers import send_mail, send_support_email, \
+    send_waiting_list_email
 
 from studioadmin.forms import BookingStatusFilter,  UserBookingFormSet,  \
     UserBlockFormSet,  UserListSearchForm
 
-from studioadmin.views.helpers import InstructorOrStaffUserMixin,  \
+from studioadmin.views.helpers import get_keyset_querystring, \
+    InstructorOrStaffUserMixin, KeysetPaginationMixin, KeysetPaginator, \
     staff_required, StaffUserMixin
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -56,12 +60,16 @@ def _get_name_filter_available(queryset):
     return name_filter_options
 
 
-class UserListView(LoginRequiredMixin,  InstructorOrStaffUserMixin,  ListView):
+class UserListView(
+    LoginRequiredMixin, InstructorOrStaffUserMixin, KeysetPaginationMixin,
+    ListView
+):
 
     model = User
     template_name = 'studioadmin/user_list.html'
     context_object_name = 'users'
     paginate_by = 30
+    keyset_ordering = ('first_name', 'id')
 
     def get_queryset(self):
         queryset = User.objects.all().order_by('first_name')
@@ -83,7 +91,7 @@ class UserListView(LoginRequiredMixin,  InstructorOrStaffUserMixin,  ListView):
         if filter and filter != 'All':
             queryset = queryset.filter(first_name__istartswith=filter)
 
-        return queryset
+        return annotate_user_flags(queryset)
 
     def get_context_data(self):
         queryset = self.get_queryset()
@@ -117,8 +125,8 @@ def toggle_regular_student(request,  user_id):
     if not user_to_change.is_superuser:
         if user_to_change.is_regular_student():
             user_to_change.user_permissions.remove(perm)
-            ActivityLog.objects.create(
-                log="'Regular student' status has been removed for "
+            log_activity(
+                "'Regular student' status has been removed for "
                 "{} {} ({}) by admin user {}".format(
                     user_to_change.first_name,
                     user_to_change.last_name,
@@ -128,8 +136,8 @@ def toggle_regular_student(request,  user_id):
             )
         else:
             user_to_change.user_permissions.add(perm)
-            ActivityLog.objects.create(
-                log="{} {} ({}) has been given 'regular student' "
+            log_activity(
+                "{} {} ({}) has been given 'regular student' "
                 "status by admin user {}".format(
                     user_to_change.first_name,
                         user_to_change.last_name,
@@ -137,6 +145,7 @@ def toggle_regular_student(request,  user_id):
                         request.user.username
                     )
             )
+    auth_cache.invalidate_user(user_to_change)
     # get the user again, otherwise permissions are cached
     return render_to_response(
         "studioadmin/includes/regular_student_button.txt",
@@ -151,8 +160,8 @@ def toggle_print_disclaimer(request,  user_id):
     disclaimer = PrintDisclaimer.objects.filter(user=user_to_change)
     if disclaimer:
         disclaimer.delete()
-        ActivityLog.objects.create(
-            log="Print disclaimer has been removed for "
+        log_activity(
+            "Print disclaimer has been removed for "
             "{} {} ({}) by admin user {}".format(
                 user_to_change.first_name,
                 user_to_change.last_name,
@@ -162,8 +171,8 @@ def toggle_print_disclaimer(request,  user_id):
         )
     else:
         PrintDisclaimer.objects.create(user=user_to_change)
-        ActivityLog.objects.create(
-            log="Print disclaimer recorded for {} {} ({}) "
+        log_activity(
+            "Print disclaimer recorded for {} {} ({}) "
             "by admin user {}".format(
                 user_to_change.first_name,
                     user_to_change.last_name,
@@ -184,8 +193,8 @@ def toggle_subscribed(request,  user_id):
     group, _ = Group.objects.get_or_create(name='subscribed')
     if user_to_change.subscribed():
         group.user_set.remove(user_to_change)
-        ActivityLog.objects.create(
-            log="User {} {} ({}) unsubscribed from mailing list by "
+        log_activity(
+            "User {} {} ({}) unsubscribed from mailing list by "
                 "admin user {}".format(
                 user_to_change.first_name,
                 user_to_change.last_name,
@@ -195,8 +204,8 @@ def toggle_subscribed(request,  user_id):
         )
     else:
         group.user_set.add(user_to_change)
-        ActivityLog.objects.create(
-            log="User {} {} ({}) subscribed to mailing list by "
+        log_activity(
+            "User {} {} ({}) subscribed to mailing list by "
                 "admin user {}".format(
                 user_to_change.first_name,
                 user_to_change.last_name,
@@ -204,6 +213,7 @@ def toggle_subscribed(request,  user_id):
                 request.user.username
             )
         )
+    auth_cache.invalidate_user(user_to_change)
     return render_to_response(
         "studioadmin/includes/subscribed_button.txt",
         {"user": user_to_change}
@@ -214,6 +224,8 @@ def toggle_subscribed(request,  user_id):
 @staff_required
 def user_bookings_view(request,  user_id,  booking_status='future'):
     user = get_object_or_404(User,  id=user_id)
+    # only past bookings are paginated
+    bookings_page = None
 
     if request.method == 'POST':
         booking_status = request.POST.getlist('booking_status')[0]
@@ -371,8 +383,8 @@ def user_bookings_view(request,  user_id,  booking_status='future'):
                                 else:
                                     extra_msg = ''
 
-                                ActivityLog.objects.create(
-                                    log='Booking id {} (user {}) for "{}" {} '
+                                log_activity(
+                                    'Booking id {} (user {}) for "{}" {} '
                                             'by admin user {} {}'.format(
                                         booking.id,  booking.user.username,  booking.event, 
                                         action,  request.user.username, 
@@ -450,8 +462,8 @@ def user_bookings_view(request,  user_id,  booking_status='future'):
                                                         request.META.get('HTTP_HOST')
                                                     )
                                                 )
-                                                ActivityLog.objects.create(
-                                                    log='Waiting list email sent to '
+                                                log_activity(
+                                                    'Waiting list email sent to '
                                                     'user(s) {} for event {}'.format(
                                                         ',  '.join(
                                                             [wluser.user.username \
@@ -474,8 +486,8 @@ def user_bookings_view(request,  user_id,  booking_status='future'):
                                             user=booking.user,  event=booking.event
                                         )
                                         waiting_list_user.delete()
-                                        ActivityLog.objects.create(
-                                            log='User {} has been removed from the '
+                                        log_activity(
+                                            'User {} has been removed from the '
                                             'waiting list for {}'.format(
                                                 booking.user.username, 
                                                 booking.event
@@ -520,23 +532,29 @@ def user_bookings_view(request,  user_id,  booking_status='future'):
                 )
             )
     else:
-        all_bookings = Booking.objects.filter(user=user)
+        all_bookings = Booking.objects.filter(user=user).select_related(
+            'event__event_type'
+        )
 
         if booking_status == 'past':
-            queryset = all_bookings.filter(
+            past_bookings = all_bookings.select_related('event').filter(
                 event__date__lt=timezone.now()
-            ).order_by('-event__date')
-            userbookingformset = UserBookingFormSet(
-                queryset=queryset,  instance=user,  user=user, 
             )
+            paginator = KeysetPaginator(
+                past_bookings, 20, ordering=('-event__date', '-id')
+            )
+            bookings_page = paginator.page(
+                after=request.GET.get('after'),
+                before=request.GET.get('before')
+            )
+            queryset = past_bookings.filter(
+                id__in=[booking.id for booking in bookings_page]
+            ).order_by('-event__date', '-id')
         else:
             # 'future' by default
             queryset = all_bookings.filter(
                 event__date__gte=timezone.now()
             ).order_by('event__date')
-            userbookingformset = UserBookingFormSet(
-                queryset=queryset,  instance=user,  user=user, 
-            )
 
         userbookingformset = UserBookingFormSet(
             instance=user, 
@@ -554,7 +572,9 @@ def user_bookings_view(request,  user_id,  booking_status='future'):
             'userbookingformset': userbookingformset,  'user': user, 
             'sidenav_selection': 'users', 
             'booking_status_filter': booking_status_filter, 
-            'booking_status': booking_status
+            'booking_status': booking_status,
+            'bookings_page': bookings_page,
+            'keyset_querystring': get_keyset_querystring(request)
         }
     )
 
@@ -591,8 +611,8 @@ def user_blocks_view(request,  user_id):
                                     )
                                 )
                             )
-                            ActivityLog.objects.create(
-                                log='Block {} (id {}) deleted by admin user {}'.format(
+                            log_activity(
+                                'Block {} (id {}) deleted by admin user {}'.format(
                                 form.instance,  form.instance.id,  request.user.username)
                             )
                             block.delete()
@@ -607,8 +627,8 @@ def user_blocks_view(request,  user_id):
                                 )
                             )
                             block.save()
-                            ActivityLog.objects.create(
-                                log='Block id {} ({}),  user {},  {}'
+                            log_activity(
+                                'Block id {} ({}),  user {},  {}'
                                         ' by admin user {}'.format(
                                     block.id,  block.block_type, 
                                     block.user.username,  msg, 
@@ -642,6 +662,9 @@ def user_blocks_view(request,  user_id):
             queryset=queryset, 
             user=user
         )
+        set_transferred_bookings(
+            form.instance for form in userblockformset.forms
+        )
 
     template = 'studioadmin/user_block_list.html'
     return TemplateResponse(
@@ -674,8 +697,8 @@ def unsubscribe(request, user_id):
             user_to_change.username
         )
     )
-    ActivityLog.objects.create(
-        log="User {} {} ({}) unsubscribed from mailing list by "
+    log_activity(
+        "User {} {} ({}) unsubscribed from mailing list by "
             "admin user {}".format(
             user_to_change.first_name,
             user_to_change.last_name,
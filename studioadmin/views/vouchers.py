@@ -3,6 +3,7 @@
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.db.models import Count
 from django.shortcuts import HttpResponseRedirect
 from django.views.generic import CreateView, DetailView, ListView, UpdateView
 from django.utils.safestring import mark_safe
@@ -14,14 +15,16 @@ from booking.models import BlockVoucher, EventVoucher, UsedBlockVoucher, \
 from studioadmin.forms import BlockVoucherStudioadminForm, \
     VoucherStudioadminForm
 from studioadmin.views.helpers import StaffUserMixin
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 class VoucherListView(LoginRequiredMixin, StaffUserMixin, ListView):
     model = EventVoucher
     template_name = 'studioadmin/vouchers.html'
     context_object_name = 'vouchers'
-    queryset = EventVoucher.objects.all().order_by('-start_date')
+    queryset = EventVoucher.objects.annotate(
+        times_used=Count('usedeventvoucher')
+    ).prefetch_related('event_types').order_by('-start_date')
 
     def get_context_data(self, **kwargs):
         context = super(VoucherListView, self).get_context_data(**kwargs)
@@ -48,8 +51,8 @@ class VoucherUpdateView(LoginRequiredMixin, StaffUserMixin, UpdateView):
                 voucher.code
             )
             messages.success(self.request, mark_safe(msg))
-            ActivityLog.objects.create(
-                log='Voucher code {} (id {}) updated by admin user {}'.format(
+            log_activity(
+                'Voucher code {} (id {}) updated by admin user {}'.format(
                     voucher.code, voucher.id,
                     self.request.user.username
                 )
@@ -80,8 +83,8 @@ class VoucherCreateView(LoginRequiredMixin, StaffUserMixin, CreateView):
             voucher.code
         )
         messages.success(self.request, mark_safe(msg))
-        ActivityLog.objects.create(
-            log='Voucher with code {} (id {}) created by admin user {}'.format(
+        log_activity(
+            'Voucher with code {} (id {}) created by admin user {}'.format(
                 voucher.code, voucher.id,
                 self.request.user.username
             )
@@ -96,7 +99,9 @@ class BlockVoucherListView(LoginRequiredMixin, StaffUserMixin, ListView):
     model = BlockVoucher
     template_name = 'studioadmin/block_vouchers.html'
     context_object_name = 'vouchers'
-    queryset = BlockVoucher.objects.all().order_by('-start_date')
+    queryset = BlockVoucher.objects.annotate(
+        times_used=Count('usedblockvoucher')
+    ).prefetch_related('block_types__event_type').order_by('-start_date')
 
     def get_context_data(self, **kwargs):
         context = super(BlockVoucherListView, self).get_context_data(**kwargs)
@@ -124,8 +129,8 @@ class BlockVoucherUpdateView(LoginRequiredMixin, StaffUserMixin, UpdateView):
                 voucher.code
             )
             messages.success(self.request, mark_safe(msg))
-            ActivityLog.objects.create(
-                log='Block Voucher code {} (id {}) updated by admin user {}'.format(
+            log_activity(
+                'Block Voucher code {} (id {}) updated by admin user {}'.format(
                     voucher.code, voucher.id,
                     self.request.user.username
                 )
@@ -157,8 +162,8 @@ class BlockVoucherCreateView(LoginRequiredMixin, StaffUserMixin, CreateView):
             voucher.code
         )
         messages.success(self.request, mark_safe(msg))
-        ActivityLog.objects.create(
-            log='Block Voucher with code {} (id {}) created by admin user {}'.format(
+        log_activity(
+            'Block Voucher with code {} (id {}) created by admin user {}'.format(
                 voucher.code, voucher.id,
                 self.request.user.username
             )
@@ -180,19 +185,16 @@ class EventVoucherDetailView(LoginRequiredMixin, StaffUserMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super(EventVoucherDetailView, self).get_context_data(**kwargs)
         context['sidenav_selection'] = 'vouchers'
-        user_list = []
-
-        used_vouchers = self.get_used_vouchers()\
+        user_counts = self.get_used_vouchers().values('user')\
+            .annotate(count=Count('id'))\
             .order_by('user__first_name', 'user__last_name')
-        user_ids = used_vouchers.values_list('user', flat=True).distinct()
-        for user_id in user_ids:
-            voucher_count = used_vouchers.filter(user__id=user_id).count()
-            user_list.append(
-                {
-                    'user': User.objects.get(id=user_id),
-                    'count': voucher_count}
-            )
-        context['user_list'] = user_list
+        users = User.objects.in_bulk(
+            [user_count['user'] for user_count in user_counts]
+        )
+        context['user_list'] = [
+            {'user': users[user_count['user']], 'count': user_count['count']}
+            for user_count in user_counts
+        ]
         return context
 
 
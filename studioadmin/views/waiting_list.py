@@ -10,7 +10,7 @@ from django.shortcuts import get_object_or_404
 from booking.models import Event, WaitingListUser
 
 from studioadmin.views.helpers import is_instructor_or_staff
-from activitylog.models import ActivityLog
+from activitylog.helpers import log_activity
 
 
 logger = logging.getLogger(__name__)
@@ -41,8 +41,8 @@ def event_waiting_list_view(request, event_id):
                 user_to_remove.username
             )
         )
-        ActivityLog.objects.create(
-            log="{} {} ({}) removed from the waiting list "
+        log_activity(
+            "{} {} ({}) removed from the waiting list "
                 "by admin user {}".format(
                 user_to_remove.first_name,
                 user_to_remove.last_name,
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from django.forms import widgets
+from django.utils.encoding import force_text
+from django.utils.html import mark_safe
+
+
+class AutocompleteSelect(widgets.Select):
+    """
+    Select widget for a ModelChoiceField whose queryset is too big to list.
+    Only the empty option and the currently selected object are rendered;
+    other options are searched for by studioadmin/js/autocomplete.js from the
+    JSON endpoint at url, which should return
+    {"results": [{"id": ..., "text": ...}, ...]}
+    """
+
+    def __init__(self, url, attrs=None):
+        super(AutocompleteSelect, self).__init__(attrs)
+        self.url = url
+
+    def render(self, name, value, attrs=None, choices=()):
+        attrs = dict(attrs or {})
+        attrs['data-autocomplete-url'] = self.url
+        return super(AutocompleteSelect, self).render(
+            name, value, attrs, choices
+        )
+
+    def render_options(self, choices, selected_choices):
+        selected_choices = [
+            force_text(value) for value in selected_choices
+            if value not in ('', None)
+        ]
+        model_choices = self.choices
+        output = [
+            self.render_option(
+                selected_choices, '', model_choices.field.empty_label or ''
+            )
+        ]
+        if selected_choices:
+            try:
+                selected = list(
+                    model_choices.queryset.filter(pk__in=selected_choices)
+                )
+            except (ValueError, TypeError):
+                selected = []
+            for obj in selected:
+                output.append(
+                    self.render_option(
+                        selected_choices, *model_choices.choice(obj)
+                    )
+                )
+        return mark_safe('\n'.join(output))